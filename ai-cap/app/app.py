@@ -1,17 +1,22 @@
 from __future__ import annotations
 
+import asyncio
 import os
 from contextlib import asynccontextmanager
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional
 
 import yaml
 from fastapi import Body, FastAPI
 from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
 
+from chatbrain.service import ServiceError, service
+
 APP_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 CFG_PATH = os.path.join(APP_ROOT, "config", "app.yaml")
 REG_PATH = os.path.join(APP_ROOT, "registry.yaml")
+# service.startup() nạp registry này (cùng journal, dọn phiên, bảo trì log)
+os.environ.setdefault("CHATBRAIN_REGISTRY", REG_PATH)
 
 
 def load_yaml(path: str, *, label: str) -> Dict[str, Any]:
@@ -33,44 +38,8 @@ def load_config() -> Dict[str, Any]:
     return load_yaml(CFG_PATH, label="config/app.yaml")
 
 
-def load_registry() -> Dict[str, Any]:
-    registry = load_yaml(REG_PATH, label="registry.yaml")
-    modules = registry.get("modules", [])
-    if isinstance(modules, list):
-        for module in modules:
-            path = module.get("path")
-            if isinstance(path, str):
-                module["abs_path"] = os.path.join(APP_ROOT, path)
-    return registry
-
-
-def load_intents(registry: Dict[str, Any]) -> Dict[str, Any]:
-    intents: Dict[str, Any] = {}
-    modules = registry.get("modules", [])
-    if not isinstance(modules, list):
-        return intents
-    for module in modules:
-        abs_path = module.get("abs_path")
-        label = module.get("path") or "module"
-        if not isinstance(abs_path, str):
-            continue
-        doc = load_yaml(abs_path, label=label)
-        if not doc:
-            continue
-        module_intents = doc.get("intents")
-        if isinstance(module_intents, list):
-            for intent in module_intents:
-                if isinstance(intent, dict) and "id" in intent:
-                    intents[intent["id"]] = intent
-        elif isinstance(doc, dict) and "id" in doc:
-            intents[doc["id"]] = doc
-    return intents
-
-
-STATE: Dict[str, Dict[str, Any]] = {
+STATE: Dict[str, Any] = {
     "config": {},
-    "registry": {},
-    "intents": {},
 }
 
 
@@ -96,14 +65,33 @@ def _initialize_state(app: FastAPI) -> None:
     STATE["config"] = load_config()
     if STATE["config"]:
         _mount_static(app, STATE["config"])
-    STATE["registry"] = load_registry()
-    STATE["intents"] = load_intents(STATE["registry"])
+
+
+def _load_registry() -> Optional[str]:
+    """Nạp lại registry.yaml; trả thông báo lỗi thay vì để tiến trình sập."""
+    # Cùng engine và cùng pack đã biên dịch với chatbrain.app: các module trong
+    # registry.yaml, bí danh toàn cục và luật chuyển hướng (chatbrain/core/registry.py)
+    try:
+        service.load_registry(os.environ["CHATBRAIN_REGISTRY"])
+    except ServiceError as exc:
+        return f"Khong the nap registry.yaml: {exc.detail}"
+    except Exception as exc:  # thiếu thư viện, YAML sai, kịch bản không hợp lệ...
+        return f"Khong the nap registry.yaml: {type(exc).__name__}: {exc}"
+    return None
+
+
+def _intent_ids() -> List[str]:
+    return [intent.id for intent in service.nlu.all_intents()]
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     _initialize_state(app)
+    await asyncio.to_thread(service.startup)
+    if service.startup_error:
+        print(f"LOI: Khong the nap registry.yaml: {service.startup_error}")
     yield
+    await asyncio.to_thread(service.shutdown)
 
 
 app = FastAPI(title="AI CAP Bot", lifespan=lifespan)
@@ -112,32 +100,29 @@ app = FastAPI(title="AI CAP Bot", lifespan=lifespan)
 @app.get("/admin/reload")
 def reload():
     _initialize_state(app)
-    return {"ok": True, "intents": list(STATE["intents"].keys())}
+    error = _load_registry()
+    if error is not None:
+        print(f"LOI: {error}")
+        return JSONResponse(status_code=500, content={"ok": False, "detail": error})
+    return {"ok": True, "intents": _intent_ids()}
 
 @app.get("/intents")
 def list_intents():
-    return {"intents": list(STATE["intents"].keys())}
+    return {"intents": _intent_ids()}
 
 @app.post("/chat")
-def chat(message: str = Body(..., embed=True)):
-    # ROUTING rất đơn giản (placeholder): khớp theo synonyms/entry_patterns
-    text = message.lower().strip()
-    for it in STATE.get("intents", {}).values():
-        # kiểu intent 1 file
-        syns = it.get("synonyms", [])
-        if any(s.lower() in text for s in syns):
-            return JSONResponse({"matched_intent": it["id"], "mode": "final_or_flow", "data": it})
-        # kiểu bundle nhiều intents
-        for flow in it.get("guided_flows", []) if "guided_flows" in it else []:
-            eps = flow.get("entry_patterns", [])
-            if any(e.lower() in text for e in eps):
-                return JSONResponse({"matched_intent": it["id"], "flow": flow["id"], "step": flow["steps"][0], "data": it})
-
-    # fallback
-    registry = STATE.get("registry", {})
-    fb = registry.get("fallback", {}).get("answer", "Xin lỗi, tôi chưa có thông tin.")
-    return {"matched_intent": None, "answer": fb}
+def chat(message: str = Body(..., embed=True), session_id: str = Body("default", embed=True)):
+    try:
+        response = service.handle_message(session_id, message)
+    except ServiceError as exc:
+        return JSONResponse(status_code=exc.status_code, content={"detail": exc.detail})
+    chosen = response.debug.get("chosen")
+    body = response.model_dump()
+    body["matched_intent"] = chosen["intent_id"] if chosen else None
+    if chosen is None:
+        body["answer"] = response.reply
+    return body
 
 @app.get("/")
 def root():
-    return {"status": "ok", "intents": list(STATE.get("intents", {}).keys())}
+    return {"status": "ok", "intents": _intent_ids()}
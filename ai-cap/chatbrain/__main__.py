@@ -0,0 +1,26 @@
+"""``python -m chatbrain <lệnh> ...``: gọi CLI tương ứng trong ``chatbrain/cli``."""
+from __future__ import annotations
+
+import importlib
+import sys
+
+COMMANDS = {
+    "lint": "chatbrain.cli.lint",
+    "collisions": "chatbrain.cli.collisions",
+    "menu": "chatbrain.cli.menu",
+    "evaluate": "chatbrain.cli.evaluate",
+    "export-logs": "chatbrain.cli.export_logs",
+}
+
+
+def main() -> None:
+    if len(sys.argv) < 2 or sys.argv[1] not in COMMANDS:
+        print(f"Dùng: python -m chatbrain {{{','.join(COMMANDS)}}} ...", file=sys.stderr)
+        sys.exit(2)
+    command = sys.argv.pop(1)
+    sys.argv[0] = f"chatbrain {command}"
+    importlib.import_module(COMMANDS[command]).main()
+
+
+if __name__ == "__main__":
+    main()
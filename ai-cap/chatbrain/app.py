@@ -1,250 +1,201 @@
 from __future__ import annotations
 
+import asyncio
+import json
 import os
+from contextlib import asynccontextmanager
 from typing import Any, Dict, List, Optional
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel, Field, ValidationError
+from pydantic import BaseModel, Field
 
 from .connectors.facebook import router as facebook_router
-from .core import loader
-from .core.context import ContextManager
-from .core.executor import Executor
 from .core.loader import ScriptLoaderError
-from .core.nlu import NLUIndex
-from .core.policy import Policy
-from .core.schema import Candidate, ContextState, ScriptPack, StepUI
-from .storage.repo import SQLiteRepo
-
-BUTTON_LABELS = {
-    "Đã xong",
-    "Quay lại",
-    "Huỷ",
-    "Cần trợ giúp thêm",
-    "Không",
-    "Tiếp tục",
-    "Khởi động lại",
-}
+from .core.schema import ContextState
+from .service import (  # noqa: F401 - tái xuất cho mã cũ import từ chatbrain.app
+    BUTTON_LABELS,
+    ChatBrainService,
+    MediaResponse,
+    MessageResponse,
+    ServiceError,
+    UIResponse,
+    message_events,
+    service,
+)
 
 
 class MessageRequest(BaseModel):
     session_id: str
     message: str
+    # True: kèm debug.next = bước mà nút "Đã xong" sẽ hiện, để connector chuẩn bị sẵn
+    prefetch: bool = False
 
 
-class MediaResponse(BaseModel):
-    type: str = "image"
-    url: str
-    alt: Optional[str] = None
+class LoadRequest(BaseModel):
+    folder: str
+    # False: chỉ biên dịch thành phiên bản mới, chưa nhận traffic (dùng với /versions/split)
+    activate: bool = True
 
 
-class UIResponse(BaseModel):
-    buttons: List[str] = Field(default_factory=list)
-    media: List[MediaResponse] = Field(default_factory=list)
+class SplitRequest(BaseModel):
+    weights: Dict[str, float] = Field(default_factory=dict)
 
-    def __getitem__(self, item: str) -> Any:  # giữ tương thích kiểu dict
-        return getattr(self, item)
 
-    def get(self, item: str, default: Any = None) -> Any:
-        return getattr(self, item, default)
+# Số câu tối đa mỗi request /rank/batch: ma trận điểm tỉ lệ với số câu x số intent
+RANK_BATCH_MAX_TEXTS = int(os.getenv("RANK_BATCH_MAX_TEXTS", "10000"))
 
 
-class MessageResponse(BaseModel):
-    reply: str
-    ui: UIResponse = Field(default_factory=UIResponse)
-    debug: Dict[str, Any] = Field(default_factory=dict)
+class RankBatchRequest(BaseModel):
+    texts: List[str] = Field(..., min_length=1, max_length=RANK_BATCH_MAX_TEXTS)
+    top_k: int = Field(default=3, ge=1, le=50)
 
 
-class LoadRequest(BaseModel):
-    folder: str
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Nạp kịch bản/model ở nền để tiến trình nhận kết nối ngay; /healthz báo ready khi xong
+    task = asyncio.create_task(asyncio.to_thread(service.startup))
+    yield
+    if not task.done():
+        task.cancel()
+    await asyncio.to_thread(service.shutdown)
 
-
-class ChatBrainService:
-    def __init__(self) -> None:
-        self.context = ContextManager()
-        self.nlu = NLUIndex()
-        self.policy = Policy()
-        self.executor = Executor(self.context)
-        self.repo = SQLiteRepo()
-        self.script_pack = ScriptPack(intents=[])
-        default_folder = os.getenv("CHATBRAIN_DEFAULT_SCRIPTS", "knowledge_base/scripts")
-        try:
-            self.load_scripts(default_folder)
-        except Exception:
-            # Cho phép khởi động ngay cả khi chưa có kịch bản
-            pass
-
-    # Script management -------------------------------------------------
-    def load_scripts(self, folder: str) -> Dict[str, Any]:
-        pack = loader.load_from_folder(folder)
-        self.script_pack = pack
-        self.nlu.build(pack)
-        self.executor.load_script_pack(pack)
-        return {"intents": len(pack.intents), "folder": folder}
-
-    # Message handling --------------------------------------------------
-    def handle_message(self, session_id: str, message: str) -> MessageResponse:
-        if not message:
-            raise HTTPException(status_code=400, detail="Tin nhắn không hợp lệ")
-        normalized = message.strip()
-        pending_resume = self.context.pending_resume(session_id)
-        if pending_resume and normalized not in {"Quay lại", "Không"}:
-            reply = f"Anh/chị đang tạm dừng **{pending_resume}**. Vui lòng chọn 'Quay lại' hoặc 'Không' giúp em nhé."
-            response = self._build_response(session_id, reply, StepUI(), [], None)
-            self._log(session_id, normalized, response)
-            return response
-        if session_id in self.executor.version_prompts and normalized not in {"Tiếp tục", "Khởi động lại"}:
-            reply = "Nội dung đã cập nhật, anh/chị hãy chọn 'Tiếp tục' hoặc 'Khởi động lại' giúp em nhé."
-            response = self._build_response(session_id, reply, StepUI(), [], None)
-            self._log(session_id, normalized, response)
-            return response
-
-        if normalized in BUTTON_LABELS:
-            result = self.executor.handle_button(session_id, normalized)
-            response = self._build_response(session_id, result["reply"], result.get("ui", StepUI()), [], None)
-            self._log(session_id, normalized, response)
-            return response
-
-        top_k = self.nlu.rank(normalized)
-        chosen = self.policy.choose(top_k, self.context.peek(session_id))
-        if self.policy.is_below_threshold(chosen):
-            reply = self.policy.fallback_ask()
-            response = self._build_response(session_id, reply, StepUI(), top_k, None)
-            self._log(session_id, normalized, response)
-            return response
-
-        intent = self.nlu.intent_by_id(chosen.intent_id)
-        if intent is None:
-            raise HTTPException(status_code=500, detail="Intent không tồn tại")
-        interruption = self.policy.should_interrupt(chosen, self.context.peek(session_id))
-        result = self.executor.execute_intent(session_id, intent, interruption)
-        response = self._build_response(session_id, result["reply"], result.get("ui", StepUI()), top_k, chosen)
-        self._log(session_id, normalized, response)
-        return response
-
-    # Helpers -----------------------------------------------------------
-    def _build_response(
-        self,
-        session_id: str,
-        reply: str,
-        ui: Any,
-        top_k: List[Candidate],
-        chosen: Optional[Candidate],
-    ) -> MessageResponse:
-        ui_model = self._normalize_ui(ui)
-        debug_top_k = [c.model_dump() for c in top_k]
-        debug_chosen = chosen.model_dump() if chosen else None
-        stack_depth = len(self.context.stack(session_id))
-        response = MessageResponse(
-            reply=reply,
-            ui=ui_model,
-            debug={
-                "top_k": debug_top_k,
-                "chosen": debug_chosen,
-                "stack_depth": stack_depth,
-            },
-        )
-        return response
-
-    def _normalize_ui(self, ui: Any) -> UIResponse:
-        if isinstance(ui, UIResponse):
-            return ui
-        if isinstance(ui, StepUI):
-            data = ui.model_dump()
-        elif isinstance(ui, dict):
-            data = dict(ui)
-        else:
-            data = {}
-        try:
-            return UIResponse.model_validate(data)
-        except ValidationError:
-            buttons_raw = data.get("buttons", []) if isinstance(data, dict) else []
-            media_raw = data.get("media", []) if isinstance(data, dict) else []
-            buttons: List[str] = []
-            if isinstance(buttons_raw, list):
-                for btn in buttons_raw:
-                    buttons.append(btn if isinstance(btn, str) else str(btn))
-            elif buttons_raw:
-                buttons = [str(buttons_raw)]
-            media: List[MediaResponse] = []
-            if isinstance(media_raw, list):
-                for item in media_raw:
-                    if isinstance(item, dict) and "url" in item:
-                        media.append(
-                            MediaResponse(
-                                type=str(item.get("type", "image") or "image"),
-                                url=str(item["url"]),
-                                alt=item.get("alt"),
-                            )
-                        )
-            return UIResponse(buttons=buttons, media=media)
-
-    def _log(self, session_id: str, message: str, response: MessageResponse) -> None:
-        self.repo.log_interaction(
-            session_id=session_id,
-            message=message,
-            reply=response.reply,
-            top_k=response.debug.get("top_k", []),
-            chosen=response.debug.get("chosen"),
-            stack_depth=response.debug.get("stack_depth", 0),
-        )
-
-    # Misc --------------------------------------------------------------
-    def list_intents(self, domain: Optional[str] = None) -> List[Dict[str, Any]]:
-        intents = self.nlu.all_intents()
-        if domain:
-            intents = [i for i in intents if i.domain == domain]
-        return [i.model_dump() for i in intents]
-
-    def context_state(self, session_id: str) -> ContextState:
-        return self.context.state(session_id)
-
-    def clear_context(self, session_id: str) -> None:
-        self.context.clear(session_id)
-
-    def set_logging(self, enabled: bool) -> None:
-        self.repo.set_enabled(enabled)
-
-
-service = ChatBrainService()
-app = FastAPI(title="ChatBrain API")
+app = FastAPI(title="ChatBrain API", lifespan=lifespan)
 
 static_dir = os.path.join(os.getcwd(), "static")
 app.mount("/static", StaticFiles(directory=static_dir), name="static")
 app.include_router(facebook_router)
 
 
+@app.exception_handler(ServiceError)
+async def service_error_handler(_: Request, exc: ServiceError) -> JSONResponse:
+    return JSONResponse(status_code=exc.status_code, content={"detail": exc.detail})
+
+
 @app.get("/healthz")
-async def healthz() -> Dict[str, str]:
+async def healthz() -> Dict[str, Any]:
+    return {"status": "ok", "ready": service.ready}
+
+
+@app.get("/healthz/live")
+async def healthz_live() -> Dict[str, str]:
+    # Liveness: tiến trình còn phục vụ HTTP, không quan tâm chỉ mục đã sẵn sàng chưa
     return {"status": "ok"}
 
 
+@app.get("/healthz/ready")
+async def healthz_ready() -> JSONResponse:
+    # Readiness: chỉ 200 sau khi dựng chỉ mục và warmup xong, để load balancer
+    # không chuyển traffic tới worker còn lạnh
+    body = {"status": service.state, "warmup": service.warmup_stats, "error": service.startup_error}
+    return JSONResponse(status_code=200 if service.ready else 503, content=body)
+
+
 @app.post("/load-scripts")
 async def load_scripts(body: LoadRequest) -> Dict[str, Any]:
     try:
-        result = service.load_scripts(body.folder)
+        # Dựng + warmup chỉ mục mới trong thread; chỉ mục cũ vẫn phục vụ tới lúc hoán đổi
+        result = await asyncio.to_thread(service.load_scripts, body.folder, body.activate)
     except ScriptLoaderError as exc:
         raise HTTPException(status_code=400, detail=str(exc)) from exc
     return {"message": "Đã nạp kịch bản", **result}
 
 
+@app.get("/versions")
+async def versions() -> Dict[str, Any]:
+    return service.versions()
+
+
+@app.post("/versions/{version}/activate")
+async def activate_version(version: str) -> Dict[str, Any]:
+    # Chỉ đổi con trỏ sang snapshot đã biên dịch: rollback tức thì, không dựng lại chỉ mục.
+    # Bản nạp trước khi có tenants.yaml còn phải biên dịch lớp phủ: chạy ngoài event loop.
+    return await asyncio.to_thread(service.activate, version)
+
+
+@app.put("/versions/split")
+async def split_versions(body: SplitRequest) -> Dict[str, Any]:
+    return service.set_split(body.weights)
+
+
+@app.get("/stats")
+async def stats(days: int = Query(default=7, ge=1, le=366), limit: int = Query(default=10, ge=1, le=100)) -> Dict[str, Any]:
+    # Chỉ đọc bảng rollup nhỏ, nhưng vẫn là I/O SQLite nên chạy ngoài event loop
+    return await asyncio.to_thread(service.stats, days, limit)
+
+
+@app.get("/sessions/stats")
+async def session_stats(x_tenant: Optional[str] = Header(default=None)) -> Dict[str, Any]:
+    return service.tenant(x_tenant).session_stats()
+
+
+@app.get("/tenants/stats")
+async def tenant_stats() -> Dict[str, Any]:
+    return service.tenant_stats()
+
+
+@app.get("/hooks/stats")
+async def hook_stats() -> Dict[str, Any]:
+    return service.hook_stats()
+
+
 @app.get("/intents")
-async def list_intents(domain: Optional[str] = None) -> List[Dict[str, Any]]:
-    return service.list_intents(domain)
+async def list_intents(domain: Optional[str] = None, x_tenant: Optional[str] = Header(default=None)) -> List[Dict[str, Any]]:
+    return service.tenant(x_tenant).list_intents(domain)
 
 
 @app.get("/context/{session_id}")
-async def get_context(session_id: str) -> ContextState:
-    return service.context_state(session_id)
+async def get_context(session_id: str, x_tenant: Optional[str] = Header(default=None)) -> ContextState:
+    return service.tenant(x_tenant).context_state(session_id)
 
 
 @app.post("/context/{session_id}/clear")
-async def clear_context(session_id: str) -> Dict[str, str]:
-    service.clear_context(session_id)
+async def clear_context(session_id: str, x_tenant: Optional[str] = Header(default=None)) -> Dict[str, str]:
+    service.tenant(x_tenant).clear_context(session_id)
     return {"message": "Đã xoá stack"}
 
 
 @app.post("/message")
-async def post_message(body: MessageRequest) -> MessageResponse:
-    return service.handle_message(body.session_id, body.message)
+async def post_message(
+    body: MessageRequest,
+    x_tenant: Optional[str] = Header(default=None),
+    x_page_id: Optional[str] = Header(default=None),
+) -> MessageResponse:
+    if not service.ready:
+        raise HTTPException(status_code=503, detail="Dịch vụ đang khởi động")
+    # Tenant chọn theo header X-Tenant, hoặc X-Page-Id do connector Messenger gửi kèm.
+    # Hook có thể chờ tới timeout của nó: chạy lượt ngoài event loop như /rank/batch.
+    target = service.tenant(x_tenant, x_page_id)
+    return await asyncio.to_thread(target.handle_message, body.session_id, body.message, body.prefetch)
+
+
+@app.post("/message/stream")
+async def stream_message(
+    body: MessageRequest,
+    x_tenant: Optional[str] = Header(default=None),
+    x_page_id: Optional[str] = Header(default=None),
+) -> StreamingResponse:
+    """Như ``/message`` nhưng trả Server-Sent Events: ``reply``, từng ``media``, rồi ``done``."""
+    if not service.ready:
+        raise HTTPException(status_code=503, detail="Dịch vụ đang khởi động")
+    # Xử lý trước khi mở stream để lỗi nghiệp vụ vẫn trả đúng mã HTTP; như /message,
+    # lượt chạy ngoài event loop vì hook có thể chờ tới timeout của nó
+    target = service.tenant(x_tenant, x_page_id)
+    response = await asyncio.to_thread(target.handle_message, body.session_id, body.message, body.prefetch)
+
+    async def events():
+        for name, data in message_events(response):
+            yield f"event: {name}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    # X-Accel-Buffering: nginx không gom sự kiện lại trước khi chuyển cho client
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(events(), media_type="text/event-stream", headers=headers)
+
+
+@app.post("/rank/batch")
+async def rank_batch(body: RankBatchRequest) -> Dict[str, Any]:
+    if not service.ready:
+        raise HTTPException(status_code=503, detail="Dịch vụ đang khởi động")
+    # Chấm điểm hàng loạt tốn CPU; chạy ngoài event loop để không chặn /message
+    return await asyncio.to_thread(service.rank_batch, body.texts, body.top_k)
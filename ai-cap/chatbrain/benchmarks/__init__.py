@@ -0,0 +1 @@
+"""Các script đo hiệu năng chạy tay: ``python -m chatbrain.benchmarks.<tên>``."""
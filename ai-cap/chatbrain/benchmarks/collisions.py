@@ -0,0 +1,69 @@
+"""Đo phân tích va chạm intent trên pack giả lập lớn (mặc định 10k intent).
+
+    python -m chatbrain.benchmarks.collisions --intents 10000 --tile 128
+
+In thời gian và đỉnh bộ nhớ Python (tracemalloc) để kiểm tra bộ nhớ tỉ lệ với ``tile``.
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import time
+import tracemalloc
+
+from chatbrain.core.collisions import intent_pairs, outranked_phrases
+from chatbrain.core.nlu import NLUIndex
+from chatbrain.core.schema import Intent, ScriptPack, Step
+
+WORDS = (
+    "đăng ký tạm trú thường trú thông báo lưu trú căn cước công dân định danh điện tử vneid tài khoản"
+    " mật khẩu xác nhận cư trú tách hộ chủ hộ xoá giấy tờ tích hợp bằng lái xe bảo hiểm y tế sổ sức khoẻ"
+).split()
+
+
+def synthetic_pack(n: int, seed: int = 7) -> ScriptPack:
+    rng = random.Random(seed)
+    intents = []
+    synonyms: list = []
+    for idx in range(n):
+        if idx % 100 != 1:
+            synonyms = [" ".join(rng.sample(WORDS, rng.randint(2, 5))) + f" m{idx}" for _ in range(3)]
+        # intent ngay sau mỗi intent thứ 100 dùng lại synonym của nó: va chạm cố ý
+        intents.append(
+            Intent(
+                id=f"intent_{idx}",
+                domain=f"d{idx % 20}",
+                version=1,
+                synonyms=synonyms,
+                steps=[Step(id="b1", say="x")],
+            )
+        )
+    return ScriptPack(intents=intents)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--intents", type=int, default=10_000)
+    parser.add_argument("--tile", type=int, default=128)
+    parser.add_argument("--threshold", type=float, default=0.8)
+    args = parser.parse_args()
+
+    nlu = NLUIndex(use_embedding=False, spell_correction=False)
+    nlu.build(synthetic_pack(args.intents))
+    tracemalloc.start()
+    started = time.perf_counter()
+    pairs = intent_pairs(nlu, args.threshold, args.tile)
+    pair_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    outranked = outranked_phrases(nlu, tile=args.tile)
+    phrase_seconds = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{args.intents} intent, tile {args.tile}")
+    print(f"cặp intent      : {pair_seconds:7.2f} s, {len(pairs)} cặp >= {args.threshold}")
+    print(f"synonym bị vượt : {phrase_seconds:7.2f} s, {len(outranked)} câu")
+    print(f"đỉnh bộ nhớ     : {peak / 2**20:7.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""So sánh các backend embedding: độ trễ encode, thông lượng và độ khớp xếp hạng.
+
+    python -m chatbrain.benchmarks.encoders --scripts knowledge_base/scripts \
+        --backends torch int8 onnx --onnx-dir models/minilm-onnx --threads 2
+
+    # xuất model ONNX một lần (cần torch + mạng hoặc cache model)
+    python -m chatbrain.benchmarks.encoders --export-onnx models/minilm-onnx
+
+Độ khớp được tính so với backend đầu tiên trong ``--backends``: tỉ lệ trùng top-1
+và tỉ lệ giao top-3 khi xếp hạng toàn bộ synonyms/examples của script pack.
+"""
+from __future__ import annotations
+
+import argparse
+import statistics
+import time
+from typing import Dict, List
+
+from chatbrain.core import loader
+from chatbrain.core.encoders import DEFAULT_MODEL, create_encoder, export_onnx
+from chatbrain.core.nlu import NLUIndex
+
+
+def _queries(pack) -> List[str]:
+    queries: List[str] = []
+    for intent in pack.intents:
+        queries.extend(intent.synonyms)
+        queries.extend(intent.examples)
+    return queries
+
+
+def _bench_backend(name: str, args, pack, queries: List[str]) -> Dict[str, object]:
+    model = args.onnx_dir if name == "onnx" else args.model
+    started = time.perf_counter()
+    encoder = create_encoder(name, model=model, threads=args.threads)
+    load_ms = (time.perf_counter() - started) * 1000
+
+    encoder.encode(queries[:4])  # warmup
+    latencies = []
+    for query in queries[: args.latency_samples]:
+        t0 = time.perf_counter()
+        encoder.encode([query])
+        latencies.append((time.perf_counter() - t0) * 1000)
+    t0 = time.perf_counter()
+    encoder.encode(queries, batch_size=args.batch_size)
+    throughput = len(queries) / max(time.perf_counter() - t0, 1e-9)
+
+    nlu = NLUIndex(use_embedding=True, embedder=encoder)
+    nlu.build(pack)
+    rankings = [[c.intent_id for c in nlu.rank(q, top_k=3)] for q in queries]
+    latencies.sort()
+    return {
+        "load_ms": load_ms,
+        "p50_ms": statistics.median(latencies),
+        "p95_ms": latencies[int(0.95 * (len(latencies) - 1))],
+        "throughput": throughput,
+        "rankings": rankings,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scripts", default="knowledge_base/scripts")
+    parser.add_argument("--backends", nargs="+", default=["torch", "int8"])
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--onnx-dir", default=None)
+    parser.add_argument("--threads", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--latency-samples", type=int, default=200)
+    parser.add_argument("--export-onnx", metavar="DIR", default=None)
+    args = parser.parse_args()
+
+    if args.export_onnx:
+        print(f"Đã xuất ONNX vào {export_onnx(args.model, args.export_onnx)}")
+        return
+
+    pack = loader.load_from_folder(args.scripts)
+    queries = _queries(pack)
+    results = {name: _bench_backend(name, args, pack, queries) for name in args.backends}
+    reference = results[args.backends[0]]["rankings"]
+
+    print(f"{len(queries)} câu, {len(pack.intents)} intents, threads={args.threads or 'mặc định'}")
+    print(f"{'backend':>8} {'nạp ms':>9} {'p50 ms':>8} {'p95 ms':>8} {'câu/s':>9} {'top1 khớp':>10} {'top3 giao':>10}")
+    for name, result in results.items():
+        rankings = result["rankings"]
+        top1 = sum(a[0] == b[0] for a, b in zip(rankings, reference)) / max(len(reference), 1)
+        top3 = sum(len(set(a) & set(b)) / 3 for a, b in zip(rankings, reference)) / max(len(reference), 1)
+        print(
+            f"{name:>8} {result['load_ms']:9.0f} {result['p50_ms']:8.2f} {result['p95_ms']:8.2f} "
+            f"{result['throughput']:9.0f} {top1:10.3f} {top3:10.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
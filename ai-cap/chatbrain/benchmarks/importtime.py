@@ -0,0 +1,75 @@
+"""Đo thời gian import bằng ``python -X importtime`` và kiểm tra ngân sách.
+
+    python -m chatbrain.benchmarks.importtime            # in báo cáo, exit 1 nếu vượt ngân sách
+    python -m chatbrain.benchmarks.importtime --top 20   # kèm 20 module tốn thời gian nhất
+
+Ngoài ngân sách thời gian (ms, cộng dồn), mỗi entry còn liệt kê các module nặng
+không được phép xuất hiện sau khi import; vi phạm này không phụ thuộc máy đo.
+"""
+from __future__ import annotations
+
+import argparse
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+HEAVY_MODULES = ("numpy", "rank_bm25", "sqlmodel", "sqlalchemy", "httpx", "torch", "sentence_transformers")
+
+# module -> (ngân sách ms, các module nặng bị cấm)
+BUDGETS: Dict[str, Tuple[float, Tuple[str, ...]]] = {
+    "chatbrain.service": (400.0, HEAVY_MODULES + ("fastapi", "yaml")),
+    "chatbrain.cli.menu": (400.0, HEAVY_MODULES + ("fastapi", "yaml")),
+    "chatbrain.app": (1000.0, HEAVY_MODULES),
+}
+
+_PROBE = "import sys; exec('import ' + sys.argv[1]); print(','.join(sorted(sys.modules)))"
+
+
+def measure(module: str) -> Tuple[float, List[Tuple[float, str]], List[str]]:
+    """Trả về (ms cộng dồn của ``module``, [(ms tự thân, tên)...], danh sách sys.modules)."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _PROBE, module],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    total_ms = 0.0
+    rows: List[Tuple[float, str]] = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        name = name.strip()
+        rows.append((int(self_us) / 1000, name))
+        if name == module:
+            total_ms = int(cumulative_us) / 1000
+    loaded = proc.stdout.strip().split(",")
+    return total_ms, rows, loaded
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("modules", nargs="*", default=list(BUDGETS))
+    parser.add_argument("--top", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="lấy giá trị nhỏ nhất qua N lần đo")
+    args = parser.parse_args()
+
+    failed = False
+    for module in args.modules:
+        budget_ms, forbidden = BUDGETS.get(module, (float("inf"), ()))
+        runs = [measure(module) for _ in range(max(1, args.repeat))]
+        total_ms, rows, loaded = min(runs, key=lambda run: run[0])
+        leaked = sorted(name for name in forbidden if name in loaded)
+        over = total_ms > budget_ms
+        failed = failed or over or bool(leaked)
+        status = "OK" if not (over or leaked) else "FAIL"
+        print(f"[{status}] {module}: {total_ms:.1f} ms (ngân sách {budget_ms:.0f} ms)")
+        if leaked:
+            print(f"       module nặng bị import sớm: {', '.join(leaked)}")
+        for self_ms, name in sorted(rows, reverse=True)[: args.top]:
+            print(f"       {self_ms:8.2f} ms  {name}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Thời gian khôi phục phiên từ snapshot + nhật ký.
+
+    python -m chatbrain.benchmarks.journal --sessions 1000000 --tail 200000
+
+Tạo ``--sessions`` phiên (mỗi phiên một frame, một phần có frame chen ngang và cờ
+chờ quay lại), chụp snapshot, ghi thêm ``--tail`` thay đổi (sang bước, pop, clear),
+đóng nhật ký như tiến trình chết rồi đo thời gian một ``ContextManager`` mới dựng lại
+toàn bộ và kiểm tra trạng thái khớp.
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from chatbrain.core.context import ContextManager
+from chatbrain.core.schema import ContextFrame
+from chatbrain.storage.journal import Journal
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=1_000_000)
+    parser.add_argument("--tail", type=int, default=200_000)
+    parser.add_argument("--dir", default=None, help="Thư mục nhật ký (mặc định: thư mục tạm)")
+    parser.add_argument("--seed", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    directory = args.dir or tempfile.mkdtemp(prefix="chatbrain-journal-")
+    template = ContextFrame(script_file="01_vneid.yaml", intent_id="cai_va_kich_hoat_vneid", domain="vneid",
+                            step_id="b1", step_index=0, version=1)
+    journal = Journal(directory, snapshot_records=0)
+    context = ContextManager(max_depth=2, ttl=0, max_sessions=args.sessions)
+    context.attach_journal(journal)
+
+    started = time.perf_counter()
+    for idx in range(args.sessions):
+        session_id = f"psid-{idx}"
+        context.push(session_id, template.model_copy())
+        if idx % 10 == 0:
+            context.push(session_id, template.model_copy(update={"intent_id": "quen_mat_khau_vneid", "interruption": True}))
+            context.pop(session_id)
+            context.set_pending_resume(session_id, template.intent_id)
+    journal.flush()
+    write_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    journal.snapshot()
+    snapshot_s = time.perf_counter() - started
+
+    for _ in range(args.tail):
+        session_id = f"psid-{rng.randrange(args.sessions)}"
+        roll = rng.random()
+        frame = context.peek(session_id)
+        if frame is None or roll < 0.05:
+            context.push(session_id, template.model_copy())
+        elif roll < 0.9:
+            frame.step_index += 1
+            frame.step_id = f"b{frame.step_index + 1}"
+            context.record_step(session_id, frame)
+        elif roll < 0.97:
+            context.pop(session_id)
+        else:
+            context.clear(session_id)
+    journal.close()
+    size_mb = sum(p.stat().st_size for p in Path(directory).iterdir()) / 1e6
+
+    recovered = ContextManager(max_depth=2, ttl=0, max_sessions=args.sessions)
+    started = time.perf_counter()
+    count = recovered.restore(Journal(directory))
+    restore_s = time.perf_counter() - started
+
+    mismatches = sum(
+        context.state(sid).model_dump() != recovered.state(sid).model_dump()
+        for sid in (f"psid-{rng.randrange(args.sessions)}" for _ in range(10_000))
+    )
+    print(f"{args.sessions} phiên: ghi {write_s:.1f} s, snapshot {snapshot_s:.1f} s, thư mục {size_mb:.0f} MB")
+    print(f"khôi phục {count} phiên (snapshot + {args.tail} bản ghi đuôi): {restore_s:.1f} s")
+    print(f"lệch trạng thái trên 10000 phiên mẫu: {mismatches}")
+
+
+if __name__ == "__main__":
+    main()
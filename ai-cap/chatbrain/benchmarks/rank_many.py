@@ -0,0 +1,55 @@
+"""So sánh ``NLUIndex.rank`` từng câu với ``rank_many`` trên log giả lập.
+
+    python -m chatbrain.benchmarks.rank_many --scripts knowledge_base/scripts --lines 100000
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import time
+
+from chatbrain.core import loader
+from chatbrain.core.nlu import NLUIndex
+
+
+def synthetic_log(pack, lines: int, seed: int = 7) -> list:
+    rng = random.Random(seed)
+    phrases = [p for intent in pack.intents for p in intent.synonyms + intent.examples]
+    vocab = sorted({token for phrase in phrases for token in phrase.lower().split()})
+    log = []
+    for _ in range(lines):
+        if rng.random() < 0.6:
+            log.append(rng.choice(phrases))
+        else:
+            log.append(" ".join(rng.choice(vocab) for _ in range(rng.randint(1, 6))))
+    return log
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scripts", default="knowledge_base/scripts")
+    parser.add_argument("--lines", type=int, default=100_000)
+    parser.add_argument("--loop-sample", type=int, default=5_000, help="số câu đo với rank() từng câu")
+    args = parser.parse_args()
+
+    nlu = NLUIndex()
+    nlu.build(loader.load_from_folder(args.scripts))
+    log = synthetic_log(nlu.script_pack, args.lines)
+
+    sample = log[: args.loop_sample]
+    started = time.perf_counter()
+    for text in sample:
+        nlu.rank(text)
+    loop_rate = len(sample) / (time.perf_counter() - started)
+
+    started = time.perf_counter()
+    result = nlu.rank_many(log, top_k=3)
+    bulk_seconds = time.perf_counter() - started
+
+    print(f"{len(nlu.script_pack.intents)} intents, {len(log)} câu ({len(set(log))} khác nhau)")
+    print(f"rank() từng câu : {loop_rate:10.0f} câu/s  (ước tính {len(log) / loop_rate:7.1f} s cho toàn bộ log)")
+    print(f"rank_many()     : {len(log) / bulk_seconds:10.0f} câu/s  ({bulk_seconds:7.2f} s), shape {result.indices.shape}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""Bộ nhớ trạng thái phiên khi có rất nhiều người gửi một lần.
+
+    python -m chatbrain.benchmarks.sessions --senders 1000000 --max-sessions 100000
+
+Mỗi người gửi mở một quy trình (push một frame) rồi bỏ đi; một phần nhỏ bị ngắt
+ngang để có cờ chờ quay lại. In số phiên, ước lượng bộ nhớ của ``ContextManager``
+và bộ nhớ Python thực cấp phát (tracemalloc) theo từng mốc: với ``MAX_SESSIONS``
+các con số phải đứng yên sau khi đạt trần.
+"""
+from __future__ import annotations
+
+import argparse
+import time
+import tracemalloc
+
+from chatbrain.core.context import ContextManager
+from chatbrain.core.schema import ContextFrame
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--senders", type=int, default=1_000_000)
+    parser.add_argument("--max-sessions", type=int, default=100_000)
+    parser.add_argument("--checkpoints", type=int, default=5)
+    args = parser.parse_args()
+
+    context = ContextManager(max_depth=2, ttl=3600, max_sessions=args.max_sessions)
+    template = ContextFrame(script_file="01_vneid.yaml", intent_id="cai_va_kich_hoat_vneid", domain="vneid",
+                            step_id="b1", step_index=0, version=1)
+    every = max(1, args.senders // args.checkpoints)
+    tracemalloc.start()
+    started = time.perf_counter()
+    print(f"{'người gửi':>10} {'phiên':>8} {'ước lượng MB':>13} {'tracemalloc MB':>15} {'bị đẩy ra':>10}")
+    for idx in range(1, args.senders + 1):
+        session_id = f"psid-{idx}"
+        context.push(session_id, template.model_copy())
+        if idx % 10 == 0:
+            context.push(session_id, template.model_copy(update={"interruption": True}))
+            context.pop(session_id)
+            context.set_pending_resume(session_id, template.intent_id)
+        if idx % every == 0:
+            stats = context.stats()
+            current, _ = tracemalloc.get_traced_memory()
+            print(f"{idx:>10} {stats['sessions']:>8} {stats['approx_bytes'] / 1e6:13.1f} "
+                  f"{current / 1e6:15.1f} {stats['evicted']:>10}")
+    elapsed = time.perf_counter() - started
+    print(f"{args.senders / elapsed:,.0f} phiên/giây (gồm cả thời gian đo)")
+
+
+if __name__ == "__main__":
+    main()
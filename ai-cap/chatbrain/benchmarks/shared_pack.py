@@ -0,0 +1,53 @@
+"""So sánh thời gian khởi động và RSS của một worker: dựng chỉ mục từ YAML vs memmap.
+
+    python -m chatbrain.benchmarks.shared_pack --scripts knowledge_base/scripts
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+
+_CHILD = """
+import json, resource, sys, time
+start = time.perf_counter()
+from chatbrain.core.nlu import NLUIndex
+from chatbrain.core import loader, shared
+nlu = NLUIndex()
+if sys.argv[1] == "yaml":
+    nlu.build(loader.load_from_folder(sys.argv[2]))
+else:
+    shared.load_index(nlu, sys.argv[2])
+elapsed = time.perf_counter() - start
+nlu.rank("kích hoạt vneid")
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({"startup_ms": elapsed * 1000, "max_rss_mb": rss_kb / 1024}))
+"""
+
+
+def _run(mode: str, target: str) -> dict:
+    out = subprocess.run([sys.executable, "-c", _CHILD, mode, target], check=True, capture_output=True, text=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scripts", default="knowledge_base/scripts")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    from chatbrain.serve import build_shared
+
+    with tempfile.TemporaryDirectory() as shared_dir:
+        build_shared(args.scripts, shared_dir)
+        for mode, target in (("yaml", args.scripts), ("shared", shared_dir)):
+            runs = [_run(mode, target) for _ in range(args.workers)]
+            startup = sum(r["startup_ms"] for r in runs) / len(runs)
+            rss = sum(r["max_rss_mb"] for r in runs) / len(runs)
+            print(f"{mode:>6}: khởi động TB {startup:8.1f} ms | RSS TB {rss:7.1f} MB | x{args.workers} worker")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Đo lợi ích độ chính xác và chi phí độ trễ của bước sửa lỗi gõ.
+
+    python -m chatbrain.benchmarks.spelling --scripts knowledge_base/scripts
+
+Dùng tập đánh giá tự sinh của ``core/evaluation.py`` (nhóm ``noisy`` gồm câu
+không dấu, gõ sai, thêm từ đệm) và so sánh chỉ mục bật/tắt ``SPELL_CORRECTION``.
+"""
+from __future__ import annotations
+
+import argparse
+import time
+
+from chatbrain.core import evaluation, loader
+from chatbrain.core.nlu import NLUIndex, _tokenize
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scripts", default="knowledge_base/scripts")
+    parser.add_argument("--noise", type=int, default=4)
+    parser.add_argument("--threshold", type=float, default=0.55)
+    parser.add_argument("--seed", type=int, default=13)
+    args = parser.parse_args()
+
+    pack = loader.load_from_folder(args.scripts)
+    index_pack, samples = evaluation.seed_dataset(pack, holdout=0.2, noise=args.noise, seed=args.seed)
+    NLUIndex(use_embedding=False).build(index_pack)  # trả trước chi phí import lần đầu
+    reports = {}
+    for enabled in (False, True):
+        nlu = NLUIndex(use_embedding=False, spell_correction=enabled)
+        started = time.perf_counter()
+        nlu.build(index_pack)
+        build_ms = (time.perf_counter() - started) * 1000
+        cache = evaluation.score_samples(nlu, samples, latency_samples=500)
+        reports[enabled] = (evaluation.evaluate(nlu, cache, args.threshold), build_ms, nlu)
+
+    print(f"{len(samples)} câu, {len(index_pack.intents)} intents, ngưỡng {args.threshold:.2f}")
+    print(f"{'sửa lỗi':>8} {'dựng ms':>8} {'nhóm':>8} {'top-1':>7} {'fallback':>9} {'p50 ms':>7} {'p95 ms':>7}")
+    for enabled, (report, build_ms, _) in reports.items():
+        latency = report["latency"]
+        for split, stats in report["by_split"].items():
+            print(
+                f"{'bật' if enabled else 'tắt':>8} {build_ms:8.1f} {split:>8} {stats['top1']:7.3f}"
+                f" {stats['fallback_rate']:9.3f} {latency['rank_p50_ms']:7.3f} {latency['rank_p95_ms']:7.3f}"
+            )
+
+    # Chi phí tra cứu thuần cho các token ngoài vocab, lần đầu (không cache) và lặp lại
+    spelling = reports[True][2].spelling
+    vocab = reports[True][2].compiled_arrays()["vocab"]
+    unknown = sorted({t for s in samples for t in _tokenize(s.text) if t not in vocab})
+    spelling.clear_cache()
+    started = time.perf_counter()
+    for token in unknown:
+        spelling.correct_token(token)
+    cold_us = (time.perf_counter() - started) * 1e6 / max(len(unknown), 1)
+    started = time.perf_counter()
+    for token in unknown:
+        spelling.correct_token(token)
+    warm_us = (time.perf_counter() - started) * 1e6 / max(len(unknown), 1)
+    print(f"{len(unknown)} token ngoài vocab: {cold_us:.1f} µs/token lần đầu, {warm_us:.2f} µs/token khi đã cache")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""Báo cặp intent dễ nhầm và synonym bị intent khác vượt điểm, trước khi deploy.
+
+    python -m chatbrain collisions --registry registry.yaml
+    python -m chatbrain collisions --scripts knowledge_base/scripts --threshold 0.5 --json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from typing import List, Optional
+
+from ..core import loader, registry
+from ..core.collisions import find_collisions
+from ..core.nlu import NLUIndex
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--scripts", default="knowledge_base/scripts")
+    source.add_argument("--registry")
+    parser.add_argument("--threshold", type=float, default=0.6, help="Ngưỡng tương đồng để báo một cặp intent")
+    parser.add_argument("--top", type=int, default=3, help="Số intent vượt điểm liệt kê cho mỗi synonym")
+    parser.add_argument("--tile", type=int, default=128, help="Số dòng mỗi khối ma trận")
+    parser.add_argument("--limit", type=int, default=30, help="Số dòng tối đa in ra mỗi phần")
+    parser.add_argument("--json", action="store_true")
+    parser.add_argument("--fail", action="store_true", help="Exit 1 nếu có va chạm")
+    args = parser.parse_args(argv)
+
+    pack = registry.load_registry(args.registry) if args.registry else loader.load_from_folder(args.scripts)
+    nlu = NLUIndex()
+    nlu.build(pack)
+    report = find_collisions(nlu, threshold=args.threshold, top=args.top, tile=args.tile)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False))
+    else:
+        print(
+            f"{report['intents']} intent | {len(report['pairs'])} cặp >= {args.threshold}"
+            f" | {len(report['outranked'])} synonym bị vượt | {report['seconds']} s"
+        )
+        for pair in report["pairs"][: args.limit]:
+            embed = "" if pair["embed"] is None else f" embed {pair['embed']:.3f}"
+            scope = "" if pair["same_domain"] else " (khác domain)"
+            print(f"  {pair['score']:.3f}  {pair['a']} ~ {pair['b']}  bm25 {pair['bm25']:.3f}{embed}{scope}")
+        for item in report["outranked"][: args.limit]:
+            above = ", ".join(f"{o['intent']} {o['score']:.3f}" for o in item["outranked_by"])
+            print(f"  '{item['phrase']}' ({item['intent']} {item['own_score']:.3f}) < {above}")
+    if args.fail and (report["pairs"] or report["outranked"]):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
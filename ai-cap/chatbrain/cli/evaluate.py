@@ -0,0 +1,126 @@
+"""Đánh giá NLU offline và quét ngưỡng / trọng số trộn.
+
+    # tự sinh tập đánh giá từ synonyms/examples (20% held-out + 2 biến thể nhiễu mỗi câu)
+    python -m chatbrain.cli.evaluate --scripts knowledge_base/scripts
+
+    # dùng file có nhãn (JSONL: {"text": ..., "intent": ..., "split": ...})
+    python -m chatbrain.cli.evaluate --scripts knowledge_base/scripts --data labelled.jsonl
+
+    # lưu tập vừa sinh để chỉnh tay / tái sử dụng
+    python -m chatbrain.cli.evaluate --seed-out labelled.jsonl
+
+    # so sánh cách chuẩn hoá và fit calibration, ghi calibration.json cạnh script pack
+    python -m chatbrain.cli.evaluate --data labelled.jsonl --fusion rrf --fit-calibration
+"""
+from __future__ import annotations
+
+import argparse
+import json
+from typing import List, Optional
+
+from ..core import evaluation, loader
+from ..core.fusion import METHODS, Fusion, write_calibration
+from ..core.nlu import NLUIndex
+from ..core.policy import Policy
+
+
+def _float_list(raw: str) -> List[float]:
+    if ":" in raw:
+        start, stop, step = (float(part) for part in raw.split(":"))
+        values = []
+        current = start
+        while current <= stop + 1e-9:
+            values.append(round(current, 6))
+            current += step
+        return values
+    return [float(part) for part in raw.split(",") if part.strip()]
+
+
+def _print_report(report: dict) -> None:
+    print(
+        f"Mẫu: {report['samples']} | ngưỡng {report['threshold']:.2f} | BM25 weight {report['bm25_weight']:.2f}"
+    )
+    print(
+        f"top-1 {report['top1']:.3f} | top-3 {report['top3']:.3f} | fallback {report['fallback_rate']:.3f}"
+        f" | đúng & chấp nhận {report['accepted_accuracy']:.3f}"
+    )
+    for split, stats in report["by_split"].items():
+        print(
+            f"  {split:<8} n={stats['samples']:<5} top-1 {stats['top1']:.3f}"
+            f" top-3 {stats['top3']:.3f} fallback {stats['fallback_rate']:.3f}"
+        )
+    latency = report["latency"]
+    print(
+        f"Độ trễ rank(): p50 {latency['rank_p50_ms']:.2f} ms, p95 {latency['rank_p95_ms']:.2f} ms |"
+        f" hàng loạt {latency['bulk_per_query_us']:.1f} µs/câu"
+    )
+    print("Ma trận nhầm lẫn theo domain (dòng = đúng, cột = dự đoán):")
+    columns = sorted({col for row in report["confusion"].values() for col in row})
+    print("  " + " " * 14 + "".join(f"{col[:12]:>13}" for col in columns))
+    for domain, row in sorted(report["confusion"].items()):
+        print(f"  {domain[:14]:<14}" + "".join(f"{row.get(col, 0):>13}" for col in columns))
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Đánh giá NLU offline")
+    parser.add_argument("--scripts", default="knowledge_base/scripts")
+    parser.add_argument("--data", help="File JSONL có nhãn; bỏ trống để tự sinh từ script pack")
+    parser.add_argument("--seed-out", help="Ghi tập tự sinh ra file JSONL")
+    parser.add_argument("--holdout", type=float, default=0.2)
+    parser.add_argument("--noise", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=13)
+    parser.add_argument("--threshold", type=float, default=None, help="Mặc định: CONF_THRESHOLD")
+    parser.add_argument("--thresholds", default="0.30:0.90:0.05", help="start:stop:step hoặc a,b,c")
+    parser.add_argument("--weights", default="0.4,0.5,0.6,0.7,0.8,1.0", help="Trọng số BM25 khi có embedding")
+    parser.add_argument("--fusion", choices=METHODS, default=None, help="Mặc định: FUSION_METHOD")
+    parser.add_argument(
+        "--fit-calibration",
+        action="store_true",
+        help="Fit calibration trên tập đánh giá và ghi calibration.json vào --scripts",
+    )
+    parser.add_argument("--json", action="store_true", help="In kết quả dạng JSON")
+    args = parser.parse_args(argv)
+
+    pack = loader.load_from_folder(args.scripts)
+    if args.fit_calibration:
+        # Fit trên điểm thô, không chồng lên calibration cũ
+        pack = pack.model_copy(update={"calibration": None})
+    if args.data:
+        index_pack, samples = pack, evaluation.read_samples(args.data)
+    else:
+        index_pack, samples = evaluation.seed_dataset(pack, args.holdout, args.noise, args.seed)
+        if args.seed_out:
+            evaluation.write_samples(args.seed_out, samples)
+
+    nlu = NLUIndex(fusion=Fusion(args.fusion))
+    nlu.build(index_pack)
+    threshold = Policy().threshold if args.threshold is None else args.threshold
+    cache = evaluation.score_samples(nlu, samples)
+    report = evaluation.evaluate(nlu, cache, threshold)
+    grid = evaluation.sweep(nlu, cache, _float_list(args.thresholds), _float_list(args.weights))
+    calibration = evaluation.fit_calibration(nlu, cache) if args.fit_calibration else None
+    if calibration is not None:
+        write_calibration(args.scripts, calibration)
+
+    if args.json:
+        print(json.dumps({"report": report, "sweep": grid, "calibration": calibration}, ensure_ascii=False, indent=2))
+        return
+    print(f"Chuẩn hoá: {nlu.fusion.method}")
+    _print_report(report)
+    print("\nQuét ngưỡng (BM25 weight, ngưỡng -> đúng & chấp nhận / fallback / chấp nhận sai):")
+    for row in grid:
+        print(
+            f"  w={row['bm25_weight']:.2f} t={row['threshold']:.2f} -> {row['accepted_accuracy']:.3f}"
+            f" / {row['fallback_rate']:.3f} / {row['wrong_accept_rate']:.3f}"
+        )
+    best = max(grid, key=lambda row: (row["accepted_accuracy"], -row["wrong_accept_rate"]))
+    print(f"Tốt nhất: BM25 weight {best['bm25_weight']:.2f}, ngưỡng {best['threshold']:.2f}")
+    if calibration is not None:
+        print(
+            f"Calibration: sigmoid({calibration['a']:.3f} * x + {calibration['b']:.3f})"
+            f" trên {calibration['samples']} mẫu -> {args.scripts}/calibration.json"
+        )
+
+
+if __name__ == "__main__":  # pragma: no cover - entry CLI
+    main()
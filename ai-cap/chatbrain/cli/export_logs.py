@@ -0,0 +1,39 @@
+"""Xuất log hội thoại sang Parquet (cần pyarrow) hoặc CSV gzip theo lô.
+
+    python -m chatbrain.cli.export_logs --db chatbrain_logs.db --out exports/
+    python -m chatbrain.cli.export_logs --format csv --since 2026-10-01 --until 2026-10-08
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+
+from ..storage.export import FORMATS, export_logs
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=os.getenv("SQLITE_PATH", "chatbrain_logs.db"))
+    parser.add_argument("--out", default="exports")
+    parser.add_argument("--format", choices=FORMATS, default=None, help="Mặc định: parquet nếu có pyarrow")
+    parser.add_argument("--batch-size", type=int, default=50_000)
+    parser.add_argument("--chunk-rows", type=int, default=500_000, help="Số dòng tối đa mỗi file CSV")
+    parser.add_argument("--since", help="Ngày bắt đầu YYYY-MM-DD (tính cả ngày này)")
+    parser.add_argument("--until", help="Ngày kết thúc YYYY-MM-DD (không tính)")
+    args = parser.parse_args()
+
+    result = export_logs(
+        args.db,
+        args.out,
+        fmt=args.format,
+        batch_size=args.batch_size,
+        since=args.since,
+        until=args.until,
+        chunk_rows=args.chunk_rows,
+    )
+    print(json.dumps(result, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Lint script pack: đồ thị bước/nút, synonym mơ hồ, ảnh thiếu/quá nặng.
+
+    python -m chatbrain lint registry.yaml
+    python -m chatbrain lint knowledge_base/scripts --json --graph graph.json
+    python -m chatbrain lint registry.yaml --strict      # cảnh báo cũng trả exit 1
+
+Nhãn nút được giải bằng chỉ mục BM25 như lúc chạy (``--no-nlu``: chỉ khớp đúng cụm).
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+from typing import List, Optional
+
+from ..core.lint import Resolver, lint_path
+from ..core.schema import ScriptPack
+
+
+def nlu_resolver(pack: ScriptPack) -> Resolver:
+    """Giải nhãn nút giống ``ChatBrainService._resolve_label`` (chỉ BM25, không embedding)."""
+    from ..core.nlu import NLUIndex
+    from ..core.policy import Policy
+
+    if not pack.intents:
+        return lambda label: None
+    nlu = NLUIndex(use_embedding=False, spell_correction=False)
+    nlu.build(pack)
+    policy = Policy()
+
+    def resolve(label: str) -> Optional[str]:
+        chosen = policy.choose(nlu.rank(label), None)
+        return None if policy.is_below_threshold(chosen) else chosen.intent_id
+
+    return resolve
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "path",
+        nargs="?",
+        default=os.getenv("CHATBRAIN_REGISTRY") or os.getenv("CHATBRAIN_DEFAULT_SCRIPTS", "knowledge_base/scripts"),
+        help="Thư mục kịch bản hoặc registry.yaml",
+    )
+    parser.add_argument("--assets", help="Thư mục ảnh (mặc định knowledge_base/assets)")
+    parser.add_argument("--max-image-kb", type=float, default=None)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--no-nlu", action="store_true", help="Giải nhãn nút bằng khớp đúng cụm")
+    parser.add_argument("--json", action="store_true", help="In kết quả dạng JSON")
+    parser.add_argument("--graph", help="Ghi đồ thị bước -> bước (JSON) ra file")
+    parser.add_argument("--strict", action="store_true", help="Cảnh báo cũng làm lint thất bại")
+    args = parser.parse_args(argv)
+
+    report = lint_path(
+        args.path,
+        assets=args.assets,
+        resolve=None if args.no_nlu else nlu_resolver,
+        max_image_kb=args.max_image_kb,
+        workers=args.workers,
+    )
+    if args.graph:
+        with open(args.graph, "w", encoding="utf-8") as handle:
+            json.dump(report.edges, handle, ensure_ascii=False)
+    if args.json:
+        print(
+            json.dumps(
+                {"summary": report.summary(), "issues": [issue._asdict() for issue in report.issues]},
+                ensure_ascii=False,
+            )
+        )
+    else:
+        for issue in report.issues:
+            print(issue.format())
+        print(json.dumps(report.summary(), ensure_ascii=False))
+    failed = report.errors or (args.strict and report.warnings)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,23 @@
+"""CLI quản lý ChatBrain.
+
+    python -m chatbrain.cli.menu                                   # menu tương tác
+    python -m chatbrain.cli.menu replay hoi_thoai.jsonl --registry registry.yaml
+    python -m chatbrain.cli.menu replay hoi_thoai.jsonl --profile sample --profile-out replay.folded
+
+``replay`` đọc từng dòng JSONL ``{"session_id", "message", "intent"?, "reply"?, "step"?}``,
+gửi qua ``service.handle_message`` và so với kỳ vọng: ``intent`` khớp đúng (``null`` là
+fallback), ``reply`` là chuỗi con của câu trả lời, ``step`` khớp ``intent#step``.
+"""
 from __future__ import annotations
 
+import argparse
 import json
-from typing import Optional
+import sys
+import time
+from array import array
+from typing import Any, Dict, Iterator, Optional, Tuple
 
-from ..app import BUTTON_LABELS, service
+from ..service import ServiceError, service
 
 
 def prompt(text: str) -> str:
@@ -68,8 +82,10 @@ def simulate_chat() -> None:
                 buttons = ui.get("buttons")
         if buttons:
             print("Nút gợi ý:", ", ".join(buttons))
-        print("Top-k:", json.dumps(response.debug.get("top_k", []), ensure_ascii=False, indent=2))
-        print("Đang chọn:", json.dumps(response.debug.get("chosen"), ensure_ascii=False))
+        top_k = response.debug.get("top_k", [])
+        print("Top-k:", " | ".join(f"{c['intent_id']} {c['score']:.3f}" for c in top_k) or "-")
+        chosen = response.debug.get("chosen")
+        print("Đang chọn:", f"{chosen['intent_id']} {chosen['score']:.3f}" if chosen else "-")
         print("Độ sâu stack:", response.debug.get("stack_depth"))
 
 
@@ -80,7 +96,111 @@ def toggle_logging() -> None:
     print(f"Đã {status} ghi log.")
 
 
-def main() -> None:
+def _turns(path: str) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    with open(path, encoding="utf-8") as handle:
+        for line_no, line in enumerate(handle, 1):
+            if line.strip():
+                yield line_no, json.loads(line)
+
+
+def _intent_of(debug: Dict[str, Any]) -> Optional[str]:
+    chosen = debug.get("chosen")
+    if chosen:
+        return chosen["intent_id"]
+    step = debug.get("step")
+    return step.split("#", 1)[0] if step else None
+
+
+def _percentile(sorted_values: Any, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def _mismatches(turn: Dict[str, Any], reply: str, debug: Dict[str, Any]) -> Dict[str, Any]:
+    found: Dict[str, Any] = {}
+    if "intent" in turn and _intent_of(debug) != turn["intent"]:
+        found["intent"] = _intent_of(debug)
+    if turn.get("reply") and turn["reply"] not in reply:
+        found["reply"] = reply
+    if "step" in turn and debug.get("step") != turn["step"]:
+        found["step"] = debug.get("step")
+    return found
+
+
+def replay(path: str, max_failures: int = 20) -> Dict[str, Any]:
+    """Chạy lại một file hội thoại JSONL, in các lượt sai (một dòng JSON mỗi lượt) và trả tổng kết."""
+    latencies = array("d")
+    failures = errors = 0
+    handle = service.handle_message
+    clock = time.perf_counter
+    started = clock()
+    for line_no, turn in _turns(path):
+        session_id = str(turn.get("session_id", "replay"))
+        before = clock()
+        try:
+            response = handle(session_id, turn.get("message", ""))
+        except ServiceError as exc:
+            errors += 1
+            if errors + failures <= max_failures:
+                print(json.dumps({"line": line_no, "error": exc.detail}, ensure_ascii=False))
+            continue
+        latencies.append(clock() - before)
+        found = _mismatches(turn, response.reply, response.debug)
+        if found:
+            failures += 1
+            if errors + failures <= max_failures:
+                print(json.dumps({"line": line_no, "got": found}, ensure_ascii=False))
+    elapsed = clock() - started
+    ordered = sorted(latencies)
+    turns = len(latencies) + errors
+    return {
+        "turns": turns,
+        "failures": failures,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "turns_per_second": round(turns / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(_percentile(ordered, 0.50) * 1000, 3),
+        "p95_ms": round(_percentile(ordered, 0.95) * 1000, 3),
+        "p99_ms": round(_percentile(ordered, 0.99) * 1000, 3),
+    }
+
+
+def replay_command(args: argparse.Namespace) -> int:
+    if args.registry:
+        service.load_registry(args.registry)
+    elif args.scripts:
+        service.load_scripts(args.scripts)
+    else:
+        service.startup()
+    if args.profile == "cprofile":
+        import cProfile
+        import pstats
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        summary = replay(args.file, args.max_failures)
+        profiler.disable()
+        out = args.profile_out or "replay.prof"
+        profiler.dump_stats(out)
+        pstats.Stats(profiler, stream=sys.stderr).sort_stats("cumulative").print_stats(20)
+        summary["profile"] = out
+    elif args.profile == "sample":
+        from .profiling import StackSampler
+
+        with StackSampler(interval=args.interval / 1000) as sampler:
+            summary = replay(args.file, args.max_failures)
+        out = args.profile_out or "replay.folded"
+        summary["samples"] = sampler.write_folded(out)
+        summary["profile"] = out
+    else:
+        summary = replay(args.file, args.max_failures)
+    print(json.dumps(summary, ensure_ascii=False))
+    return 1 if summary["failures"] or summary["errors"] else 0
+
+
+def interactive() -> None:
+    service.startup()
     actions = {
         "1": reload_scripts,
         "2": list_intents,
@@ -106,5 +226,24 @@ def main() -> None:
             print("Lựa chọn không hợp lệ.")
 
 
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command")
+    replay_parser = commands.add_parser("replay", help="Chạy lại hội thoại JSONL, kiểm tra kỳ vọng và đo thông lượng")
+    replay_parser.add_argument("file")
+    replay_parser.add_argument("--registry", help="Nạp registry.yaml thay vì cấu hình mặc định")
+    replay_parser.add_argument("--scripts", help="Nạp thư mục kịch bản thay vì cấu hình mặc định")
+    replay_parser.add_argument("--profile", choices=("cprofile", "sample"))
+    replay_parser.add_argument(
+        "--profile-out", help="File kết quả (mặc định replay.prof cho cprofile, replay.folded cho sample)"
+    )
+    replay_parser.add_argument("--interval", type=float, default=1.0, help="Chu kỳ lấy mẫu (ms)")
+    replay_parser.add_argument("--max-failures", type=int, default=20, help="Số lượt sai tối đa được in")
+    args = parser.parse_args(argv)
+    if args.command == "replay":
+        sys.exit(replay_command(args))
+    interactive()
+
+
 if __name__ == "__main__":  # pragma: no cover - entry CLI
     main()
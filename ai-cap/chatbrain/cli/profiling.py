@@ -0,0 +1,63 @@
+"""Profiler lấy mẫu ngăn xếp, ghi ra dạng "folded" cho flamegraph.
+
+Luồng nền đọc ``sys._current_frames()`` của luồng đích mỗi ``interval`` giây và đếm
+từng ngăn xếp. File kết quả mỗi dòng là ``hàm_ngoài;...;hàm_trong số_mẫu``, đọc được
+bằng ``flamegraph.pl``, speedscope hoặc ``inferno-flamegraph``.
+"""
+from __future__ import annotations
+
+import sys
+import threading
+from collections import Counter
+from pathlib import Path
+from types import FrameType
+from typing import List, Optional
+
+
+def _label(frame: FrameType) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    def __init__(self, interval: float = 0.001, thread_id: Optional[int] = None) -> None:
+        self.interval = interval
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def __enter__(self) -> "StackSampler":
+        self.start()
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.stop()
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="chatbrain-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack: List[str] = []
+            while frame is not None:
+                stack.append(_label(frame))
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def write_folded(self, path: str) -> int:
+        """Ghi ngăn xếp dạng folded; trả số mẫu."""
+        with open(path, "w", encoding="utf-8") as handle:
+            for stack, count in self.samples.most_common():
+                handle.write(f"{stack} {count}\n")
+        return sum(self.samples.values())
@@ -1,16 +1,17 @@
 from __future__ import annotations
 
+import asyncio
+import json
 import logging
 import os
-from typing import Any, Dict, Iterable, List, Optional
-
-try:  # pragma: no cover - cho phép chạy test khi thiếu httpx
-    import httpx
-except ImportError:  # pragma: no cover
-    httpx = None  # type: ignore
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple, Union
 
 from fastapi import APIRouter, HTTPException, Query, Response, status
 
+from ..core import tenants
+from ..core.lazy import optional_module
+
 router = APIRouter()
 
 logger = logging.getLogger(__name__)
@@ -20,6 +21,23 @@ PAGE_ACCESS_TOKEN = os.getenv("FB_PAGE_ACCESS_TOKEN", "")
 USE_MEDIA = os.getenv("USE_MEDIA", "false").lower() in {"1", "true", "yes"}
 PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "")
 MESSAGE_ENDPOINT = os.getenv("CHATBRAIN_MESSAGE_URL", "http://127.0.0.1:8000/message")
+# Chế độ streaming: nhận SSE từ /message/stream và gửi từng phần sang Messenger ngay khi tới
+USE_STREAMING = os.getenv("FB_STREAMING", "false").lower() in {"1", "true", "yes"}
+STREAM_ENDPOINT = os.getenv("CHATBRAIN_STREAM_URL", MESSAGE_ENDPOINT.rstrip("/") + "/stream")
+GRAPH_URL = "https://graph.facebook.com/v17.0/me/messages"
+# Nhiều trang trên một tiến trình: token theo page id khai báo trong CHATBRAIN_TENANTS
+PAGE_TOKENS: Optional[Dict[str, str]] = None
+# Dựng sẵn payload của bước kế tiếp (debug.next) và gửi ngay khi lõi xác nhận đúng bước
+USE_PREFETCH = os.getenv("FB_PREFETCH", "false").lower() in {"1", "true", "yes"}
+if USE_PREFETCH and USE_STREAMING:
+    # Streaming đã gửi lời đáp ngay khi tới và dùng lại attachment_id: hai chế độ loại trừ nhau
+    logger.warning("FB_PREFETCH bị bỏ qua vì FB_STREAMING đang bật")
+    USE_PREFETCH = False
+PREFETCH_SESSIONS = int(os.getenv("FB_PREFETCH_SESSIONS", "10000"))
+# (trang, người dùng) -> (bước "intent#step", các body JSON đã mã hoá sẵn)
+_PREFETCHED: "OrderedDict[Tuple[str, str], Tuple[Tuple[str, str, str], List[bytes]]]" = OrderedDict()
+# (token trang, url ảnh) -> attachment_id Messenger trả về, để lần sau không tải lại ảnh
+ATTACHMENT_IDS: Dict[Tuple[str, str], str] = {}
 
 
 @router.get("/webhook/facebook")
@@ -39,6 +57,8 @@ async def handle_webhook(payload: Dict[str, Any]) -> Dict[str, str]:
     """Nhận sự kiện từ Facebook và chuyển tới lõi ChatBrain."""
     entries = payload.get("entry", [])
     for entry in entries:
+        page_id = entry.get("id")
+        page_id = page_id if isinstance(page_id, str) else None
         messaging_events = entry.get("messaging", [])
         for event in messaging_events:
             sender_id = _extract_sender(event)
@@ -48,37 +68,161 @@ async def handle_webhook(payload: Dict[str, Any]) -> Dict[str, str]:
             if text is None:
                 continue
             try:
-                core_response = await _forward_to_core(sender_id, text)
+                if USE_STREAMING:
+                    await _relay_stream(sender_id, text, page_id)
+                    continue
+                core_response = await _forward_to_core(sender_id, text, page_id)
             except Exception as exc:  # pragma: no cover - lỗi runtime khó tái hiện
                 logger.exception("Lỗi gọi lõi ChatBrain: %s", exc)
                 continue
             if not core_response:
                 continue
-            await _dispatch_response(sender_id, core_response)
+            await _dispatch_response(sender_id, core_response, page_id)
     return {"status": "ok"}
 
 
-async def _forward_to_core(session_id: str, message: str) -> Dict[str, Any]:
+def _httpx():
+    httpx = optional_module("httpx")
     if httpx is None:
         raise HTTPException(status_code=500, detail="Thiếu thư viện httpx")
+    return httpx
+
+
+async def _forward_to_core(session_id: str, message: str, page_id: Optional[str] = None) -> Dict[str, Any]:
+    httpx = _httpx()
+    headers = {"X-Page-Id": page_id} if page_id else None
     async with httpx.AsyncClient(timeout=10.0) as client:
-        response = await client.post(MESSAGE_ENDPOINT, json={"session_id": session_id, "message": message})
+        body = {"session_id": session_id, "message": message, "prefetch": USE_PREFETCH}
+        response = await client.post(MESSAGE_ENDPOINT, json=body, headers=headers)
         response.raise_for_status()
         return response.json()
 
 
-async def _dispatch_response(recipient_id: str, response: Dict[str, Any]) -> None:
+async def _dispatch_response(recipient_id: str, response: Dict[str, Any], page_id: Optional[str] = None) -> None:
+    token = _page_token(page_id)
+    key = (page_id or "", recipient_id)
+    debug = response.get("debug") or {}
+    ready = _PREFETCHED.pop(key, None)
+    bodies: List[Union[Dict[str, Any], bytes]]
+    if ready is not None and debug.get("step") and ready[0] == _content_key(debug["step"], response):
+        # Lõi trả đúng bước và đúng nội dung đã dựng sẵn ở lượt trước (cùng lời đáp, cùng
+        # nút/ảnh): gửi luôn các body đã mã hoá. Lệch bất kỳ chỗ nào thì lời đáp mới thắng.
+        bodies = list(ready[1])
+    else:
+        bodies = list(_outbound(recipient_id, response, token))
+
+    # Một client cho cả lượt: các lần gửi sau dùng lại kết nối TLS tới Graph API
+    async with _httpx().AsyncClient(timeout=10.0) as client:
+        for body in bodies:
+            await _call_facebook(body, token, client)
+
+    upcoming = debug.get("next")
+    if USE_PREFETCH and isinstance(upcoming, dict) and upcoming.get("step"):
+        encoded = [_encode(payload) for payload in _outbound(recipient_id, upcoming, token)]
+        _PREFETCHED[key] = (_content_key(upcoming["step"], upcoming), encoded)
+        while len(_PREFETCHED) > PREFETCH_SESSIONS:
+            _PREFETCHED.popitem(last=False)
+
+
+def _content_key(step: str, response: Dict[str, Any]) -> Tuple[str, str, str]:
+    """Khoá so khớp buffer dựng sẵn: bước cùng lời đáp và UI mà lõi thực sự trả về."""
+    ui = json.dumps(response.get("ui") or {}, ensure_ascii=False, sort_keys=True)
+    return step, response.get("reply") or "", ui
+
+
+def _outbound(recipient_id: str, response: Dict[str, Any], token: str = "") -> List[Dict[str, Any]]:
+    """Các payload Send API cho một phản hồi của lõi: lời đáp kèm quick replies rồi từng ảnh."""
     reply_text = response.get("reply") or ""
     ui = response.get("ui") or {}
-    buttons = _extract_buttons(ui)
-    media_items = _extract_media(ui)
-
+    payloads: List[Dict[str, Any]] = []
     if reply_text:
-        await _send_text(recipient_id, reply_text, buttons)
+        payloads.append(_text_payload(recipient_id, reply_text, _extract_buttons(ui)))
+    if USE_MEDIA:
+        payloads.extend(_media_payload(recipient_id, item, token) for item in _extract_media(ui))
+    return payloads
+
+
+def _encode(payload: Dict[str, Any]) -> bytes:
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+async def _relay_stream(recipient_id: str, message: str, page_id: Optional[str] = None) -> None:
+    """Đọc SSE từ lõi; lời đáp được gửi ngay, ảnh nối đuôi theo thứ tự khi sự kiện tới.
+
+    Không xin ``prefetch``: chế độ này không dùng payload dựng sẵn (xem ``USE_PREFETCH``).
+    """
+    headers = {"X-Page-Id": page_id} if page_id else None
+    body = {"session_id": recipient_id, "message": message}
+    async with _httpx().AsyncClient(timeout=10.0) as client:
+        chain = _SendChain(client, _page_token(page_id))
+        try:
+            async with client.stream("POST", STREAM_ENDPOINT, json=body, headers=headers) as response:
+                response.raise_for_status()
+                async for event, data in _parse_sse(response.aiter_lines()):
+                    payload = _event_payload(recipient_id, event, data, chain.token)
+                    if payload is not None:
+                        chain.send(payload)
+        finally:
+            await chain.drain()
+
+
+async def _parse_sse(lines: AsyncIterator[str]) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    event, data = "message", []
+    async for line in lines:
+        if not line:
+            if data:
+                yield event, json.loads("\n".join(data))
+            event, data = "message", []
+        elif line.startswith("event:"):
+            event = line[6:].strip()
+        elif line.startswith("data:"):
+            data.append(line[5:].lstrip())
+    if data:
+        yield event, json.loads("\n".join(data))
+
+
+def _event_payload(
+    recipient_id: str, event: str, data: Dict[str, Any], token: str = ""
+) -> Optional[Dict[str, Any]]:
+    if event == "reply" and data.get("reply"):
+        return _text_payload(recipient_id, data["reply"], _extract_buttons(data))
+    if event == "media" and USE_MEDIA:
+        media = _extract_media({"media": [data]})
+        return _media_payload(recipient_id, media[0], token) if media else None
+    return None
+
+
+class _SendChain:
+    """Gửi payload đúng thứ tự nhưng không chờ stream kết thúc.
+
+    Mỗi lần gửi là một task chờ task trước xong rồi mới gọi Graph API, nên việc đọc
+    sự kiện kế tiếp chạy song song với lần gửi đang dở. Một lần gửi lỗi thì các lần
+    sau cũng dừng (tin nhắn không bị lệch thứ tự).
+    """
 
-    if USE_MEDIA and media_items:
-        for item in media_items:
-            await _send_media(recipient_id, item)
+    def __init__(self, client: Any, token: str) -> None:
+        self.client = client
+        self.token = token
+        self._last: Optional[asyncio.Task] = None
+
+    def send(self, payload: Dict[str, Any]) -> None:
+        self._last = asyncio.create_task(self._after(self._last, payload))
+
+    async def _after(self, previous: Optional[asyncio.Task], payload: Dict[str, Any]) -> None:
+        if previous is not None:
+            await previous
+        await _call_facebook(payload, self.token, self.client)
+
+    async def drain(self) -> None:
+        if self._last is not None:
+            await self._last
+
+
+def _page_token(page_id: Optional[str]) -> str:
+    global PAGE_TOKENS
+    if PAGE_TOKENS is None:
+        PAGE_TOKENS = tenants.page_tokens()
+    return PAGE_TOKENS.get(page_id or "", PAGE_ACCESS_TOKEN)
 
 
 def _extract_buttons(ui: Dict[str, Any]) -> List[str]:
@@ -114,7 +258,7 @@ def _extract_media(ui: Dict[str, Any]) -> List[Dict[str, Any]]:
     return normalized
 
 
-async def _send_text(recipient_id: str, text: str, buttons: List[str]) -> None:
+def _text_payload(recipient_id: str, text: str, buttons: List[str]) -> Dict[str, Any]:
     payload: Dict[str, Any] = {
         "recipient": {"id": recipient_id},
         "message": {"text": text},
@@ -122,7 +266,7 @@ async def _send_text(recipient_id: str, text: str, buttons: List[str]) -> None:
     quick_replies = _build_quick_replies(buttons)
     if quick_replies:
         payload["message"]["quick_replies"] = quick_replies
-    await _call_facebook(payload)
+    return payload
 
 
 def _build_quick_replies(buttons: List[str]) -> List[Dict[str, str]]:
@@ -140,36 +284,62 @@ def _build_quick_replies(buttons: List[str]) -> List[Dict[str, str]]:
     return replies
 
 
-async def _send_media(recipient_id: str, media: Dict[str, Any]) -> None:
+def _media_payload(recipient_id: str, media: Dict[str, Any], token: str = "") -> Dict[str, Any]:
+    attachment_id = ATTACHMENT_IDS.get((token or PAGE_ACCESS_TOKEN, media.get("url") or ""))
+    if attachment_id:
+        # Ảnh đã tải lên trang này trước đó: chỉ gửi id, Messenger không phải tải lại url
+        return {
+            "recipient": {"id": recipient_id},
+            "message": {"attachment": {"type": media.get("type", "image"), "payload": {"attachment_id": attachment_id}}},
+        }
     attachment = {
         "type": media.get("type", "image"),
         "payload": {
             "url": media.get("url"),
-            "is_reusable": False,
+            "is_reusable": True,
         },
     }
     alt_text = media.get("alt")
     if isinstance(alt_text, str) and alt_text.strip():
         attachment["payload"]["alt_text"] = alt_text.strip()
-    payload = {
+    return {
         "recipient": {"id": recipient_id},
         "message": {"attachment": attachment},
     }
-    await _call_facebook(payload)
 
 
-async def _call_facebook(payload: Dict[str, Any]) -> None:
-    if not PAGE_ACCESS_TOKEN:
+async def _call_facebook(payload: Union[Dict[str, Any], bytes], token: str = "", client: Any = None) -> None:
+    """Gửi một payload (dict hoặc body JSON đã mã hoá sẵn) tới Send API."""
+    token = token or PAGE_ACCESS_TOKEN
+    if not token:
         raise HTTPException(status_code=500, detail="Thiếu FB_PAGE_ACCESS_TOKEN")
-    if httpx is None:
-        raise HTTPException(status_code=500, detail="Thiếu thư viện httpx")
-    url = "https://graph.facebook.com/v17.0/me/messages"
-    params = {"access_token": PAGE_ACCESS_TOKEN}
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        response = await client.post(url, params=params, json=payload)
-        if response.status_code >= 400:
-            logger.error("Gửi tin nhắn tới Facebook thất bại: %s", response.text)
-            raise HTTPException(status_code=500, detail="Gửi tin nhắn tới Facebook thất bại")
+    if client is None:
+        async with _httpx().AsyncClient(timeout=10.0) as own_client:
+            await _call_facebook(payload, token, own_client)
+        return
+    params = {"access_token": token}
+    if isinstance(payload, bytes):
+        headers = {"Content-Type": "application/json"}
+        response = await client.post(GRAPH_URL, params=params, content=payload, headers=headers)
+    else:
+        response = await client.post(GRAPH_URL, params=params, json=payload)
+    if response.status_code >= 400:
+        logger.error("Gửi tin nhắn tới Facebook thất bại: %s", response.text)
+        raise HTTPException(status_code=500, detail="Gửi tin nhắn tới Facebook thất bại")
+    if isinstance(payload, dict):
+        _remember_attachment(payload, token, response)
+
+
+def _remember_attachment(payload: Dict[str, Any], token: str, response: Any) -> None:
+    url = payload.get("message", {}).get("attachment", {}).get("payload", {}).get("url")
+    if not url:
+        return
+    try:
+        attachment_id = response.json().get("attachment_id")
+    except ValueError:
+        return
+    if isinstance(attachment_id, str) and attachment_id:
+        ATTACHMENT_IDS[(token, url)] = attachment_id
 
 
 def _extract_sender(event: Dict[str, Any]) -> Optional[str]:
@@ -0,0 +1,95 @@
+"""Bảng tra nút bấm / quick reply theo từng bước, biên dịch sẵn khi nạp kịch bản.
+
+Khi người dùng đang ở giữa một quy trình, phần lớn tin nhắn là nhãn nút của
+chính bước hiện tại ("Đã tải xong ✅", "↩️ Quay lại", "Về menu chính"...). Bảng
+``(intent_id, step_id) -> {nhãn chuẩn hoá -> ButtonAction}`` cho phép xử lý các
+lượt đó bằng một lần tra dict thay vì xếp hạng toàn bộ intent.
+"""
+from __future__ import annotations
+
+import re
+import unicodedata
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+
+from .schema import ScriptPack
+
+NEXT = "next"
+BACK = "back"
+CANCEL = "cancel"
+HELP = "help"
+MENU = "menu"
+INTENT = "intent"
+
+# Nhãn điều hướng dùng chung (đã chuẩn hoá bằng ``normalize_label``)
+NAVIGATION: Dict[str, str] = {
+    "đã xong": NEXT,
+    "xong": NEXT,
+    "đã tải xong": NEXT,
+    "đã cài rồi": NEXT,
+    "tiếp tục": NEXT,
+    "hoàn tất": NEXT,
+    "quay lại": BACK,
+    "huỷ": CANCEL,
+    "hủy": CANCEL,
+    "cần trợ giúp thêm": HELP,
+    "về menu chính": MENU,
+    "menu chính": MENU,
+}
+
+_SPACES = re.compile(r"\s+")
+
+
+class ButtonAction(NamedTuple):
+    kind: str
+    target: Optional[str] = None  # intent đích với INTENT/MENU
+
+
+StepKey = Tuple[str, str]
+ButtonTable = Dict[StepKey, Dict[str, ButtonAction]]
+
+
+def normalize_label(label: str) -> str:
+    """Bỏ emoji/ký hiệu, gộp khoảng trắng, chữ thường (giữ dấu tiếng Việt)."""
+    text = unicodedata.normalize("NFC", label)
+    kept = "".join(ch if unicodedata.category(ch)[0] in "LNZ" else " " for ch in text)
+    return _SPACES.sub(" ", kept).strip().casefold()
+
+
+def compile_buttons(pack: ScriptPack, resolve: Optional[Callable[[str], Optional[str]]] = None) -> ButtonTable:
+    """Dựng bảng tra cho mọi bước có ``ui.buttons``.
+
+    Nhãn điều hướng lấy từ ``NAVIGATION``; nhãn còn lại (ví dụ nút menu
+    "📲 Cài đặt & Kích hoạt") được ``resolve`` một lần lúc nạp thành intent đích.
+    Nhãn không giải được sẽ không có trong bảng và đi qua NLU như thường.
+    """
+    resolved: Dict[str, Optional[str]] = {}
+    table: ButtonTable = {}
+    for intent in pack.intents:
+        for step in intent.steps:
+            actions: Dict[str, ButtonAction] = {}
+            for label in step.ui.buttons:
+                key = normalize_label(label)
+                if not key:
+                    continue
+                kind = NAVIGATION.get(key)
+                if kind == MENU:
+                    if key not in resolved and resolve is not None:
+                        resolved[key] = resolve(label)
+                    actions[key] = ButtonAction(MENU, resolved.get(key))
+                elif kind is not None:
+                    actions[key] = ButtonAction(kind)
+                elif resolve is not None:
+                    if key not in resolved:
+                        resolved[key] = resolve(label)
+                    if resolved[key]:
+                        actions[key] = ButtonAction(INTENT, resolved[key])
+            if actions:
+                table[(intent.id, step.id)] = actions
+    return table
+
+
+def lookup(table: ButtonTable, intent_id: str, step_id: str, text: str) -> Optional[ButtonAction]:
+    actions = table.get((intent_id, step_id))
+    if not actions:
+        return None
+    return actions.get(normalize_label(text))
@@ -0,0 +1,104 @@
+"""Phát hiện intent "va chạm": cặp intent quá giống nhau và synonym bị intent khác vượt điểm.
+
+Hai phép phân tích, đều tính theo khối ``tile`` dòng để bộ nhớ chỉ là
+``tile x số intent`` dù pack có hàng chục nghìn intent:
+
+* **Cặp intent**: ma trận tương đồng intent x intent = điểm trộn của BM25 chéo (văn bản
+  intent này làm truy vấn trên chỉ mục) và cosine embedding, đúng công thức của
+  ``NLUIndex.rank``. Cặp có điểm (theo chiều cao hơn) từ ``threshold`` trở lên được báo.
+* **Synonym bị vượt**: mỗi synonym/example được xếp hạng như một câu hỏi; intent nào
+  điểm cao hơn intent sở hữu nó (hoặc bằng điểm nhưng khai báo trước, vì
+  ``Policy.choose`` phá hoà theo thứ tự) thì được liệt kê.
+"""
+from __future__ import annotations
+
+import time
+from typing import Any, Dict, List, Tuple
+
+from .lazy import optional_module
+from .nlu import NLUIndex
+
+
+def _numpy():
+    np = optional_module("numpy")
+    if np is None:  # pragma: no cover - numpy nằm trong requirements
+        raise RuntimeError("Cần numpy để phân tích va chạm intent")
+    return np
+
+
+def intent_pairs(nlu: NLUIndex, threshold: float = 0.6, tile: int = 128) -> List[Dict[str, Any]]:
+    """Các cặp intent có độ tương đồng >= ``threshold``, giảm dần theo điểm."""
+    np = _numpy()
+    intents = nlu.script_pack.intents
+    found: Dict[Tuple[int, int], Dict[str, Any]] = {}
+    for start in range(0, len(intents), tile):
+        bm25, embed = nlu.intent_components(start, min(start + tile, len(intents)))
+        fused = nlu.fuse(bm25, embed)
+        rows = np.arange(fused.shape[0])
+        fused[rows, rows + start] = -np.inf
+        for row, col in zip(*np.nonzero(fused >= threshold)):
+            i, j = int(row) + start, int(col)
+            key = (min(i, j), max(i, j))
+            score = float(fused[row, col])
+            entry = found.get(key)
+            if entry is None or score > entry["score"]:
+                found[key] = {
+                    "a": intents[key[0]].id,
+                    "b": intents[key[1]].id,
+                    "score": round(score, 4),
+                    "bm25": round(float(bm25[row, col]), 4),
+                    "embed": None if embed is None else round(float(embed[row, col]), 4),
+                    "query": intents[i].id,
+                    "same_domain": intents[i].domain == intents[j].domain,
+                }
+    return sorted(found.values(), key=lambda pair: pair["score"], reverse=True)
+
+
+def outranked_phrases(nlu: NLUIndex, top: int = 3, tile: int = 128) -> List[Dict[str, Any]]:
+    """Synonym/example mà ``rank`` không đặt intent sở hữu lên đầu."""
+    np = _numpy()
+    intents = nlu.script_pack.intents
+    phrases: List[Tuple[int, str, str]] = [
+        (idx, kind, text)
+        for idx, intent in enumerate(intents)
+        for kind, texts in (("synonym", intent.synonyms), ("example", intent.examples))
+        for text in texts
+    ]
+    columns = np.arange(len(intents))
+    results: List[Dict[str, Any]] = []
+    for start in range(0, len(phrases), tile):
+        chunk = phrases[start : start + tile]
+        scores = nlu.score_matrix([text for _, _, text in chunk])
+        owners = np.fromiter((idx for idx, _, _ in chunk), dtype=np.int64, count=len(chunk))
+        own = scores[np.arange(len(chunk)), owners][:, None]
+        above = (scores > own) | ((scores == own) & (columns[None, :] < owners[:, None]))
+        for row in np.nonzero(above.any(axis=1))[0]:
+            cols = np.nonzero(above[row])[0]
+            best = cols[np.argsort(-scores[row, cols], kind="stable")[:top]]
+            idx, kind, text = chunk[row]
+            results.append(
+                {
+                    "intent": intents[idx].id,
+                    "kind": kind,
+                    "phrase": text,
+                    "own_score": round(float(own[row, 0]), 4),
+                    "outranked_by": [
+                        {"intent": intents[int(col)].id, "score": round(float(scores[row, col]), 4)} for col in best
+                    ],
+                    "count": int(len(cols)),
+                }
+            )
+    return results
+
+
+def find_collisions(nlu: NLUIndex, threshold: float = 0.6, top: int = 3, tile: int = 128) -> Dict[str, Any]:
+    started = time.perf_counter()
+    pairs = intent_pairs(nlu, threshold, tile)
+    outranked = outranked_phrases(nlu, top, tile)
+    return {
+        "intents": len(nlu.script_pack.intents),
+        "threshold": threshold,
+        "pairs": pairs,
+        "outranked": outranked,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
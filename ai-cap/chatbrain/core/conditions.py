@@ -0,0 +1,205 @@
+"""Biên dịch điều kiện dạng chuỗi (``redirects[].if`` ...) thành hàm Python an toàn.
+
+Cú pháp hỗ trợ (không dùng ``eval``)::
+
+    da_co_vneid == false
+    tuoi >= 16 and not (loai_ho_so == "tam_tru" or da_nop)
+
+* toán tử so sánh ``== != < <= > >=``; logic ``and/or/not`` (hoặc ``&& || !``);
+* hằng: ``true/false``, ``null``/``none``, số, chuỗi trong nháy đơn/kép;
+* tên biến tra trong slots. Slot chưa có thì mọi phép so sánh đều sai, để
+  "chưa hỏi" không bị hiểu nhầm thành "false".
+
+Slot lưu dạng chuỗi nên được ép kiểu theo hằng bên kia phép so sánh
+("có"/"rồi"/"true" -> True, "16" -> 16.0...).
+"""
+from __future__ import annotations
+
+import re
+from typing import Any, Callable, List, Mapping, Optional, Tuple
+
+Predicate = Callable[[Mapping[str, Any]], bool]
+
+
+class ConditionError(ValueError):
+    """Điều kiện sai cú pháp."""
+
+
+_MISSING = object()
+_TRUE_WORDS = {"true", "1", "yes", "y", "có", "co", "rồi", "roi", "đúng", "dung", "đã", "da"}
+_FALSE_WORDS = {"false", "0", "no", "n", "không", "khong", "chưa", "chua", "sai"}
+_TOKEN = re.compile(
+    r"""\s*(?:
+        (?P<number>-?\d+(?:\.\d+)?)
+      | (?P<string>"[^"]*"|'[^']*')
+      | (?P<op>==|!=|<=|>=|<|>|&&|\|\||!|\(|\))
+      | (?P<name>[^\W\d]\w*)
+    )""",
+    re.VERBOSE | re.UNICODE,
+)
+_COMPARE = {
+    "==": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+    "<": lambda a, b: a < b,
+    "<=": lambda a, b: a <= b,
+    ">": lambda a, b: a > b,
+    ">=": lambda a, b: a >= b,
+}
+_KEYWORDS = {"and": "&&", "or": "||", "not": "!"}
+_CONSTANTS = {"true": True, "false": False, "null": None, "none": None}
+
+
+def to_bool(value: Any) -> Optional[bool]:
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        return value != 0
+    text = str(value).strip().lower()
+    if text in _TRUE_WORDS:
+        return True
+    if text in _FALSE_WORDS:
+        return False
+    return None
+
+
+def _coerce(value: Any, like: Any) -> Any:
+    if value is None or like is None:
+        return value
+    if isinstance(like, bool):
+        return to_bool(value)
+    if isinstance(like, float) and not isinstance(value, bool):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return _MISSING
+    if isinstance(like, str):
+        return str(value)
+    return value
+
+
+def _tokenize(source: str) -> List[Tuple[str, Any]]:
+    tokens: List[Tuple[str, Any]] = []
+    pos = 0
+    source = source.rstrip()
+    while pos < len(source):
+        match = _TOKEN.match(source, pos)
+        if not match or match.end() == pos:
+            raise ConditionError(f"Ký tự không hợp lệ tại vị trí {pos}: {source!r}")
+        pos = match.end()
+        kind = match.lastgroup
+        text = match.group(kind)
+        if kind == "number":
+            tokens.append(("const", float(text)))
+        elif kind == "string":
+            tokens.append(("const", text[1:-1]))
+        elif kind == "op":
+            tokens.append(("op", text))
+        elif text.lower() in _KEYWORDS:
+            tokens.append(("op", _KEYWORDS[text.lower()]))
+        elif text.lower() in _CONSTANTS:
+            tokens.append(("const", _CONSTANTS[text.lower()]))
+        else:
+            tokens.append(("name", text))
+    return tokens
+
+
+class _Parser:
+    def __init__(self, source: str) -> None:
+        self.source = source
+        self.tokens = _tokenize(source)
+        self.pos = 0
+
+    def parse(self) -> Predicate:
+        if not self.tokens:
+            raise ConditionError("Điều kiện rỗng")
+        predicate = self._or()
+        if self.pos != len(self.tokens):
+            raise ConditionError(f"Thừa ký hiệu trong điều kiện: {self.source!r}")
+        return predicate
+
+    def _peek(self) -> Optional[Tuple[str, Any]]:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def _accept(self, op: str) -> bool:
+        token = self._peek()
+        if token == ("op", op):
+            self.pos += 1
+            return True
+        return False
+
+    def _or(self) -> Predicate:
+        parts = [self._and()]
+        while self._accept("||"):
+            parts.append(self._and())
+        if len(parts) == 1:
+            return parts[0]
+        return lambda slots: any(part(slots) for part in parts)
+
+    def _and(self) -> Predicate:
+        parts = [self._not()]
+        while self._accept("&&"):
+            parts.append(self._not())
+        if len(parts) == 1:
+            return parts[0]
+        return lambda slots: all(part(slots) for part in parts)
+
+    def _not(self) -> Predicate:
+        if self._accept("!"):
+            inner = self._not()
+            return lambda slots: not inner(slots)
+        return self._comparison()
+
+    def _comparison(self) -> Predicate:
+        if self._accept("("):
+            inner = self._or()
+            if not self._accept(")"):
+                raise ConditionError(f"Thiếu ')' trong điều kiện: {self.source!r}")
+            return inner
+        left = self._operand()
+        token = self._peek()
+        if token and token[0] == "op" and token[1] in _COMPARE:
+            self.pos += 1
+            right = self._operand()
+            return _compare(_COMPARE[token[1]], left, right)
+        kind, value = left
+        if kind == "const":
+            constant = bool(value)
+            return lambda slots: constant
+        return lambda slots: to_bool(slots.get(value, False)) is True
+
+    def _operand(self) -> Tuple[str, Any]:
+        token = self._peek()
+        if token is None or token[0] == "op":
+            raise ConditionError(f"Thiếu toán hạng trong điều kiện: {self.source!r}")
+        self.pos += 1
+        return token
+
+
+def _compare(op: Callable[[Any, Any], bool], left: Tuple[str, Any], right: Tuple[str, Any]) -> Predicate:
+    def resolve(slots: Mapping[str, Any], operand: Tuple[str, Any], other: Tuple[str, Any]) -> Any:
+        kind, value = operand
+        if kind == "const":
+            return value
+        if value not in slots:
+            return _MISSING
+        like = other[1] if other[0] == "const" else None
+        return _coerce(slots[value], like)
+
+    def predicate(slots: Mapping[str, Any]) -> bool:
+        a = resolve(slots, left, right)
+        b = resolve(slots, right, left)
+        if a is _MISSING or b is _MISSING:
+            return False
+        try:
+            return bool(op(a, b))
+        except TypeError:
+            return False
+
+    return predicate
+
+
+def compile_condition(source: Optional[str]) -> Predicate:
+    """Biên dịch ``source`` một lần; điều kiện rỗng/None luôn đúng."""
+    if source is None or not str(source).strip():
+        return lambda slots: True
+    return _Parser(str(source)).parse()
@@ -1,60 +1,365 @@
+"""Trạng thái hội thoại theo phiên: stack context và các cờ tạm (chờ quay lại, chờ xác nhận phiên bản).
+
+Mọi thứ của một phiên nằm trong một ``Session`` duy nhất, nên chung một chính sách
+hết hạn:
+
+* ``SESSION_TTL`` giây không hoạt động thì phiên bị xoá (kiểm tra lười khi truy cập
+  và bởi luồng dọn nền ``start_sweeper``);
+* ``MAX_SESSIONS`` phiên tối đa, vượt thì bỏ phiên lâu không dùng nhất (LRU).
+
+Phiên chỉ được tạo khi có frame đầu tiên và bị xoá khi stack rỗng, nên người gửi
+một lần rồi thôi (fallback, chào hỏi) không để lại gì trong bộ nhớ.
+
+Khi gắn ``Journal`` (storage/journal.py), mỗi thay đổi được ghi thành một bản ghi
+``[ts, op, session_id, ...]`` với ``op`` là ``push``/``pop``/``clear``/``resume``/
+``version``/``step``; ``attach_journal`` khôi phục trạng thái từ snapshot + phần đuôi
+nhật ký trước khi nhận tin nhắn mới.
+"""
 from __future__ import annotations
 
+import gc
 import os
-from typing import Dict, List, Optional
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Sequence
 
 from .schema import ContextFrame, ContextState
 
+if TYPE_CHECKING:  # pragma: no cover
+    from ..storage.journal import Journal
+
+FRAME_FIELDS = (
+    "script_file", "intent_id", "domain", "step_id", "step_index", "slots", "version", "timestamp", "interruption",
+)
+
+
+def _frame_row(frame: ContextFrame) -> List[Any]:
+    row = [getattr(frame, name) for name in FRAME_FIELDS]
+    row[5] = dict(row[5])  # slots: bản sao, vì snapshot được ghi ngoài khoá
+    return row
+
+
+_FIELDS_SET = frozenset(FRAME_FIELDS)
+
+
+def _frame_from_row(row: Sequence[Any], _new: Any = object.__new__, _set: Any = object.__setattr__) -> ContextFrame:
+    # Như ``ContextFrame.model_construct`` nhưng nhanh gấp ~3 lần; khôi phục 1 triệu
+    # phiên tốn phần lớn thời gian ở đây. Dữ liệu do chính ``_frame_row`` ghi nên bỏ qua validate.
+    frame = _new(ContextFrame)
+    _set(frame, "__dict__", dict(zip(FRAME_FIELDS, row)))
+    _set(frame, "__pydantic_fields_set__", set(_FIELDS_SET))
+    _set(frame, "__pydantic_extra__", None)
+    _set(frame, "__pydantic_private__", None)
+    return frame
+
+
+class Session:
+    __slots__ = ("stack", "pending_resume", "version_prompt", "touched")
+
+    def __init__(self, now: float) -> None:
+        self.stack: List[ContextFrame] = []
+        self.pending_resume: Optional[str] = None
+        # intent đang chờ người dùng chọn "Tiếp tục"/"Khởi động lại" sau khi kịch bản đổi phiên bản
+        self.version_prompt: Optional[str] = None
+        self.touched = now
+
 
 class ContextManager:
-    def __init__(self, max_depth: Optional[int] = None) -> None:
+    def __init__(
+        self,
+        max_depth: Optional[int] = None,
+        ttl: Optional[float] = None,
+        max_sessions: Optional[int] = None,
+    ) -> None:
         if max_depth is None:
             max_depth = int(os.getenv("MAX_DEPTH", "2"))
         self.max_depth = max(1, max_depth)
-        self._sessions: Dict[str, List[ContextFrame]] = {}
-        self._pending_resume: Dict[str, Optional[str]] = {}
+        self.ttl = float(os.getenv("SESSION_TTL", "3600")) if ttl is None else ttl
+        if max_sessions is None:
+            max_sessions = int(os.getenv("MAX_SESSIONS", "100000"))
+        self.max_sessions = max(1, max_sessions)
+        # Thứ tự = thứ tự truy cập gần nhất: đầu dict là phiên cũ nhất
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._sweeper: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.expired = 0
+        self.evicted = 0
+        self.journal: Optional["Journal"] = None
+
+    # Phiên -------------------------------------------------------------
+    def _get(self, session_id: str) -> Optional[Session]:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            now = time.monotonic()
+            if self.ttl > 0 and now - session.touched > self.ttl:
+                del self._sessions[session_id]
+                self.expired += 1
+                return None
+            session.touched = now
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def _get_or_create(self, session_id: str) -> Session:
+        with self._lock:
+            session = self._get(session_id)
+            if session is None:
+                session = self._sessions[session_id] = Session(time.monotonic())
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+                    self.evicted += 1
+            return session
+
+    def _log(self, op: str, session_id: str, *args: Any) -> None:
+        if self.journal is not None:
+            self.journal.append([round(time.time(), 3), op, session_id, *args])
+
+    def _drop_if_idle(self, session_id: str, session: Session) -> None:
+        if not session.stack:
+            self._sessions.pop(session_id, None)
 
+    # Stack -------------------------------------------------------------
     def stack(self, session_id: str) -> List[ContextFrame]:
-        return self._sessions.setdefault(session_id, [])
+        session = self._get(session_id)
+        return session.stack if session is not None else []
 
     def push(self, session_id: str, frame: ContextFrame) -> None:
-        stack = self.stack(session_id)
-        stack.append(frame)
-        while len(stack) > self.max_depth:
-            stack.pop(0)
+        with self._lock:
+            fresh = self._get(session_id) is None
+            stack = self._get_or_create(session_id).stack
+            stack.append(frame)
+            while len(stack) > self.max_depth:
+                stack.pop(0)
+            # ``fresh``: phiên mới (hoặc vừa hết hạn/bị đẩy ra) -> khi phát lại bỏ stack cũ
+            self._log("push", session_id, _frame_row(frame), fresh)
 
     def pop(self, session_id: str) -> Optional[ContextFrame]:
-        stack = self.stack(session_id)
-        if stack:
-            frame = stack.pop()
-            if not stack:
-                self._pending_resume.pop(session_id, None)
+        with self._lock:
+            session = self._get(session_id)
+            if session is None or not session.stack:
+                return None
+            frame = session.stack.pop()
+            self._drop_if_idle(session_id, session)
+            self._log("pop", session_id)
             return frame
-        return None
 
     def peek(self, session_id: str) -> Optional[ContextFrame]:
         stack = self.stack(session_id)
         return stack[-1] if stack else None
 
     def clear(self, session_id: str) -> None:
-        self._sessions.pop(session_id, None)
-        self._pending_resume.pop(session_id, None)
+        with self._lock:
+            if self._sessions.pop(session_id, None) is not None:
+                self._log("clear", session_id)
+
+    def record_step(self, session_id: str, frame: ContextFrame) -> None:
+        """Ghi nhật ký vị trí bước / phiên bản / slot của frame trên cùng sau khi executor sửa nó."""
+        if self.journal is not None:
+            self._log("step", session_id, frame.step_index, frame.step_id, frame.version, dict(frame.slots))
 
     def is_task_active(self, session_id: str) -> bool:
         return bool(self.peek(session_id))
 
+    # Cờ tạm ------------------------------------------------------------
     def set_pending_resume(self, session_id: str, intent_id: str) -> None:
-        self._pending_resume[session_id] = intent_id
+        with self._lock:
+            session = self._get(session_id)
+            if session is not None:
+                session.pending_resume = intent_id
+                self._log("resume", session_id, intent_id)
 
     def pop_pending_resume(self, session_id: str) -> Optional[str]:
-        return self._pending_resume.pop(session_id, None)
+        with self._lock:
+            session = self._get(session_id)
+            if session is None:
+                return None
+            intent_id, session.pending_resume = session.pending_resume, None
+            if intent_id is not None:
+                self._log("resume", session_id, None)
+            return intent_id
 
     def pending_resume(self, session_id: str) -> Optional[str]:
-        return self._pending_resume.get(session_id)
+        session = self._get(session_id)
+        return session.pending_resume if session is not None else None
+
+    def set_version_prompt(self, session_id: str, intent_id: str) -> None:
+        with self._lock:
+            session = self._get(session_id)
+            if session is not None:
+                session.version_prompt = intent_id
+                self._log("version", session_id, intent_id)
+
+    def pop_version_prompt(self, session_id: str) -> Optional[str]:
+        with self._lock:
+            session = self._get(session_id)
+            if session is None:
+                return None
+            intent_id, session.version_prompt = session.version_prompt, None
+            if intent_id is not None:
+                self._log("version", session_id, None)
+            return intent_id
+
+    def version_prompt(self, session_id: str) -> Optional[str]:
+        session = self._get(session_id)
+        return session.version_prompt if session is not None else None
 
     def state(self, session_id: str) -> ContextState:
+        session = self._get(session_id)
         return ContextState(
             session_id=session_id,
-            stack=list(self.stack(session_id)),
-            pending_resume=self._pending_resume.get(session_id),
+            stack=list(session.stack) if session is not None else [],
+            pending_resume=session.pending_resume if session is not None else None,
         )
+
+    # Hết hạn -----------------------------------------------------------
+    def sweep(self) -> int:
+        """Xoá các phiên quá ``ttl``; chỉ duyệt từ đầu dict (phiên cũ nhất) tới phiên còn hạn."""
+        if self.ttl <= 0:
+            return 0
+        removed = 0
+        deadline = time.monotonic() - self.ttl
+        with self._lock:
+            while self._sessions:
+                session_id, session = next(iter(self._sessions.items()))
+                if session.touched > deadline:
+                    break
+                del self._sessions[session_id]
+                removed += 1
+            self.expired += removed
+        return removed
+
+    def start_sweeper(self, interval: Optional[float] = None) -> None:
+        """Chạy ``sweep`` định kỳ trong luồng nền (mặc định ``SESSION_SWEEP_SECONDS``)."""
+        if self._sweeper is not None and self._sweeper.is_alive():
+            return
+        if interval is None:
+            interval = float(os.getenv("SESSION_SWEEP_SECONDS", "60"))
+        self._stop.clear()
+
+        def run() -> None:
+            while not self._stop.wait(interval):
+                self.sweep()
+
+        self._sweeper = threading.Thread(target=run, name="chatbrain-session-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def stop_sweeper(self) -> None:
+        self._stop.set()
+        self._sweeper = None
+
+    def close(self) -> None:
+        """Dừng luồng dọn phiên và đóng nhật ký (ghi nốt bộ đệm ra đĩa) khi tắt tiến trình."""
+        self.stop_sweeper()
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+
+    # Nhật ký ----------------------------------------------------------
+    def attach_journal(self, journal: "Journal") -> int:
+        """Khôi phục từ ``journal`` rồi ghi mọi thay đổi tiếp theo vào đó; trả số phiên khôi phục."""
+        restored = self.restore(journal)
+        self.journal = journal
+        journal.start(self._snapshot_rows)
+        return restored
+
+    def _snapshot_rows(self, rotate: Callable[[], None]) -> List[List[Any]]:
+        with self._lock:
+            rotate()
+            now_wall, now_mono = time.time(), time.monotonic()
+            return [
+                [
+                    session_id,
+                    round(now_wall - (now_mono - session.touched), 3),
+                    session.pending_resume,
+                    session.version_prompt,
+                    [_frame_row(frame) for frame in session.stack],
+                ]
+                for session_id, session in self._sessions.items()
+            ]
+
+    def restore(self, journal: "Journal") -> int:
+        """Dựng lại các phiên từ snapshot mới nhất + phát lại phần đuôi nhật ký.
+
+        Thời điểm truy cập cuối được lấy theo lần thay đổi cuối, nên TTL và trần
+        ``max_sessions`` được áp lại đúng như trước sự cố (xấp xỉ với LRU).
+        """
+        # Dựng hàng triệu object nhỏ liên tục kích hoạt GC thế hệ 2 mà không thu được gì;
+        # tắt GC trong lúc khôi phục giảm khoảng một nửa thời gian.
+        was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return self._restore(journal)
+        finally:
+            if was_enabled:
+                gc.enable()
+
+    def _restore(self, journal: "Journal") -> int:
+        sessions: Dict[str, Session] = {}
+        for session_id, ts, pending, version_prompt, frames in journal.snapshot_rows():
+            session = sessions[session_id] = Session(ts)
+            session.pending_resume = pending
+            session.version_prompt = version_prompt
+            session.stack = [_frame_from_row(row) for row in frames]
+        for ts, op, session_id, *args in journal.records():
+            session = sessions.get(session_id)
+            if op == "push":
+                if session is None or args[1]:
+                    session = sessions[session_id] = Session(ts)
+                session.stack.append(_frame_from_row(args[0]))
+                del session.stack[: -self.max_depth]
+            elif session is None:
+                continue
+            elif op == "pop":
+                if session.stack:
+                    session.stack.pop()
+                if not session.stack:
+                    del sessions[session_id]
+                    continue
+            elif op == "clear":
+                del sessions[session_id]
+                continue
+            elif op == "resume":
+                session.pending_resume = args[0]
+            elif op == "version":
+                session.version_prompt = args[0]
+            elif op == "step" and session.stack:
+                frame = session.stack[-1]
+                frame.step_index, frame.step_id, frame.version, frame.slots = args
+            session.touched = ts
+
+        now_wall, now_mono = time.time(), time.monotonic()
+        live = sorted(
+            (item for item in sessions.items() if self.ttl <= 0 or now_wall - item[1].touched <= self.ttl),
+            key=lambda item: item[1].touched,
+        )[-self.max_sessions :]
+        with self._lock:
+            self._sessions.clear()
+            for session_id, session in live:
+                session.touched = now_mono - (now_wall - session.touched)
+                self._sessions[session_id] = session
+        return len(live)
+
+    def stats(self) -> Dict[str, Any]:
+        """Số phiên/frame và ước lượng bộ nhớ (byte) của toàn bộ trạng thái phiên."""
+        with self._lock:
+            sessions = list(self._sessions.items())
+            frames = 0
+            size = sys.getsizeof(self._sessions)
+            for session_id, session in sessions:
+                frames += len(session.stack)
+                size += sys.getsizeof(session_id) + sys.getsizeof(session) + sys.getsizeof(session.stack)
+                for frame in session.stack:
+                    size += sys.getsizeof(frame) + sys.getsizeof(frame.__dict__) + sys.getsizeof(frame.slots)
+            return {
+                "sessions": len(sessions),
+                "frames": frames,
+                "pending_resume": sum(1 for _, s in sessions if s.pending_resume),
+                "version_prompts": sum(1 for _, s in sessions if s.version_prompt),
+                "expired": self.expired,
+                "evicted": self.evicted,
+                "approx_bytes": size,
+            }
@@ -0,0 +1,181 @@
+"""Backend mã hoá câu cho NLUIndex.
+
+Chọn qua biến môi trường:
+
+* ``EMBEDDING_BACKEND``: ``torch`` (mặc định, SentenceTransformer fp32), ``int8``
+  (SentenceTransformer với các lớp Linear lượng tử hoá động) hoặc ``onnx``
+  (ONNX Runtime, đọc model từ thư mục cục bộ, không truy cập mạng).
+* ``EMBEDDING_MODEL``: tên hoặc đường dẫn model cho ``torch``/``int8``.
+* ``EMBEDDING_MODEL_DIR``: thư mục chứa ``model.onnx`` + ``tokenizer.json`` cho ``onnx``
+  (tạo bằng ``export_onnx``).
+* ``EMBEDDING_THREADS``: số luồng CPU cho torch/onnxruntime (0 = mặc định thư viện).
+"""
+from __future__ import annotations
+
+import os
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import TYPE_CHECKING, Optional, Sequence
+
+from .lazy import is_available, optional_module
+
+if TYPE_CHECKING:  # pragma: no cover
+    import numpy as np
+
+DEFAULT_MODEL = "paraphrase-MiniLM-L6-v2"
+BACKENDS = ("torch", "int8", "onnx")
+
+
+class EncoderError(Exception):
+    """Ngoại lệ khi khởi tạo backend mã hoá."""
+
+
+class Encoder(ABC):
+    """Giao diện chung: ``encode`` nhận danh sách câu, trả ma trận float32 (n x dim)."""
+
+    name = "base"
+
+    @abstractmethod
+    def encode(self, texts: Sequence[str], batch_size: int = 32) -> "np.ndarray":
+        """Mã hoá ``texts`` theo lô ``batch_size``."""
+
+
+class SentenceTransformerEncoder(Encoder):
+    name = "torch"
+
+    def __init__(self, model: str = DEFAULT_MODEL, threads: int = 0) -> None:
+        module = optional_module("sentence_transformers")
+        if module is None:
+            raise EncoderError("sentence-transformers chưa được cài đặt")
+        _set_torch_threads(threads)
+        self.model = module.SentenceTransformer(model, device="cpu")
+
+    def encode(self, texts: Sequence[str], batch_size: int = 32) -> "np.ndarray":
+        np = optional_module("numpy")
+        vectors = self.model.encode(list(texts), batch_size=batch_size, convert_to_numpy=True)
+        return np.asarray(vectors, dtype=np.float32)
+
+
+class QuantizedEncoder(SentenceTransformerEncoder):
+    """SentenceTransformer với ``torch.quantization.quantize_dynamic`` (Linear -> int8)."""
+
+    name = "int8"
+
+    def __init__(self, model: str = DEFAULT_MODEL, threads: int = 0) -> None:
+        super().__init__(model, threads)
+        torch = optional_module("torch")
+        self.model = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+class OnnxEncoder(Encoder):
+    """ONNX Runtime + mean pooling, đọc ``model.onnx`` và ``tokenizer.json`` từ thư mục cục bộ."""
+
+    name = "onnx"
+
+    def __init__(self, model_dir: str, threads: int = 0, max_length: int = 128) -> None:
+        ort = optional_module("onnxruntime")
+        tokenizers = optional_module("tokenizers")
+        if ort is None or tokenizers is None:
+            raise EncoderError("Backend onnx cần onnxruntime và tokenizers")
+        folder = Path(model_dir)
+        model_path = folder / "model.onnx"
+        tokenizer_path = folder / "tokenizer.json"
+        if not model_path.is_file() or not tokenizer_path.is_file():
+            raise EncoderError(f"Thiếu model.onnx hoặc tokenizer.json trong {model_dir}")
+        options = ort.SessionOptions()
+        if threads > 0:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(str(model_path), options, providers=["CPUExecutionProvider"])
+        self.input_names = {item.name for item in self.session.get_inputs()}
+        self.tokenizer = tokenizers.Tokenizer.from_file(str(tokenizer_path))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding()
+
+    def encode(self, texts: Sequence[str], batch_size: int = 32) -> "np.ndarray":
+        np = optional_module("numpy")
+        chunks = []
+        texts = list(texts)
+        for start in range(0, len(texts), batch_size):
+            encodings = self.tokenizer.encode_batch(texts[start : start + batch_size])
+            input_ids = np.asarray([e.ids for e in encodings], dtype=np.int64)
+            mask = np.asarray([e.attention_mask for e in encodings], dtype=np.int64)
+            feeds = {"input_ids": input_ids, "attention_mask": mask}
+            if "token_type_ids" in self.input_names:
+                feeds["token_type_ids"] = np.zeros_like(input_ids)
+            token_vectors = self.session.run(None, feeds)[0]
+            weights = mask[..., None].astype(np.float32)
+            pooled = (token_vectors * weights).sum(axis=1) / np.clip(weights.sum(axis=1), 1e-9, None)
+            chunks.append(pooled.astype(np.float32))
+        if not chunks:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.vstack(chunks)
+
+
+def backend_available(backend: Optional[str] = None) -> bool:
+    backend = backend or os.getenv("EMBEDDING_BACKEND", "torch").lower()
+    if not is_available("numpy"):
+        return False
+    if backend == "onnx":
+        return is_available("onnxruntime") and is_available("tokenizers")
+    return is_available("sentence_transformers")
+
+
+def create_encoder(
+    backend: Optional[str] = None,
+    model: Optional[str] = None,
+    threads: Optional[int] = None,
+) -> Encoder:
+    backend = (backend or os.getenv("EMBEDDING_BACKEND", "torch")).lower()
+    if threads is None:
+        threads = int(os.getenv("EMBEDDING_THREADS", "0"))
+    if backend == "torch":
+        return SentenceTransformerEncoder(model or os.getenv("EMBEDDING_MODEL", DEFAULT_MODEL), threads)
+    if backend == "int8":
+        return QuantizedEncoder(model or os.getenv("EMBEDDING_MODEL", DEFAULT_MODEL), threads)
+    if backend == "onnx":
+        model_dir = model or os.getenv("EMBEDDING_MODEL_DIR")
+        if not model_dir:
+            raise EncoderError("Backend onnx cần EMBEDDING_MODEL_DIR")
+        return OnnxEncoder(model_dir, threads)
+    raise EncoderError(f"Backend embedding không hỗ trợ: {backend} (chọn một trong {', '.join(BACKENDS)})")
+
+
+def export_onnx(model: str, out_dir: str, opset: int = 14) -> Path:
+    """Xuất transformer của SentenceTransformer ra ``out_dir`` để dùng với backend onnx.
+
+    Chạy một lần trên máy có mạng/có sẵn model; máy chủ chỉ cần copy thư mục kết quả.
+    """
+    module = optional_module("sentence_transformers")
+    torch = optional_module("torch")
+    if module is None or torch is None:
+        raise EncoderError("Cần sentence-transformers và torch để xuất ONNX")
+    st_model = module.SentenceTransformer(model, device="cpu")
+    transformer = st_model[0]
+    transformer.auto_model.config.return_dict = False
+    folder = Path(out_dir)
+    folder.mkdir(parents=True, exist_ok=True)
+    sample = transformer.tokenizer(["xin chào"], return_tensors="pt")
+    names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "seq"} for name in names}
+    dynamic_axes["token_embeddings"] = {0: "batch", 1: "seq"}
+    torch.onnx.export(
+        transformer.auto_model,
+        tuple(sample[name] for name in names),
+        str(folder / "model.onnx"),
+        input_names=names,
+        output_names=["token_embeddings"],
+        dynamic_axes=dynamic_axes,
+        opset_version=opset,
+    )
+    transformer.tokenizer.backend_tokenizer.save(str(folder / "tokenizer.json"))
+    return folder
+
+
+def _set_torch_threads(threads: int) -> None:
+    if threads <= 0:
+        return
+    torch = optional_module("torch")
+    if torch is not None:
+        torch.set_num_threads(threads)
@@ -0,0 +1,278 @@
+"""Đánh giá NLU offline: sinh tập câu có nhãn, chấm điểm hàng loạt, quét ngưỡng.
+
+Tập dữ liệu được gieo từ ``synonyms``/``examples`` của từng intent:
+
+* ``train``   – câu còn nằm trong chỉ mục (kiểm tra khớp chính xác).
+* ``heldout`` – câu bị rút khỏi chỉ mục trước khi dựng (kiểm tra tổng quát hoá).
+* ``noisy``   – biến thể gõ không dấu, sai chính tả, thêm từ đệm.
+
+Mọi chỉ số được tính trên các ma trận điểm đã cache (``NLUIndex.score_components``),
+nên quét nhiều ngưỡng/trọng số trộn chỉ là vài phép toán numpy.
+"""
+from __future__ import annotations
+
+import json
+import math
+import random
+import time
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from . import fusion
+from .lazy import optional_module
+from .nlu import NLUIndex
+from .schema import ScriptPack
+from .spelling import fold_diacritics as strip_diacritics
+
+FALLBACK = "__fallback__"
+_FILLERS_BEFORE = ("cho em hỏi", "mình muốn", "làm sao để", "hướng dẫn")
+_FILLERS_AFTER = ("với ạ", "được không", "nhé", "ạ")
+
+
+class Sample(NamedTuple):
+    text: str
+    intent_id: str
+    split: str = "test"
+
+
+def noisy_variants(text: str, rng: random.Random, count: int) -> List[str]:
+    """Sinh tối đa ``count`` biến thể nhiễu khác nhau của ``text``."""
+    makers = [
+        lambda t: strip_diacritics(t),
+        lambda t: _typo(t, rng),
+        lambda t: f"{rng.choice(_FILLERS_BEFORE)} {t}",
+        lambda t: f"{t} {rng.choice(_FILLERS_AFTER)}",
+        lambda t: _typo(strip_diacritics(t), rng),
+    ]
+    rng.shuffle(makers)
+    variants: List[str] = []
+    for make in makers:
+        variant = make(text)
+        if variant != text and variant not in variants:
+            variants.append(variant)
+        if len(variants) >= count:
+            break
+    return variants
+
+
+def _typo(text: str, rng: random.Random) -> str:
+    tokens = text.split()
+    candidates = [i for i, tok in enumerate(tokens) if len(tok) > 3]
+    if not candidates:
+        return text
+    idx = rng.choice(candidates)
+    token = tokens[idx]
+    pos = rng.randrange(1, len(token) - 1)
+    if rng.random() < 0.5:
+        token = token[:pos] + token[pos + 1 :]
+    else:
+        token = token[: pos - 1] + token[pos] + token[pos - 1] + token[pos + 1 :]
+    tokens[idx] = token
+    return " ".join(tokens)
+
+
+def seed_dataset(
+    pack: ScriptPack,
+    holdout: float = 0.2,
+    noise: int = 2,
+    seed: int = 13,
+) -> Tuple[ScriptPack, List[Sample]]:
+    """Trả về (pack đã rút câu held-out, danh sách mẫu có nhãn)."""
+    rng = random.Random(seed)
+    samples: List[Sample] = []
+    intents = []
+    for intent in pack.intents:
+        phrases = list(dict.fromkeys(intent.synonyms + intent.examples))
+        shuffled = phrases[:]
+        rng.shuffle(shuffled)
+        # Luôn giữ lại ít nhất một câu trong chỉ mục để intent còn tài liệu
+        n_out = min(int(math.ceil(holdout * len(phrases))), max(len(phrases) - 1, 0)) if holdout > 0 else 0
+        held = set(shuffled[:n_out])
+        for phrase in phrases:
+            samples.append(Sample(phrase, intent.id, "heldout" if phrase in held else "train"))
+            for variant in noisy_variants(phrase, rng, noise):
+                samples.append(Sample(variant, intent.id, "noisy"))
+        intents.append(
+            intent.model_copy(
+                update={
+                    "synonyms": [p for p in intent.synonyms if p not in held],
+                    "examples": [p for p in intent.examples if p not in held],
+                }
+            )
+        )
+    return ScriptPack(intents=intents, calibration=pack.calibration), samples
+
+
+def read_samples(path: str) -> List[Sample]:
+    samples: List[Sample] = []
+    with open(path, "r", encoding="utf-8") as stream:
+        for line in stream:
+            line = line.strip()
+            if not line:
+                continue
+            row = json.loads(line)
+            samples.append(Sample(row["text"], row["intent"], row.get("split", "test")))
+    return samples
+
+
+def write_samples(path: str, samples: Iterable[Sample]) -> None:
+    with open(path, "w", encoding="utf-8") as stream:
+        for sample in samples:
+            stream.write(
+                json.dumps({"text": sample.text, "intent": sample.intent_id, "split": sample.split}, ensure_ascii=False)
+            )
+            stream.write("\n")
+
+
+class ScoreCache(NamedTuple):
+    """Ma trận điểm thành phần + nhãn vàng, tính một lần cho mọi lần quét."""
+
+    intent_ids: List[str]
+    domains: List[str]
+    gold: Any  # np.ndarray (n,) chỉ số intent đúng, -1 nếu nhãn không có trong pack
+    splits: List[str]
+    bm25: Any  # np.ndarray (n, n_intents)
+    embed: Any  # np.ndarray | None
+    bulk_ms: float
+    single_ms: List[float]
+
+
+def score_samples(nlu: NLUIndex, samples: Sequence[Sample], latency_samples: int = 200) -> ScoreCache:
+    np = optional_module("numpy")
+    intents = nlu.all_intents()
+    intent_ids = [intent.id for intent in intents]
+    position = {intent_id: idx for idx, intent_id in enumerate(intent_ids)}
+    gold = np.asarray([position.get(s.intent_id, -1) for s in samples], dtype=np.int64)
+    texts = [s.text for s in samples]
+
+    started = time.perf_counter()
+    bm25, embed = nlu.score_components(texts)
+    bulk_ms = (time.perf_counter() - started) * 1000
+
+    single_ms: List[float] = []
+    for text in texts[:latency_samples]:
+        t0 = time.perf_counter()
+        nlu.rank(text)
+        single_ms.append((time.perf_counter() - t0) * 1000)
+    return ScoreCache(
+        intent_ids=intent_ids,
+        domains=[intent.domain for intent in intents],
+        gold=gold,
+        splits=[s.split for s in samples],
+        bm25=bm25,
+        embed=embed,
+        bulk_ms=bulk_ms,
+        single_ms=single_ms,
+    )
+
+
+def evaluate(nlu: NLUIndex, cache: ScoreCache, threshold: float, bm25_weight: Optional[float] = None) -> Dict[str, Any]:
+    """Báo cáo chi tiết cho một cấu hình (ngưỡng, trọng số trộn)."""
+    np = optional_module("numpy")
+    scores = nlu.fuse(cache.bm25, cache.embed, bm25_weight)
+    order = np.argsort(-scores, axis=1, kind="stable")[:, :3]
+    best = np.take_along_axis(scores, order[:, :1], axis=1)[:, 0]
+    top1 = order[:, 0] == cache.gold
+    top3 = (order == cache.gold[:, None]).any(axis=1)
+    fallback = best < threshold
+    correct = top1 & ~fallback
+
+    report: Dict[str, Any] = {
+        "samples": int(len(cache.gold)),
+        "threshold": threshold,
+        "bm25_weight": nlu.bm25_weight if bm25_weight is None else bm25_weight,
+        "top1": _mean(top1),
+        "top3": _mean(top3),
+        "fallback_rate": _mean(fallback),
+        "accepted_accuracy": _mean(correct),
+        "by_split": {},
+        "latency": _latency(cache),
+    }
+    splits = np.asarray(cache.splits)
+    for split in sorted(set(cache.splits)):
+        mask = splits == split
+        report["by_split"][split] = {
+            "samples": int(mask.sum()),
+            "top1": _mean(top1[mask]),
+            "top3": _mean(top3[mask]),
+            "fallback_rate": _mean(fallback[mask]),
+        }
+    report["confusion"] = _domain_confusion(cache, order[:, 0], fallback)
+    return report
+
+
+def sweep(
+    nlu: NLUIndex,
+    cache: ScoreCache,
+    thresholds: Sequence[float],
+    weights: Optional[Sequence[float]] = None,
+) -> List[Dict[str, float]]:
+    """Quét lưới (trọng số trộn x ngưỡng) trên ma trận đã cache.
+
+    Mỗi trọng số cần một phép trộn + argmax; mọi ngưỡng được đánh giá cùng lúc
+    bằng broadcast nên chi phí gần như không phụ thuộc số ngưỡng.
+    """
+    np = optional_module("numpy")
+    if cache.embed is None or not weights:
+        weights = [nlu.bm25_weight]
+    grid = np.asarray(list(thresholds), dtype=np.float64)
+    rows: List[Dict[str, float]] = []
+    for weight in weights:
+        scores = nlu.fuse(cache.bm25, cache.embed, weight)
+        predicted = scores.argmax(axis=1)
+        best = scores[np.arange(len(predicted)), predicted]
+        hit = predicted == cache.gold
+        accepted = best[:, None] >= grid[None, :]
+        n = max(len(predicted), 1)
+        accuracy = (accepted & hit[:, None]).sum(axis=0) / n
+        fallback = 1.0 - accepted.sum(axis=0) / n
+        wrong_accept = (accepted & ~hit[:, None]).sum(axis=0) / n
+        for idx, threshold in enumerate(grid):
+            rows.append(
+                {
+                    "bm25_weight": float(weight),
+                    "threshold": float(threshold),
+                    "accepted_accuracy": float(accuracy[idx]),
+                    "fallback_rate": float(fallback[idx]),
+                    "wrong_accept_rate": float(wrong_accept[idx]),
+                }
+            )
+    return rows
+
+
+def fit_calibration(nlu: NLUIndex, cache: ScoreCache, bm25_weight: Optional[float] = None) -> Dict[str, Any]:
+    """Fit đường cong P(top-1 đúng | điểm) trên điểm *chưa* calibration của cache."""
+    np = optional_module("numpy")
+    weight = nlu.bm25_weight if bm25_weight is None else bm25_weight
+    saved, nlu.fusion.calibration = nlu.fusion.calibration, None
+    try:
+        scores = nlu.fuse(cache.bm25, cache.embed, weight)
+    finally:
+        nlu.fusion.calibration = saved
+    predicted = scores.argmax(axis=1)
+    best = scores[np.arange(len(predicted)), predicted]
+    return fusion.fit_calibration(best, predicted == cache.gold, nlu.fusion.method, weight)
+
+
+def _mean(values) -> float:
+    return float(values.mean()) if len(values) else 0.0
+
+
+def _latency(cache: ScoreCache) -> Dict[str, float]:
+    single = sorted(cache.single_ms)
+    n = len(cache.gold)
+    return {
+        "rank_p50_ms": single[len(single) // 2] if single else 0.0,
+        "rank_p95_ms": single[int(0.95 * (len(single) - 1))] if single else 0.0,
+        "bulk_ms": cache.bulk_ms,
+        "bulk_per_query_us": cache.bulk_ms * 1000 / n if n else 0.0,
+    }
+
+
+def _domain_confusion(cache: ScoreCache, predicted, fallback) -> Dict[str, Dict[str, int]]:
+    confusion: Dict[str, Dict[str, int]] = {}
+    for gold_idx, pred_idx, is_fallback in zip(cache.gold.tolist(), predicted.tolist(), fallback.tolist()):
+        gold_domain = cache.domains[gold_idx] if gold_idx >= 0 else "?"
+        pred_domain = FALLBACK if is_fallback else cache.domains[pred_idx]
+        row = confusion.setdefault(gold_domain, {})
+        row[pred_domain] = row.get(pred_domain, 0) + 1
+    return confusion
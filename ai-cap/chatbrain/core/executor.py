@@ -1,35 +1,88 @@
 from __future__ import annotations
 
-from typing import Dict, Optional
+from typing import Dict, Mapping, Optional
 
+from . import buttons, flows
+from .buttons import ButtonAction, ButtonTable
+from .conditions import Predicate
 from .context import ContextManager
-from .schema import ContextFrame, Intent, ScriptPack, StepUI
+from .flows import FlowTable
+from .hooks import HookRegistry, HookTable
+from .schema import ContextFrame, Intent, ScriptPack, Step, StepUI
+from .slots import SlotExtractor, StepKey, compile_step_conditions
 
 
 class Executor:
-    def __init__(self, context: ContextManager) -> None:
+    def __init__(self, context: ContextManager, hooks: Optional[HookRegistry] = None) -> None:
         self.context = context
         self.script_pack = ScriptPack(intents=[])
-        self.version_prompts: Dict[str, str] = {}
+        # (intent_id, step_id) -> nhãn nút chuẩn hoá -> hành động (core/buttons.py)
+        self.buttons: ButtonTable = {}
+        # Trích slot và điều kiện ``when`` của bước, biên dịch khi nạp pack (core/slots.py)
+        self.slot_extractor = SlotExtractor()
+        self.step_conditions: Dict[StepKey, Predicate] = {}
+        # Hook đã đăng ký (core/hooks.py) và bảng hook theo bước của pack hiện tại.
+        # Các tenant dùng chung một registry (và thread pool) với service gốc.
+        self.hooks = hooks if hooks is not None else HookRegistry()
+        self.step_hooks: HookTable = {}
+        # Tra intent theo id và bảng chuyển bước của pack hiện tại (core/flows.py)
+        self.flows = FlowTable()
 
-    def load_script_pack(self, pack: ScriptPack) -> None:
+    def load_script_pack(
+        self,
+        pack: ScriptPack,
+        button_table: Optional[ButtonTable] = None,
+        hook_table: Optional[HookTable] = None,
+    ) -> None:
+        self.install(
+            pack,
+            button_table if button_table is not None else buttons.compile_buttons(pack),
+            hook_table if hook_table is not None else self.hooks.compile(pack),
+            SlotExtractor(pack),
+            compile_step_conditions(pack),
+        )
+
+    def install(
+        self,
+        pack: ScriptPack,
+        button_table: ButtonTable,
+        hook_table: HookTable,
+        slot_extractor: SlotExtractor,
+        step_conditions: Dict[StepKey, Predicate],
+        flow_table: Optional[FlowTable] = None,
+    ) -> None:
+        """Gắn các bảng đã biên dịch sẵn (snapshot, xem core/snapshots.py): chỉ gán con trỏ."""
+        self.flows = flow_table if flow_table is not None else FlowTable(pack)
+        self.step_hooks = hook_table
         self.script_pack = pack
+        self.buttons = button_table
+        self.slot_extractor = slot_extractor
+        self.step_conditions = step_conditions
 
-    # Hook placeholders -------------------------------------------------
-    def _run_hook(self, hook_name: Optional[str], session_id: str, intent: Intent, step_id: str) -> None:
-        if not hook_name:
-            return
-        func = getattr(self, hook_name, None)
-        if callable(func):
-            func(session_id=session_id, intent=intent, step_id=step_id)
-
-    def noop(self, **kwargs) -> None:  # pragma: no cover - ví dụ hook
-        return None
+    # Hooks -------------------------------------------------------------
+    def _run_hooks(self, session_id: str, frame: ContextFrame, intent: Intent, step_id: str) -> None:
+        for hook in self.step_hooks.get((intent.id, step_id), ()):
+            updates = self.hooks.run(
+                hook,
+                session_id=session_id,
+                intent=intent,
+                step_id=step_id,
+                slots=dict(frame.slots),
+            )
+            if updates:
+                frame.slots.update({str(k): str(v) for k, v in updates.items()})
 
     # Core execution ----------------------------------------------------
-    def execute_intent(self, session_id: str, intent: Intent, interruption: bool) -> Dict[str, object]:
+    def execute_intent(
+        self,
+        session_id: str,
+        intent: Intent,
+        interruption: bool,
+        slots: Optional[Mapping[str, str]] = None,
+    ) -> Dict[str, object]:
         frame = self.context.peek(session_id)
         if frame and frame.intent_id == intent.id and not interruption:
+            frame.slots.update(slots or {})
             return self._render_current_step(session_id, frame, intent)
 
         new_frame = ContextFrame(
@@ -38,11 +91,12 @@ class Executor:
             domain=intent.domain,
             step_id=intent.steps[0].id,
             step_index=0,
+            slots=dict(slots or {}),
             version=intent.version,
             interruption=interruption,
         )
         self.context.push(session_id, new_frame)
-        return self._render_current_step(session_id, new_frame, intent, run_hooks=True)
+        return self._enter_step(session_id, new_frame, intent, 0)
 
     def advance_step(self, session_id: str) -> Dict[str, object]:
         frame = self.context.peek(session_id)
@@ -52,12 +106,85 @@ class Executor:
         if not intent:
             self.context.pop(session_id)
             return self._message("Em chưa có thông tin về quy trình trước đó.")
-        if self._check_version_prompt(session_id, frame, intent):
-            return self._check_version_prompt(session_id, frame, intent)
-        if frame.step_index + 1 < len(intent.steps):
-            frame.step_index += 1
-            frame.step_id = intent.steps[frame.step_index].id
+        version_message = self._check_version_prompt(session_id, frame, intent)
+        if version_message:
+            return version_message
+        index = self.flows.next_index(intent.id, frame.step_index)
+        if index == flows.DYNAMIC:
+            return self._enter_step(session_id, frame, intent, frame.step_index + 1)
+        # Bước kế tiếp không có điều kiện/slot: chuyển thẳng theo bảng, không xét bỏ qua
+        if index >= len(intent.steps):
+            return self._finish(session_id)
+        frame.step_index = index
+        frame.step_id = intent.steps[index].id
+        return self._render_current_step(session_id, frame, intent, run_hooks=True)
+
+    def peek_next(self, session_id: str) -> Optional[Dict[str, object]]:
+        """Bước mà nút "Đã xong" của bước hiện tại sẽ hiện ra, nếu biết trước được.
+
+        Chỉ trả khi bước kế tiếp cố định (không ``when``/slot) và phiên không chờ xác
+        nhận nào; không đổi trạng thái phiên và không chạy hook.
+        """
+        frame = self.context.peek(session_id)
+        if not frame or self.context.pending_resume(session_id) or self.context.version_prompt(session_id):
+            return None
+        intent = self._intent_by_id(frame.intent_id)
+        if not intent or frame.version != intent.version:
+            return None
+        index = self.flows.next_index(intent.id, frame.step_index)
+        labels = self.flows.advance_labels.get(intent.id, ())
+        if index == flows.DYNAMIC or index >= len(intent.steps) or not labels or not labels[frame.step_index]:
+            return None
+        step = intent.steps[index]
+        return {
+            "labels": list(labels[frame.step_index]),
+            "reply": step.say or step.ask or "",
+            "ui": step.ui,
+            "step": self.flows.ref(intent, index),
+        }
+
+    def answer_slot(self, session_id: str, text: str) -> Optional[Dict[str, object]]:
+        """Nếu bước đang chạy hỏi slot và ``text`` trả lời được thì lưu slot rồi sang bước sau."""
+        frame = self.context.peek(session_id)
+        if not frame:
+            return None
+        intent = self._intent_by_id(frame.intent_id)
+        if not intent or frame.version != intent.version:
+            return None
+        step = intent.steps[frame.step_index]
+        if not step.slot_name:
+            return None
+        value = self.slot_extractor.answer(step.slot_name, step.slot_type, text)
+        if value is None:
+            return None
+        frame.slots[step.slot_name] = value
+        return self._enter_step(session_id, frame, intent, frame.step_index + 1)
+
+    def slots(self, session_id: str) -> Dict[str, str]:
+        """Slot đã biết của phiên, frame trên cùng ghi đè frame bên dưới."""
+        slots: Dict[str, str] = {}
+        for frame in self.context.stack(session_id):
+            slots.update(frame.slots)
+        return slots
+
+    def _enter_step(self, session_id: str, frame: ContextFrame, intent: Intent, index: int) -> Dict[str, object]:
+        """Chuyển tới bước ``index``, bỏ qua bước đã có slot hoặc có ``when`` sai."""
+        slots = self.slots(session_id)
+        while index < len(intent.steps) and self._skip_step(intent, intent.steps[index], slots):
+            index += 1
+        if index < len(intent.steps):
+            frame.step_index = index
+            frame.step_id = intent.steps[index].id
             return self._render_current_step(session_id, frame, intent, run_hooks=True)
+        return self._finish(session_id)
+
+    def _skip_step(self, intent: Intent, step: Step, slots: Mapping[str, str]) -> bool:
+        if step.slot_name and step.slot_name in slots:
+            return True
+        condition = self.step_conditions.get((intent.id, step.id))
+        return condition is not None and not condition(slots)
+
+    def _finish(self, session_id: str) -> Dict[str, object]:
         popped = self.context.pop(session_id)
         if popped and popped.interruption:
             previous = self.context.peek(session_id)
@@ -76,15 +203,27 @@ class Executor:
         intent = self._intent_by_id(frame.intent_id)
         if not intent:
             return self._message("Không tìm thấy thông tin quy trình.")
-        if frame.step_index == 0:
+        # Lùi qua các bước có ``when`` sai; bước hỏi slot vẫn dừng để trả lời lại
+        slots = self.slots(session_id)
+        index = frame.step_index - 1
+        while index >= 0 and not self._step_applies(intent, intent.steps[index], slots):
+            index -= 1
+        if index < 0:
             return {
                 "reply": "Đang ở bước đầu tiên, anh/chị hãy tiếp tục nhé.",
                 "ui": self._current_ui(intent, frame),
             }
-        frame.step_index -= 1
-        frame.step_id = intent.steps[frame.step_index].id
+        frame.step_index = index
+        frame.step_id = intent.steps[index].id
+        step = intent.steps[index]
+        if step.slot_name:
+            frame.slots.pop(step.slot_name, None)
         return self._render_current_step(session_id, frame, intent)
 
+    def _step_applies(self, intent: Intent, step: Step, slots: Mapping[str, str]) -> bool:
+        condition = self.step_conditions.get((intent.id, step.id))
+        return condition is None or condition(slots)
+
     def clear_task(self, session_id: str) -> Dict[str, object]:
         popped = self.context.pop(session_id)
         if not popped:
@@ -116,22 +255,22 @@ class Executor:
                 self.context.pop_pending_resume(session_id)
                 return self._message("Dạ vâng, nếu cần hỗ trợ thêm anh/chị cứ nói nhé.")
 
-        if session_id in self.version_prompts:
-            intent_id = self.version_prompts[session_id]
+        intent_id = self.context.version_prompt(session_id)
+        if intent_id:
             frame = self.context.peek(session_id)
             intent = self._intent_by_id(intent_id)
             if not frame or not intent:
-                self.version_prompts.pop(session_id, None)
+                self.context.pop_version_prompt(session_id)
                 return self._message("Em chưa thể tiếp tục do thiếu dữ liệu.")
             if label == "Tiếp tục":
                 frame.version = intent.version
-                self.version_prompts.pop(session_id, None)
+                self.context.pop_version_prompt(session_id)
                 return self._render_current_step(session_id, frame, intent)
             if label == "Khởi động lại":
                 frame.version = intent.version
                 frame.step_index = 0
                 frame.step_id = intent.steps[0].id
-                self.version_prompts.pop(session_id, None)
+                self.context.pop_version_prompt(session_id)
                 return self._render_current_step(session_id, frame, intent)
             return self._message("Anh/chị vui lòng chọn một trong các nút gợi ý giúp em nhé.")
 
@@ -147,9 +286,33 @@ class Executor:
             return self._message("Vâng ạ, nếu cần anh/chị cứ nhắn tiếp nhé.")
         return self._message("Em đã ghi nhận.")
 
+    def step_button(self, session_id: str, text: str) -> Optional[ButtonAction]:
+        """Tra nhãn trong bảng nút của bước đang chạy; None nếu không phải nút của bước."""
+        frame = self.context.peek(session_id)
+        if not frame:
+            return None
+        return buttons.lookup(self.buttons, frame.intent_id, frame.step_id, text)
+
+    def handle_step_action(self, session_id: str, action: ButtonAction) -> Dict[str, object]:
+        if action.kind == buttons.NEXT:
+            return self.advance_step(session_id)
+        if action.kind == buttons.BACK:
+            return self.previous_step(session_id)
+        if action.kind == buttons.CANCEL:
+            return self.clear_task(session_id)
+        if action.kind == buttons.HELP:
+            return self.handle_button(session_id, "Cần trợ giúp thêm")
+        if action.kind == buttons.MENU:
+            self.context.clear(session_id)
+            intent = self._intent_by_id(action.target) if action.target else None
+            if intent:
+                return self.execute_intent(session_id, intent, interruption=False)
+            return self._message("Dạ vâng, anh/chị cần hỗ trợ gì tiếp theo ạ?")
+        return self._message("Em đã ghi nhận.")
+
     # Helpers -----------------------------------------------------------
     def _intent_by_id(self, intent_id: str) -> Optional[Intent]:
-        return self.script_pack.intent_by_id(intent_id)
+        return self.flows.intent(intent_id)
 
     def _current_ui(self, intent: Intent, frame: ContextFrame) -> StepUI:
         step = intent.steps[frame.step_index]
@@ -166,15 +329,15 @@ class Executor:
         if version_message:
             return version_message
         step = intent.steps[frame.step_index]
-        self._run_hook(step.before_hook, session_id, intent, step.id)
-        self._run_hook(step.action, session_id, intent, step.id)
-        self._run_hook(step.after_hook, session_id, intent, step.id)
+        if run_hooks:
+            self._run_hooks(session_id, frame, intent, step.id)
+        self.context.record_step(session_id, frame)
         ui = step.ui
-        return {"reply": step.say, "ui": ui}
+        return {"reply": step.say or step.ask or "", "ui": ui, "step": self.flows.ref(intent, frame.step_index)}
 
     def _check_version_prompt(self, session_id: str, frame: ContextFrame, intent: Intent) -> Optional[Dict[str, object]]:
         if frame.version != intent.version:
-            self.version_prompts[session_id] = intent.id
+            self.context.set_version_prompt(session_id, intent.id)
             return {
                 "reply": "Nội dung đã cập nhật. Anh/chị muốn tiếp tục hay khởi động lại?",
                 "ui": StepUI(buttons=["Tiếp tục", "Khởi động lại"]),
@@ -0,0 +1,54 @@
+"""Bảng chuyển bước biên dịch sẵn cho các quy trình hướng dẫn.
+
+Phần lớn quy trình (ví dụ ``01_vneid.yaml``) là chuỗi bước tuyến tính: "Đã xong" luôn
+dẫn tới bước kế tiếp. Khi nạp pack, mỗi intent được biên dịch thành một bộ chỉ số
+``next[i]`` = bước đến sau bước ``i``; ``len(steps)`` nghĩa là kết thúc, ``DYNAMIC``
+nghĩa là bước kế tiếp có ``when``/hỏi slot nên phải xét lúc chạy. Nhờ vậy executor
+tra intent bằng dict, chuyển bước bằng một lần tra mảng, và biết trước bước sẽ hiện
+ra để connector chuẩn bị sẵn payload gửi đi (xem ``Executor.peek_next``).
+"""
+from __future__ import annotations
+
+from typing import Dict, Optional, Tuple
+
+from .buttons import NAVIGATION, NEXT, normalize_label
+from .schema import Intent, ScriptPack
+
+DYNAMIC = -1
+
+
+class FlowTable:
+    def __init__(self, pack: Optional[ScriptPack] = None) -> None:
+        self.intents: Dict[str, Intent] = {}
+        self.next: Dict[str, Tuple[int, ...]] = {}
+        # "intent#step" dựng sẵn, dùng làm tham chiếu bước trong phản hồi và log
+        self.refs: Dict[str, Tuple[str, ...]] = {}
+        # Nhãn nút của từng bước dẫn tới bước kế tiếp (NEXT trong core/buttons.py)
+        self.advance_labels: Dict[str, Tuple[Tuple[str, ...], ...]] = {}
+        for intent in pack.intents if pack is not None else ():
+            steps = intent.steps
+            self.intents.setdefault(intent.id, intent)
+            self.next[intent.id] = tuple(
+                DYNAMIC if index + 1 < len(steps) and (steps[index + 1].when or steps[index + 1].slot_name) else index + 1
+                for index in range(len(steps))
+            )
+            self.refs[intent.id] = tuple(f"{intent.id}#{step.id}" for step in steps)
+            self.advance_labels[intent.id] = tuple(
+                tuple(label for label in step.ui.buttons if NAVIGATION.get(normalize_label(label)) == NEXT)
+                for step in steps
+            )
+
+    def intent(self, intent_id: str) -> Optional[Intent]:
+        return self.intents.get(intent_id)
+
+    def next_index(self, intent_id: str, index: int) -> int:
+        row = self.next.get(intent_id)
+        if row is None or not 0 <= index < len(row):
+            return DYNAMIC
+        return row[index]
+
+    def ref(self, intent: Intent, index: int) -> str:
+        row = self.refs.get(intent.id)
+        if row is not None and 0 <= index < len(row) and intent is self.intents.get(intent.id):
+            return row[index]
+        return f"{intent.id}#{intent.steps[index].id}"
@@ -0,0 +1,172 @@
+"""Chuẩn hoá và trộn điểm BM25 / embedding thành độ tự tin có thể so với ngưỡng.
+
+Cách cũ (``max``) chia điểm BM25 cho điểm lớn nhất của chính truy vấn, nên intent
+đứng đầu luôn được 1.0 kể cả khi câu hỏi vô nghĩa. Các phương pháp ở đây giữ
+thông tin tuyệt đối:
+
+* ``saturation`` (mặc định): BM25 chia cho *self-score* của truy vấn – tổng idf
+  của các token trong câu (token ngoài từ vựng nhận idf lớn nhất), tức điểm một
+  tài liệu độ dài trung bình khớp trọn câu hỏi sẽ nhận được – rồi bão hoà
+  ``x / (x + k)`` (``SATURATION_K``) để giữ thứ tự mà vẫn nằm trong [0, 1).
+  Embedding dùng cosine cắt về [0, 1] rồi trộn tuyến tính.
+* ``rrf``: reciprocal-rank fusion giữa thứ hạng BM25 và embedding để sắp thứ tự,
+  nhân với độ tự tin ``saturation`` tốt nhất của truy vấn để giữ ý nghĩa ngưỡng.
+* ``max``: hành vi cũ, giữ để so sánh.
+
+Sau cùng có thể áp một đường cong logistic ``sigmoid(a * x + b)`` được fit offline
+(``fit_calibration``) và lưu cạnh script pack trong ``calibration.json``.
+Mọi bước chỉ là vài phép toán vector trên ma trận điểm đã có.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import math
+import os
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Optional, Sequence
+
+from .lazy import optional_module
+
+if TYPE_CHECKING:  # pragma: no cover
+    import numpy as np
+
+logger = logging.getLogger(__name__)
+
+METHODS = ("saturation", "rrf", "max")
+CALIBRATION_FILE = "calibration.json"
+
+
+class Fusion:
+    def __init__(
+        self,
+        method: Optional[str] = None,
+        rrf_k: Optional[float] = None,
+        saturation_k: Optional[float] = None,
+        calibration: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        method = (method or os.getenv("FUSION_METHOD", "saturation")).lower()
+        if method not in METHODS:
+            raise ValueError(f"FUSION_METHOD không hợp lệ: {method} (chọn một trong {', '.join(METHODS)})")
+        self.method = method
+        self.rrf_k = float(os.getenv("RRF_K", "60")) if rrf_k is None else rrf_k
+        # Khớp trọn câu hỏi (tỉ lệ 1.0) -> 1 / (1 + k); mặc định 0.8
+        self.saturation_k = float(os.getenv("SATURATION_K", "0.25")) if saturation_k is None else saturation_k
+        self.calibration: Optional[Dict[str, Any]] = None
+        self.set_calibration(calibration)
+
+    def set_calibration(self, calibration: Optional[Dict[str, Any]]) -> None:
+        if calibration and calibration.get("method", self.method) != self.method:
+            logger.warning(
+                "Bỏ qua calibration fit cho '%s' vì đang dùng '%s'", calibration.get("method"), self.method
+            )
+            calibration = None
+        self.calibration = calibration or None
+
+    # Chuẩn hoá từng thành phần ----------------------------------------
+    def normalize_bm25(self, raw: "np.ndarray", self_scores: "np.ndarray") -> "np.ndarray":
+        np = optional_module("numpy")
+        if self.method == "max":
+            row_max = raw.max(axis=1, keepdims=True) if raw.size else np.zeros((raw.shape[0], 1))
+            with np.errstate(divide="ignore", invalid="ignore"):
+                return np.where(row_max > 0, raw / row_max, 0.0)
+        denom = self_scores.reshape(-1, 1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratio = np.where(denom > 0, raw / denom, 0.0)
+        return ratio / (ratio + self.saturation_k)
+
+    def normalize_embed(self, cosine: "Optional[np.ndarray]") -> "Optional[np.ndarray]":
+        if cosine is None:
+            return None
+        np = optional_module("numpy")
+        if self.method == "max":
+            return (cosine + 1) / 2
+        return np.clip(cosine, 0.0, 1.0)
+
+    # Trộn --------------------------------------------------------------
+    def fuse(self, bm25: "np.ndarray", embed: "Optional[np.ndarray]", bm25_weight: float) -> "np.ndarray":
+        np = optional_module("numpy")
+        if embed is None:
+            linear = bm25
+        else:
+            linear = bm25_weight * bm25 + (1 - bm25_weight) * embed
+        if self.method == "rrf" and embed is not None and bm25.shape[1] > 0:
+            rrf = bm25_weight / (self.rrf_k + _ranks(bm25)) + (1 - bm25_weight) / (self.rrf_k + _ranks(embed))
+            rrf = rrf * (self.rrf_k + 1)  # 1.0 khi cả hai cùng xếp hạng nhất
+            fused = rrf * linear.max(axis=1, keepdims=True)
+        else:
+            fused = linear
+        return self.calibrate(fused)
+
+    def calibrate(self, scores: "np.ndarray") -> "np.ndarray":
+        if not self.calibration:
+            return scores
+        np = optional_module("numpy")
+        a = float(self.calibration.get("a", 1.0))
+        b = float(self.calibration.get("b", 0.0))
+        return 1.0 / (1.0 + np.exp(-(a * scores + b)))
+
+
+def _ranks(scores: "np.ndarray") -> "np.ndarray":
+    """Hạng 1-based theo từng dòng (điểm cao nhất = 1), giữ thứ tự ổn định khi hoà."""
+    np = optional_module("numpy")
+    order = np.argsort(-scores, axis=1, kind="stable")
+    ranks = np.empty_like(order)
+    np.put_along_axis(ranks, order, np.arange(1, scores.shape[1] + 1)[None, :].repeat(scores.shape[0], 0), axis=1)
+    return ranks.astype(np.float64)
+
+
+def fit_calibration(
+    scores: Sequence[float],
+    correct: Sequence[bool],
+    method: str,
+    bm25_weight: float,
+    iterations: int = 50,
+    l2: float = 1e-3,
+) -> Dict[str, Any]:
+    """Fit logistic 1 biến (Newton/IRLS): P(đúng | điểm top-1) = sigmoid(a * x + b)."""
+    np = optional_module("numpy")
+    x = np.asarray(scores, dtype=np.float64)
+    y = np.asarray(correct, dtype=np.float64)
+    if x.size == 0 or y.min() == y.max():
+        raise ValueError("Cần cả mẫu đúng và sai để fit calibration")
+    features = np.stack([x, np.ones_like(x)], axis=1)
+    theta = np.zeros(2)
+    for _ in range(iterations):
+        p = 1.0 / (1.0 + np.exp(-(features @ theta)))
+        gradient = features.T @ (p - y) + l2 * theta
+        hessian = (features * (p * (1 - p))[:, None]).T @ features + l2 * np.eye(2)
+        step = np.linalg.solve(hessian, gradient)
+        theta -= step
+        if np.abs(step).max() < 1e-8:
+            break
+    return {
+        "method": method,
+        "bm25_weight": bm25_weight,
+        "a": float(theta[0]),
+        "b": float(theta[1]),
+        "samples": int(x.size),
+    }
+
+
+def read_calibration(folder: str) -> Optional[Dict[str, Any]]:
+    path = Path(folder) / CALIBRATION_FILE
+    if not path.is_file():
+        return None
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError) as exc:
+        logger.warning("Không đọc được %s: %s", path, exc)
+        return None
+    if not isinstance(data, dict) or not all(isinstance(data.get(k), (int, float)) for k in ("a", "b")):
+        logger.warning("File %s thiếu hệ số a/b", path)
+        return None
+    if not all(math.isfinite(float(data[k])) for k in ("a", "b")):
+        return None
+    return data
+
+
+def write_calibration(folder: str, calibration: Dict[str, Any]) -> Path:
+    path = Path(folder) / CALIBRATION_FILE
+    path.write_text(json.dumps(calibration, ensure_ascii=False, indent=2), encoding="utf-8")
+    return path
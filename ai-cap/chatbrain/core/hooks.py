@@ -0,0 +1,189 @@
+"""Đăng ký và chạy hook của bước (``before_hook`` / ``action`` / ``after_hook``).
+
+Tên hook trong YAML được tra **một lần** lúc nạp pack (``HookRegistry.compile``)
+thành bảng ``(intent, step) -> (hook, ...)``; tên chưa đăng ký là lỗi nạp, không
+phải lỗi lúc chat. Hook có thể là hàm thường hoặc ``async def``:
+
+* hàm thường chạy trong thread pool giới hạn ``HOOK_WORKERS`` luồng;
+* coroutine chạy trên một event loop nền dùng chung;
+* hook ``inline=True`` (rẻ, không I/O) được gọi trực tiếp, không qua pool.
+
+Mỗi hook có ``timeout`` riêng (mặc định ``HOOK_TIMEOUT_MS``). Quá hạn hay lỗi chỉ
+ghi log và thống kê, không làm hỏng câu trả lời. Hook trả về mapping thì các cặp
+đó được ghi vào slot của frame. Thời gian chạy được ghi theo tên hook (``stats``).
+
+Hàm hook nhận tham số từ khoá ``session_id``, ``intent``, ``step_id``, ``slots``::
+
+    @hooks.register("tra_cuu_ho_so", timeout=1.5)
+    async def tra_cuu_ho_so(session_id, intent, step_id, slots):
+        return {"trang_thai": await api.lookup(slots["ma_ho_so"])}
+"""
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import inspect
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Mapping, Optional, Tuple
+
+from .schema import ScriptPack
+
+logger = logging.getLogger(__name__)
+
+StepKey = Tuple[str, str]
+HOOK_FIELDS = ("before_hook", "action", "after_hook")
+
+
+class HookError(ValueError):
+    """Hook không tồn tại hoặc đăng ký sai."""
+
+
+@dataclass
+class HookStats:
+    calls: int = 0
+    errors: int = 0
+    timeouts: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+
+    def record(self, elapsed_ms: float) -> None:
+        self.calls += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "avg_ms": round(self.total_ms / self.calls, 3) if self.calls else 0.0,
+            "max_ms": round(self.max_ms, 3),
+        }
+
+
+@dataclass(frozen=True)
+class Hook:
+    name: str
+    func: Callable[..., Any]
+    timeout: float
+    is_async: bool = False
+    inline: bool = False
+    stats: HookStats = field(default_factory=HookStats, compare=False)
+
+
+HookTable = Dict[StepKey, Tuple[Hook, ...]]
+
+
+def _noop(**_: Any) -> None:
+    return None
+
+
+class HookRegistry:
+    def __init__(self, workers: Optional[int] = None, timeout: Optional[float] = None) -> None:
+        self.workers = workers if workers is not None else int(os.getenv("HOOK_WORKERS", "4"))
+        if timeout is None:
+            timeout = float(os.getenv("HOOK_TIMEOUT_MS", "2000")) / 1000
+        self.timeout = timeout
+        self._hooks: Dict[str, Hook] = {}
+        self._pool: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+        self.register("noop", _noop, inline=True)
+
+    # Đăng ký -----------------------------------------------------------
+    def register(
+        self,
+        name: str,
+        func: Optional[Callable[..., Any]] = None,
+        *,
+        timeout: Optional[float] = None,
+        inline: bool = False,
+    ) -> Any:
+        """Đăng ký ``func`` dưới tên ``name``; dùng được như decorator khi bỏ ``func``."""
+        if func is None:
+            return lambda f: self.register(name, f, timeout=timeout, inline=inline)
+        if not callable(func):
+            raise HookError(f"Hook {name} phải là hàm")
+        is_async = inspect.iscoroutinefunction(func)
+        if inline and is_async:
+            raise HookError(f"Hook async {name} không thể chạy inline")
+        self._hooks[name] = Hook(name, func, self.timeout if timeout is None else timeout, is_async, inline)
+        return func
+
+    def names(self) -> Tuple[str, ...]:
+        return tuple(self._hooks)
+
+    def compile(self, pack: ScriptPack) -> HookTable:
+        """Tra mọi tên hook của pack thành hàm; tên chưa đăng ký -> ``HookError``."""
+        table: HookTable = {}
+        for intent in pack.intents:
+            for step in intent.steps:
+                names = [getattr(step, attr) for attr in HOOK_FIELDS if getattr(step, attr)]
+                if not names:
+                    continue
+                resolved = []
+                for name in names:
+                    hook = self._hooks.get(name)
+                    if hook is None:
+                        raise HookError(f"Hook chưa đăng ký '{name}' ở bước {intent.id}/{step.id}")
+                    resolved.append(hook)
+                table[(intent.id, step.id)] = tuple(resolved)
+        return table
+
+    # Thực thi ----------------------------------------------------------
+    def run(self, hook: Hook, **kwargs: Any) -> Optional[Mapping[str, Any]]:
+        """Chạy một hook trong giới hạn thời gian; trả về slot cần ghi (nếu có)."""
+        started = time.perf_counter()
+        result: Any = None
+        try:
+            if hook.inline:
+                result = hook.func(**kwargs)
+            elif hook.is_async:
+                future = asyncio.run_coroutine_threadsafe(hook.func(**kwargs), self._event_loop())
+                result = future.result(timeout=hook.timeout)
+            else:
+                result = self._thread_pool().submit(hook.func, **kwargs).result(timeout=hook.timeout)
+        except concurrent.futures.TimeoutError:
+            hook.stats.timeouts += 1
+            if hook.is_async:
+                future.cancel()
+            logger.warning("Hook %s quá %.0f ms", hook.name, hook.timeout * 1000)
+        except Exception:  # noqa: BLE001 - hook lỗi không được làm hỏng câu trả lời
+            hook.stats.errors += 1
+            logger.exception("Hook %s lỗi", hook.name)
+        hook.stats.record((time.perf_counter() - started) * 1000)
+        return result if isinstance(result, Mapping) else None
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: hook.stats.as_dict() for name, hook in self._hooks.items() if hook.stats.calls}
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+            if self._loop is not None:
+                self._loop.call_soon_threadsafe(self._loop.stop)
+                self._loop = None
+
+    def _thread_pool(self) -> concurrent.futures.ThreadPoolExecutor:
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = concurrent.futures.ThreadPoolExecutor(
+                        max_workers=max(1, self.workers), thread_name_prefix="chatbrain-hook"
+                    )
+        return self._pool
+
+    def _event_loop(self) -> asyncio.AbstractEventLoop:
+        if self._loop is None:
+            with self._lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    threading.Thread(target=loop.run_forever, name="chatbrain-hook-loop", daemon=True).start()
+                    self._loop = loop
+        return self._loop
@@ -0,0 +1,36 @@
+"""Nạp trễ các thư viện nặng (numpy, rank_bm25, sentence-transformers, ...).
+
+``import chatbrain.service`` không được kéo theo các module này; chúng chỉ được
+import ở lần dùng đầu tiên (thường là khi dựng chỉ mục trong lifespan).
+"""
+from __future__ import annotations
+
+import importlib
+import importlib.util
+from types import ModuleType
+from typing import Dict, Optional
+
+_MISSING = object()
+_cache: Dict[str, object] = {}
+
+
+def optional_module(name: str) -> Optional[ModuleType]:
+    """Import ``name`` ở lần gọi đầu tiên; trả về ``None`` nếu chưa cài."""
+    cached = _cache.get(name)
+    if cached is None:
+        try:
+            cached = importlib.import_module(name)
+        except ImportError:
+            cached = _MISSING
+        _cache[name] = cached
+    return None if cached is _MISSING else cached  # type: ignore[return-value]
+
+
+def is_available(name: str) -> bool:
+    """Kiểm tra đã cài ``name`` hay chưa mà không import nó."""
+    if name in _cache:
+        return _cache[name] is not _MISSING
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
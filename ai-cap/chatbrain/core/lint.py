@@ -0,0 +1,355 @@
+"""Kiểm tra tĩnh script pack trước khi nạp: đồ thị intent/bước/nút, synonym mơ hồ, ảnh.
+
+``lint_path`` đọc song song mọi file của một thư mục hoặc ``registry.yaml`` (mỗi file
+lỗi thành một issue, không dừng cả lượt), rồi ``lint_pack`` kiểm tra:
+
+* ``unreachable-step``: bước đứng sau một bước có nút nhưng không nút nào đi tiếp;
+* ``unreachable-intent``: intent không có synonym/example và không được nút, bí danh
+  hay chuyển hướng nào trỏ tới;
+* ``unknown-button``: nhãn nút không phải nút điều hướng và không giải ra intent nào;
+* ``ambiguous-synonym``: một cụm (đã chuẩn hoá) là synonym/example của nhiều intent,
+  tìm bằng chỉ mục ngược cụm -> intent nên chỉ tốn một lượt duyệt;
+* ``invalid-media-url`` / ``missing-asset`` / ``oversized-image``: ảnh trỏ vào
+  ``knowledge_base/assets`` phải tồn tại và không quá ``LINT_MAX_IMAGE_KB``.
+
+Mức ``error`` chặn được việc nạp kịch bản (``LINT_ON_LOAD``); ``warning`` chỉ báo.
+"""
+from __future__ import annotations
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from . import buttons
+from .loader import ScriptLoaderError, parse_module, read_yaml
+from .schema import Intent, ScriptPack, Step
+
+ERROR = "error"
+WARNING = "warning"
+
+_ASSET_MARKER = "knowledge_base/assets/"
+_IMAGE_SUFFIXES = (".png", ".jpg", ".jpeg", ".gif", ".webp")
+_STEP_KEYS = set(Step.model_fields)
+_INTENT_KEYS = set(Intent.model_fields)
+
+Resolver = Callable[[str], Optional[str]]
+
+
+class Issue(NamedTuple):
+    level: str
+    code: str
+    message: str
+    file: str = ""
+    intent: str = ""
+    step: str = ""
+
+    def format(self) -> str:
+        where = self.intent + (f"#{self.step}" if self.step else "")
+        location = " ".join(part for part in (self.file, where) if part)
+        return f"{self.level:<7} {self.code:<18} {location}: {self.message}"
+
+
+@dataclass
+class LintReport:
+    issues: List[Issue] = field(default_factory=list)
+    files: int = 0
+    intents: int = 0
+    steps: int = 0
+    edges: Dict[str, List[str]] = field(default_factory=dict)
+    seconds: float = 0.0
+
+    @property
+    def errors(self) -> List[Issue]:
+        return [issue for issue in self.issues if issue.level == ERROR]
+
+    @property
+    def warnings(self) -> List[Issue]:
+        return [issue for issue in self.issues if issue.level == WARNING]
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "files": self.files,
+            "intents": self.intents,
+            "steps": self.steps,
+            "edges": sum(len(targets) for targets in self.edges.values()),
+            "errors": len(self.errors),
+            "warnings": len(self.warnings),
+            "seconds": round(self.seconds, 3),
+        }
+
+
+def default_assets(path: str) -> Path:
+    """Thư mục ảnh: ``CHATBRAIN_ASSETS`` hoặc ``knowledge_base/assets`` cạnh thư mục/registry."""
+    configured = os.getenv("CHATBRAIN_ASSETS")
+    if configured:
+        return Path(configured)
+    base = Path(path)
+    for candidate in (base.parent / "assets", base.parent / "knowledge_base" / "assets"):
+        if candidate.is_dir():
+            return candidate
+    return Path("knowledge_base/assets")
+
+
+def phrase_resolver(pack: ScriptPack) -> Resolver:
+    """Giải nhãn nút bằng khớp đúng cụm synonym/example/id (không cần chỉ mục NLU)."""
+    index: Dict[str, str] = {}
+    for intent in pack.intents:
+        for phrase in (intent.id.replace("_", " "), *intent.synonyms, *intent.examples):
+            index.setdefault(buttons.normalize_label(phrase), intent.id)
+    return lambda label: index.get(buttons.normalize_label(label))
+
+
+def lint_path(
+    path: str,
+    assets: Optional[str] = None,
+    resolve: Optional[Callable[[ScriptPack], Resolver]] = None,
+    max_image_kb: Optional[float] = None,
+    workers: Optional[int] = None,
+) -> LintReport:
+    """Lint một thư mục kịch bản hoặc một ``registry.yaml``.
+
+    ``resolve(pack)`` trả hàm giải nhãn nút; mặc định là ``phrase_resolver``. CLI
+    truyền vào bộ giải dùng chỉ mục BM25 giống lúc chạy thật.
+    """
+    started = time.perf_counter()
+    source = Path(path)
+    issues: List[Issue] = []
+    registry: Dict[str, Any] = {}
+    if source.is_dir():
+        files = sorted(p for p in source.glob("*.yaml") if p.is_file())
+    else:
+        try:
+            registry = read_yaml(source)
+        except ScriptLoaderError as exc:
+            return LintReport(issues=[Issue(ERROR, "load", str(exc), source.name)])
+        files = [
+            source.parent / module["path"]
+            for module in registry.get("modules") or []
+            if isinstance(module, dict) and isinstance(module.get("path"), str)
+        ]
+
+    with ThreadPoolExecutor(max_workers=workers or min(8, len(files) or 1)) as pool:
+        loaded = list(pool.map(_load, files))
+
+    intents: List[Intent] = []
+    seen: Dict[str, str] = {}
+    for file, (file_intents, raw, error) in zip(files, loaded):
+        if error is not None:
+            issues.append(Issue(ERROR, "load", error, file.name))
+            continue
+        issues.extend(_raw_issues(raw, file.name))
+        for intent in file_intents:
+            if intent.id in seen:
+                issues.append(
+                    Issue(ERROR, "duplicate-id", f"đã khai báo trong {seen[intent.id]}", file.name, intent.id)
+                )
+                continue
+            seen[intent.id] = file.name
+            intents.append(intent)
+
+    pack = ScriptPack(intents=intents)
+    extra_targets = _registry_targets(registry, seen, source.name, issues)
+    resolver = (resolve or phrase_resolver)(pack)
+    report = LintReport(files=len(files))
+    issues.extend(
+        lint_pack(
+            pack,
+            assets=assets or str(default_assets(path)),
+            resolve=resolver,
+            max_image_kb=max_image_kb,
+            targets=extra_targets,
+            report=report,
+        )
+    )
+    report.issues = issues
+    report.seconds = time.perf_counter() - started
+    return report
+
+
+def lint_pack(
+    pack: ScriptPack,
+    assets: Optional[str] = None,
+    resolve: Optional[Resolver] = None,
+    max_image_kb: Optional[float] = None,
+    targets: Iterable[str] = (),
+    report: Optional[LintReport] = None,
+) -> List[Issue]:
+    """Các kiểm tra trên pack đã nạp; ``targets`` là intent được bí danh/chuyển hướng trỏ tới."""
+    if resolve is None:
+        resolve = phrase_resolver(pack)
+    if max_image_kb is None:
+        max_image_kb = float(os.getenv("LINT_MAX_IMAGE_KB", "500"))
+    assets_root = Path(assets) if assets else default_assets(".")
+    issues: List[Issue] = []
+    first_step = {intent.id: intent.steps[0].id for intent in pack.intents}
+    referenced: Set[str] = set(targets) | set(pack.aliases.values())
+    for redirect in pack.redirects:
+        referenced.add(redirect.to)
+    edges: Dict[str, List[str]] = {}
+    resolved: Dict[str, Optional[str]] = {}
+    sizes: Dict[Path, Optional[int]] = {}
+
+    for intent in pack.intents:
+        reachable = True
+        for index, step in enumerate(intent.steps):
+            node = f"{intent.id}#{step.id}"
+            where = (intent.source_file or "", intent.id, step.id)
+            if not reachable:
+                issues.append(Issue(WARNING, "unreachable-step", "không nút nào của bước trước đi tiếp", *where))
+            out: List[str] = []
+            advances = not step.ui.buttons or bool(step.ask or step.slot_name)
+            for label in step.ui.buttons:
+                key = buttons.normalize_label(label)
+                kind = buttons.NAVIGATION.get(key)
+                if kind == buttons.NEXT:
+                    advances = True
+                    if index + 1 < len(intent.steps):
+                        out.append(f"{intent.id}#{intent.steps[index + 1].id}")
+                elif kind == buttons.BACK:
+                    if index > 0:
+                        out.append(f"{intent.id}#{intent.steps[index - 1].id}")
+                elif kind in (buttons.CANCEL, buttons.HELP):
+                    continue
+                else:
+                    if key not in resolved:
+                        resolved[key] = resolve(label)
+                    target = resolved[key]
+                    if target is None:
+                        if kind != buttons.MENU:
+                            issues.append(
+                                Issue(WARNING, "unknown-button", f"nhãn '{label}' không khớp nút điều hướng hay intent nào", *where)
+                            )
+                        continue
+                    referenced.add(target)
+                    if target in first_step:
+                        out.append(f"{target}#{first_step[target]}")
+            edges[node] = out
+            reachable = reachable and advances
+            issues.extend(_media_issues(step, where, assets_root, max_image_kb * 1024, sizes))
+
+    for intent in pack.intents:
+        if not intent.synonyms and not intent.examples and intent.id not in referenced:
+            issues.append(
+                Issue(
+                    WARNING,
+                    "unreachable-intent",
+                    "không có synonym/example và không được nút, bí danh hay chuyển hướng nào trỏ tới",
+                    intent.source_file or "",
+                    intent.id,
+                )
+            )
+    issues.extend(_ambiguous_phrases(pack))
+
+    if report is not None:
+        report.intents = len(pack.intents)
+        report.steps = sum(len(intent.steps) for intent in pack.intents)
+        report.edges = edges
+    return issues
+
+
+def _load(file: Path) -> Tuple[List[Intent], Dict[str, Any], Optional[str]]:
+    try:
+        raw = read_yaml(file)
+        return parse_module(raw, file.name)[0], raw, None
+    except ScriptLoaderError as exc:
+        return [], {}, str(exc)
+
+
+def _raw_issues(raw: Dict[str, Any], file_name: str) -> List[Issue]:
+    """Khoá không có trong schema bị bỏ qua âm thầm khi nạp (ví dụ ``media`` đặt ngoài ``ui``)."""
+    issues: List[Issue] = []
+    for raw_intent in raw.get("intents") or []:
+        if not isinstance(raw_intent, dict):
+            continue
+        intent_id = str(raw_intent.get("id", ""))
+        for key in sorted(set(raw_intent) - _INTENT_KEYS):
+            issues.append(Issue(WARNING, "unknown-key", f"khoá '{key}' của intent bị bỏ qua", file_name, intent_id))
+        for raw_step in raw_intent.get("steps") or []:
+            if not isinstance(raw_step, dict):
+                continue
+            for key in sorted(set(raw_step) - _STEP_KEYS):
+                hint = " (đặt trong ui)" if key == "media" else ""
+                issues.append(
+                    Issue(
+                        WARNING,
+                        "unknown-key",
+                        f"khoá '{key}' của bước bị bỏ qua{hint}",
+                        file_name,
+                        intent_id,
+                        str(raw_step.get("id", "")),
+                    )
+                )
+    return issues
+
+
+def _registry_targets(registry: Dict[str, Any], seen: Dict[str, str], name: str, issues: List[Issue]) -> Set[str]:
+    targets: Set[str] = set()
+    for rule in registry.get("aliases_global") or []:
+        if isinstance(rule, dict) and rule.get("target"):
+            targets.add(str(rule["target"]))
+    for rule in registry.get("redirects") or []:
+        if isinstance(rule, dict) and rule.get("to"):
+            targets.add(str(rule["to"]))
+    for target in sorted(targets - set(seen)):
+        issues.append(Issue(ERROR, "unknown-target", f"bí danh/chuyển hướng trỏ tới intent không tồn tại: {target}", name))
+    for module in registry.get("modules") or []:
+        if not isinstance(module, dict):
+            continue
+        missing = [intent_id for intent_id in module.get("intents") or [] if intent_id not in seen]
+        if missing:
+            issues.append(
+                Issue(WARNING, "missing-intent", f"module {module.get('name')} khai báo intent không có: {', '.join(missing)}", name)
+            )
+    return targets & set(seen)
+
+
+def _ambiguous_phrases(pack: ScriptPack) -> List[Issue]:
+    owners: Dict[str, Dict[str, None]] = {}
+    for intent in pack.intents:
+        for phrase in (*intent.synonyms, *intent.examples):
+            key = buttons.normalize_label(phrase)
+            if key:
+                owners.setdefault(key, {})[intent.id] = None
+    issues = []
+    for phrase, intents in owners.items():
+        if len(intents) > 1:
+            ids = list(intents)
+            issues.append(
+                Issue(WARNING, "ambiguous-synonym", f"'{phrase}' thuộc {len(ids)} intent: {', '.join(ids)}", "", ids[0])
+            )
+    return issues
+
+
+def _media_issues(
+    step: Step,
+    where: Tuple[str, str, str],
+    assets_root: Path,
+    max_bytes: float,
+    sizes: Dict[Path, Optional[int]],
+) -> List[Issue]:
+    issues: List[Issue] = []
+    for item in step.ui.media:
+        url = item.url
+        if _ASSET_MARKER in url:
+            local = assets_root / url.split(_ASSET_MARKER, 1)[1]
+        elif "://" in url:
+            continue  # ảnh ngoài kho: không kiểm tra mạng khi lint
+        elif url.lower().endswith(_IMAGE_SUFFIXES):
+            local = assets_root / url
+        else:
+            issues.append(Issue(ERROR, "invalid-media-url", f"url ảnh không hợp lệ: {url}", *where))
+            continue
+        if local not in sizes:
+            try:
+                sizes[local] = local.stat().st_size
+            except OSError:
+                sizes[local] = None
+        size = sizes[local]
+        if size is None:
+            issues.append(Issue(ERROR, "missing-asset", f"không có file {local}", *where))
+        elif size > max_bytes:
+            issues.append(Issue(WARNING, "oversized-image", f"{local.name} nặng {size // 1024} KB", *where))
+    return issues
@@ -1,11 +1,14 @@
 from __future__ import annotations
 
 from pathlib import Path
-from typing import Iterable, List
+from typing import Any, Dict, Iterable, List, Tuple
 
-import yaml
+from .conditions import ConditionError, compile_condition
+from .fusion import read_calibration
+from .lazy import optional_module
+from .schema import Entity, Intent, MediaItem, ScriptPack, Step, StepUI
 
-from .schema import Intent, MediaItem, ScriptPack, Step, StepUI
+ENTITY_TYPES = ("list", "boolean", "number", "text")
 
 
 class ScriptLoaderError(Exception):
@@ -24,37 +27,124 @@ def load_from_folder(folder: str) -> ScriptPack:
         raise ScriptLoaderError("Không tìm thấy file YAML nào")
 
     intents: List[Intent] = []
+    seen: Dict[str, str] = {}
+    entities: Dict[str, Entity] = {}
     for file in files:
-        try:
-            text = file.read_text(encoding="utf-8")
-        except OSError as exc:  # pragma: no cover - lỗi IO hiếm gặp
-            raise ScriptLoaderError(f"Không thể đọc file {file.name}: {exc}") from exc
-        try:
-            data = yaml.safe_load(text) or {}
-        except yaml.YAMLError as exc:
-            raise ScriptLoaderError(f"YAML lỗi cú pháp trong {file.name}: {exc}") from exc
-
-        entries = data.get("intents", [])
-        if not isinstance(entries, list):
-            raise ScriptLoaderError(f"File {file.name} không đúng định dạng intents")
-
-        for raw_intent in entries:
-            if not isinstance(raw_intent, dict):
-                raise ScriptLoaderError(f"Intent trong {file.name} phải là object")
-            normalized_steps = _normalize_steps(raw_intent.get("steps"), file.name)
-            intent_payload = {**raw_intent, "steps": normalized_steps, "source_file": file.name}
-            try:
-                intent = Intent(**intent_payload)
-            except Exception as exc:  # pragma: no cover - để báo lỗi rõ ràng
-                raise ScriptLoaderError(f"Intent {raw_intent.get('id')} trong {file.name} lỗi: {exc}") from exc
-            if any(existing.id == intent.id for existing in intents):
-                raise ScriptLoaderError(f"Intent trùng id: {intent.id}")
+        file_intents, file_entities = load_module(file)
+        for intent in file_intents:
+            if intent.id in seen:
+                raise ScriptLoaderError(f"Intent trùng id: {intent.id} ({seen[intent.id]}, {file.name})")
+            seen[intent.id] = file.name
             intents.append(intent)
+        entities.update(file_entities)
 
     if not intents:
         raise ScriptLoaderError("Không có intent nào được nạp")
 
-    return ScriptPack(intents=intents)
+    return ScriptPack(intents=intents, calibration=read_calibration(folder), entities=entities)
+
+
+def load_file(file: Path) -> List[Intent]:
+    """Đọc các intent trong một file YAML kịch bản."""
+    return load_module(file)[0]
+
+
+def load_module(file: Path) -> Tuple[List[Intent], Dict[str, Entity]]:
+    """Đọc intent và entity (khoá ``entities`` cấp file) của một file YAML kịch bản."""
+    return parse_module(read_yaml(file), file.name)
+
+
+def read_yaml(file: Path) -> Dict[str, Any]:
+    """Đọc một file YAML bằng bộ parse C của libyaml nếu có (nhanh hơn ~10 lần)."""
+    yaml = optional_module("yaml")
+    if yaml is None:  # pragma: no cover - PyYAML nằm trong requirements
+        raise ScriptLoaderError("Thiếu thư viện PyYAML")
+    try:
+        text = file.read_text(encoding="utf-8")
+    except OSError as exc:  # pragma: no cover - lỗi IO hiếm gặp
+        raise ScriptLoaderError(f"Không thể đọc file {file.name}: {exc}") from exc
+    try:
+        data = yaml.load(text, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader)) or {}
+    except yaml.YAMLError as exc:
+        raise ScriptLoaderError(f"YAML lỗi cú pháp trong {file.name}: {exc}") from exc
+    if not isinstance(data, dict):
+        raise ScriptLoaderError(f"File {file.name} phải là object")
+    return data
+
+
+def parse_module(data: Dict[str, Any], file_name: str) -> Tuple[List[Intent], Dict[str, Entity]]:
+    entries = data.get("intents", [])
+    if not isinstance(entries, list):
+        raise ScriptLoaderError(f"File {file_name} không đúng định dạng intents")
+
+    intents: List[Intent] = []
+    for raw_intent in entries:
+        if not isinstance(raw_intent, dict):
+            raise ScriptLoaderError(f"Intent trong {file_name} phải là object")
+        normalized_steps = _normalize_steps(raw_intent.get("steps"), file_name)
+        intent_payload = {**raw_intent, "steps": normalized_steps, "source_file": file_name}
+        try:
+            intent = Intent(**intent_payload)
+        except Exception as exc:  # pragma: no cover - để báo lỗi rõ ràng
+            raise ScriptLoaderError(f"Intent {raw_intent.get('id')} trong {file_name} lỗi: {exc}") from exc
+        intents.append(intent)
+    return intents, parse_entities(data.get("entities"), file_name)
+
+
+def parse_entities(raw: object, source: str) -> Dict[str, Entity]:
+    """Chuẩn hoá khai báo entity về ``Entity``.
+
+    Chấp nhận dạng object ``{ten: spec}`` hoặc danh sách (``- ten`` / ``- ten: spec``),
+    với ``spec`` là danh sách giá trị, tên kiểu (``number``...), object
+    ``{giá trị chuẩn: [cách nói]}`` hoặc ``{type: ..., values: ...}``.
+    """
+    if raw is None:
+        return {}
+    if isinstance(raw, dict):
+        items: List[Tuple[Any, Any]] = list(raw.items())
+    elif isinstance(raw, list):
+        items = []
+        for entry in raw:
+            if isinstance(entry, str):
+                items.append((entry, None))
+            elif isinstance(entry, dict):
+                items.extend(entry.items())
+            else:
+                raise ScriptLoaderError(f"Entity trong {source} không hợp lệ: {entry!r}")
+    else:
+        raise ScriptLoaderError(f"entities trong {source} phải là object hoặc danh sách")
+
+    entities: Dict[str, Entity] = {}
+    for name, spec in items:
+        entity_type = "list"
+        values: Dict[str, List[str]] = {}
+        if spec is None:
+            entity_type = "text"
+        elif isinstance(spec, str):
+            entity_type = spec
+        elif isinstance(spec, list):
+            values = {_value_key(v): [str(v)] for v in spec}
+        elif isinstance(spec, dict):
+            if "values" in spec or "type" in spec:
+                entity_type = str(spec.get("type") or "list")
+                spec = spec.get("values") or {}
+            if isinstance(spec, list):
+                values = {_value_key(v): [str(v)] for v in spec}
+            else:
+                for key, surfaces in spec.items():
+                    forms = surfaces if isinstance(surfaces, list) else [surfaces]
+                    values[_value_key(key)] = [str(f) for f in forms if f is not None]
+        if entity_type not in ENTITY_TYPES:
+            raise ScriptLoaderError(f"Entity {name} trong {source} có kiểu không hỗ trợ: {entity_type}")
+        entities[str(name)] = Entity(name=str(name), type=entity_type, values=values)
+    return entities
+
+
+def _value_key(value: object) -> str:
+    # YAML đọc ``true:`` thành bool; slot luôn lưu chuỗi
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
 
 
 def _normalize_steps(raw_steps: object, file_name: str) -> List[Step]:
@@ -70,6 +160,12 @@ def _normalize_steps(raw_steps: object, file_name: str) -> List[Step]:
         payload.setdefault("say", "")
         payload["say"] = str(payload.get("say", ""))
         payload["ui"] = _normalize_ui(payload.get("ui"), file_name, payload.get("id", f"step_{index}"))
+        try:
+            compile_condition(payload.get("when"))
+        except ConditionError as exc:
+            raise ScriptLoaderError(
+                f"Điều kiện 'when' của step {payload.get('id')} trong {file_name} lỗi: {exc}"
+            ) from exc
         try:
             step = Step(**payload)
         except Exception as exc:
@@ -0,0 +1,120 @@
+"""Bộ khớp nhiều mẫu Aho–Corasick cho định tuyến theo synonyms / entry_patterns.
+
+Mẫu được chuẩn hoá (chữ thường) và biên dịch một lần; mỗi tin nhắn chỉ cần một
+lượt duyệt tuyến tính theo độ dài câu, bất kể số mẫu. Khi nhiều mẫu cùng khớp,
+``best`` chọn theo thứ tự xác định: ``priority`` cao hơn, rồi mẫu dài hơn, rồi
+mẫu được thêm trước.
+"""
+from __future__ import annotations
+
+from collections import deque
+from typing import Any, Dict, Generic, Iterator, List, NamedTuple, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class Match(NamedTuple):
+    start: int
+    end: int  # vị trí sau ký tự cuối, theo chuỗi đã chuẩn hoá
+    pattern: str
+    value: Any
+    priority: int
+
+
+def normalize(text: str) -> str:
+    return text.lower().strip()
+
+
+class AhoCorasick(Generic[T]):
+    def __init__(self) -> None:
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # Chỉ số mẫu kết thúc tại nút (kể cả qua chuỗi fail), gộp sẵn khi compile
+        self._out: List[Tuple[int, ...]] = [()]
+        # Mẫu tốt nhất tại nút theo (priority, độ dài, thứ tự thêm); -1 nếu không có
+        self._best: List[int] = [-1]
+        self._patterns: List[Tuple[str, T, int]] = []
+        self._compiled = False
+
+    def __len__(self) -> int:
+        return len(self._patterns)
+
+    def add(self, pattern: str, value: T, priority: int = 0) -> None:
+        key = normalize(pattern)
+        if not key:
+            return
+        if self._compiled:
+            raise RuntimeError("Không thể thêm mẫu sau khi đã compile")
+        node = 0
+        for ch in key:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+                self._best.append(-1)
+            node = nxt
+        self._out[node] = self._out[node] + (len(self._patterns),)
+        self._patterns.append((key, value, priority))
+
+    def compile(self) -> "AhoCorasick[T]":
+        queue = deque(self._goto[0].values())
+        for child in queue:
+            self._fail[child] = 0
+        order: List[int] = [0]
+        while queue:
+            node = queue.popleft()
+            order.append(node)
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(ch, 0)
+                self._fail[child] = target if target != child else 0
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+        for node in order:
+            if self._out[node]:
+                self._best[node] = min(self._out[node], key=self._rank)
+        self._compiled = True
+        return self
+
+    def _rank(self, idx: int) -> Tuple[int, int, int]:
+        pattern, _, priority = self._patterns[idx]
+        return (-priority, -len(pattern), idx)
+
+    def _walk(self, text: str) -> Iterator[Tuple[int, int]]:
+        """Sinh (vị trí kết thúc, nút) cho mỗi nút có mẫu khớp."""
+        if not self._compiled:
+            self.compile()
+        goto, fail, best = self._goto, self._fail, self._best
+        node = 0
+        for pos, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if best[node] >= 0:
+                yield pos + 1, node
+
+    def _match(self, idx: int, end: int) -> Match:
+        pattern, value, priority = self._patterns[idx]
+        return Match(end - len(pattern), end, pattern, value, priority)
+
+    def find_all(self, text: str) -> List[Match]:
+        """Mọi lần khớp (kể cả chồng lấn), theo vị trí kết thúc tăng dần."""
+        text = normalize(text)
+        return [self._match(idx, end) for end, node in self._walk(text) for idx in self._out[node]]
+
+    def best(self, text: str) -> Optional[Match]:
+        text = normalize(text)
+        chosen = -1
+        chosen_end = 0
+        for end, node in self._walk(text):
+            candidate = self._best[node]
+            if chosen < 0 or self._rank(candidate) < self._rank(chosen):
+                chosen, chosen_end = candidate, end
+        if chosen < 0:
+            return None
+        return self._match(chosen, chosen_end)
@@ -2,78 +2,140 @@ from __future__ import annotations
 
 import math
 import os
-from typing import List
-
-try:
-    from rank_bm25 import BM25Okapi
-except ImportError:  # pragma: no cover
-    class BM25Okapi:  # type: ignore
-        def __init__(self, corpus, k1: float = 1.5, b: float = 0.75) -> None:
-            self.corpus = corpus
-            self.k1 = k1
-            self.b = b
-            self.doc_freqs = []
-            self.idf = {}
-            self.avgdl = sum(len(doc) for doc in corpus) / max(len(corpus), 1)
-            doc_counts = {}
-            for doc in corpus:
-                freqs = {}
-                for token in doc:
-                    freqs[token] = freqs.get(token, 0) + 1
-                self.doc_freqs.append(freqs)
-                for token in freqs:
-                    doc_counts[token] = doc_counts.get(token, 0) + 1
-            for token, freq in doc_counts.items():
-                numerator = len(corpus) - freq + 0.5
-                denominator = freq + 0.5
-                self.idf[token] = math.log(1 + numerator / denominator)
-
-        def get_scores(self, query_tokens):
-            scores = []
-            for freqs in self.doc_freqs:
-                score = 0.0
-                dl = sum(freqs.values())
-                for token in query_tokens:
-                    if token not in freqs:
-                        continue
-                    idf = self.idf.get(token, 0.0)
-                    freq = freqs[token]
-                    denom = freq + self.k1 * (1 - self.b + self.b * dl / max(self.avgdl, 1e-9))
-                    score += idf * (freq * (self.k1 + 1)) / denom
-                scores.append(score)
-            return scores
+import sys
+from typing import TYPE_CHECKING, Dict, List, NamedTuple, Optional, Sequence, Tuple
 
+from .encoders import backend_available, create_encoder
+from .fusion import Fusion
+from .lazy import optional_module
 from .schema import Candidate, Intent, ScriptPack
+from .spelling import SpellIndex
 
-try:
-    from sentence_transformers import SentenceTransformer
-except ImportError:  # pragma: no cover
-    SentenceTransformer = None  # type: ignore
-
-try:  # pragma: no cover - chạy khi có numpy
+if TYPE_CHECKING:  # pragma: no cover
     import numpy as np
-except ImportError:  # pragma: no cover
-    np = None  # type: ignore
+
+
+class _FallbackBM25Okapi:
+    """BM25 thuần Python khi chưa cài rank_bm25."""
+
+    def __init__(self, corpus, k1: float = 1.5, b: float = 0.75) -> None:
+        self.corpus = corpus
+        self.k1 = k1
+        self.b = b
+        self.doc_freqs = []
+        self.idf = {}
+        self.avgdl = sum(len(doc) for doc in corpus) / max(len(corpus), 1)
+        doc_counts = {}
+        for doc in corpus:
+            freqs = {}
+            for token in doc:
+                freqs[token] = freqs.get(token, 0) + 1
+            self.doc_freqs.append(freqs)
+            for token in freqs:
+                doc_counts[token] = doc_counts.get(token, 0) + 1
+        for token, freq in doc_counts.items():
+            numerator = len(corpus) - freq + 0.5
+            denominator = freq + 0.5
+            self.idf[token] = math.log(1 + numerator / denominator)
+
+    def get_scores(self, query_tokens):
+        scores = []
+        for freqs in self.doc_freqs:
+            score = 0.0
+            dl = sum(freqs.values())
+            for token in query_tokens:
+                if token not in freqs:
+                    continue
+                idf = self.idf.get(token, 0.0)
+                freq = freqs[token]
+                denom = freq + self.k1 * (1 - self.b + self.b * dl / max(self.avgdl, 1e-9))
+                score += idf * (freq * (self.k1 + 1)) / denom
+            scores.append(score)
+        return scores
+
+
+def _numpy():
+    np = optional_module("numpy")
+    if np is None:  # pragma: no cover - numpy đi kèm rank-bm25 trong requirements
+        raise RuntimeError("NLUIndex cần numpy")
+    return np
+
+
+def _bm25_class():
+    module = optional_module("rank_bm25")
+    return module.BM25Okapi if module is not None else _FallbackBM25Okapi
 
 
 def _tokenize(text: str) -> List[str]:
     return [t for t in text.lower().split() if t]
 
 
+class BatchRanking(NamedTuple):
+    """Kết quả ``rank_many``: mỗi dòng là một truy vấn, mỗi cột là một hạng."""
+
+    intent_ids: List[str]
+    indices: "np.ndarray"  # (n_queries, k) chỉ số intent trong ``intent_ids``
+    scores: "np.ndarray"  # (n_queries, k) điểm tương ứng, giảm dần
+
+    def top_ids(self, row: int) -> List[str]:
+        return [self.intent_ids[idx] for idx in self.indices[row]]
+
+
 class NLUIndex:
-    def __init__(self, use_embedding: bool | None = None) -> None:
+    def __init__(
+        self,
+        use_embedding: bool | None = None,
+        embedder=None,
+        bm25_weight: float | None = None,
+        fusion: Fusion | None = None,
+        spell_correction: bool | None = None,
+    ) -> None:
         if use_embedding is None:
             flag = os.getenv("USE_EMBEDDING", "false").lower()
             use_embedding = flag in {"1", "true", "yes"}
-        self.use_embedding = use_embedding and SentenceTransformer is not None and np is not None
-        self.embedder = None
+        if spell_correction is None:
+            spell_correction = os.getenv("SPELL_CORRECTION", "true").lower() in {"1", "true", "yes"}
+        if bm25_weight is None:
+            bm25_weight = float(os.getenv("BM25_WEIGHT", "0.6"))
+        # Trọng số BM25 khi trộn với embedding; phần còn lại (1 - w) dành cho embedding.
+        # Calibration của pack mang trọng số nó được fit cùng và thay giá trị cấu hình này.
+        self._base_weight = min(max(bm25_weight, 0.0), 1.0)
+        self.bm25_weight = self._base_weight
+        # Chỉ kiểm tra gói đã cài; backend (torch/int8/onnx, xem core/encoders.py)
+        # được khởi tạo khi dựng chỉ mục.
+        self.use_embedding = use_embedding and (embedder is not None or backend_available())
+        self.embedder = embedder if self.use_embedding else None
+        # Chuẩn hoá + trộn điểm (FUSION_METHOD, xem core/fusion.py)
+        self.fusion = fusion or Fusion()
+        # Sửa lỗi gõ / bỏ dấu / viết tắt cho token ngoài vocab (core/spelling.py)
+        self.spelling = SpellIndex() if spell_correction else None
         self.script_pack = ScriptPack(intents=[])
-        self._bm25: BM25Okapi | None = None
+        self._bm25 = None
         self._documents: List[str] = []
         self._embeddings: np.ndarray | None = None
+        # Postings BM25 dạng CSR (term -> doc): trọng số đã tính sẵn cho từng cặp
+        # (term, doc) nên điểm truy vấn chỉ là phép cộng theo lát mảng. Các mảng
+        # này có thể là memmap chỉ đọc dùng chung giữa nhiều worker (xem core/shared.py).
+        self._vocab: Dict[str, int] = {}
+        self._indptr: np.ndarray | None = None
+        self._doc_ids: np.ndarray | None = None
+        self._weights: np.ndarray | None = None
+        # idf theo từng dòng của vocab; token ngoài vocab nhận ``_oov_idf`` khi tính self-score
+        self._idf: np.ndarray | None = None
+        self._oov_idf = 0.0
+        # domain -> chỉ số cột (intent) để xếp hạng giới hạn trong domain đang chạy
+        self._domain_columns: Dict[str, np.ndarray] = {}
+
+    def _set_calibration(self, calibration) -> None:
+        """Gắn calibration của pack cùng ``bm25_weight`` mà đường cong được fit trên đó."""
+        self.fusion.set_calibration(calibration)
+        stored = (self.fusion.calibration or {}).get("bm25_weight")
+        weight = self._base_weight if stored is None else float(stored)
+        self.bm25_weight = min(max(weight, 0.0), 1.0)
 
     def build(self, pack: ScriptPack) -> None:
         self.script_pack = pack
+        self._set_calibration(pack.calibration)
         documents: List[List[str]] = []
         self._documents = []
         for intent in pack.intents:
@@ -83,56 +145,322 @@ class NLUIndex:
             joined = " \n ".join(text_parts)
             documents.append(_tokenize(joined))
             self._documents.append(joined)
-        self._bm25 = BM25Okapi(documents)
+        self._bm25 = _bm25_class()(documents)
+        self._compile_postings(documents, self._bm25)
+        self._index_vocab()
 
         if self.use_embedding:
-            if SentenceTransformer is None or np is None:
-                raise RuntimeError("sentence-transformers chưa được cài đặt")
-            self.embedder = SentenceTransformer("paraphrase-MiniLM-L6-v2")
-            self._embeddings = np.array(self.embedder.encode(self._documents, convert_to_numpy=True))
+            np = _numpy()
+            if self.embedder is None:
+                self.embedder = create_encoder()
+            self._embeddings = np.asarray(self.embedder.encode(self._documents))
         else:
             self.embedder = None
             self._embeddings = None
 
-    def rank(self, text: str, top_k: int = 3) -> List[Candidate]:
-        if self._bm25 is None:
+    def _compile_postings(self, documents: List[List[str]], bm25) -> None:
+        np = _numpy()
+        k1 = getattr(bm25, "k1", 1.5)
+        b = getattr(bm25, "b", 0.75)
+        avgdl = max(float(getattr(bm25, "avgdl", 0.0)), 1e-9)
+        postings: Dict[str, List[tuple]] = {}
+        for doc_idx, doc in enumerate(documents):
+            freqs: Dict[str, int] = {}
+            for token in doc:
+                freqs[token] = freqs.get(token, 0) + 1
+            norm = k1 * (1 - b + b * len(doc) / avgdl)
+            for token, freq in freqs.items():
+                idf = bm25.idf.get(token) or 0.0
+                postings.setdefault(token, []).append((doc_idx, idf * freq * (k1 + 1) / (freq + norm)))
+        vocab: Dict[str, int] = {}
+        indptr = [0]
+        doc_ids: List[int] = []
+        weights: List[float] = []
+        idf_rows: List[float] = []
+        for row, token in enumerate(sorted(postings)):
+            vocab[token] = row
+            idf_rows.append(bm25.idf.get(token) or 0.0)
+            for doc_idx, weight in postings[token]:
+                doc_ids.append(doc_idx)
+                weights.append(weight)
+            indptr.append(len(doc_ids))
+        self._vocab = vocab
+        self._indptr = np.asarray(indptr, dtype=np.int64)
+        self._doc_ids = np.asarray(doc_ids, dtype=np.int32)
+        self._weights = np.asarray(weights, dtype=np.float32)
+        self._idf = np.asarray(idf_rows, dtype=np.float32)
+        self._oov_idf = float(self._idf.max()) if self._idf.size else 0.0
+
+    def attach_compiled(
+        self,
+        pack: ScriptPack,
+        documents: List[str],
+        vocab: Dict[str, int],
+        indptr: np.ndarray,
+        doc_ids: np.ndarray,
+        weights: np.ndarray,
+        idf: np.ndarray,
+        embeddings: Optional[np.ndarray] = None,
+    ) -> None:
+        """Gắn chỉ mục đã biên dịch sẵn (thường là memmap) thay cho việc gọi build()."""
+        self.script_pack = pack
+        self._set_calibration(pack.calibration)
+        self._documents = list(documents)
+        self._bm25 = None
+        self._vocab = vocab
+        self._indptr = indptr
+        self._doc_ids = doc_ids
+        self._weights = weights
+        self._idf = idf
+        self._oov_idf = float(idf.max()) if len(idf) else 0.0
+        self._index_vocab()
+        if self.use_embedding and embeddings is not None:
+            self._embeddings = embeddings
+            # Chỉ nạp model để mã hoá câu hỏi; ma trận tài liệu đã có sẵn.
+            if self.embedder is None:
+                self.embedder = create_encoder()
+        else:
+            self.embedder = None
+            self._embeddings = None
+
+    def _index_vocab(self) -> None:
+        self._index_domains()
+        if self.spelling is not None:
+            np = _numpy()
+            doc_freq = np.diff(np.asarray(self._indptr)).tolist()
+            self.spelling.build(self._vocab, {token: doc_freq[row] for token, row in self._vocab.items()})
+
+    def _index_domains(self) -> None:
+        np = _numpy()
+        columns: Dict[str, List[int]] = {}
+        for idx, intent in enumerate(self.script_pack.intents):
+            columns.setdefault(intent.domain, []).append(idx)
+        self._domain_columns = {domain: np.asarray(idx, dtype=np.int64) for domain, idx in columns.items()}
+
+    def compiled_arrays(self) -> Dict[str, object]:
+        if self._indptr is None:
             raise RuntimeError("Chưa xây dựng NLU index")
+        return {
+            "vocab": self._vocab,
+            "indptr": self._indptr,
+            "doc_ids": self._doc_ids,
+            "weights": self._weights,
+            "idf": self._idf,
+            "embeddings": self._embeddings,
+            "documents": self._documents,
+        }
+
+    def tokenize(self, text: str) -> List[str]:
+        """Token truy vấn sau bước sửa lỗi gõ (nếu bật)."""
         tokens = _tokenize(text)
-        bm25_scores = self._bm25.get_scores(tokens)
-        max_bm25 = max(bm25_scores) if len(bm25_scores) else 0.0
-        candidates: List[Candidate] = []
-
-        embed_scores = None
-        if self.embedder is not None and self._embeddings is not None and np is not None:
-            query_vec = self.embedder.encode([text], convert_to_numpy=True)
-            norms = np.linalg.norm(self._embeddings, axis=1) * np.linalg.norm(query_vec, axis=1)[0]
-            cosine = (self._embeddings @ query_vec.T).reshape(-1)
-            with np.errstate(divide="ignore", invalid="ignore"):
-                cosine = np.where(norms == 0, 0.0, cosine / norms)
-            embed_scores = cosine
+        if self.spelling is None:
+            return tokens
+        return self.spelling.correct(tokens)
 
-        for idx, intent in enumerate(self.script_pack.intents):
-            bm25_score = bm25_scores[idx]
-            normalized_bm25 = bm25_score / max_bm25 if max_bm25 > 0 else 0.0
-            final_score = normalized_bm25
-            if embed_scores is not None:
-                normalized_embed = (embed_scores[idx] + 1) / 2
-                final_score = 0.6 * normalized_bm25 + 0.4 * normalized_embed
-            candidates.append(
-                Candidate(
-                    intent_id=intent.id,
-                    file=intent.source_file,
-                    score=float(final_score),
-                    can_interrupt=intent.can_interrupt,
-                    domain=intent.domain,
-                )
+    def _bm25_matrix(self, token_lists: Sequence[Sequence[str]]) -> "Tuple[np.ndarray, np.ndarray]":
+        """Điểm BM25 thô (n_queries x n_docs) = Q (truy vấn x term) @ W (term x doc).
+
+        Q và W đều thưa: mỗi lần xuất hiện của một term trong truy vấn kéo theo
+        lát postings của term đó; toàn bộ được cộng dồn bằng một lần bincount.
+        Trả kèm self-score của từng truy vấn (tổng idf các token) để chuẩn hoá.
+        """
+        np = _numpy()
+        n_docs = len(self.script_pack.intents)
+        query_rows: List[int] = []
+        term_rows: List[int] = []
+        self_scores = np.zeros(len(token_lists), dtype=np.float64)
+        vocab = self._vocab
+        for query_idx, tokens in enumerate(token_lists):
+            oov = 0
+            for token in tokens:
+                row = vocab.get(token)
+                if row is not None:
+                    query_rows.append(query_idx)
+                    term_rows.append(row)
+                else:
+                    oov += 1
+            self_scores[query_idx] = oov * self._oov_idf
+        flat = np.zeros(len(token_lists) * n_docs, dtype=np.float64)
+        if term_rows:
+            terms = np.asarray(term_rows, dtype=np.int64)
+            self_scores += np.bincount(
+                np.asarray(query_rows, dtype=np.int64), weights=self._idf[terms], minlength=len(token_lists)
             )
+            starts = np.asarray(self._indptr[terms], dtype=np.int64)
+            lengths = np.asarray(self._indptr[terms + 1], dtype=np.int64) - starts
+            total = int(lengths.sum())
+            offsets = np.arange(total, dtype=np.int64) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+            postings = np.repeat(starts, lengths) + offsets
+            owners = np.repeat(np.asarray(query_rows, dtype=np.int64), lengths)
+            cells = owners * n_docs + np.asarray(self._doc_ids[postings], dtype=np.int64)
+            flat += np.bincount(cells, weights=self._weights[postings], minlength=flat.size)
+        return flat.reshape(len(token_lists), n_docs), self_scores
+
+    def _embedding_matrix(
+        self, texts: Sequence[str], batch_size: int = 256, columns: "Optional[np.ndarray]" = None
+    ) -> "Optional[np.ndarray]":
+        """Cosine (n_queries x n_docs) giữa truy vấn và tài liệu; None nếu không bật embedding."""
+        if self.embedder is None or self._embeddings is None:
+            return None
+        np = _numpy()
+        query_vecs = np.asarray(self.embedder.encode(list(texts), batch_size=batch_size), dtype=np.float32)
+        doc_vecs = np.asarray(self._embeddings if columns is None else self._embeddings[columns], dtype=np.float32)
+        doc_norms = np.linalg.norm(doc_vecs, axis=1)
+        query_norms = np.linalg.norm(query_vecs, axis=1)
+        cosine = query_vecs @ doc_vecs.T
+        norms = query_norms[:, None] * doc_norms[None, :]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(norms == 0, 0.0, cosine / norms)
+
+    def score_components(
+        self, texts: Sequence[str], batch_size: int = 256, columns: "Optional[np.ndarray]" = None
+    ) -> "Tuple[np.ndarray, Optional[np.ndarray]]":
+        """Hai thành phần điểm đã chuẩn hoá về [0, 1]: BM25 và embedding (None nếu tắt).
+
+        Công cụ đánh giá giữ lại hai ma trận này để quét trọng số trộn mà không
+        phải xếp hạng lại. ``columns`` giới hạn các intent được chấm điểm.
+        """
+        if self._indptr is None:
+            raise RuntimeError("Chưa xây dựng NLU index")
+        bm25, self_scores = self._bm25_matrix([self.tokenize(text) for text in texts])
+        if columns is not None:
+            bm25 = bm25[:, columns]
+        return (
+            self.fusion.normalize_bm25(bm25, self_scores),
+            self.fusion.normalize_embed(self._embedding_matrix(texts, batch_size, columns)),
+        )
+
+    def intent_components(self, start: int, stop: int) -> "Tuple[np.ndarray, Optional[np.ndarray]]":
+        """Điểm chéo đã chuẩn hoá của intent ``[start, stop)`` với mọi intent.
+
+        Văn bản tài liệu (synonyms + examples) của mỗi intent được dùng làm truy vấn;
+        cosine lấy thẳng từ ma trận embedding tài liệu nên không phải mã hoá lại.
+        Dùng cho phân tích va chạm intent (core/collisions.py) theo từng khối dòng.
+        """
+        if self._indptr is None:
+            raise RuntimeError("Chưa xây dựng NLU index")
+        bm25, self_scores = self._bm25_matrix([_tokenize(doc) for doc in self._documents[start:stop]])
+        cosine = None
+        if self._embeddings is not None:
+            np = _numpy()
+            docs = np.asarray(self._embeddings, dtype=np.float32)
+            norms = np.linalg.norm(docs, axis=1)
+            norms[norms == 0] = 1.0
+            cosine = (docs[start:stop] / norms[start:stop, None]) @ (docs / norms[:, None]).T
+        return self.fusion.normalize_bm25(bm25, self_scores), self.fusion.normalize_embed(cosine)
+
+    def fuse(self, bm25_norm: "np.ndarray", embed_norm: "Optional[np.ndarray]", bm25_weight: float | None = None):
+        weight = self.bm25_weight if bm25_weight is None else bm25_weight
+        return self.fusion.fuse(bm25_norm, embed_norm, weight)
+
+    def score_matrix(
+        self, texts: Sequence[str], batch_size: int = 256, columns: "Optional[np.ndarray]" = None
+    ) -> "np.ndarray":
+        """Điểm cuối cùng (n_queries x n_intents) theo đúng công thức của ``rank``."""
+        return self.fuse(*self.score_components(texts, batch_size, columns))
 
-        candidates.sort(key=lambda c: c.score, reverse=True)
-        return candidates[:top_k]
+    def rank(self, text: str, top_k: int = 3, domain: Optional[str] = None) -> List[Candidate]:
+        """Xếp hạng toàn bộ intent, hoặc chỉ các intent thuộc ``domain`` nếu được chỉ định."""
+        return self.candidates(self.score_row(text), top_k, domain)
+
+    def score_row(self, text: str) -> "np.ndarray":
+        """Điểm cuối cùng của một câu trên mọi intent.
+
+        Một lượt chấm một lần rồi lấy cả top-k trong domain lẫn top-k toàn cục từ cùng
+        dòng điểm (``candidates``), không tính BM25/mã hoá embedding hai lần.
+        """
+        return self.score_matrix([text])[0]
+
+    def candidates(self, scores: "np.ndarray", top_k: int = 3, domain: Optional[str] = None) -> List[Candidate]:
+        """Top-k từ dòng điểm của ``score_row``, giới hạn trong ``domain`` nếu có.
+
+        Điểm luôn chuẩn hoá trên mọi intent trước khi lấy cột của domain: ``max``/``rrf``
+        chuẩn hoá theo cả dòng, chấm riêng domain thì intent yếu trong domain luôn được 1.0.
+        """
+        np = _numpy()
+        columns = None
+        if domain is not None:
+            columns = self._domain_columns.get(domain)
+            if columns is None:
+                return []
+            scores = scores[columns]
+        # sort ổn định: điểm bằng nhau giữ thứ tự khai báo intent (Policy.choose dựa vào đó)
+        order = np.argsort(-scores, kind="stable")[:top_k]
+        if columns is None:
+            return [self._candidate(int(idx), float(scores[idx])) for idx in order]
+        return [self._candidate(int(columns[idx]), float(scores[idx])) for idx in order]
+
+    def rank_many(
+        self,
+        texts: Sequence[str],
+        top_k: int = 3,
+        chunk_size: int = 4096,
+        batch_size: int = 256,
+    ) -> BatchRanking:
+        """Xếp hạng hàng loạt cho đánh giá offline / gán nhãn log.
+
+        Truy vấn trùng lặp chỉ được chấm điểm một lần; ma trận điểm được tính theo
+        từng khối ``chunk_size`` truy vấn để bộ nhớ tỉ lệ với chunk_size x n_intents.
+        """
+        np = _numpy()
+        if self._indptr is None:
+            raise RuntimeError("Chưa xây dựng NLU index")
+        intent_ids = [intent.id for intent in self.script_pack.intents]
+        k = max(0, min(top_k, len(intent_ids)))
+        unique: Dict[str, int] = {}
+        inverse = np.fromiter((unique.setdefault(t, len(unique)) for t in texts), dtype=np.int64, count=len(texts))
+        distinct = list(unique)
+        top_idx = np.zeros((len(distinct), k), dtype=np.int32)
+        top_scores = np.zeros((len(distinct), k), dtype=np.float32)
+        for start in range(0, len(distinct), chunk_size):
+            block = self.score_matrix(distinct[start : start + chunk_size], batch_size)
+            idx, vals = _top_k_rows(block, k)
+            top_idx[start : start + len(block)] = idx
+            top_scores[start : start + len(block)] = vals
+        return BatchRanking(intent_ids=intent_ids, indices=top_idx[inverse], scores=top_scores[inverse])
+
+    def _candidate(self, idx: int, score: float) -> Candidate:
+        intent = self.script_pack.intents[idx]
+        return Candidate(
+            intent_id=intent.id,
+            file=intent.source_file,
+            score=score,
+            can_interrupt=intent.can_interrupt,
+            domain=intent.domain,
+        )
 
     def intent_by_id(self, intent_id: str) -> Intent | None:
         return self.script_pack.intent_by_id(intent_id)
 
     def all_intents(self) -> List[Intent]:
         return list(self.script_pack.intents)
+
+    def approx_bytes(self) -> int:
+        """Ước lượng bộ nhớ của chỉ mục: các mảng postings/embedding cộng vocab và tài liệu."""
+        arrays = (self._indptr, self._doc_ids, self._weights, self._idf, self._embeddings)
+        size = sum(int(getattr(array, "nbytes", 0)) for array in arrays if array is not None)
+        size += sys.getsizeof(self._vocab) + sum(sys.getsizeof(token) for token in self._vocab)
+        return size + sum(sys.getsizeof(doc) for doc in self._documents)
+
+
+def _top_k_rows(scores: "np.ndarray", k: int) -> Tuple["np.ndarray", "np.ndarray"]:
+    """Top-k theo từng dòng, giảm dần; điểm bằng nhau ưu tiên chỉ số nhỏ hơn."""
+    np = _numpy()
+    n_rows, n_cols = scores.shape
+    if k == 0 or n_rows == 0:
+        return np.zeros((n_rows, k), dtype=np.int32), np.zeros((n_rows, k), dtype=np.float32)
+    if k < n_cols:
+        # Chọn đúng k cột mỗi dòng: mọi cột lớn hơn điểm thứ k, cộng các cột bằng
+        # điểm thứ k theo thứ tự chỉ số, để kết quả trùng với sort ổn định của rank().
+        kth = -np.partition(-scores, k - 1, axis=1)[:, k - 1 : k]
+        above = scores > kth
+        equal = scores == kth
+        need = k - above.sum(axis=1, keepdims=True)
+        chosen = above | (equal & (np.cumsum(equal, axis=1) <= need))
+        part = np.nonzero(chosen)[1].reshape(n_rows, k)
+    else:
+        part = np.broadcast_to(np.arange(n_cols), (n_rows, n_cols))
+    part_scores = np.take_along_axis(scores, part, axis=1)
+    order = np.lexsort((part, -part_scores), axis=1)
+    idx = np.take_along_axis(part, order, axis=1)
+    return idx.astype(np.int32), np.take_along_axis(scores, idx, axis=1).astype(np.float32)
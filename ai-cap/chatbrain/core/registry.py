@@ -0,0 +1,147 @@
+"""Nạp script pack từ ``registry.yaml`` và biên dịch các luật định tuyến của nó.
+
+``registry.yaml`` liệt kê các module kịch bản (``modules[].path``), bí danh toàn cục
+(``aliases_global``), luật chuyển hướng (``redirects``), entity dùng chung
+(``entities``) và câu ``fallback``. Tất cả
+được gộp vào một ``ScriptPack`` duy nhất, nên chỉ mục dùng chung (core/shared.py)
+mang theo cả luật định tuyến.
+
+``Routes`` là dạng đã biên dịch dùng lúc xử lý tin nhắn: bảng bí danh khớp chính
+xác (sau ``normalize_label``) và điều kiện chuyển hướng đã biên dịch sẵn thành hàm.
+"""
+from __future__ import annotations
+
+import logging
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from .buttons import normalize_label
+from .conditions import ConditionError, Predicate, compile_condition
+from .fusion import read_calibration
+from .lazy import optional_module
+from .loader import ScriptLoaderError, load_module, parse_entities
+from .schema import Entity, Intent, Redirect, ScriptPack
+
+logger = logging.getLogger(__name__)
+
+MAX_REDIRECT_HOPS = 4
+
+
+def load_registry(path: str) -> ScriptPack:
+    """Đọc registry và mọi module của nó thành một ``ScriptPack``.
+
+    Module lỗi định dạng bị bỏ qua kèm cảnh báo (như app cũ); bí danh / chuyển
+    hướng trỏ tới intent không tồn tại cũng bị bỏ qua. Điều kiện sai cú pháp là
+    lỗi nạp.
+    """
+    registry_path = Path(path)
+    yaml = optional_module("yaml")
+    if yaml is None:  # pragma: no cover - PyYAML nằm trong requirements
+        raise ScriptLoaderError("Thiếu thư viện PyYAML")
+    try:
+        data = yaml.safe_load(registry_path.read_text(encoding="utf-8")) or {}
+    except OSError as exc:
+        raise ScriptLoaderError(f"Không đọc được registry {path}: {exc}") from exc
+    except yaml.YAMLError as exc:
+        raise ScriptLoaderError(f"Registry {path} lỗi cú pháp: {exc}") from exc
+    if not isinstance(data, dict):
+        raise ScriptLoaderError(f"Registry {path} phải là object")
+
+    root = registry_path.parent
+    intents: List[Intent] = []
+    seen: Dict[str, Intent] = {}
+    entities: Dict[str, Entity] = {}
+    for module in data.get("modules") or []:
+        if not isinstance(module, dict) or not isinstance(module.get("path"), str):
+            raise ScriptLoaderError("Mỗi module trong registry cần trường 'path'")
+        try:
+            module_intents, module_entities = load_module(root / module["path"])
+        except ScriptLoaderError as exc:
+            logger.warning("Bỏ qua module %s: %s", module.get("name") or module["path"], exc)
+            continue
+        for intent in module_intents:
+            if intent.id in seen:
+                raise ScriptLoaderError(f"Intent trùng id: {intent.id}")
+            seen[intent.id] = intent
+            intents.append(intent)
+        entities.update(module_entities)
+        missing = [name for name in module.get("intents") or [] if name not in seen]
+        if missing:
+            logger.warning("Module %s khai báo intent không có trong file: %s", module.get("name"), ", ".join(missing))
+    if not intents:
+        raise ScriptLoaderError("Không có intent nào được nạp từ registry")
+
+    entities.update(parse_entities(data.get("entities"), registry_path.name))
+    fallback = (data.get("fallback") or {}).get("answer")
+    return ScriptPack(
+        intents=intents,
+        calibration=read_calibration(str(root)),
+        aliases=_compile_aliases(data.get("aliases_global") or [], seen),
+        redirects=_compile_redirects(data.get("redirects") or [], seen),
+        entities=entities,
+        fallback=fallback.strip() if isinstance(fallback, str) else None,
+    )
+
+
+def _compile_aliases(raw: List[Any], intents: Mapping[str, Intent]) -> Dict[str, str]:
+    aliases: Dict[str, str] = {}
+    for rule in raw:
+        if not isinstance(rule, dict):
+            raise ScriptLoaderError("aliases_global phải là danh sách object")
+        target = rule.get("target")
+        if target not in intents:
+            logger.warning("Bỏ qua bí danh tới intent không tồn tại: %s", target)
+            continue
+        for synonym in rule.get("synonyms") or []:
+            key = normalize_label(str(synonym))
+            if key and aliases.setdefault(key, target) != target:
+                logger.warning("Bí danh '%s' trỏ tới nhiều intent, giữ %s", synonym, aliases[key])
+    return aliases
+
+
+def _compile_redirects(raw: List[Any], intents: Mapping[str, Intent]) -> List[Redirect]:
+    redirects: List[Redirect] = []
+    for rule in raw:
+        if not isinstance(rule, dict):
+            raise ScriptLoaderError("redirects phải là danh sách object")
+        try:
+            redirect = Redirect.model_validate(rule)
+            compile_condition(redirect.condition)
+        except (ValueError, ConditionError) as exc:
+            raise ScriptLoaderError(f"Luật chuyển hướng lỗi {rule}: {exc}") from exc
+        if redirect.when_intent not in intents or redirect.to not in intents:
+            logger.warning("Bỏ qua chuyển hướng %s -> %s: intent không tồn tại", redirect.when_intent, redirect.to)
+            continue
+        redirects.append(redirect)
+    return redirects
+
+
+class Routes:
+    """Luật định tuyến đã biên dịch của một script pack."""
+
+    def __init__(self, pack: Optional[ScriptPack] = None) -> None:
+        self.aliases: Dict[str, str] = {}
+        self._redirects: Dict[str, List[Tuple[Predicate, str]]] = {}
+        if pack is not None:
+            self.aliases = dict(pack.aliases)
+            for redirect in pack.redirects:
+                self._redirects.setdefault(redirect.when_intent, []).append(
+                    (compile_condition(redirect.condition), redirect.to)
+                )
+
+    def alias(self, text: str) -> Optional[str]:
+        if not self.aliases:
+            return None
+        return self.aliases.get(normalize_label(text))
+
+    def redirect(self, intent_id: str, slots: Mapping[str, Any]) -> str:
+        """Intent đích sau khi áp các luật chuyển hướng (theo thứ tự khai báo)."""
+        for _ in range(MAX_REDIRECT_HOPS):
+            rules = self._redirects.get(intent_id)
+            if not rules:
+                break
+            target = next((to for predicate, to in rules if predicate(slots)), None)
+            if target is None or target == intent_id:
+                break
+            intent_id = target
+        return intent_id
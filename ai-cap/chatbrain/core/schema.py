@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 from datetime import datetime, timezone
-from typing import Dict, List, Optional
+from typing import Any, Dict, List, Optional
 
 from pydantic import BaseModel, Field, field_validator, model_validator
 
@@ -24,6 +24,12 @@ class Step(BaseModel):
     before_hook: Optional[str] = None
     action: Optional[str] = None
     after_hook: Optional[str] = None
+    # Bước hỏi slot: câu hỏi, tên slot và kiểu (boolean/number/text hoặc theo entity)
+    ask: Optional[str] = None
+    slot_name: Optional[str] = None
+    slot_type: Optional[str] = None
+    # Điều kiện theo slots (core/conditions.py); sai thì bỏ qua bước
+    when: Optional[str] = None
 
     @field_validator("say", mode="before")
     @classmethod
@@ -56,8 +62,32 @@ class Intent(BaseModel):
         return self
 
 
+class Entity(BaseModel):
+    name: str
+    # list | boolean | number | text; chỉ entity có danh sách giá trị mới được trích tự do
+    type: str = "list"
+    # giá trị chuẩn -> các cách nói
+    values: Dict[str, List[str]] = Field(default_factory=dict)
+
+
+class Redirect(BaseModel):
+    when_intent: str
+    condition: Optional[str] = Field(default=None, alias="if")
+    to: str
+
+    model_config = {"populate_by_name": True}
+
+
 class ScriptPack(BaseModel):
     intents: List[Intent]
+    # Hệ số calibration điểm (calibration.json cạnh các file YAML, xem core/fusion.py)
+    calibration: Optional[Dict[str, Any]] = None
+    # Từ registry.yaml (core/registry.py): bí danh đã chuẩn hoá -> intent, chuyển hướng, câu fallback
+    aliases: Dict[str, str] = Field(default_factory=dict)
+    redirects: List[Redirect] = Field(default_factory=list)
+    # Entity khai báo trong file kịch bản / registry (core/slots.py)
+    entities: Dict[str, Entity] = Field(default_factory=dict)
+    fallback: Optional[str] = None
 
     def intent_by_id(self, intent_id: str) -> Optional[Intent]:
         return next((i for i in self.intents if i.id == intent_id), None)
@@ -0,0 +1,113 @@
+"""Chỉ mục NLU biên dịch sẵn, dùng chung chỉ đọc giữa nhiều worker.
+
+Tiến trình cha biên dịch script pack + postings BM25 + ma trận embedding một lần
+rồi ghi ra thư mục ``<root>/<generation>/``. Các worker chỉ việc ``np.load`` với
+``mmap_mode="r"`` nên các trang dữ liệu nằm chung trong page cache của hệ điều
+hành thay vì mỗi worker giữ một bản sao riêng.
+"""
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Optional
+
+from .lazy import optional_module
+from .nlu import NLUIndex
+from .schema import ScriptPack
+
+CURRENT_FILE = "CURRENT"
+KEEP_GENERATIONS = 2
+
+
+class SharedPackError(Exception):
+    """Ngoại lệ khi ghi/đọc chỉ mục dùng chung."""
+
+
+def export_index(nlu: NLUIndex, root: str) -> str:
+    """Ghi chỉ mục hiện tại của ``nlu`` thành một generation mới và trả về tên generation."""
+    np = optional_module("numpy")
+    if np is None:
+        raise SharedPackError("Chế độ dùng chung cần numpy")
+    arrays = nlu.compiled_arrays()
+    root_path = Path(root)
+    root_path.mkdir(parents=True, exist_ok=True)
+    generation = f"{time.time_ns():x}"
+    target = root_path / generation
+    tmp = root_path / f".{generation}.tmp"
+    tmp.mkdir()
+
+    (tmp / "pack.json").write_text(nlu.script_pack.model_dump_json(), encoding="utf-8")
+    meta = {
+        "vocab": arrays["vocab"],
+        "documents": arrays["documents"],
+        "has_embeddings": arrays["embeddings"] is not None,
+    }
+    (tmp / "meta.json").write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+    np.save(tmp / "indptr.npy", np.ascontiguousarray(arrays["indptr"]))
+    np.save(tmp / "doc_ids.npy", np.ascontiguousarray(arrays["doc_ids"]))
+    np.save(tmp / "weights.npy", np.ascontiguousarray(arrays["weights"]))
+    np.save(tmp / "idf.npy", np.ascontiguousarray(arrays["idf"]))
+    if arrays["embeddings"] is not None:
+        np.save(tmp / "embeddings.npy", np.ascontiguousarray(arrays["embeddings"], dtype=np.float32))
+    os.replace(tmp, target)
+
+    pointer_tmp = root_path / f".{CURRENT_FILE}.tmp"
+    pointer_tmp.write_text(generation, encoding="utf-8")
+    os.replace(pointer_tmp, root_path / CURRENT_FILE)
+    _prune(root_path, generation)
+    return generation
+
+
+def current_generation(root: str) -> Optional[str]:
+    try:
+        return (Path(root) / CURRENT_FILE).read_text(encoding="utf-8").strip() or None
+    except OSError:
+        return None
+
+
+def load_index(nlu: NLUIndex, root: str, generation: Optional[str] = None) -> ScriptPack:
+    """Gắn generation ``generation`` (mặc định: CURRENT) vào ``nlu`` qua memmap."""
+    np = optional_module("numpy")
+    if np is None:
+        raise SharedPackError("Chế độ dùng chung cần numpy")
+    generation = generation or current_generation(root)
+    if not generation:
+        raise SharedPackError(f"Chưa có chỉ mục dùng chung trong {root}")
+    folder = Path(root) / generation
+    try:
+        pack = ScriptPack.model_validate_json((folder / "pack.json").read_text(encoding="utf-8"))
+        meta = json.loads((folder / "meta.json").read_text(encoding="utf-8"))
+        indptr = np.load(folder / "indptr.npy", mmap_mode="r")
+        doc_ids = np.load(folder / "doc_ids.npy", mmap_mode="r")
+        weights = np.load(folder / "weights.npy", mmap_mode="r")
+        idf = np.load(folder / "idf.npy", mmap_mode="r")
+        embeddings = None
+        if meta.get("has_embeddings"):
+            embeddings = np.load(folder / "embeddings.npy", mmap_mode="r")
+    except (OSError, ValueError) as exc:
+        raise SharedPackError(f"Không đọc được chỉ mục dùng chung {folder}: {exc}") from exc
+    nlu.attach_compiled(
+        pack,
+        documents=meta.get("documents", []),
+        vocab=meta.get("vocab", {}),
+        indptr=indptr,
+        doc_ids=doc_ids,
+        weights=weights,
+        idf=idf,
+        embeddings=embeddings,
+    )
+    return pack
+
+
+def _prune(root: Path, keep: str) -> None:
+    generations = sorted(
+        (p for p in root.iterdir() if p.is_dir() and not p.name.startswith(".")),
+        key=lambda p: p.name,
+    )
+    stale = [p for p in generations if p.name != keep][: max(0, len(generations) - KEEP_GENERATIONS)]
+    for path in stale:
+        # Worker cũ vẫn giữ memmap tới file đã unlink; Linux giữ inode tới khi đóng.
+        shutil.rmtree(path, ignore_errors=True)
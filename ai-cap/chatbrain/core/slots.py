@@ -0,0 +1,132 @@
+"""Trích slot từ tin nhắn và điều kiện bỏ qua bước, biên dịch một lần khi nạp pack.
+
+* Entity có danh sách giá trị (``Entity.values``) được gộp vào **một** automaton
+  Aho–Corasick (core/matcher.py) cho cả pack, kèm biến thể không dấu; mỗi tin nhắn
+  chỉ cần một lượt quét để lấy mọi slot nhắc tới, không gọi NLU.
+* Bước hỏi slot (``Step.slot_name``) nhận câu trả lời theo kiểu: entity đã khai báo,
+  ``boolean`` (có/rồi/chưa/không...), ``number`` (regex) hoặc ``text`` (nguyên câu).
+* ``Step.when`` được biên dịch thành hàm (core/conditions.py) theo ``(intent, step)``.
+
+Khớp chỉ tính khi trọn từ (hai đầu không dính chữ/số) để "app" không khớp trong
+"happy". Nhiều giá trị cùng một entity thì lấy cụm dài nhất, rồi cụm xuất hiện trước.
+"""
+from __future__ import annotations
+
+import logging
+import re
+import unicodedata
+from typing import Dict, List, Optional, Tuple
+
+from .buttons import NAVIGATION, normalize_label
+from .conditions import Predicate, compile_condition
+from .matcher import AhoCorasick, Match
+from .schema import Entity, ScriptPack
+from .spelling import fold_diacritics
+
+logger = logging.getLogger(__name__)
+
+StepKey = Tuple[str, str]
+
+YES_PHRASES = (
+    "có", "rồi", "đã", "đúng", "vâng", "dạ có", "ừ", "ok", "yes",
+    "có rồi", "đã làm", "làm rồi", "đã có", "đúng vậy", "đúng rồi",
+)
+NO_PHRASES = (
+    "không", "chưa", "ko", "sai", "no",
+    "không có", "chưa có", "chưa làm", "chưa từng", "không phải", "không đúng",
+)
+_NUMBER = re.compile(r"(?<![\w.,])(\d+(?:[.,]\d+)?)(?!\w)")
+
+
+def _normalize(text: str) -> str:
+    return unicodedata.normalize("NFC", text).lower().strip()
+
+
+def _add_phrase(matcher: AhoCorasick, phrase: str, value: Tuple[str, str]) -> None:
+    key = _normalize(phrase)
+    matcher.add(key, value)
+    folded = fold_diacritics(key)
+    if folded != key:
+        matcher.add(folded, value)
+
+
+def _whole_word(text: str, match: Match) -> bool:
+    before = text[match.start - 1] if match.start > 0 else " "
+    after = text[match.end] if match.end < len(text) else " "
+    return not before.isalnum() and not after.isalnum()
+
+
+def _pick(text: str, matches: List[Match]) -> Dict[str, str]:
+    """Mỗi entity một giá trị: cụm dài nhất, rồi cụm xuất hiện trước."""
+    chosen: Dict[str, Match] = {}
+    for match in matches:
+        if not _whole_word(text, match):
+            continue
+        name = match.value[0]
+        current = chosen.get(name)
+        if current is None or (len(match.pattern), -match.start) > (len(current.pattern), -current.start):
+            chosen[name] = match
+    return {name: match.value[1] for name, match in chosen.items()}
+
+
+class SlotExtractor:
+    def __init__(self, pack: Optional[ScriptPack] = None) -> None:
+        self.entities: Dict[str, Entity] = {}
+        self._values: AhoCorasick = AhoCorasick()
+        self._boolean: AhoCorasick = AhoCorasick()
+        for phrase in YES_PHRASES:
+            _add_phrase(self._boolean, phrase, ("boolean", "true"))
+        for phrase in NO_PHRASES:
+            _add_phrase(self._boolean, phrase, ("boolean", "false"))
+        self._boolean.compile()
+        if pack is not None:
+            self.entities = dict(pack.entities)
+            for entity in self.entities.values():
+                for canonical, surfaces in entity.values.items():
+                    for surface in [canonical, *surfaces]:
+                        _add_phrase(self._values, surface, (entity.name, canonical))
+            _check_required_slots(pack, self.entities)
+        self._values.compile()
+
+    def extract(self, text: str) -> Dict[str, str]:
+        """Mọi slot có danh sách giá trị được nhắc tới trong ``text``."""
+        if not len(self._values):
+            return {}
+        normalized = _normalize(text)
+        return _pick(normalized, self._values.find_all(normalized))
+
+    def answer(self, slot: str, slot_type: Optional[str], text: str) -> Optional[str]:
+        """Giá trị cho slot đang được hỏi; None nếu câu trả lời không chứa giá trị hợp lệ."""
+        entity = self.entities.get(slot)
+        normalized = _normalize(text)
+        if entity is not None and entity.values:
+            value = self.extract(text).get(slot)
+            if value is not None:
+                return value
+        kind = slot_type or (entity.type if entity is not None else "text")
+        if kind == "boolean":
+            return _pick(normalized, self._boolean.find_all(normalized)).get("boolean")
+        if kind == "number":
+            match = _NUMBER.search(normalized)
+            return match.group(1).replace(",", ".") if match else None
+        if kind == "text" and normalized and normalize_label(text) not in NAVIGATION:
+            return text.strip()
+        return None
+
+
+def compile_step_conditions(pack: ScriptPack) -> Dict[StepKey, Predicate]:
+    """``Step.when`` của cả pack đã biên dịch; bước không có điều kiện không có mặt."""
+    return {
+        (intent.id, step.id): compile_condition(step.when)
+        for intent in pack.intents
+        for step in intent.steps
+        if step.when
+    }
+
+
+def _check_required_slots(pack: ScriptPack, entities: Dict[str, Entity]) -> None:
+    for intent in pack.intents:
+        asked = {step.slot_name for step in intent.steps if step.slot_name}
+        for slot in intent.required_slots:
+            if slot not in asked and slot not in entities:
+                logger.warning("Intent %s cần slot %s nhưng không có bước hỏi hay entity", intent.id, slot)
@@ -0,0 +1,194 @@
+"""Các phiên bản pack đã biên dịch giữ trong bộ nhớ: rollback tức thì và chia traffic A/B.
+
+Mỗi lần nạp kịch bản tạo một ``Snapshot`` bất biến gồm pack, chỉ mục NLU, bí danh/
+chuyển hướng, executor với các bảng đã biên dịch và lớp phủ của từng tenant. Đổi phiên
+bản đang chạy chỉ là gán lại con trỏ, không dựng lại gì; mỗi lượt đọc một con trỏ
+snapshot từ đầu nên không bao giờ trộn hai phiên bản. Intent không đổi giữa hai lần nạp được dùng chung đối
+tượng (``intern_intents``); chỉ mục NLU dùng lại khi nội dung NLU không đổi.
+
+``TrafficSplit`` chia phiên theo crc32 của session id nên một người dùng luôn rơi vào
+cùng một phiên bản chừng nào trọng số chưa đổi.
+"""
+from __future__ import annotations
+
+import threading
+import time
+import zlib
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from .buttons import ButtonTable
+from .conditions import Predicate
+from .executor import Executor
+from .flows import FlowTable
+from .hooks import HookTable
+from .nlu import NLUIndex
+from .registry import Routes
+from .schema import Intent, ScriptPack
+from .slots import SlotExtractor, StepKey
+
+
+class Usage:
+    """Số lượt, tỉ lệ fallback và độ trễ p50/p95 trên cửa sổ ``window`` lượt gần nhất."""
+
+    def __init__(self, window: int = 2048) -> None:
+        self._lock = threading.Lock()
+        self._latencies: deque = deque(maxlen=window)
+        self.messages = 0
+        self.fallbacks = 0
+
+    def record(self, seconds: float, fallback: bool) -> None:
+        with self._lock:
+            self._latencies.append(seconds)
+            self.messages += 1
+            self.fallbacks += int(fallback)
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            latencies = sorted(self._latencies)
+            messages, fallbacks = self.messages, self.fallbacks
+
+        def percentile(q: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000, 3)
+
+        return {
+            "messages": messages,
+            "fallbacks": fallbacks,
+            "fallback_rate": round(fallbacks / messages, 4) if messages else 0.0,
+            "p50_ms": percentile(0.5),
+            "p95_ms": percentile(0.95),
+        }
+
+
+@dataclass
+class Snapshot:
+    version: str
+    pack: ScriptPack
+    nlu: NLUIndex
+    routes: Routes
+    intents: Dict[str, Intent]
+    buttons: ButtonTable
+    hooks: HookTable
+    slot_extractor: SlotExtractor
+    step_conditions: Dict[StepKey, Predicate]
+    flows: FlowTable
+    # Executor gắn các bảng trên (và context của service đã biên dịch snapshot)
+    executor: Executor
+    fingerprint: str
+    source: Optional[str] = None
+    # Snapshot của tenant: id intent mà file ghi đè thay thế trên pack gốc
+    overridden: List[str] = field(default_factory=list)
+    # Snapshot gốc: lớp phủ tenant biên dịch trên pack này, theo tenant id
+    tenants: Dict[str, "Snapshot"] = field(default_factory=dict)
+    shared_intents: int = 0
+    reused_index: bool = False
+    created_at: float = field(default_factory=time.time)
+    usage: Usage = field(default_factory=Usage)
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "source": self.source,
+            "intents": len(self.pack.intents),
+            "shared_intents": self.shared_intents,
+            "reused_index": self.reused_index,
+            "created_at": self.created_at,
+            **self.usage.summary(),
+        }
+
+
+def intern_intents(pack: ScriptPack, previous: Iterable[ScriptPack]) -> Tuple[ScriptPack, int]:
+    """Thay intent giống hệt (so sánh theo giá trị) bằng đối tượng của pack trước.
+
+    Trả ``(pack, số intent dùng chung)``; pack mới nhất trong ``previous`` được ưu tiên.
+    """
+    known: Dict[str, Intent] = {}
+    for old in previous:
+        known.update({intent.id: intent for intent in old.intents})
+    if not known:
+        return pack, 0
+    merged: List[Intent] = []
+    shared = 0
+    for intent in pack.intents:
+        old = known.get(intent.id)
+        if old is not None and old == intent:
+            merged.append(old)
+            shared += 1
+        else:
+            merged.append(intent)
+    return pack.model_copy(update={"intents": merged}), shared
+
+
+class SnapshotStore:
+    """Giữ tối đa ``limit`` snapshot; không bao giờ bỏ phiên bản đang được dùng."""
+
+    def __init__(self, limit: int = 3) -> None:
+        self.limit = max(1, limit)
+        self._snapshots: "OrderedDict[str, Snapshot]" = OrderedDict()
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    def next_version(self) -> str:
+        with self._lock:
+            self._counter += 1
+            return f"v{self._counter}"
+
+    def add(self, snapshot: Snapshot, pinned: Iterable[str] = ()) -> List[str]:
+        """Lưu snapshot, bỏ bản cũ nhất không bị ghim khi vượt ``limit``; trả các bản đã bỏ."""
+        keep = {snapshot.version, *pinned}
+        dropped: List[str] = []
+        with self._lock:
+            self._snapshots[snapshot.version] = snapshot
+            for version in list(self._snapshots):
+                if len(self._snapshots) <= self.limit:
+                    break
+                if version not in keep:
+                    del self._snapshots[version]
+                    dropped.append(version)
+        return dropped
+
+    def get(self, version: str) -> Optional[Snapshot]:
+        return self._snapshots.get(version)
+
+    def packs(self) -> List[ScriptPack]:
+        """Pack theo thứ tự nạp (cũ trước) để ``intern_intents`` ưu tiên bản mới nhất."""
+        return [snapshot.pack for snapshot in list(self._snapshots.values())]
+
+    def index_for(self, fingerprint: str) -> Optional[NLUIndex]:
+        for snapshot in reversed(list(self._snapshots.values())):
+            if snapshot.fingerprint == fingerprint:
+                return snapshot.nlu
+        return None
+
+    def __iter__(self):
+        return iter(list(self._snapshots.values()))
+
+    def __len__(self) -> int:
+        return len(self._snapshots)
+
+
+class TrafficSplit:
+    """Chia phiên giữa các phiên bản theo trọng số, dựa trên crc32 của session id."""
+
+    def __init__(self, weights: Mapping[str, float]) -> None:
+        positive = {version: float(w) for version, w in weights.items() if float(w) > 0}
+        if not positive:
+            raise ValueError("Cần ít nhất một phiên bản có trọng số dương")
+        total = sum(positive.values())
+        self.weights = {version: w / total for version, w in positive.items()}
+        self._bounds: List[Tuple[int, str]] = []
+        running = 0.0
+        for version, weight in self.weights.items():
+            running += weight
+            self._bounds.append((int(running * 0xFFFFFFFF), version))
+        self._bounds[-1] = (0xFFFFFFFF, self._bounds[-1][1])
+
+    def choose(self, session_id: str) -> str:
+        point = zlib.crc32(session_id.encode("utf-8"))
+        for bound, version in self._bounds:
+            if point <= bound:
+                return version
+        return self._bounds[-1][1]  # pragma: no cover - bound cuối luôn là 0xFFFFFFFF
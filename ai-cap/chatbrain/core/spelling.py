@@ -0,0 +1,176 @@
+"""Sửa lỗi gõ cho token truy vấn trước khi chấm BM25.
+
+Người dùng Messenger hay gõ không dấu ("kich hoat vneid"), sai chính tả
+("vnied") hoặc viết tắt ("quen mk"). BM25 chỉ cộng điểm cho token khớp chính
+xác, nên ``SpellIndex`` ánh xạ token lạ về token có trong vocab theo thứ tự:
+
+1. bảng viết tắt (``ABBREVIATIONS``), nếu mọi token mở rộng đều có trong vocab;
+2. bỏ dấu: dạng không dấu -> token có dấu phổ biến nhất (theo số tài liệu chứa);
+3. từ điển xoá kiểu SymSpell trên dạng không dấu: khoảng cách Damerau-Levenshtein
+   tối đa 1 với token 4-7 ký tự, 2 với token dài hơn.
+
+Mọi bảng được dựng một lần từ vocab khi dựng chỉ mục; mỗi lượt tra chỉ là vài
+lần tra dict, kết quả còn được cache theo token.
+"""
+from __future__ import annotations
+
+import os
+import unicodedata
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Set
+
+ABBREVIATIONS: Dict[str, str] = {
+    "mk": "mật khẩu",
+    "tk": "tài khoản",
+    "sdt": "số điện thoại",
+    "sđt": "số điện thoại",
+    "dt": "điện thoại",
+    "đt": "điện thoại",
+    "k": "không",
+    "ko": "không",
+    "kh": "không",
+    "khg": "không",
+    "dc": "được",
+    "đc": "được",
+    "đk": "đăng ký",
+    "dk": "đăng ký",
+    "gt": "giấy tờ",
+    "cmnd": "chứng minh nhân dân",
+    "vs": "với",
+    "ntn": "như thế nào",
+}
+
+_CACHE_LIMIT = 50_000
+
+
+def fold_diacritics(text: str) -> str:
+    """Bỏ dấu tiếng Việt (kể cả đ -> d)."""
+    decomposed = unicodedata.normalize("NFD", text)
+    stripped = "".join(ch for ch in decomposed if unicodedata.category(ch) != "Mn")
+    return stripped.replace("đ", "d").replace("Đ", "D")
+
+
+def max_distance_for(token: str, limit: int) -> int:
+    if len(token) < 4:
+        return 0
+    return min(limit, 1 if len(token) < 8 else 2)
+
+
+def _deletes(word: str, distance: int) -> Set[str]:
+    results: Set[str] = set()
+    frontier = {word}
+    for _ in range(distance):
+        next_frontier = set()
+        for item in frontier:
+            for idx in range(len(item)):
+                next_frontier.add(item[:idx] + item[idx + 1 :])
+        results |= next_frontier
+        frontier = next_frontier
+    return results
+
+
+def damerau_levenshtein(a: str, b: str, limit: int) -> int:
+    """Khoảng cách optimal-string-alignment; trả ``limit + 1`` khi vượt ngưỡng."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    prev2: List[int] = []
+    prev = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        row_min = current[0]
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            value = min(prev[j] + 1, current[j - 1] + 1, prev[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                value = min(value, prev2[j - 2] + 1)
+            current[j] = value
+            row_min = min(row_min, value)
+        if row_min > limit:
+            return limit + 1
+        prev2, prev = prev, current
+    return prev[len(b)]
+
+
+class SpellIndex:
+    def __init__(self, max_distance: Optional[int] = None) -> None:
+        if max_distance is None:
+            max_distance = int(os.getenv("SPELL_MAX_DISTANCE", "2"))
+        self.max_distance = max(0, max_distance)
+        self._vocab: Set[str] = set()
+        self._folded: Dict[str, str] = {}
+        self._deletes: Dict[str, List[str]] = {}
+        self._order: Dict[str, int] = {}
+        self._cache: Dict[str, List[str]] = {}
+
+    def build(self, vocab: Iterable[str], doc_freq: Optional[Mapping[str, int]] = None) -> None:
+        """Dựng bảng bỏ dấu và từ điển xoá từ ``vocab``; ``doc_freq`` dùng để chọn khi trùng."""
+        doc_freq = doc_freq or {}
+        self._vocab = set(vocab)
+        self._cache = {}
+        folded: Dict[str, str] = {}
+        for token in sorted(self._vocab, key=lambda t: (-doc_freq.get(t, 0), t)):
+            # Token phổ biến hơn thắng khi nhiều token có dấu cùng một dạng không dấu
+            folded.setdefault(fold_diacritics(token), token)
+        self._folded = folded
+        self._order = {plain: idx for idx, plain in enumerate(folded)}
+        deletes: Dict[str, List[str]] = {}
+        for plain in folded:
+            distance = max_distance_for(plain, self.max_distance)
+            if distance == 0:
+                continue
+            for variant in _deletes(plain, distance):
+                deletes.setdefault(variant, []).append(plain)
+        self._deletes = deletes
+
+    def clear_cache(self) -> None:
+        self._cache = {}
+
+    def correct_token(self, token: str) -> List[str]:
+        """Trả về token (hoặc các token, với viết tắt) trong vocab; giữ nguyên nếu không sửa được."""
+        if token in self._vocab or not self._vocab:
+            return [token]
+        cached = self._cache.get(token)
+        if cached is not None:
+            return cached
+        result = self._lookup(token)
+        if len(self._cache) >= _CACHE_LIMIT:
+            self._cache.clear()
+        self._cache[token] = result
+        return result
+
+    def correct(self, tokens: Sequence[str]) -> List[str]:
+        corrected: List[str] = []
+        for token in tokens:
+            corrected.extend(self.correct_token(token))
+        return corrected
+
+    def _lookup(self, token: str) -> List[str]:
+        expansion = ABBREVIATIONS.get(token)
+        if expansion:
+            parts = [
+                part if part in self._vocab else self._folded.get(fold_diacritics(part), part)
+                for part in expansion.split()
+            ]
+            if all(part in self._vocab for part in parts):
+                return parts
+        plain = fold_diacritics(token)
+        exact = self._folded.get(plain)
+        if exact is not None:
+            return [exact]
+        limit = max_distance_for(plain, self.max_distance)
+        if limit == 0:
+            return [token]
+        candidates: Set[str] = set()
+        for variant in _deletes(plain, limit) | {plain}:
+            candidates.update(self._deletes.get(variant, ()))
+            if variant in self._folded:
+                candidates.add(variant)
+        best: Optional[str] = None
+        best_key = (limit + 1, 0)
+        for candidate in candidates:
+            # Cùng khoảng cách: ưu tiên token phổ biến hơn (thứ tự chèn của _folded)
+            key = (damerau_levenshtein(plain, candidate, limit), self._order[candidate])
+            if key < best_key:
+                best, best_key = candidate, key
+        if best is None:
+            return [token]
+        return [self._folded[best]]
@@ -0,0 +1,130 @@
+"""Nhiều trang/phường trong một tiến trình: pack riêng từng tenant, phủ lên pack gốc.
+
+``tenants.yaml`` (đường dẫn trong ``CHATBRAIN_TENANTS``)::
+
+    tenants:
+      - id: nghia_lo
+        pages: ["104512345678901"]          # page id Facebook -> tenant
+        page_access_token_env: FB_TOKEN_NGHIA_LO
+        fallback: "Em chưa hiểu, anh/chị gọi {{phone}} giúp em nhé."
+        variables: {phone: "0216 3870 123", address: "Số 1 Điện Biên"}
+        overrides: tenants/nghia_lo.yaml   # intent thay thế (theo id) hoặc thêm mới
+
+Pack của tenant là bản sao nông của pack gốc (copy-on-write): danh sách intent mới
+nhưng các ``Intent`` không bị ghi đè là chính đối tượng của pack gốc. Chỉ mục NLU
+được dùng chung giữa các pack có cùng nội dung NLU (``nlu_fingerprint``), nên tenant
+chỉ đổi lời thoại/số điện thoại không tốn thêm chỉ mục nào. ``{{tên}}`` trong câu trả
+lời được thay bằng ``variables`` của tenant lúc trả lời.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Mapping, Optional, Tuple
+
+from .loader import ScriptLoaderError, read_yaml
+from .schema import Entity, Intent, ScriptPack
+
+_VARIABLE = re.compile(r"\{\{\s*([\w.]+)\s*\}\}")
+_TENANT_ID = re.compile(r"^[\w-]+$")
+
+
+@dataclass(frozen=True)
+class TenantConfig:
+    id: str
+    pages: Tuple[str, ...] = ()
+    fallback: Optional[str] = None
+    variables: Mapping[str, str] = field(default_factory=dict)
+    overrides: Optional[Path] = None
+    token_env: Optional[str] = None
+
+    def page_access_token(self) -> str:
+        return os.getenv(self.token_env, "") if self.token_env else ""
+
+
+def load_tenants(path: str) -> List[TenantConfig]:
+    """Đọc ``tenants.yaml``; đường dẫn ``overrides`` tính từ thư mục chứa file."""
+    source = Path(path)
+    data = read_yaml(source)
+    root = source.parent
+    configs: List[TenantConfig] = []
+    seen_pages: Dict[str, str] = {}
+    for raw in data.get("tenants") or []:
+        if not isinstance(raw, dict) or not raw.get("id"):
+            raise ScriptLoaderError(f"Mỗi tenant trong {source.name} cần trường 'id'")
+        tenant_id = str(raw["id"])
+        if not _TENANT_ID.match(tenant_id) or any(c.id == tenant_id for c in configs):
+            raise ScriptLoaderError(f"id tenant không hợp lệ hoặc bị trùng: {tenant_id}")
+        pages = tuple(str(page) for page in raw.get("pages") or [])
+        for page in pages:
+            if page in seen_pages:
+                raise ScriptLoaderError(f"Trang {page} thuộc cả {seen_pages[page]} và {tenant_id}")
+            seen_pages[page] = tenant_id
+        overrides = raw.get("overrides")
+        configs.append(
+            TenantConfig(
+                id=tenant_id,
+                pages=pages,
+                fallback=raw.get("fallback"),
+                variables={str(k): str(v) for k, v in (raw.get("variables") or {}).items()},
+                overrides=root / overrides if overrides else None,
+                token_env=raw.get("page_access_token_env"),
+            )
+        )
+    return configs
+
+
+def overlay(
+    base: ScriptPack,
+    intents: List[Intent],
+    entities: Optional[Mapping[str, Entity]] = None,
+    fallback: Optional[str] = None,
+) -> Tuple[ScriptPack, List[str]]:
+    """Pack của tenant: intent trùng id thay tại chỗ, intent mới nối vào cuối.
+
+    Trả kèm danh sách id bị ghi đè/thêm. Intent còn lại, bí danh, chuyển hướng và
+    calibration dùng chung đối tượng với pack gốc.
+    """
+    replacements = {intent.id: intent for intent in intents}
+    merged = [replacements.pop(intent.id, intent) for intent in base.intents]
+    merged.extend(replacements.values())
+    update: Dict[str, object] = {"intents": merged}
+    if entities:
+        update["entities"] = {**base.entities, **entities}
+    if fallback:
+        update["fallback"] = fallback
+    return base.model_copy(update=update), [intent.id for intent in intents]
+
+
+def nlu_fingerprint(pack: ScriptPack) -> str:
+    """Băm phần nội dung mà ``NLUIndex`` dùng; hai pack cùng băm dùng chung một chỉ mục."""
+    digest = hashlib.sha1()
+    for intent in pack.intents:
+        row = [intent.id, intent.domain, intent.can_interrupt, intent.synonyms, intent.examples]
+        digest.update(json.dumps(row, ensure_ascii=False).encode("utf-8"))
+    digest.update(json.dumps(pack.calibration, sort_keys=True, default=str).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def render(text: str, variables: Mapping[str, str]) -> str:
+    """Thay ``{{tên}}``; biến không khai báo được giữ nguyên để dễ phát hiện."""
+    if not variables or "{{" not in text:
+        return text
+    return _VARIABLE.sub(lambda match: variables.get(match.group(1), match.group(0)), text)
+
+
+def page_tokens(path: Optional[str] = None) -> Dict[str, str]:
+    """page id -> page access token (đọc từ biến môi trường khai báo trong tenants.yaml)."""
+    path = path or os.getenv("CHATBRAIN_TENANTS")
+    if not path:
+        return {}
+    tokens: Dict[str, str] = {}
+    for config in load_tenants(path):
+        token = config.page_access_token()
+        if token:
+            tokens.update({page: token for page in config.pages})
+    return tokens
@@ -0,0 +1,50 @@
+"""Khởi chạy nhiều worker uvicorn dùng chung một chỉ mục NLU biên dịch sẵn.
+
+    python -m chatbrain.serve --workers 4 --scripts knowledge_base/scripts
+
+Tiến trình cha đọc YAML, dựng BM25 (và embeddings nếu bật) đúng một lần, ghi ra
+``--shared-dir`` rồi mới fork các worker. Mỗi worker chỉ memmap các mảng đó.
+Với ``CHATBRAIN_JOURNAL_DIR``, mỗi worker tự nhận một ô nhật ký riêng (``storage/journal.claim``).
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import tempfile
+from typing import List, Optional
+
+from .core import loader, shared
+from .core.nlu import NLUIndex
+
+
+def build_shared(scripts: str, shared_dir: str) -> str:
+    pack = loader.load_from_folder(scripts)
+    nlu = NLUIndex()
+    nlu.build(pack)
+    return shared.export_index(nlu, shared_dir)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="ChatBrain prefork server")
+    parser.add_argument("--scripts", default=os.getenv("CHATBRAIN_DEFAULT_SCRIPTS", "knowledge_base/scripts"))
+    parser.add_argument(
+        "--shared-dir",
+        default=os.getenv("CHATBRAIN_SHARED_PACK") or os.path.join(tempfile.gettempdir(), "chatbrain_shared"),
+    )
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "2")))
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args(argv)
+
+    generation = build_shared(args.scripts, args.shared_dir)
+    print(f"Đã biên dịch chỉ mục dùng chung {generation} tại {args.shared_dir}")
+    # Worker kế thừa biến môi trường và nạp chỉ mục qua memmap thay vì đọc YAML
+    os.environ["CHATBRAIN_SHARED_PACK"] = args.shared_dir
+
+    import uvicorn
+
+    uvicorn.run("chatbrain.app:app", host=args.host, port=args.port, workers=max(1, args.workers))
+
+
+if __name__ == "__main__":  # pragma: no cover - entry CLI
+    main()
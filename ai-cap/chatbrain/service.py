@@ -0,0 +1,824 @@
+"""Lõi xử lý hội thoại, không phụ thuộc FastAPI.
+
+CLI và test import module này trực tiếp để khỏi trả giá import FastAPI/httpx.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import time
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Tuple
+
+from pydantic import BaseModel, Field, ValidationError
+
+from .core import buttons, lint, loader, registry, shared, snapshots, tenants
+from .core.context import ContextManager
+from .core.executor import Executor
+from .core.flows import FlowTable
+from .core.hooks import HookError, HookRegistry
+from .core.nlu import NLUIndex
+from .core.policy import Policy
+from .core.schema import Candidate, ContextState, Intent, ScriptPack, StepUI
+from .core.slots import SlotExtractor, compile_step_conditions
+from .storage import journal
+from .storage.pipeline import LogEntry
+from .storage.repo import SQLiteRepo
+
+logger = logging.getLogger(__name__)
+
+BUTTON_LABELS = {
+    "Đã xong",
+    "Quay lại",
+    "Huỷ",
+    "Cần trợ giúp thêm",
+    "Không",
+    "Tiếp tục",
+    "Khởi động lại",
+}
+
+
+class MediaResponse(BaseModel):
+    type: str = "image"
+    url: str
+    alt: Optional[str] = None
+
+
+class UIResponse(BaseModel):
+    buttons: List[str] = Field(default_factory=list)
+    media: List[MediaResponse] = Field(default_factory=list)
+
+    def __getitem__(self, item: str) -> Any:  # giữ tương thích kiểu dict
+        return getattr(self, item)
+
+    def get(self, item: str, default: Any = None) -> Any:
+        return getattr(self, item, default)
+
+
+class MessageResponse(BaseModel):
+    reply: str
+    ui: UIResponse = Field(default_factory=UIResponse)
+    debug: Dict[str, Any] = Field(default_factory=dict)
+
+
+def message_events(response: MessageResponse) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """Tách phản hồi thành các sự kiện cho chế độ streaming (``/message/stream``).
+
+    Lời đáp kèm nút đi trước để connector gửi ngay; mỗi ảnh là một sự kiện riêng;
+    ``done`` mang phần debug và đánh dấu hết lượt.
+    """
+    yield "reply", {"reply": response.reply, "buttons": list(response.ui.buttons)}
+    for index, item in enumerate(response.ui.media):
+        yield "media", {"index": index, **item.model_dump()}
+    yield "done", {"debug": response.debug}
+
+
+class ServiceError(Exception):
+    """Lỗi nghiệp vụ kèm mã HTTP; app.py chuyển thành phản hồi JSON ``{"detail": ...}``."""
+
+    def __init__(self, status_code: int, detail: str) -> None:
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class ChatBrainService:
+    def __init__(
+        self,
+        context: Optional[ContextManager] = None,
+        repo: Optional[SQLiteRepo] = None,
+        hooks: Optional[HookRegistry] = None,
+        tenant_id: Optional[str] = None,
+    ) -> None:
+        self.context = context or ContextManager()
+        self.nlu = NLUIndex()
+        self.policy = Policy()
+        self.executor = Executor(self.context, hooks=hooks)
+        self.repo = repo or SQLiteRepo()
+        self.script_pack = ScriptPack(intents=[])
+        self._intents: Dict[str, Intent] = {}
+        # Bí danh + chuyển hướng đã biên dịch từ registry.yaml (core/registry.py)
+        self.routes = registry.Routes()
+        # Chế độ prefork: thư mục chỉ mục dùng chung do chatbrain.serve biên dịch sẵn
+        self.shared_root = os.getenv("CHATBRAIN_SHARED_PACK") or None
+        self._shared_generation: Optional[str] = None
+        self._shared_checked_at = 0.0
+        # Kịch bản và model được nạp trong startup() (lifespan của FastAPI hoặc CLI),
+        # không phải lúc import module. ``state``: starting -> loading -> warming -> ready,
+        # hoặc ``error`` khi không nạp được kịch bản/tenants.yaml (xem ``startup_error``).
+        self.state = "starting"
+        self.startup_error: Optional[str] = None
+        self._starting = False
+        self.warmup_stats: Dict[str, Any] = {}
+        # Đa tenant (core/tenants.py): service gốc giữ pack cơ sở và các service con
+        # theo tenant; con dùng chung repo log, hook registry và chỉ mục NLU khi có thể.
+        self.tenant_id = tenant_id
+        self.tenant_configs: List[tenants.TenantConfig] = []
+        self.tenants: Dict[str, "ChatBrainService"] = {}
+        self.pages: Dict[str, str] = {}
+        self.variables: Dict[str, str] = {}
+        self.overridden: List[str] = []
+        self.usage = snapshots.Usage(int(os.getenv("LATENCY_WINDOW", "2048")))
+        # Phiên bản pack đã biên dịch (core/snapshots.py): bản đang chạy, các bản giữ lại
+        # để rollback và service biến thể cho phiên bản nhận một phần traffic A/B.
+        self.snapshots = snapshots.SnapshotStore(int(os.getenv("CHATBRAIN_SNAPSHOTS", "3")))
+        self.snapshot: Optional[snapshots.Snapshot] = None
+        self.split: Optional[snapshots.TrafficSplit] = None
+        self._variants: Dict[str, ChatBrainService] = {}
+        self._keeps_snapshots = tenant_id is None
+        # Snapshot rỗng cho các lượt đến trước khi nạp kịch bản (không lưu trong ``snapshots``)
+        self._empty = snapshots.Snapshot(
+            version="",
+            pack=self.script_pack,
+            nlu=self.nlu,
+            routes=self.routes,
+            intents={},
+            buttons={},
+            hooks={},
+            slot_extractor=SlotExtractor(),
+            step_conditions={},
+            flows=FlowTable(),
+            executor=self.executor,
+            fingerprint=tenants.nlu_fingerprint(self.script_pack),
+        )
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    def startup(self) -> Dict[str, Any]:
+        """Nạp kịch bản mặc định (registry, thư mục hoặc chỉ mục dùng chung), warmup rồi mới báo sẵn sàng."""
+        default_folder = os.getenv("CHATBRAIN_DEFAULT_SCRIPTS", "knowledge_base/scripts")
+        registry_path = os.getenv("CHATBRAIN_REGISTRY")
+        allow_empty = os.getenv("CHATBRAIN_ALLOW_EMPTY", "false").lower() in {"1", "true", "yes"}
+        result: Dict[str, Any] = {"intents": 0}
+        self.state = "loading"
+        self.startup_error = None
+        journal_dir = os.getenv("CHATBRAIN_JOURNAL_DIR")
+        if journal_dir and self.context.journal is None:
+            # Khôi phục các phiên đang dở từ snapshot + nhật ký trước khi nhận tin nhắn
+            # Worker prefork dùng chung biến môi trường: mỗi worker nhận một ô riêng
+            self.context.attach_journal(journal.claim(journal_dir))
+        # ``_install`` không báo ready giữa chừng: khi tenant chưa nạp, trang của tenant
+        # sẽ bị trả lời bằng pack gốc
+        self._starting = True
+        try:
+            if self.shared_root:
+                result = self.load_shared()
+            elif registry_path:
+                result = self.load_registry(registry_path)
+            else:
+                result = self.load_scripts(default_folder)
+        except Exception as exc:
+            self.startup_error = f"{type(exc).__name__}: {exc}"
+            logger.error("Không nạp được kịch bản lúc khởi động: %s", self.startup_error)
+            # Pack rỗng trả fallback cho mọi câu: readiness 503, trừ khi chủ động bật
+            # CHATBRAIN_ALLOW_EMPTY để khởi động rỗng rồi nạp qua /load-scripts
+            if not allow_empty:
+                self.state = "error"
+        tenants_path = os.getenv("CHATBRAIN_TENANTS")
+        if tenants_path and self.state != "error":
+            try:
+                result["tenants"] = len(self.load_tenants(tenants_path))
+            except Exception as exc:
+                # Trang của tenant không được trả lời bằng pack gốc (sai địa chỉ, số điện
+                # thoại): báo lỗi, readiness trả 503 cho tới khi sửa tenants.yaml
+                self.startup_error = f"{tenants_path}: {type(exc).__name__}: {exc}"
+                logger.error("Không nạp được tenant: %s", self.startup_error)
+                self.state = "error"
+        self._starting = False
+        self.context.start_sweeper()
+        self.repo.start_maintenance()
+        if self.state != "error":
+            self.state = "ready"
+        return result
+
+    def shutdown(self) -> None:
+        """Dừng tài nguyên nền khi tiến trình tắt (gọi sau ``yield`` của lifespan)."""
+        # Hủy hook đang chờ để không giữ luồng của pool/event loop riêng của hook
+        self.executor.hooks.shutdown()
+        # Log còn trong hàng đợi của LogWriter được ghi hết trước khi đóng SQLite
+        self.repo.close()
+        # Mỗi tenant có context/nhật ký riêng; service biến thể dùng chung context gốc
+        for child in self.tenants.values():
+            child.context.close()
+        self.context.close()
+
+    # Script management -------------------------------------------------
+    def load_scripts(self, folder: str, activate: bool = True) -> Dict[str, Any]:
+        """Nạp thư mục kịch bản thành một phiên bản mới; ``activate=False`` chỉ biên dịch và giữ lại."""
+        pack = loader.load_from_folder(folder)
+        snapshot = self._build_and_activate(pack, source=folder, activate=activate)
+        return {"intents": len(pack.intents), "folder": folder, "version": snapshot.version}
+
+    def load_registry(self, path: str, activate: bool = True) -> Dict[str, Any]:
+        """Nạp các module trong ``registry.yaml`` thành một pack kèm bí danh/chuyển hướng."""
+        pack = registry.load_registry(path)
+        snapshot = self._build_and_activate(pack, source=path, activate=activate)
+        return {
+            "intents": len(pack.intents),
+            "registry": path,
+            "aliases": len(pack.aliases),
+            "redirects": len(pack.redirects),
+            "version": snapshot.version,
+        }
+
+    def _build_and_activate(
+        self, pack: ScriptPack, source: Optional[str] = None, activate: bool = True
+    ) -> snapshots.Snapshot:
+        # Intent không đổi so với các phiên bản đang giữ dùng chung đối tượng; nội dung
+        # NLU không đổi (chỉ sửa lời thoại/bước) thì dùng lại chỉ mục, khỏi dựng lại.
+        pack, shared_intents = snapshots.intern_intents(pack, self.snapshots.packs())
+        fingerprint = tenants.nlu_fingerprint(pack)
+        # Chế độ dùng chung xuất pack từ chính chỉ mục nên luôn dựng chỉ mục mới
+        nlu = None if self.shared_root else self.snapshots.index_for(fingerprint)
+        reused = nlu is not None
+        if nlu is None:
+            nlu = self._new_index()
+            nlu.build(pack)
+        if os.getenv("LINT_ON_LOAD", "false").lower() in {"1", "true", "yes"}:
+            self._lint_gate(pack, nlu)
+        snapshot = self._compile(pack, nlu, warm=not reused, source=source, fingerprint=fingerprint)
+        snapshot.shared_intents = shared_intents
+        snapshot.reused_index = reused
+        self._ensure_tenants(snapshot)
+        self._remember(snapshot)
+        if activate:
+            self._install(snapshot)
+            if self.shared_root:
+                # Xuất generation mới để các worker khác tự nạp lại ở request kế tiếp
+                self._shared_generation = shared.export_index(self.nlu, self.shared_root)
+        return snapshot
+
+    def load_shared(self, generation: Optional[str] = None) -> Dict[str, Any]:
+        if not self.shared_root:
+            raise RuntimeError("Chưa cấu hình CHATBRAIN_SHARED_PACK")
+        generation = generation or shared.current_generation(self.shared_root)
+        nlu = self._new_index()
+        pack = shared.load_index(nlu, self.shared_root, generation)
+        self._activate(pack, nlu, source=f"shared:{generation}")
+        self._shared_generation = generation
+        return {"intents": len(pack.intents), "generation": generation}
+
+    def warmup(self, nlu: Optional[NLUIndex] = None, queries: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Chạy vài truy vấn giả qua ``NLUIndex.rank`` để trả trước chi phí lần gọi đầu.
+
+        Với embeddings, lần ``encode`` đầu tiên khởi tạo kernel torch và mất vài giây;
+        warmup đảm bảo chi phí đó không rơi vào tin nhắn thật đầu tiên.
+        """
+        nlu = nlu or self.nlu
+        if queries is None:
+            queries = self._warmup_queries(nlu)
+        started = time.perf_counter()
+        for query in queries:
+            nlu.rank(query)
+        self.warmup_stats = {"queries": len(queries), "ms": round((time.perf_counter() - started) * 1000, 2)}
+        return self.warmup_stats
+
+    def _warmup_queries(self, nlu: NLUIndex) -> List[str]:
+        raw = os.getenv("WARMUP_QUERIES")
+        if raw is not None:
+            return [q.strip() for q in raw.split("|") if q.strip()]
+        limit = int(os.getenv("WARMUP_LIMIT", "8"))
+        queries = [intent.synonyms[0] for intent in nlu.all_intents() if intent.synonyms]
+        return queries[:limit]
+
+    def _new_index(self) -> NLUIndex:
+        # Dùng lại model embedding đã nạp để lần dựng sau không phải nạp lại model
+        return NLUIndex(embedder=self.nlu.embedder)
+
+    def _activate(
+        self,
+        pack: ScriptPack,
+        nlu: NLUIndex,
+        warm: bool = True,
+        source: Optional[str] = None,
+        fingerprint: Optional[str] = None,
+    ) -> snapshots.Snapshot:
+        snapshot = self._compile(pack, nlu, warm=warm, source=source, fingerprint=fingerprint)
+        self._ensure_tenants(snapshot)
+        if self._keeps_snapshots:
+            self._remember(snapshot)
+        self._install(snapshot)
+        return snapshot
+
+    def _compile(
+        self,
+        pack: ScriptPack,
+        nlu: NLUIndex,
+        warm: bool = True,
+        source: Optional[str] = None,
+        fingerprint: Optional[str] = None,
+    ) -> snapshots.Snapshot:
+        # Chỉ mục mới được dựng và warmup ở bên cạnh; request đang chạy vẫn dùng
+        # snapshot cũ cho tới khi hoán đổi con trỏ. Hook chưa đăng ký là lỗi nạp.
+        try:
+            hook_table = self.executor.hooks.compile(pack)
+        except HookError as exc:
+            raise loader.ScriptLoaderError(str(exc)) from exc
+        if self.state not in {"ready", "error"}:
+            self.state = "warming"
+        if warm:
+            self.warmup(nlu)
+        flow_table = FlowTable(pack)
+        button_table = buttons.compile_buttons(pack, resolve=lambda label: self._resolve_label(nlu, label))
+        slot_extractor = SlotExtractor(pack)
+        step_conditions = compile_step_conditions(pack)
+        executor = Executor(self.context, hooks=self.executor.hooks)
+        executor.install(pack, button_table, hook_table, slot_extractor, step_conditions, flow_table)
+        return snapshots.Snapshot(
+            version=self.snapshots.next_version(),
+            pack=pack,
+            nlu=nlu,
+            routes=registry.Routes(pack),
+            intents=flow_table.intents,
+            buttons=button_table,
+            hooks=hook_table,
+            slot_extractor=slot_extractor,
+            step_conditions=step_conditions,
+            flows=flow_table,
+            executor=executor,
+            fingerprint=fingerprint or tenants.nlu_fingerprint(pack),
+            source=source,
+        )
+
+    def _install(self, snapshot: snapshots.Snapshot) -> None:
+        # Mọi bảng đã biên dịch sẵn trong snapshot: đổi phiên bản chỉ là gán con trỏ.
+        # Lượt xử lý chỉ đọc ``self.snapshot``; các thuộc tính còn lại để tra cứu/thống kê.
+        self.script_pack = snapshot.pack
+        self._intents = snapshot.intents
+        self.nlu = snapshot.nlu
+        self.routes = snapshot.routes
+        self.executor = snapshot.executor
+        self.overridden = snapshot.overridden
+        self.snapshot = snapshot
+        if self.state != "error" and not self._starting:
+            self.state = "ready"
+        if self.split is not None:
+            self._sync_variants()
+        if self.tenant_configs:
+            # Lớp phủ của tenant đã biên dịch cùng snapshot gốc (``_ensure_tenants``)
+            self._install_tenants(snapshot)
+
+    def _remember(self, snapshot: snapshots.Snapshot) -> None:
+        pinned = set(self.split.weights) if self.split is not None else set()
+        if self.snapshot is not None:
+            pinned.add(self.snapshot.version)
+        self.snapshots.add(snapshot, pinned)
+
+    # Versions ----------------------------------------------------------
+    def versions(self) -> Dict[str, Any]:
+        """Các phiên bản đang giữ kèm tỉ lệ fallback/độ trễ, phiên bản chạy và tỉ lệ chia."""
+        return {
+            "active": self.snapshot.version if self.snapshot else None,
+            "split": dict(self.split.weights) if self.split else None,
+            "versions": [snapshot.describe() for snapshot in self.snapshots],
+        }
+
+    def activate(self, version: str) -> Dict[str, Any]:
+        """Chuyển phiên bản đang chạy (rollback hoặc lên bản mới) mà không dựng lại gì."""
+        snapshot = self._version(version)
+        self._ensure_tenants(snapshot)
+        self._install(snapshot)
+        return self.versions()
+
+    def set_split(self, weights: Optional[Mapping[str, float]]) -> Dict[str, Any]:
+        """Chia phiên theo trọng số giữa các phiên bản; rỗng thì mọi phiên dùng bản đang chạy."""
+        if not weights:
+            self.split = None
+            self._variants = {}
+            return self.versions()
+        for version in weights:
+            self._version(version)
+        try:
+            self.split = snapshots.TrafficSplit(weights)
+        except ValueError as exc:
+            raise ServiceError(400, str(exc)) from exc
+        self._sync_variants()
+        return self.versions()
+
+    def _version(self, version: str) -> snapshots.Snapshot:
+        snapshot = self.snapshots.get(version)
+        if snapshot is None:
+            raise ServiceError(404, f"Không có phiên bản: {version}")
+        return snapshot
+
+    def _sync_variants(self) -> None:
+        # Phiên bản không phải bản đang chạy được phục vụ bởi service biến thể dùng chung
+        # context/log/hook với service gốc, nên phiên vẫn liền mạch khi đổi tỉ lệ chia.
+        active = self.snapshot.version if self.snapshot else None
+        variants: Dict[str, ChatBrainService] = {}
+        for version in self.split.weights if self.split else ():
+            if version == active:
+                continue
+            child = self._variants.get(version)
+            if child is None:
+                child = ChatBrainService(context=self.context, repo=self.repo, hooks=self.executor.hooks)
+                child.shared_root = None
+                child._keeps_snapshots = False
+            child.variables = self.variables
+            child._install(self._version(version))
+            variants[version] = child
+        self._variants = variants
+
+    # Tenants -----------------------------------------------------------
+    def load_tenants(self, path: str) -> Dict[str, "ChatBrainService"]:
+        """Nạp ``tenants.yaml`` và biên dịch lớp phủ của từng tenant trên pack đang chạy."""
+        configs = tenants.load_tenants(path)
+        # Giữ service con (và phiên đang dở của nó) qua các lần nạp lại
+        children = {config.id: self.tenants.get(config.id) or self._new_tenant(config.id) for config in configs}
+        base = self.snapshot or self._empty
+        try:
+            # Biên dịch hết trước khi đổi bất cứ gì: lỗi ở một tenant không để lại nửa vời
+            overlays = self._compile_tenants(base, configs, children)
+        except Exception:
+            for tenant_id, child in children.items():
+                if tenant_id not in self.tenants:
+                    child.context.close()
+            raise
+        # Cấu hình tenant đổi: lớp phủ đã biên dịch cho các phiên bản khác hết hiệu lực
+        for snapshot in self.snapshots:
+            snapshot.tenants = {}
+        base.tenants = overlays
+        self.tenant_configs = configs
+        self.tenants = children
+        self.pages = {page: config.id for config in configs for page in config.pages}
+        self._install_tenants(base)
+        return self.tenants
+
+    def _ensure_tenants(self, snapshot: snapshots.Snapshot) -> None:
+        # Mỗi snapshot gốc biên dịch lớp phủ tenant một lần, trước khi được hoán đổi vào
+        if self.tenant_configs and not snapshot.tenants:
+            snapshot.tenants = self._compile_tenants(snapshot, self.tenant_configs, self.tenants)
+
+    def _compile_tenants(
+        self,
+        base: snapshots.Snapshot,
+        configs: List[tenants.TenantConfig],
+        children: Mapping[str, "ChatBrainService"],
+    ) -> Dict[str, snapshots.Snapshot]:
+        # Chỉ mục theo dấu vân tay nội dung NLU: tenant chỉ đổi lời thoại dùng luôn
+        # chỉ mục của pack gốc, tenant có synonym riêng mới dựng chỉ mục của mình.
+        indexes = {base.fingerprint: base.nlu}
+        compiled: Dict[str, snapshots.Snapshot] = {}
+        for config in configs:
+            override_intents: List[Intent] = []
+            override_entities: Dict[str, Any] = {}
+            if config.overrides is not None:
+                override_intents, override_entities = loader.load_module(config.overrides)
+            pack, overridden = tenants.overlay(base.pack, override_intents, override_entities, config.fallback)
+            fingerprint = tenants.nlu_fingerprint(pack)
+            nlu = indexes.get(fingerprint)
+            warm = nlu is None
+            if nlu is None:
+                nlu = self._new_index()
+                nlu.build(pack)
+                indexes[fingerprint] = nlu
+            snapshot = children[config.id]._compile(pack, nlu, warm=warm, source=base.source, fingerprint=fingerprint)
+            snapshot.overridden = overridden
+            compiled[config.id] = snapshot
+        return compiled
+
+    def _install_tenants(self, base: snapshots.Snapshot) -> None:
+        for config in self.tenant_configs:
+            child = self.tenants[config.id]
+            child.variables = dict(config.variables)
+            child._install(base.tenants[config.id])
+            child.context.start_sweeper()
+
+    def _new_tenant(self, tenant_id: str) -> "ChatBrainService":
+        child = ChatBrainService(repo=self.repo, hooks=self.executor.hooks, tenant_id=tenant_id)
+        child.shared_root = None  # service gốc theo dõi generation và dựng lại tenant
+        # Nhật ký của tenant nằm trong ô nhật ký mà worker này đã nhận
+        root = self.context.journal
+        journal_dir = str(root.directory) if root is not None else os.getenv("CHATBRAIN_JOURNAL_DIR")
+        if journal_dir:
+            child.context.attach_journal(journal.Journal(os.path.join(journal_dir, tenant_id)))
+        return child
+
+    def tenant(self, tenant_id: Optional[str] = None, page_id: Optional[str] = None) -> "ChatBrainService":
+        """Service của tenant theo id (header X-Tenant) hoặc page id; không chỉ định thì là pack gốc."""
+        if not tenant_id and page_id:
+            tenant_id = self.pages.get(page_id)
+        if not tenant_id:
+            return self
+        child = self.tenants.get(tenant_id)
+        if child is None:
+            raise ServiceError(404, f"Không có tenant: {tenant_id}")
+        return child
+
+    def tenant_stats(self) -> Dict[str, Any]:
+        """Số intent ghi đè, bộ nhớ (chỉ mục riêng + phiên) và độ trễ p50/p95 theo tenant."""
+        result = {"default": self._usage(shared_index=False)}
+        for tenant_id, child in self.tenants.items():
+            result[tenant_id] = child._usage(shared_index=child.nlu is self.nlu)
+        return result
+
+    def _usage(self, shared_index: bool) -> Dict[str, Any]:
+        sessions = self.context.stats()
+        return {
+            "intents": len(self.script_pack.intents),
+            "overridden": len(self.overridden),
+            "shared_index": shared_index,
+            "index_bytes": 0 if shared_index else self.nlu.approx_bytes(),
+            "sessions": sessions["sessions"],
+            "session_bytes": sessions["approx_bytes"],
+            **self.usage.summary(),
+        }
+
+    def _lint_gate(self, pack: ScriptPack, nlu: NLUIndex) -> None:
+        """Từ chối pack có lỗi lint (ảnh thiếu, url hỏng...) trước khi hoán đổi."""
+        issues = lint.lint_pack(pack, resolve=lambda label: self._resolve_label(nlu, label))
+        errors = [issue for issue in issues if issue.level == lint.ERROR]
+        if errors:
+            details = "; ".join(issue.format() for issue in errors[:5])
+            raise loader.ScriptLoaderError(f"Kịch bản có {len(errors)} lỗi lint: {details}")
+
+    def _resolve_label(self, nlu: NLUIndex, label: str) -> Optional[str]:
+        """Intent đích của một nhãn nút, xếp hạng một lần lúc nạp kịch bản."""
+        chosen = self.policy.choose(nlu.rank(label), None)
+        if self.policy.is_below_threshold(chosen):
+            return None
+        return chosen.intent_id
+
+    def _refresh_shared(self) -> None:
+        now = time.monotonic()
+        if now - self._shared_checked_at < 1.0:
+            return
+        self._shared_checked_at = now
+        generation = shared.current_generation(self.shared_root)
+        if generation and generation != self._shared_generation:
+            self.load_shared(generation)
+
+    # Message handling --------------------------------------------------
+    def handle_message(self, session_id: str, message: str, prefetch: bool = False) -> MessageResponse:
+        """Xử lý một lượt; ``prefetch`` thêm ``debug["next"]`` là bước mà nút "Đã xong" sẽ hiện."""
+        if not message:
+            raise ServiceError(400, "Tin nhắn không hợp lệ")
+        if self.shared_root:
+            self._refresh_shared()
+        if self.split is not None:
+            variant = self._variants.get(self.split.choose(session_id))
+            if variant is not None:
+                return variant.handle_message(session_id, message, prefetch)
+        started = time.perf_counter()
+        # Cả lượt đọc từ một snapshot: nạp lại/rollback giữa chừng không trộn hai phiên bản
+        snapshot = self.snapshot or self._empty
+        response: Optional[MessageResponse] = None
+        try:
+            response = self._handle(session_id, message, snapshot)
+            if prefetch:
+                self._attach_next(session_id, response, snapshot)
+            return response
+        finally:
+            elapsed = time.perf_counter() - started
+            fallback = response is not None and bool(response.debug.get("fallback"))
+            self.usage.record(elapsed, fallback)
+            snapshot.usage.record(elapsed, fallback)
+
+    def _handle(self, session_id: str, message: str, snapshot: snapshots.Snapshot) -> MessageResponse:
+        executor = snapshot.executor
+        normalized = message.strip()
+        pending_resume = self.context.pending_resume(session_id)
+        if pending_resume and normalized not in {"Quay lại", "Không"}:
+            reply = f"Anh/chị đang tạm dừng **{pending_resume}**. Vui lòng chọn 'Quay lại' hoặc 'Không' giúp em nhé."
+            response = self._build_response(session_id, reply, StepUI(), [], None)
+            self._log(session_id, normalized, response)
+            return response
+        version_prompt = self.context.version_prompt(session_id)
+        if version_prompt and normalized not in {"Tiếp tục", "Khởi động lại"}:
+            reply = "Nội dung đã cập nhật, anh/chị hãy chọn 'Tiếp tục' hoặc 'Khởi động lại' giúp em nhé."
+            response = self._build_response(session_id, reply, StepUI(), [], None)
+            self._log(session_id, normalized, response)
+            return response
+
+        # Nút của bước đang chạy: một lần tra dict, không cần xếp hạng. Khi đang chờ
+        # xác nhận quay lại / cập nhật phiên bản thì nhãn thuộc về lời nhắc đó.
+        action = None
+        if not pending_resume and not version_prompt:
+            action = executor.step_button(session_id, normalized)
+        if action is not None:
+            return self._handle_step_button(session_id, normalized, action, snapshot)
+
+        # Bước đang hỏi slot: trích giá trị ngay từ câu trả lời, không xếp hạng
+        if not pending_resume and not version_prompt:
+            result = executor.answer_slot(session_id, normalized)
+            if result is not None:
+                response = self._build_response(
+                    session_id, result["reply"], result.get("ui", StepUI()), [], None, result.get("step")
+                )
+                self._log(session_id, normalized, response)
+                return response
+
+        if normalized in BUTTON_LABELS:
+            result = executor.handle_button(session_id, normalized)
+            response = self._build_response(
+                session_id, result["reply"], result.get("ui", StepUI()), [], None, result.get("step")
+            )
+            self._log(session_id, normalized, response)
+            return response
+
+        active = self.context.peek(session_id)
+        top_k: List[Candidate] = []
+        chosen = None
+        alias = snapshot.routes.alias(normalized)
+        if alias is not None:
+            # Bí danh toàn cục của registry: khớp chính xác, không cần xếp hạng
+            intent = snapshot.intents.get(alias)
+            chosen = self._direct_candidate(intent) if intent else None
+        else:
+            # Chấm điểm một lần cho cả lượt: top-k trong domain và toàn cục cùng lấy từ đây
+            scores = snapshot.nlu.score_row(normalized)
+            if active is not None:
+                # Đang trong quy trình: thử các intent cùng domain trước, chỉ xét toàn
+                # bộ khi không intent nào trong domain vượt ngưỡng.
+                top_k = snapshot.nlu.candidates(scores, domain=active.domain)
+                chosen = self.policy.choose(top_k, active)
+            if self.policy.is_below_threshold(chosen):
+                top_k = snapshot.nlu.candidates(scores)
+                chosen = self.policy.choose(top_k, active)
+        if self.policy.is_below_threshold(chosen):
+            reply = snapshot.pack.fallback or self.policy.fallback_ask()
+            response = self._build_response(session_id, reply, StepUI(), top_k, None)
+            response.debug["fallback"] = True
+            self._log(session_id, normalized, response)
+            return response
+
+        # Slot nhắc tới trong câu (entity có danh sách giá trị): một lượt quét automaton
+        found = executor.slot_extractor.extract(normalized)
+        target = snapshot.routes.redirect(chosen.intent_id, {**executor.slots(session_id), **found})
+        intent = snapshot.intents.get(target)
+        if intent is None:
+            raise ServiceError(500, "Intent không tồn tại")
+        if target != chosen.intent_id:
+            chosen = self._direct_candidate(intent, score=chosen.score)
+        interruption = self.policy.should_interrupt(chosen, active)
+        result = executor.execute_intent(session_id, intent, interruption, slots=found)
+        response = self._build_response(
+            session_id, result["reply"], result.get("ui", StepUI()), top_k, chosen, result.get("step")
+        )
+        self._log(session_id, normalized, response)
+        return response
+
+    # Helpers -----------------------------------------------------------
+    def _attach_next(self, session_id: str, response: MessageResponse, snapshot: snapshots.Snapshot) -> None:
+        # Connector dựng sẵn payload của bước kế tiếp và gửi ngay khi lõi xác nhận bước
+        upcoming = snapshot.executor.peek_next(session_id)
+        if upcoming is None:
+            return
+        reply = str(upcoming["reply"])
+        if self.variables:
+            reply = tenants.render(reply, self.variables)
+        response.debug["next"] = {
+            "labels": upcoming["labels"],
+            "reply": reply,
+            "ui": self._normalize_ui(upcoming["ui"]).model_dump(),
+            "step": upcoming["step"],
+        }
+
+    def _direct_candidate(self, intent: Intent, score: float = 1.0) -> Candidate:
+        """Ứng viên cho intent được chọn không qua xếp hạng (nút, bí danh, chuyển hướng)."""
+        return Candidate(
+            intent_id=intent.id,
+            file=intent.source_file,
+            score=score,
+            can_interrupt=intent.can_interrupt,
+            domain=intent.domain,
+        )
+
+    def _handle_step_button(
+        self, session_id: str, message: str, action: buttons.ButtonAction, snapshot: snapshots.Snapshot
+    ) -> MessageResponse:
+        chosen = None
+        if action.kind == buttons.INTENT:
+            intent = snapshot.intents.get(action.target)
+            if intent is None:
+                raise ServiceError(500, "Intent không tồn tại")
+            chosen = self._direct_candidate(intent)
+            interruption = self.policy.should_interrupt(chosen, self.context.peek(session_id))
+            result = snapshot.executor.execute_intent(session_id, intent, interruption)
+        else:
+            result = snapshot.executor.handle_step_action(session_id, action)
+        response = self._build_response(
+            session_id, result["reply"], result.get("ui", StepUI()), [], chosen, result.get("step")
+        )
+        self._log(session_id, message, response)
+        return response
+
+    def _build_response(
+        self,
+        session_id: str,
+        reply: str,
+        ui: Any,
+        top_k: List[Candidate],
+        chosen: Optional[Candidate],
+        step: Optional[str] = None,
+    ) -> MessageResponse:
+        ui_model = self._normalize_ui(ui)
+        if self.variables:
+            reply = tenants.render(reply, self.variables)
+        debug_top_k = [c.model_dump() for c in top_k]
+        debug_chosen = chosen.model_dump() if chosen else None
+        stack_depth = len(self.context.stack(session_id))
+        response = MessageResponse(
+            reply=reply,
+            ui=ui_model,
+            debug={
+                "top_k": debug_top_k,
+                "chosen": debug_chosen,
+                "stack_depth": stack_depth,
+                "step": step,
+            },
+        )
+        return response
+
+    def _normalize_ui(self, ui: Any) -> UIResponse:
+        if isinstance(ui, UIResponse):
+            return ui
+        if isinstance(ui, StepUI):
+            data = ui.model_dump()
+        elif isinstance(ui, dict):
+            data = dict(ui)
+        else:
+            data = {}
+        try:
+            return UIResponse.model_validate(data)
+        except ValidationError:
+            buttons_raw = data.get("buttons", []) if isinstance(data, dict) else []
+            media_raw = data.get("media", []) if isinstance(data, dict) else []
+            buttons: List[str] = []
+            if isinstance(buttons_raw, list):
+                for btn in buttons_raw:
+                    buttons.append(btn if isinstance(btn, str) else str(btn))
+            elif buttons_raw:
+                buttons = [str(buttons_raw)]
+            media: List[MediaResponse] = []
+            if isinstance(media_raw, list):
+                for item in media_raw:
+                    if isinstance(item, dict) and "url" in item:
+                        media.append(
+                            MediaResponse(
+                                type=str(item.get("type", "image") or "image"),
+                                url=str(item["url"]),
+                                alt=item.get("alt"),
+                            )
+                        )
+            return UIResponse(buttons=buttons, media=media)
+
+    def _log(self, session_id: str, message: str, response: MessageResponse) -> None:
+        # Chỉ đưa vào hàng đợi; che PII, lấy mẫu, ghi SQLite chạy ở luồng ghi log
+        if not self.repo.enabled:
+            return
+        debug = response.debug
+        self.repo.submit(
+            LogEntry(
+                created_at=self.repo.clock(),
+                session_id=session_id,
+                message=message,
+                reply=response.reply,
+                top_k=debug.get("top_k", []),
+                chosen=debug.get("chosen"),
+                stack_depth=debug.get("stack_depth", 0),
+                reply_step=debug.get("step"),
+                is_fallback=bool(debug.get("fallback")),
+            )
+        )
+
+    def rank_batch(self, texts: List[str], top_k: int = 3) -> Dict[str, Any]:
+        """Xếp hạng hàng loạt (không qua policy/executor), trả top-k dạng mảng."""
+        ranking = self.nlu.rank_many(texts, top_k=top_k)
+        ids = ranking.intent_ids
+        return {
+            "top_k": int(ranking.indices.shape[1]),
+            "intents": [[ids[idx] for idx in row] for row in ranking.indices.tolist()],
+            "scores": ranking.scores.round(6).tolist(),
+        }
+
+    # Misc --------------------------------------------------------------
+    def list_intents(self, domain: Optional[str] = None) -> List[Dict[str, Any]]:
+        intents = self.script_pack.intents
+        if domain:
+            intents = [i for i in intents if i.domain == domain]
+        return [i.model_dump() for i in intents]
+
+    def context_state(self, session_id: str) -> ContextState:
+        return self.context.state(session_id)
+
+    def stats(self, days: int = 7, limit: int = 10) -> Dict[str, Any]:
+        """Thống kê hội thoại từ bảng rollup của log SQLite."""
+        return self.repo.stats(days=days, limit=limit)
+
+    def session_stats(self) -> Dict[str, Any]:
+        return self.context.stats()
+
+    def clear_context(self, session_id: str) -> None:
+        self.context.clear(session_id)
+
+    def hook_stats(self) -> Dict[str, Any]:
+        """Số lần gọi, lỗi, quá hạn và độ trễ theo tên hook."""
+        return self.executor.hooks.stats()
+
+    def set_logging(self, enabled: bool) -> None:
+        self.repo.set_enabled(enabled)
+
+
+service = ChatBrainService()
@@ -0,0 +1,200 @@
+"""Xuất ``InteractionLog`` sang định dạng cột để phân tích, theo từng lô.
+
+Đọc bằng ``sqlite3`` theo khoá ``id`` tăng dần (``WHERE id > ? LIMIT n``), nên bộ
+nhớ chỉ giữ một lô dù bảng lớn bao nhiêu. Có ``pyarrow`` thì ghi một file Parquet
+(mỗi lô một row group); không có thì ghi các file CSV nén gzip, mỗi file tối đa
+``chunk_rows`` dòng. Log chia phân vùng (``LOG_PARTITION``) được đọc lần lượt từng
+file giao với khoảng ngày; phân vùng đã nén ``.db.gz`` được giải nén ra file tạm.
+"""
+from __future__ import annotations
+
+import csv
+import gzip
+import shutil
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from ..core.lazy import optional_module
+from .partitions import list_partitions
+
+COLUMNS = (
+    "id",
+    "created_at",
+    "session_id",
+    "user_message",
+    "bot_reply",
+    "reply_step",
+    "chosen_intent",
+    "score",
+    "is_fallback",
+    "stack_depth",
+    "top_k",
+)
+FORMATS = ("parquet", "csv")
+
+
+def _parse_day(day: Optional[str]) -> Optional[float]:
+    if not day:
+        return None
+    return time.mktime(time.strptime(day, "%Y-%m-%d"))
+
+
+def iter_batches(
+    db_path: str,
+    batch_size: int = 50_000,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+) -> Iterator[List[Tuple[Any, ...]]]:
+    """Các lô dòng log (theo ``COLUMNS``) trong khoảng ngày ``[since, until)``."""
+    conditions = ["id > ?"]
+    params: List[Any] = []
+    start, end = _parse_day(since), _parse_day(until)
+    if start is not None:
+        conditions.append("created_at >= ?")
+        params.append(start)
+    if end is not None:
+        conditions.append("created_at < ?")
+        params.append(end)
+    query = (
+        f"SELECT {', '.join(COLUMNS)} FROM interactionlog WHERE {' AND '.join(conditions)} ORDER BY id LIMIT ?"
+    )
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        last_id = 0
+        while True:
+            rows = conn.execute(query, (last_id, *params, batch_size)).fetchall()
+            if not rows:
+                return
+            yield rows
+            last_id = rows[-1][0]
+    finally:
+        conn.close()
+
+
+def iter_partitioned_batches(
+    db_path: str,
+    batch_size: int = 50_000,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+) -> Iterator[List[Tuple[Any, ...]]]:
+    """Như ``iter_batches`` nhưng đi qua file gốc và mọi phân vùng giao với ``[since, until)``.
+
+    ``id`` chỉ duy nhất trong một file; khoá ổn định giữa các phân vùng là (``created_at``, ``id``).
+    """
+    start, end = _parse_day(since), _parse_day(until)
+    sources = [Path(db_path)] if Path(db_path).exists() else []
+    for part in list_partitions(db_path):
+        if (start is None or part.end > start) and (end is None or part.start < end):
+            sources.append(part.path)
+    with tempfile.TemporaryDirectory(prefix="chatbrain-export-") as scratch:
+        for source in sources:
+            if source.suffix == ".gz":
+                plain = Path(scratch) / source.stem
+                with gzip.open(source, "rb") as src, plain.open("wb") as dst:
+                    shutil.copyfileobj(src, dst, 1 << 20)
+                yield from iter_batches(str(plain), batch_size, since, until)
+                plain.unlink()
+            else:
+                yield from iter_batches(str(source), batch_size, since, until)
+
+
+def _arrow_schema(pa: Any) -> Any:
+    return pa.schema(
+        [
+            ("id", pa.int64()),
+            ("created_at", pa.timestamp("ms")),
+            ("session_id", pa.string()),
+            ("user_message", pa.string()),
+            ("bot_reply", pa.string()),
+            ("reply_step", pa.string()),
+            ("chosen_intent", pa.string()),
+            ("score", pa.float64()),
+            ("is_fallback", pa.bool_()),
+            ("stack_depth", pa.int32()),
+            ("top_k", pa.string()),
+        ]
+    )
+
+
+def write_parquet(batches: Iterator[Sequence[Tuple[Any, ...]]], path: Path) -> int:
+    pa = optional_module("pyarrow")
+    pq = optional_module("pyarrow.parquet")
+    if pa is None or pq is None:
+        raise RuntimeError("Cần cài pyarrow để xuất Parquet")
+    schema = _arrow_schema(pa)
+    total = 0
+    with pq.ParquetWriter(str(path), schema, compression="zstd") as writer:
+        for rows in batches:
+            columns = list(zip(*rows))
+            created = [None if value is None else int(value * 1000) for value in columns[1]]
+            arrays = [pa.array(columns[0], pa.int64()), pa.array(created, pa.int64()).cast(pa.timestamp("ms"))]
+            arrays += [pa.array(values, field.type) for values, field in zip(columns[2:], list(schema)[2:])]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            total += len(rows)
+    return total
+
+
+def write_csv_chunks(
+    batches: Iterator[Sequence[Tuple[Any, ...]]],
+    out_dir: Path,
+    prefix: str = "interactions",
+    chunk_rows: int = 500_000,
+) -> Tuple[int, List[Path]]:
+    total = 0
+    files: List[Path] = []
+    handle = writer = None
+    in_chunk = 0
+    try:
+        for rows in batches:
+            for row in rows:
+                if writer is None or in_chunk >= chunk_rows:
+                    if handle is not None:
+                        handle.close()
+                    path = out_dir / f"{prefix}-{len(files) + 1:05d}.csv.gz"
+                    files.append(path)
+                    handle = gzip.open(path, "wt", encoding="utf-8", newline="")
+                    writer = csv.writer(handle)
+                    writer.writerow(COLUMNS)
+                    in_chunk = 0
+                writer.writerow(row)
+                in_chunk += 1
+            total += len(rows)
+    finally:
+        if handle is not None:
+            handle.close()
+    return total, files
+
+
+def export_logs(
+    db_path: str,
+    out_dir: str,
+    fmt: Optional[str] = None,
+    batch_size: int = 50_000,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    chunk_rows: int = 500_000,
+) -> Dict[str, Any]:
+    """Xuất log; ``fmt=None`` chọn Parquet nếu có pyarrow, ngược lại CSV gzip."""
+    if fmt is None:
+        fmt = "parquet" if optional_module("pyarrow.parquet") is not None else "csv"
+    if fmt not in FORMATS:
+        raise ValueError(f"Định dạng không hỗ trợ: {fmt}")
+    target = Path(out_dir)
+    target.mkdir(parents=True, exist_ok=True)
+    batches = iter_partitioned_batches(db_path, batch_size, since, until)
+    started = time.perf_counter()
+    if fmt == "parquet":
+        path = target / "interactions.parquet"
+        rows = write_parquet(batches, path)
+        files = [path]
+    else:
+        rows, files = write_csv_chunks(batches, target, chunk_rows=chunk_rows)
+    return {
+        "format": fmt,
+        "rows": rows,
+        "files": [str(path) for path in files],
+        "seconds": round(time.perf_counter() - started, 3),
+    }
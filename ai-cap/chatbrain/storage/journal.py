@@ -0,0 +1,267 @@
+"""Nhật ký ghi nối các thay đổi context, kèm snapshot định kỳ để khôi phục sau sự cố.
+
+Thư mục nhật ký gồm::
+
+    segment-000007.log      # mỗi dòng một bản ghi JSON [ts, op, session_id, ...]
+    snapshot-000007.jsonl   # trạng thái mọi phiên ngay trước khi segment 7 bắt đầu
+
+``append`` chỉ đưa dòng vào bộ đệm; luồng ghi nền gom các dòng, ghi và ``fsync``
+mỗi ``JOURNAL_FSYNC_MS`` (group commit), nên một sự cố mất tối đa ngần ấy mili giây.
+Sau ``JOURNAL_SNAPSHOT_RECORDS`` bản ghi, luồng ghi xin nguồn trạng thái
+(``ContextManager``) một bản sao đồng thời chuyển sang segment mới, ghi snapshot
+(tmp + rename) rồi xoá segment/snapshot cũ. Khôi phục = snapshot mới nhất + phát lại
+các segment từ số đó trở đi; dòng cuối bị cắt dở do sự cố được bỏ qua.
+
+Mỗi thư mục chỉ một tiến trình ghi: ``Journal`` giữ khoá ``flock`` độc quyền trên file
+``LOCK`` tới khi ``close``. Các worker prefork dùng chung ``CHATBRAIN_JOURNAL_DIR`` nhận
+thư mục qua ``claim``: thư mục gốc cho worker đầu tiên, ``worker-1``, ``worker-2``... cho
+các worker sau, nên worker khởi động lại nhận đúng ô trống và khôi phục phiên của ô đó.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+import threading
+from itertools import islice
+from pathlib import Path
+from typing import Any, Callable, Iterator, List, Optional, Sequence
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows: không có flock, không khoá thư mục
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+_SEGMENT = re.compile(r"^segment-(\d+)\.log$")
+_SNAPSHOT = re.compile(r"^snapshot-(\d+)\.jsonl$")
+_ROTATE = object()
+
+# Nguồn snapshot nhận hàm ``rotate`` và phải gọi nó trong cùng khoá với lúc sao chép
+# trạng thái, để ranh giới snapshot/segment khớp đúng thứ tự thay đổi.
+SnapshotSource = Callable[[Callable[[], None]], Sequence[Sequence[Any]]]
+
+
+class JournalLocked(RuntimeError):
+    """Thư mục nhật ký đang được một tiến trình (hoặc ``Journal``) khác giữ."""
+
+
+def _lock_directory(directory: Path):
+    handle = (directory / "LOCK").open("a")
+    if fcntl is None:
+        return handle
+    try:
+        fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        handle.close()
+        raise JournalLocked(f"Thư mục nhật ký đang được dùng: {directory}") from None
+    return handle
+
+
+def _dumps(record: Sequence[Any]) -> str:
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+
+
+def _read_snapshot(path: Path, chunk: int = 20_000) -> Iterator[List[Any]]:
+    # Snapshot được ghi trọn (tmp + rename) nên đọc theo khối: một ``json.loads`` cho
+    # ``chunk`` dòng nhanh hơn nhiều so với từng dòng một.
+    with path.open("r", encoding="utf-8") as handle:
+        while True:
+            lines = [line for line in islice(handle, chunk) if line.strip()]
+            if not lines:
+                return
+            yield from json.loads("[" + ",".join(lines) + "]")
+
+
+def _read_lines(path: Path) -> Iterator[List[Any]]:
+    with path.open("r", encoding="utf-8") as handle:
+        for number, line in enumerate(handle, 1):
+            if not line.endswith("\n"):
+                logger.warning("Bỏ dòng ghi dở ở cuối %s (dòng %d)", path.name, number)
+                return
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning("Bỏ dòng hỏng trong %s (dòng %d)", path.name, number)
+
+
+class Journal:
+    def __init__(
+        self,
+        directory: str,
+        fsync_ms: Optional[float] = None,
+        snapshot_records: Optional[int] = None,
+    ) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # Hai tiến trình ghi cùng segment và xoá segment của nhau thì không khôi phục được
+        self._dir_lock = _lock_directory(self.directory)
+        if fsync_ms is None:
+            fsync_ms = float(os.getenv("JOURNAL_FSYNC_MS", "50"))
+        self.fsync_interval = max(fsync_ms, 1.0) / 1000
+        if snapshot_records is None:
+            snapshot_records = int(os.getenv("JOURNAL_SNAPSHOT_RECORDS", "100000"))
+        self.snapshot_records = snapshot_records
+        self._buffer: List[Any] = []
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._since_snapshot = 0
+        self._segment = max(self._numbers(_SEGMENT), default=0) + 1
+        self._file = None
+        self._source: Optional[SnapshotSource] = None
+        self._stop = threading.Event()
+        self._writer: Optional[threading.Thread] = None
+        self.records_written = 0
+
+    # Khôi phục ---------------------------------------------------------
+    def _numbers(self, pattern: "re.Pattern[str]") -> List[int]:
+        numbers = []
+        for path in self.directory.iterdir():
+            match = pattern.match(path.name)
+            if match:
+                numbers.append(int(match.group(1)))
+        return sorted(numbers)
+
+    def latest_snapshot(self) -> Optional[int]:
+        snapshots = self._numbers(_SNAPSHOT)
+        return snapshots[-1] if snapshots else None
+
+    def snapshot_rows(self) -> Iterator[List[Any]]:
+        """Các dòng của snapshot mới nhất (rỗng nếu chưa có)."""
+        latest = self.latest_snapshot()
+        if latest is None:
+            return iter(())
+        return _read_snapshot(self.directory / f"snapshot-{latest:06d}.jsonl")
+
+    def records(self) -> Iterator[List[Any]]:
+        """Các bản ghi cần phát lại sau snapshot mới nhất, theo thứ tự ghi."""
+        start = self.latest_snapshot() or 0
+        for number in self._numbers(_SEGMENT):
+            if number >= start and number < self._segment:
+                yield from _read_lines(self.directory / f"segment-{number:06d}.log")
+
+    # Ghi ---------------------------------------------------------------
+    def append(self, record: Sequence[Any]) -> None:
+        line = _dumps(record)
+        with self._lock:
+            self._buffer.append(line)
+            self._since_snapshot += 1
+
+    def start(self, source: Optional[SnapshotSource] = None) -> None:
+        self._source = source
+        if self._writer is not None and self._writer.is_alive():
+            return
+        self._stop.clear()
+        self._writer = threading.Thread(target=self._run, name="chatbrain-journal", daemon=True)
+        self._writer.start()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.fsync_interval):
+            try:
+                self.flush()
+                if self._source is not None and 0 < self.snapshot_records <= self._since_snapshot:
+                    self.snapshot()
+            except OSError:
+                logger.exception("Ghi nhật ký context lỗi")
+
+    def rotate(self) -> int:
+        """Chuyển các bản ghi tiếp theo sang segment mới; trả số segment mới."""
+        with self._lock:
+            self._segment += 1
+            self._buffer.append(_ROTATE)
+            self._since_snapshot = 0
+            return self._segment
+
+    def flush(self) -> None:
+        """Ghi bộ đệm ra đĩa và ``fsync`` (một lần cho cả nhóm bản ghi)."""
+        with self._io_lock:
+            with self._lock:
+                pending, self._buffer = self._buffer, []
+                segment = self._segment
+            if not pending:
+                return
+            # Số segment của file đang mở = segment hiện tại trừ số lần xoay còn trong bộ đệm
+            current = segment - sum(1 for item in pending if item is _ROTATE)
+            handle = self._open(current)
+            lines: List[str] = []
+            for item in pending:
+                if item is _ROTATE:
+                    self._write(handle, lines)
+                    lines = []
+                    self._close()
+                    current += 1
+                    handle = self._open(current)
+                else:
+                    lines.append(item)
+            self._write(handle, lines)
+
+    def _open(self, number: int):
+        if self._file is None or self._file[0] != number:
+            self._close()
+            path = self.directory / f"segment-{number:06d}.log"
+            self._file = (number, path.open("a", encoding="utf-8"))
+        return self._file[1]
+
+    def _write(self, handle, lines: List[str]) -> None:
+        if not lines:
+            return
+        handle.write("\n".join(lines) + "\n")
+        handle.flush()
+        os.fsync(handle.fileno())
+        self.records_written += len(lines)
+
+    def _close(self) -> None:
+        if self._file is not None:
+            self._file[1].close()
+            self._file = None
+
+    def snapshot(self) -> Optional[int]:
+        """Chụp trạng thái từ nguồn, ghi file snapshot rồi dọn segment cũ."""
+        if self._source is None:
+            return None
+        numbers: List[int] = []
+        rows = self._source(lambda: numbers.append(self.rotate()))
+        if not numbers:
+            raise RuntimeError("Nguồn snapshot phải gọi rotate()")
+        number = numbers[0]
+        path = self.directory / f"snapshot-{number:06d}.jsonl"
+        tmp = path.with_suffix(".tmp")
+        with tmp.open("w", encoding="utf-8") as handle:
+            for start in range(0, len(rows), 10_000):
+                handle.write("".join(_dumps(row) + "\n" for row in rows[start : start + 10_000]))
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(tmp, path)
+        self.flush()
+        for old in self._numbers(_SEGMENT):
+            if old < number:
+                (self.directory / f"segment-{old:06d}.log").unlink(missing_ok=True)
+        for old in self._numbers(_SNAPSHOT):
+            if old < number:
+                (self.directory / f"snapshot-{old:06d}.jsonl").unlink(missing_ok=True)
+        return number
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._writer is not None:
+            self._writer.join(timeout=5)
+            self._writer = None
+        self.flush()
+        with self._io_lock:
+            self._close()
+        if self._dir_lock is not None:
+            self._dir_lock.close()
+            self._dir_lock = None
+
+
+def claim(directory: str, **kwargs: Any) -> Journal:
+    """Nhật ký trong ô đầu tiên chưa bị giữ: ``directory``, rồi ``directory/worker-<n>``."""
+    index = 0
+    while True:
+        path = directory if index == 0 else os.path.join(directory, f"worker-{index}")
+        try:
+            return Journal(path, **kwargs)
+        except JournalLocked:
+            index += 1
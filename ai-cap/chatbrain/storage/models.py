@@ -0,0 +1,47 @@
+"""Bảng SQLModel cho log hội thoại; chỉ được import khi bật USE_SQLITE_LOG.
+
+``InteractionLog`` giữ từng lượt chat (có thời điểm và các cột tra cứu được đánh chỉ
+mục); ``InteractionRollup`` và ``MissedPhrase`` là bảng tổng hợp theo ngày, được cộng
+dồn ngay trong transaction ghi log nên ``/stats`` không phải quét bảng log.
+"""
+from __future__ import annotations
+
+import time
+from typing import Optional
+
+from sqlmodel import Field, SQLModel
+
+# Phiên bản schema, lưu trong ``PRAGMA user_version`` (xem ``repo.migrate``)
+SCHEMA_VERSION = 3
+# Khoá ``intent`` của dòng rollup cho các lượt fallback
+FALLBACK = ""
+# Khoá cho lượt không qua xếp hạng nhưng không phải fallback (bấm nút, trả lời slot)
+DIRECT = "#"
+
+
+class InteractionLog(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    created_at: Optional[float] = Field(default_factory=time.time, index=True)
+    session_id: str = Field(index=True)
+    user_message: str
+    bot_reply: str  # rỗng khi câu trả lời là nội dung bước (xem ``reply_step``)
+    reply_step: Optional[str] = None  # ``intent#step``
+    top_k: str
+    chosen: Optional[str]
+    chosen_intent: Optional[str] = Field(default=None, index=True)
+    score: Optional[float] = Field(default=None, index=True)
+    is_fallback: bool = False
+    stack_depth: int
+
+
+class InteractionRollup(SQLModel, table=True):
+    day: str = Field(primary_key=True)  # YYYY-MM-DD theo giờ máy chủ
+    intent: str = Field(primary_key=True)
+    messages: int = 0
+    score_sum: float = 0.0
+
+
+class MissedPhrase(SQLModel, table=True):
+    day: str = Field(primary_key=True)
+    phrase: str = Field(primary_key=True)  # câu fallback đã chuẩn hoá
+    count: int = 0
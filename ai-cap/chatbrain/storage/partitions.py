@@ -0,0 +1,241 @@
+"""Chia log SQLite theo ngày/tuần, dọn dẹp và nén các phân vùng đã đóng.
+
+Với ``LOG_PARTITION=day`` và ``SQLITE_PATH=logs/chatbrain_logs.db``::
+
+    logs/chatbrain_logs-2026-10-19.db      # phân vùng đang ghi
+    logs/chatbrain_logs-2026-10-18.db      # đã đóng, đã VACUUM
+    logs/chatbrain_logs-2026-10-01.db.gz   # quá LOG_COMPRESS_AFTER_DAYS: nén gzip
+    logs/chatbrain_logs-rollup.db          # rollup của các phân vùng đã nén
+
+``Maintenance`` chạy trong luồng nền và chỉ đụng tới phân vùng đã đóng, nên luồng
+ghi log không bao giờ phải chờ. Trước khi nén, rollup của phân vùng được gộp vào
+``*-rollup.db`` (ghi nhận trong bảng ``merged`` cùng transaction, làm lại an toàn)
+để ``/stats`` vẫn bao phủ các ngày cũ. Quá ``LOG_RETENTION_DAYS`` thì phân vùng bị xoá.
+"""
+from __future__ import annotations
+
+import datetime as dt
+import gzip
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+MODES = ("none", "day", "week")
+ROLLUP_DDL = (
+    "CREATE TABLE IF NOT EXISTS interactionrollup (day VARCHAR NOT NULL, intent VARCHAR NOT NULL,"
+    " messages INTEGER NOT NULL, score_sum FLOAT NOT NULL, PRIMARY KEY (day, intent))",
+    "CREATE TABLE IF NOT EXISTS missedphrase (day VARCHAR NOT NULL, phrase VARCHAR NOT NULL,"
+    " count INTEGER NOT NULL, PRIMARY KEY (day, phrase))",
+    "CREATE TABLE IF NOT EXISTS merged (partition VARCHAR PRIMARY KEY, merged_at FLOAT NOT NULL)",
+)
+
+
+@dataclass(frozen=True)
+class Partition:
+    path: Path
+    key: str
+    start: float
+    end: float
+
+    @property
+    def compressed(self) -> bool:
+        return self.path.suffix == ".gz"
+
+
+def period(timestamp: float, mode: str) -> Tuple[str, float, float]:
+    """Khoá, thời điểm bắt đầu và kết thúc (giờ máy chủ) của phân vùng chứa ``timestamp``."""
+    day = dt.date.fromtimestamp(timestamp)
+    if mode == "week":
+        start_day = day - dt.timedelta(days=day.weekday())
+        year, week, _ = day.isocalendar()
+        key, length = f"{year}-W{week:02d}", 7
+    elif mode == "day":
+        start_day, key, length = day, day.isoformat(), 1
+    else:
+        raise ValueError(f"Kiểu phân vùng không hỗ trợ: {mode}")
+    start = time.mktime(start_day.timetuple())
+    end = time.mktime((start_day + dt.timedelta(days=length)).timetuple())
+    return key, start, end
+
+
+def partition_path(base: str, key: str) -> Path:
+    path = Path(base)
+    return path.with_name(f"{path.stem}-{key}{path.suffix}")
+
+
+def rollup_path(base: str) -> Path:
+    return partition_path(base, "rollup")
+
+
+def list_partitions(base: str) -> List[Partition]:
+    """Các phân vùng (kể cả đã nén) của ``base``, cũ trước mới sau."""
+    path = Path(base)
+    pattern = re.compile(
+        rf"^{re.escape(path.stem)}-(\d{{4}}-\d{{2}}-\d{{2}}|\d{{4}}-W\d{{2}}){re.escape(path.suffix)}(\.gz)?$"
+    )
+    folder = path.parent if str(path.parent) else Path(".")
+    if not folder.exists():
+        return []
+    found = []
+    for item in folder.iterdir():
+        match = pattern.match(item.name)
+        if not match:
+            continue
+        key = match.group(1)
+        if "W" in key:
+            year, week = key.split("-W")
+            first = dt.date.fromisocalendar(int(year), int(week), 1)
+            _, start, end = period(time.mktime(first.timetuple()), "week")
+        else:
+            _, start, end = period(time.mktime(dt.date.fromisoformat(key).timetuple()), "day")
+        found.append(Partition(item, key, start, end))
+    return sorted(found, key=lambda p: (p.start, p.compressed))
+
+
+class Maintenance:
+    """Dọn phân vùng đã đóng: VACUUM, gộp rollup + nén gzip, xoá theo thời hạn lưu."""
+
+    def __init__(
+        self,
+        base: str,
+        retention_days: Optional[float] = None,
+        compress_after_days: Optional[float] = None,
+        interval: Optional[float] = None,
+    ) -> None:
+        self.base = base
+        if retention_days is None:
+            retention_days = float(os.getenv("LOG_RETENTION_DAYS", "0"))
+        if compress_after_days is None:
+            compress_after_days = float(os.getenv("LOG_COMPRESS_AFTER_DAYS", "7"))
+        self.retention_days = retention_days
+        self.compress_after_days = compress_after_days
+        self.interval = float(os.getenv("LOG_MAINTENANCE_SECONDS", "3600")) if interval is None else interval
+        self.active: Optional[Path] = None
+        self._compacted: Set[Path] = set()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="chatbrain-log-maintenance", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def notify(self, active: Path) -> None:
+        """Báo phân vùng đang ghi (gọi khi chuyển phân vùng) và đánh thức luồng nền."""
+        self.active = active
+        self._wake.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception:  # noqa: BLE001 - luồng nền không được chết vì một file hỏng
+                logger.exception("Bảo trì log lỗi")
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def run_once(self, now: Optional[float] = None) -> dict:
+        now = time.time() if now is None else now
+        report = {"compacted": 0, "compressed": 0, "deleted": 0}
+        with self._lock:
+            for part in list_partitions(self.base):
+                if part.path == self.active or part.end > now:
+                    continue
+                if self.retention_days > 0 and part.end <= now - self.retention_days * 86400:
+                    self._delete(part)
+                    report["deleted"] += 1
+                elif part.compressed:
+                    continue
+                elif self.compress_after_days > 0 and part.end <= now - self.compress_after_days * 86400:
+                    self._compress(part)
+                    report["compressed"] += 1
+                elif part.path not in self._compacted:
+                    self._compact(part.path)
+                    report["compacted"] += 1
+            if self.retention_days > 0:
+                self._prune_rollups(now - self.retention_days * 86400)
+        return report
+
+    def _compact(self, path: Path) -> None:
+        conn = sqlite3.connect(path)
+        try:
+            conn.execute("PRAGMA journal_mode=DELETE")  # gộp WAL vào file chính
+            conn.execute("VACUUM")
+            conn.execute("PRAGMA optimize")
+        finally:
+            conn.close()
+        self._compacted.add(path)
+
+    def _compress(self, part: Partition) -> None:
+        if part.path not in self._compacted:
+            self._compact(part.path)
+        self.merge_rollups(part)
+        target = part.path.with_name(part.path.name + ".gz")
+        tmp = target.with_name(target.name + ".tmp")
+        with part.path.open("rb") as src, gzip.open(tmp, "wb", compresslevel=6) as dst:
+            shutil.copyfileobj(src, dst, 1 << 20)
+        os.replace(tmp, target)
+        part.path.unlink()
+        self._compacted.discard(part.path)
+
+    def merge_rollups(self, part: Partition) -> None:
+        """Cộng rollup của ``part`` vào ``*-rollup.db`` đúng một lần."""
+        conn = sqlite3.connect(rollup_path(self.base))
+        try:
+            for ddl in ROLLUP_DDL:
+                conn.execute(ddl)
+            with conn:
+                if conn.execute("SELECT 1 FROM merged WHERE partition = ?", (part.key,)).fetchone():
+                    return
+                conn.execute("ATTACH DATABASE ? AS part", (str(part.path),))
+                conn.execute(
+                    "INSERT INTO interactionrollup SELECT day, intent, messages, score_sum FROM part.interactionrollup"
+                    " WHERE true ON CONFLICT(day, intent) DO UPDATE SET messages = messages + excluded.messages,"
+                    " score_sum = score_sum + excluded.score_sum"
+                )
+                conn.execute(
+                    "INSERT INTO missedphrase SELECT day, phrase, count FROM part.missedphrase"
+                    " WHERE true ON CONFLICT(day, phrase) DO UPDATE SET count = count + excluded.count"
+                )
+                conn.execute("INSERT INTO merged VALUES (?, ?)", (part.key, time.time()))
+            conn.execute("DETACH DATABASE part")
+        finally:
+            conn.close()
+
+    def _delete(self, part: Partition) -> None:
+        for suffix in ("", "-wal", "-shm"):
+            Path(str(part.path) + suffix).unlink(missing_ok=True)
+        self._compacted.discard(part.path)
+
+    def _prune_rollups(self, cutoff: float) -> None:
+        path = rollup_path(self.base)
+        if not path.exists():
+            return
+        day = dt.date.fromtimestamp(cutoff).isoformat()
+        conn = sqlite3.connect(path)
+        try:
+            with conn:
+                conn.execute("DELETE FROM interactionrollup WHERE day < ?", (day,))
+                conn.execute("DELETE FROM missedphrase WHERE day < ?", (day,))
+        finally:
+            conn.close()
@@ -0,0 +1,167 @@
+"""Tầng xử lý log trước khi ghi: che dữ liệu cá nhân, lấy mẫu, ghi theo lô ở luồng nền.
+
+Đường xử lý tin nhắn chỉ tạo một ``LogEntry`` và đẩy vào hàng đợi (``LogWriter.submit``,
+không chặn; hàng đợi đầy thì bỏ và đếm). Luồng ghi gom lô rồi gọi ``SQLiteRepo.write_batch``:
+ở đó câu người dùng được ``Scrubber`` che CCCD/CMND, số điện thoại, email; lượt tự tin
+được lấy mẫu theo phiên (``Sampler``) còn fallback và lượt điểm thấp luôn được giữ.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import queue
+import re
+import threading
+import zlib
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+# Đặt vào hàng đợi để luồng ghi dừng sau khi ghi hết các lượt đứng trước nó
+_STOP = object()
+
+# Thứ tự nhánh quan trọng: email trước (có thể chứa số), CCCD 12 số trước số điện thoại
+_PII = re.compile(
+    r"(?P<EMAIL>[\w.+-]+@[\w-]+(?:\.[\w-]+)+)"
+    r"|(?P<CCCD>(?<!\d)\d{12}(?!\d))"
+    r"|(?P<PHONE>(?<![\d+])(?:\+84|84|0)(?:[ .-]?\d){9,10}(?!\d))"
+    r"|(?P<CMND>(?<!\d)\d{9}(?!\d))"
+)
+
+
+class Scrubber:
+    """Thay CCCD/CMND, số điện thoại, email bằng nhãn ``[CCCD]``, ``[PHONE]``..."""
+
+    def __init__(self, enabled: Optional[bool] = None) -> None:
+        if enabled is None:
+            enabled = os.getenv("LOG_SCRUB", "true").lower() in {"1", "true", "yes"}
+        self.enabled = enabled
+
+    def __call__(self, text: str) -> str:
+        if not self.enabled or not text:
+            return text
+        return _PII.sub(lambda match: f"[{match.lastgroup}]", text)
+
+
+class Sampler:
+    """Quyết định có giữ dòng log chi tiết của một lượt không.
+
+    Fallback và lượt có điểm dưới ``LOG_SAMPLE_BELOW`` luôn được giữ; các lượt khác giữ
+    theo tỉ lệ ``LOG_SAMPLE_RATE``, tính theo băm ``session_id`` nên một cuộc hội thoại
+    được giữ trọn hoặc bỏ trọn. Bảng rollup vẫn đếm mọi lượt.
+    """
+
+    def __init__(self, rate: Optional[float] = None, keep_below: Optional[float] = None) -> None:
+        if rate is None:
+            rate = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))
+        if keep_below is None:
+            keep_below = float(os.getenv("LOG_SAMPLE_BELOW", "0.75"))
+        self.rate = min(max(rate, 0.0), 1.0)
+        self.keep_below = keep_below
+        self._cutoff = int(self.rate * 0xFFFFFFFF)
+
+    def keep(self, session_id: str, chosen: Optional[Dict[str, Any]], fallback: bool) -> bool:
+        if self.rate >= 1.0 or fallback:
+            return True
+        score = chosen.get("score") if chosen else None
+        if score is not None and score < self.keep_below:
+            return True
+        return zlib.crc32(session_id.encode("utf-8")) <= self._cutoff
+
+
+@dataclass
+class LogEntry:
+    created_at: float
+    session_id: str
+    message: str
+    reply: str
+    top_k: List[Dict[str, Any]]
+    chosen: Optional[Dict[str, Any]]
+    stack_depth: int
+    # ``intent#step`` khi câu trả lời là nội dung của một bước; khi đó không lưu nguyên văn
+    reply_step: Optional[str] = None
+    # Lấy từ ``debug["fallback"]``: ``chosen`` rỗng cả khi bấm nút/trả lời slot
+    is_fallback: bool = False
+
+
+class LogWriter:
+    """Luồng nền gom ``LogEntry`` thành lô và ghi bằng ``write(batch)``."""
+
+    def __init__(
+        self,
+        write: Callable[[List[LogEntry]], None],
+        max_queue: Optional[int] = None,
+        batch_size: Optional[int] = None,
+    ) -> None:
+        if max_queue is None:
+            max_queue = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+        if batch_size is None:
+            batch_size = int(os.getenv("LOG_BATCH_SIZE", "256"))
+        self._write = write
+        self.batch_size = max(1, batch_size)
+        self._queue: "queue.Queue[LogEntry]" = queue.Queue(maxsize=max(1, max_queue))
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self.processed = 0
+        self.dropped = 0
+        self.errors = 0
+
+    def submit(self, entry: LogEntry) -> bool:
+        if self._thread is None:
+            self.start()
+        try:
+            self._queue.put_nowait(entry)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def start(self) -> None:
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="chatbrain-log-writer", daemon=True)
+                self._thread.start()
+
+    def flush(self) -> None:
+        """Chờ tới khi mọi lượt đã nhận được ghi xong."""
+        if self._thread is not None:
+            self._queue.join()
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Ghi nốt hàng đợi rồi dừng luồng ghi (gọi khi tắt tiến trình)."""
+        thread = self._thread
+        if thread is None:
+            return
+        self._queue.put(_STOP)  # type: ignore[arg-type]
+        thread.join(timeout)
+        self._thread = None
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            entries = [entry for entry in batch if entry is not _STOP]
+            try:
+                if entries:
+                    self._write(entries)
+                    self.processed += len(entries)
+            except Exception:  # noqa: BLE001 - mất một lô log không được làm chết luồng ghi
+                self.errors += 1
+                logger.exception("Ghi log thất bại (%d lượt)", len(entries))
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if len(entries) < len(batch):
+                return
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "queued": self._queue.qsize(),
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "errors": self.errors,
+        }
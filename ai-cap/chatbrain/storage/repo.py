@@ -2,62 +2,130 @@ from __future__ import annotations
 
 import json
 import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter, defaultdict
 from contextlib import contextmanager
-from typing import Any, Dict, Iterable, Optional
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional
 
-try:
-    from sqlmodel import Field, Session, SQLModel, create_engine
-except ImportError:  # pragma: no cover
-    Field = Session = SQLModel = create_engine = None  # type: ignore
+from ..core.lazy import is_available, optional_module
+from .partitions import MODES, Maintenance, list_partitions, partition_path, period, rollup_path
+from .pipeline import LogEntry, LogWriter, Sampler, Scrubber
 
+# SQLModel/SQLAlchemy chỉ được import khi thực sự bật ghi log
+SQLMODEL_AVAILABLE = is_available("sqlmodel")
 
-if SQLModel is not None:
-    class InteractionLog(SQLModel, table=True):  # type: ignore
-        id: Optional[int] = Field(default=None, primary_key=True)
-        session_id: str
-        user_message: str
-        bot_reply: str
-        top_k: str
-        chosen: Optional[str]
-        score: Optional[float]
-        stack_depth: int
-else:  # pragma: no cover - fallback
-    InteractionLog = object  # type: ignore
+_SPACES = re.compile(r"\s+")
+MAX_PHRASE_LENGTH = 200
+
+
+def log_day(timestamp: float) -> str:
+    return time.strftime("%Y-%m-%d", time.localtime(timestamp))
+
+
+def normalize_phrase(text: str) -> str:
+    return _SPACES.sub(" ", text.strip().lower())[:MAX_PHRASE_LENGTH]
 
 
 class SQLiteRepo:
-    def __init__(self, path: Optional[str] = None, enabled: Optional[bool] = None) -> None:
+    """Ghi log hội thoại vào SQLite.
+
+    ``LOG_PARTITION=day|week`` ghi mỗi ngày/tuần một file (``chatbrain_logs-2026-10-19.db``),
+    tự chuyển file khi sang kỳ mới; phân vùng cũ được ``partitions.Maintenance`` dọn ở
+    luồng nền. Mặc định ``none``: một file ``SQLITE_PATH`` như trước.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        enabled: Optional[bool] = None,
+        partition: Optional[str] = None,
+        clock: Optional[Callable[[], float]] = None,
+    ) -> None:
         if enabled is None:
             flag = os.getenv("USE_SQLITE_LOG", "false").lower()
             enabled = flag in {"1", "true", "yes"}
         if path is None:
             path = os.getenv("SQLITE_PATH", "chatbrain_logs.db")
+        if partition is None:
+            partition = os.getenv("LOG_PARTITION", "none").lower()
+        if partition not in MODES:
+            raise ValueError(f"LOG_PARTITION không hợp lệ: {partition} (chọn {', '.join(MODES)})")
         self.path = path
-        self.enabled = enabled and SQLModel is not None
+        self.partition = partition
+        # Đồng hồ dùng để đóng dấu log và chọn phân vùng; test truyền hàm giả
+        self.clock = clock or time.time
+        self.active_path = path
+        self.maintenance = Maintenance(path) if partition != "none" else None
+        self.enabled = enabled and SQLMODEL_AVAILABLE
         self._engine = None
+        self._partition_end = float("inf")
+        self._engine_lock = threading.Lock()
+        self.scrubber = Scrubber()
+        self.sampler = Sampler()
+        self._writer: Optional[LogWriter] = None
         if self.enabled:
             self._init_engine()
 
     def _init_engine(self) -> None:
-        if SQLModel is None:
+        sqlmodel = optional_module("sqlmodel")
+        if sqlmodel is None:
             return
         if self._engine is None:
-            self._engine = create_engine(f"sqlite:///{self.path}")
-            SQLModel.metadata.create_all(self._engine)
+            self._open(self.clock())
+
+    def _open(self, now: float) -> None:
+        """Mở engine cho phân vùng chứa ``now`` (đóng engine của phân vùng trước nếu có)."""
+        sqlmodel = optional_module("sqlmodel")
+        from . import models  # noqa: F401 - đăng ký bảng vào metadata
+
+        path, end = self.path, float("inf")
+        if self.partition != "none":
+            key, _, end = period(now, self.partition)
+            path = str(partition_path(self.path, key))
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        engine = sqlmodel.create_engine(f"sqlite:///{path}")
+        if self.partition != "none":
+            # WAL: /stats, export và luồng bảo trì đọc được trong khi vẫn ghi
+            with engine.begin() as conn:
+                conn.exec_driver_sql("PRAGMA journal_mode=WAL")
+        migrate(engine)
+        previous, self._engine = self._engine, engine
+        self.active_path, self._partition_end = path, end
+        if previous is not None:
+            previous.dispose()
+        if self.maintenance is not None:
+            self.maintenance.notify(Path(path))
+
+    def _current_engine(self) -> Any:
+        if self._engine is None or self.clock() >= self._partition_end:
+            with self._engine_lock:
+                now = self.clock()
+                if self._engine is None or now >= self._partition_end:
+                    self._open(now)
+        return self._engine
+
+    def start_maintenance(self) -> None:
+        """Chạy luồng dọn phân vùng cũ (chỉ khi bật ghi log và chia phân vùng)."""
+        if self.enabled and self.maintenance is not None:
+            self.maintenance.start()
 
     def set_enabled(self, enabled: bool) -> None:
-        self.enabled = enabled and SQLModel is not None
+        self.enabled = enabled and SQLMODEL_AVAILABLE
         if self.enabled and self._engine is None:
             self._init_engine()
 
     @contextmanager
-    def session(self) -> Iterable[Session]:  # pragma: no cover - được gọi gián tiếp
+    def session(self) -> Iterable[Any]:  # pragma: no cover - được gọi gián tiếp
         if not self.enabled:
             yield None
             return
-        if self._engine is None:
-            self._init_engine()
-        with Session(self._engine) as sess:
+        engine = self._current_engine()
+        sqlmodel = optional_module("sqlmodel")
+        with sqlmodel.Session(engine) as sess:
             yield sess
 
     def log_interaction(
@@ -68,20 +136,237 @@ class SQLiteRepo:
         top_k: list[Dict[str, Any]],
         chosen: Optional[Dict[str, Any]],
         stack_depth: int,
+        reply_step: Optional[str] = None,
+        is_fallback: bool = False,
     ) -> None:
-        if not self.enabled or SQLModel is None:
+        """Ghi ngay một lượt (đồng bộ); đường xử lý tin nhắn dùng ``submit``."""
+        if not self.enabled:
             return
-        record = InteractionLog(
-            session_id=session_id,
-            user_message=message,
-            bot_reply=reply,
-            top_k=json.dumps(top_k, ensure_ascii=False),
-            chosen=json.dumps(chosen, ensure_ascii=False) if chosen else None,
-            score=chosen.get("score") if chosen else None,
-            stack_depth=stack_depth,
-        )
+        entry = LogEntry(self.clock(), session_id, message, reply, top_k, chosen, stack_depth, reply_step, is_fallback)
+        self.write_batch([entry])
+
+    def submit(self, entry: LogEntry) -> None:
+        """Đẩy một lượt cho luồng ghi nền; không chặn, không đụng tới SQLite."""
+        if not self.enabled:
+            return
+        if self._writer is None:
+            with self._engine_lock:
+                if self._writer is None:
+                    self._writer = LogWriter(self.write_batch)
+        self._writer.submit(entry)
+
+    def flush(self) -> None:
+        if self._writer is not None:
+            self._writer.flush()
+
+    def close(self) -> None:
+        """Ghi nốt log trong hàng đợi, dừng luồng bảo trì phân vùng và đóng engine."""
+        if self._writer is not None:
+            self._writer.close()
+        if self.maintenance is not None:
+            self.maintenance.stop()
+        with self._engine_lock:
+            if self._engine is not None:
+                self._engine.dispose()
+                self._engine = None
+
+    def writer_stats(self) -> Dict[str, Any]:
+        return self._writer.stats() if self._writer is not None else {}
+
+    def write_batch(self, entries: List[LogEntry]) -> None:
+        """Che PII, lấy mẫu và ghi một lô trong một transaction (rollup đếm mọi lượt)."""
+        from .models import InteractionLog
+
         with self.session() as sess:
             if sess is None:
                 return
-            sess.add(record)
+            for entry in entries:
+                chosen = entry.chosen
+                chosen_intent = chosen.get("intent_id") if chosen else None
+                score = chosen.get("score") if chosen else None
+                fallback = entry.is_fallback
+                message = self.scrubber(entry.message)
+                if self.sampler.keep(entry.session_id, chosen, fallback):
+                    sess.add(
+                        InteractionLog(
+                            created_at=entry.created_at,
+                            session_id=entry.session_id,
+                            user_message=message,
+                            bot_reply="" if entry.reply_step else entry.reply,
+                            reply_step=entry.reply_step,
+                            top_k=json.dumps(entry.top_k, ensure_ascii=False),
+                            chosen=json.dumps(chosen, ensure_ascii=False) if chosen else None,
+                            chosen_intent=chosen_intent,
+                            score=score,
+                            is_fallback=fallback,
+                            stack_depth=entry.stack_depth,
+                        )
+                    )
+                for statement in _rollup_statements(
+                    log_day(entry.created_at), chosen_intent, score, message, fallback
+                ):
+                    sess.execute(statement)
             sess.commit()
+
+    def stats(self, days: int = 7, limit: int = 10) -> Dict[str, Any]:
+        """Tổng hợp từ bảng rollup: theo ngày, intent nhiều nhất, câu fallback hay gặp nhất.
+
+        Khi chia phân vùng, cộng rollup của các phân vùng chưa nén trong khoảng ngày với
+        ``*-rollup.db`` (nơi gộp rollup của phân vùng đã nén).
+        """
+        if not self.enabled:
+            return {"enabled": False}
+        self.flush()
+        since_ts = self.clock() - max(days - 1, 0) * 86400
+        since = log_day(since_ts)
+        per_day: Dict[str, List[Any]] = defaultdict(lambda: [0, 0, 0.0, 0])
+        intents: Dict[str, List[Any]] = defaultdict(lambda: [0, 0.0])
+        missed: Counter = Counter()
+        for source in self._stats_sources(since_ts):
+            try:
+                conn = sqlite3.connect(f"file:{source}?mode=ro", uri=True)
+            except sqlite3.OperationalError:
+                continue  # phân vùng vừa bị xoá/nén
+            try:
+                for day, total, fallbacks, score_sum, matched in conn.execute(
+                    "SELECT day, SUM(messages), SUM(CASE WHEN intent = '' THEN messages ELSE 0 END),"
+                    " SUM(score_sum), SUM(CASE WHEN intent IN ('', '#') THEN 0 ELSE messages END)"
+                    " FROM interactionrollup WHERE day >= ? GROUP BY day",
+                    (since,),
+                ):
+                    row = per_day[day]
+                    row[0] += total
+                    row[1] += fallbacks
+                    row[2] += score_sum
+                    row[3] += matched
+                for intent, n, score_sum in conn.execute(
+                    "SELECT intent, SUM(messages), SUM(score_sum) FROM interactionrollup"
+                    " WHERE day >= ? AND intent NOT IN ('', '#') GROUP BY intent",
+                    (since,),
+                ):
+                    intents[intent][0] += n
+                    intents[intent][1] += score_sum
+                for phrase, n in conn.execute(
+                    "SELECT phrase, SUM(count) FROM missedphrase WHERE day >= ? GROUP BY phrase", (since,)
+                ):
+                    missed[phrase] += n
+            except sqlite3.OperationalError:
+                continue  # file chưa có bảng rollup
+            finally:
+                conn.close()
+        top = sorted(intents.items(), key=lambda item: item[1][0], reverse=True)[:limit]
+        return {
+            "enabled": True,
+            "since": since,
+            "days": [
+                {
+                    "day": day,
+                    "messages": total,
+                    "fallbacks": fallbacks,
+                    "fallback_rate": round(fallbacks / total, 4) if total else 0.0,
+                    "avg_score": round(score_sum / matched, 4) if matched else None,
+                }
+                for day, (total, fallbacks, score_sum, matched) in sorted(per_day.items())
+            ],
+            "top_intents": [
+                {"intent": intent, "messages": n, "avg_score": round(score_sum / n, 4) if n else None}
+                for intent, (n, score_sum) in top
+            ],
+            "missed_phrases": [{"phrase": phrase, "count": n} for phrase, n in missed.most_common(limit)],
+            "writer": self.writer_stats(),
+        }
+
+    def _stats_sources(self, since_ts: float) -> List[str]:
+        if self.partition == "none":
+            return [self.path]
+        sources: List[str] = []
+        merged: set = set()
+        rollup = rollup_path(self.path)
+        if rollup.exists():
+            sources.append(str(rollup))
+            conn = sqlite3.connect(f"file:{rollup}?mode=ro", uri=True)
+            try:
+                merged = {key for (key,) in conn.execute("SELECT partition FROM merged")}
+            except sqlite3.OperationalError:
+                pass
+            finally:
+                conn.close()
+        if Path(self.path).exists():
+            sources.append(self.path)  # log ghi trước khi bật chia phân vùng
+        for part in list_partitions(self.path):
+            if not part.compressed and part.key not in merged and part.end > since_ts:
+                sources.append(str(part.path))
+        return sources
+
+
+def _rollup_statements(
+    day: str, intent: Optional[str], score: Optional[float], message: str, fallback: bool
+) -> List[Any]:
+    """Câu lệnh upsert cộng dồn rollup cho một lượt; chạy chung transaction với bản ghi log.
+
+    Lượt không có intent được xếp hạng mà cũng không phải fallback (nút, slot) cộng vào
+    khoá ``DIRECT``: tính vào tổng số lượt nhưng không vào fallback/điểm/top intent.
+    """
+    from sqlalchemy.dialects.sqlite import insert
+
+    from .models import DIRECT, FALLBACK, InteractionRollup, MissedPhrase
+
+    score_value = float(score or 0.0)
+    key = intent or (FALLBACK if fallback else DIRECT)
+    rollup = insert(InteractionRollup).values(day=day, intent=key, messages=1, score_sum=score_value)
+    statements = [
+        rollup.on_conflict_do_update(
+            index_elements=["day", "intent"],
+            set_={
+                "messages": InteractionRollup.messages + 1,
+                "score_sum": InteractionRollup.score_sum + score_value,
+            },
+        )
+    ]
+    if fallback:
+        missed = insert(MissedPhrase).values(day=day, phrase=normalize_phrase(message), count=1)
+        statements.append(
+            missed.on_conflict_do_update(
+                index_elements=["day", "phrase"], set_={"count": MissedPhrase.count + 1}
+            )
+        )
+    return statements
+
+
+_ADDED_COLUMNS = (
+    ("created_at", "FLOAT"),
+    ("chosen_intent", "VARCHAR"),
+    ("is_fallback", "BOOLEAN NOT NULL DEFAULT 0"),
+    ("reply_step", "VARCHAR"),
+)
+
+
+def migrate(engine: Any) -> int:
+    """Đưa file log về schema hiện tại (``PRAGMA user_version``); trả phiên bản trước đó.
+
+    File cũ (v1: chỉ có ``top_k``/``chosen`` dạng JSON, không thời điểm) được thêm cột,
+    chỉ mục, điền ``chosen_intent``/``is_fallback`` từ JSON. Dòng cũ không có thời điểm
+    nên không được cộng vào rollup. v3 thêm ``reply_step`` (dòng cũ giữ nguyên văn câu trả lời).
+    """
+    sqlmodel = optional_module("sqlmodel")
+    from .models import SCHEMA_VERSION, InteractionLog
+
+    with engine.begin() as conn:
+        version = conn.exec_driver_sql("PRAGMA user_version").scalar() or 0
+        if version >= SCHEMA_VERSION:
+            return version
+        existing = {row[1] for row in conn.exec_driver_sql("PRAGMA table_info(interactionlog)")}
+        sqlmodel.SQLModel.metadata.create_all(conn)
+        if existing:
+            for name, ddl in _ADDED_COLUMNS:
+                if name not in existing:
+                    conn.exec_driver_sql(f"ALTER TABLE interactionlog ADD COLUMN {name} {ddl}")
+            for index in InteractionLog.__table__.indexes:
+                index.create(conn, checkfirst=True)
+            if "chosen_intent" not in existing:
+                conn.exec_driver_sql(
+                    "UPDATE interactionlog SET chosen_intent = json_extract(chosen, '$.intent_id'),"
+                    " is_fallback = (chosen IS NULL)"
+                )
+        conn.exec_driver_sql(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    return version
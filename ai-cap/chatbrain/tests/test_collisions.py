@@ -0,0 +1,42 @@
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+os.environ.setdefault("USE_EMBEDDING", "false")
+os.environ.setdefault("USE_SQLITE_LOG", "false")
+
+from chatbrain.core.collisions import find_collisions
+from chatbrain.core.nlu import NLUIndex
+from chatbrain.core.schema import Intent, ScriptPack, Step
+
+
+def _intent(intent_id: str, *synonyms: str) -> Intent:
+    return Intent(id=intent_id, domain="cu_tru", version=1, synonyms=list(synonyms), steps=[Step(id="b1", say="x")])
+
+
+def test_flags_similar_pairs_and_outranked_synonyms() -> None:
+    pack = ScriptPack(
+        intents=[
+            _intent("dang_ky_tam_tru", "đăng ký tạm trú", "khai báo tạm trú"),
+            _intent("gia_han_tam_tru", "gia hạn tạm trú", "đăng ký tạm trú"),
+            _intent("quen_mat_khau", "quên mật khẩu vneid"),
+            _intent("cap_cccd", "làm căn cước công dân"),
+            # BM25 cho idf = 0 khi từ nằm trong một nửa số tài liệu: thêm intent đệm
+            *(
+                _intent(f"khac_{i}", phrase)
+                for i, phrase in enumerate(["hộ chiếu", "bằng lái xe", "bảo hiểm y tế", "đổi tên", "kết hôn"])
+            ),
+        ]
+    )
+    nlu = NLUIndex(use_embedding=False, spell_correction=False)
+    nlu.build(pack)
+
+    tiled = find_collisions(nlu, threshold=0.5, tile=1)
+    whole = find_collisions(nlu, threshold=0.5, tile=64)
+    assert tiled["pairs"] == whole["pairs"] and tiled["outranked"] == whole["outranked"]
+    assert [(p["a"], p["b"]) for p in whole["pairs"]] == [("dang_ky_tam_tru", "gia_han_tam_tru")]
+    (item,) = whole["outranked"]
+    assert (item["intent"], item["phrase"]) == ("gia_han_tam_tru", "đăng ký tạm trú")
+    assert item["outranked_by"][0]["intent"] == "dang_ky_tam_tru"
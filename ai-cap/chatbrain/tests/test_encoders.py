@@ -0,0 +1,48 @@
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+os.environ.setdefault("USE_EMBEDDING", "false")
+os.environ.setdefault("USE_SQLITE_LOG", "false")
+
+import numpy as np
+import pytest
+
+from chatbrain.core import loader
+from chatbrain.core.encoders import Encoder, EncoderError, create_encoder
+from chatbrain.core.nlu import NLUIndex
+
+
+class HashingEncoder(Encoder):
+    """Encoder giả: túi từ băm vào 64 chiều, đủ để kiểm tra đường embedding."""
+
+    name = "hashing"
+
+    def __init__(self) -> None:
+        self.calls = 0
+
+    def encode(self, texts, batch_size: int = 32) -> np.ndarray:
+        self.calls += 1
+        out = np.zeros((len(texts), 64), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in text.lower().split():
+                out[row, hash(token) % 64] += 1.0
+        return out
+
+
+def test_custom_encoder_plugs_into_index() -> None:
+    encoder = HashingEncoder()
+    nlu = NLUIndex(use_embedding=True, embedder=encoder)
+    nlu.build(loader.load_from_folder("chatbrain/examples"))
+    assert nlu.embedder is encoder
+    assert nlu.rank("quên passcode")[0].intent_id == "quen_mat_khau_vneid"
+    assert encoder.calls == 2
+    with pytest.raises(TypeError):
+        Encoder()  # lớp trừu tượng: backend phải cài ``encode``
+
+
+def test_unknown_backend_is_rejected() -> None:
+    with pytest.raises(EncoderError):
+        create_encoder("tpu")
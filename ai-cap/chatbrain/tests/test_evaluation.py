@@ -0,0 +1,32 @@
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+os.environ.setdefault("USE_EMBEDDING", "false")
+os.environ.setdefault("USE_SQLITE_LOG", "false")
+
+from chatbrain.core import evaluation, loader
+from chatbrain.core.nlu import NLUIndex
+
+
+def test_seeded_evaluation_and_sweep() -> None:
+    pack = loader.load_from_folder("chatbrain/examples")
+    index_pack, samples = evaluation.seed_dataset(pack, holdout=0.5, noise=1, seed=1)
+    held = [s for s in samples if s.split == "heldout"]
+    assert held
+    for sample in held:
+        intent = index_pack.intent_by_id(sample.intent_id)
+        assert sample.text not in intent.synonyms + intent.examples
+
+    nlu = NLUIndex(use_embedding=False)
+    nlu.build(index_pack)
+    cache = evaluation.score_samples(nlu, samples, latency_samples=5)
+    report = evaluation.evaluate(nlu, cache, threshold=0.55)
+    assert report["by_split"]["train"]["top1"] == 1.0
+    assert sum(sum(row.values()) for row in report["confusion"].values()) == len(samples)
+
+    grid = evaluation.sweep(nlu, cache, [0.0, 0.5, 1.01])
+    assert [row["threshold"] for row in grid] == [0.0, 0.5, 1.01]
+    assert grid[0]["fallback_rate"] == 0.0 and grid[-1]["fallback_rate"] == 1.0
@@ -0,0 +1,57 @@
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+os.environ.setdefault("USE_EMBEDDING", "false")
+os.environ.setdefault("USE_SQLITE_LOG", "false")
+
+from chatbrain.core.flows import DYNAMIC, FlowTable
+from chatbrain.core.loader import load_from_folder
+from chatbrain.service import ChatBrainService
+
+SCRIPT = """
+intents:
+  - id: nop_ho_so
+    domain: cu_tru
+    version: 1
+    synonyms: ["nộp hồ sơ cư trú"]
+    steps:
+      - id: mo
+        say: "Mở cổng dịch vụ công"
+        ui: {buttons: ["Đã xong ✅", "Huỷ"]}
+      - id: hoi
+        ask: "Mã hồ sơ?"
+        slot_name: ma_ho_so
+      - id: tam_tru
+        when: "ma_ho_so == 'x'"
+        say: "Tạm trú"
+      - id: xong
+        say: "Hoàn tất"
+"""
+
+
+def test_transition_table(tmp_path: Path) -> None:
+    (tmp_path / "flow.yaml").write_text(SCRIPT, encoding="utf-8")
+    table = FlowTable(load_from_folder(str(tmp_path)))
+    assert table.next["nop_ho_so"] == (DYNAMIC, DYNAMIC, 3, 4)
+    assert table.advance_labels["nop_ho_so"][0] == ("Đã xong ✅",)
+    assert table.refs["nop_ho_so"][3] == "nop_ho_so#xong"
+
+
+def test_prefetch_matches_the_next_turn() -> None:
+    svc = ChatBrainService()
+    svc.load_scripts("chatbrain/examples")
+    first = svc.handle_message("s", "tôi muốn kích hoạt vneid", prefetch=True)
+    upcoming = first.debug["next"]
+    assert upcoming["labels"] == ["Đã xong"]
+
+    second = svc.handle_message("s", upcoming["labels"][0], prefetch=True)
+    assert second.debug["step"] == upcoming["step"]
+    assert (second.reply, second.ui.model_dump()) == (upcoming["reply"], upcoming["ui"])
+
+    # Bước cuối chỉ có "Huỷ": không có gì để dựng sẵn
+    third = svc.handle_message("s", "Đã xong", prefetch=True)
+    assert third.debug["step"].endswith("#b3_xac_nhan") and "next" not in third.debug
+    assert "next" not in svc.handle_message("t", "tôi muốn kích hoạt vneid").debug
@@ -0,0 +1,94 @@
+import os
+import shutil
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+os.environ.setdefault("USE_EMBEDDING", "false")
+os.environ.setdefault("USE_SQLITE_LOG", "false")
+
+import numpy as np
+import pytest
+
+from chatbrain.core import evaluation, loader
+from chatbrain.core.fusion import Fusion, fit_calibration, write_calibration
+from chatbrain.core.nlu import NLUIndex
+
+
+def test_saturation_keeps_order_and_rejects_off_topic() -> None:
+    pack = loader.load_from_folder("chatbrain/examples")
+    legacy = NLUIndex(use_embedding=False, fusion=Fusion("max"))
+    legacy.build(pack)
+    nlu = NLUIndex(use_embedding=False, fusion=Fusion("saturation"))
+    nlu.build(pack)
+    for text in ("kích hoạt vneid", "lệ phí định danh tổ chức"):
+        assert [c.intent_id for c in nlu.rank(text)] == [c.intent_id for c in legacy.rank(text)]
+    # Chỉ trùng một từ khoá: cách cũ cho 1.0, saturation giữ dưới ngưỡng
+    off_topic = "thời tiết vneid hôm nay"
+    assert legacy.rank(off_topic)[0].score == 1.0
+    assert nlu.rank(off_topic)[0].score < 0.55
+
+
+def test_domain_rank_normalizes_over_all_intents() -> None:
+    nlu = NLUIndex(use_embedding=False, fusion=Fusion("max"))
+    nlu.build(loader.load_from_folder("chatbrain/examples"))
+    text = "lệ phí định danh tổ chức vneid"  # khớp mạnh domain to_chuc, yếu với vneid
+    full = {c.intent_id: c.score for c in nlu.rank(text, top_k=10)}
+    (weak,) = nlu.rank(text, top_k=1, domain="vneid")
+    assert max(full.values()) == 1.0
+    assert weak.score == full[weak.intent_id] < 1.0
+
+
+def test_rrf_top_rank_scores_like_best_linear() -> None:
+    fusion = Fusion("rrf", rrf_k=60)
+    bm25 = np.array([[0.9, 0.2, 0.1]])
+    embed = np.array([[0.8, 0.7, 0.0]])
+    fused = fusion.fuse(bm25, embed, 0.5)
+    assert fused.argmax() == 0
+    assert abs(fused[0, 0] - 0.85) < 1e-9
+
+
+def test_calibration_fit_and_load(tmp_path: Path) -> None:
+    pack = loader.load_from_folder("chatbrain/examples")
+    index_pack, samples = evaluation.seed_dataset(pack, holdout=0.3, noise=2, seed=3)
+    nlu = NLUIndex(use_embedding=False, fusion=Fusion("saturation"))
+    nlu.build(index_pack)
+    cache = evaluation.score_samples(nlu, samples, latency_samples=0)
+    calibration = evaluation.fit_calibration(nlu, cache)
+    assert calibration["method"] == "saturation"
+    assert calibration["a"] > 0  # điểm cao hơn -> xác suất đúng cao hơn
+
+    for file in Path("chatbrain/examples").glob("*.yaml"):
+        shutil.copy(file, tmp_path / file.name)
+    write_calibration(str(tmp_path), calibration)
+    calibrated = NLUIndex(use_embedding=False, fusion=Fusion("saturation"))
+    calibrated.build(loader.load_from_folder(str(tmp_path)))
+    plain = NLUIndex(use_embedding=False, fusion=Fusion("saturation"))
+    plain.build(pack)
+    raw = plain.rank("quên passcode")[0].score
+    expected = 1 / (1 + np.exp(-(calibration["a"] * raw + calibration["b"])))
+    assert abs(calibrated.rank("quên passcode")[0].score - expected) < 1e-6
+
+    ignored = Fusion("max", calibration=calibration)
+    assert ignored.calibration is None
+
+
+def test_calibration_applies_its_bm25_weight() -> None:
+    pack = loader.load_from_folder("chatbrain/examples")
+    calibration = {"method": "saturation", "bm25_weight": 0.8, "a": 4.0, "b": -2.0, "samples": 10}
+    nlu = NLUIndex(use_embedding=False, bm25_weight=0.6, fusion=Fusion("saturation"))
+    nlu.build(pack.model_copy(update={"calibration": calibration}))
+    assert nlu.bm25_weight == 0.8
+
+    # Calibration bị bỏ qua (khác method) hoặc không có: quay về trọng số cấu hình
+    nlu.build(pack.model_copy(update={"calibration": {**calibration, "method": "max"}}))
+    assert nlu.bm25_weight == 0.6
+    nlu.build(pack.model_copy(update={"calibration": calibration}))
+    nlu.build(pack)
+    assert nlu.bm25_weight == 0.6
+
+
+def test_fit_calibration_requires_both_outcomes() -> None:
+    with pytest.raises(ValueError):
+        fit_calibration([0.5, 0.6], [True, True], "saturation", 0.6)
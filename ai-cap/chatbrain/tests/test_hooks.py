@@ -0,0 +1,99 @@
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+os.environ.setdefault("USE_EMBEDDING", "false")
+os.environ.setdefault("USE_SQLITE_LOG", "false")
+
+import pytest
+
+from chatbrain.core.hooks import HookRegistry
+from chatbrain.core.loader import ScriptLoaderError
+from chatbrain.service import ChatBrainService
+
+SCRIPT = """
+intents:
+  - id: tra_cuu
+    domain: cu_tru
+    version: 1
+    synonyms: ["tra cứu hồ sơ cư trú"]
+    steps:
+      - id: s1
+        say: "Đang tra cứu"
+        before_hook: ghi_nhan
+        action: tra_cuu_ho_so
+      - id: s2
+        say: "Xong"
+        after_hook: cham
+  - id: le_phi
+    domain: cu_tru
+    version: 1
+    synonyms: ["lệ phí bao nhiêu"]
+    steps:
+      - id: s1
+        say: "Miễn phí"
+  - id: tam_tru
+    domain: cu_tru
+    version: 1
+    synonyms: ["đăng ký tạm trú"]
+    steps:
+      - id: s1
+        say: "Hướng dẫn tạm trú"
+"""
+
+
+def _write(tmp_path: Path) -> str:
+    (tmp_path / "main.yaml").write_text(SCRIPT, encoding="utf-8")
+    return str(tmp_path)
+
+
+def test_unknown_hook_fails_load(tmp_path: Path) -> None:
+    svc = ChatBrainService()
+    with pytest.raises(ScriptLoaderError):
+        svc.load_scripts(_write(tmp_path))
+
+
+def test_hooks_run_with_timeouts_and_stats(tmp_path: Path) -> None:
+    svc = ChatBrainService()
+    hooks = svc.executor.hooks
+    hooks.timeout = 0.05
+    calls = []
+
+    @hooks.register("ghi_nhan", inline=True)
+    def ghi_nhan(session_id, intent, step_id, slots):
+        calls.append((session_id, intent.id, step_id))
+
+    @hooks.register("tra_cuu_ho_so")
+    async def tra_cuu_ho_so(session_id, intent, step_id, slots):
+        await asyncio.sleep(0)
+        return {"trang_thai": "da_tiep_nhan"}
+
+    @hooks.register("cham")
+    def cham(**_):
+        time.sleep(0.5)
+
+    svc.load_scripts(_write(tmp_path))
+    assert svc.handle_message("a", "tra cứu hồ sơ cư trú").reply == "Đang tra cứu"
+    assert calls == [("a", "tra_cuu", "s1")]
+    assert svc.context.peek("a").slots == {"trang_thai": "da_tiep_nhan"}
+
+    started = time.perf_counter()
+    assert svc.handle_message("a", "Đã xong").reply == "Xong"
+    assert time.perf_counter() - started < 0.4  # hook chậm bị cắt theo timeout
+
+    stats = svc.hook_stats()
+    assert stats["cham"]["timeouts"] == 1
+    assert stats["tra_cuu_ho_so"]["calls"] == 1 and stats["tra_cuu_ho_so"]["errors"] == 0
+    svc.shutdown()  # lifespan gọi khi tắt: pool và event loop của hook được dừng
+    assert hooks._pool is None and hooks._loop is None
+
+
+def test_register_rejects_non_callable() -> None:
+    registry = HookRegistry(workers=1)
+    assert registry.names() == ("noop",)
+    with pytest.raises(ValueError):
+        registry.register("hong", "không phải hàm")  # type: ignore[arg-type]
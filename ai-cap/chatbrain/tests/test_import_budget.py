@@ -0,0 +1,12 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from chatbrain.benchmarks.importtime import BUDGETS, measure
+
+
+def test_service_import_defers_heavy_modules() -> None:
+    _, forbidden = BUDGETS["chatbrain.service"]
+    _, _, loaded = measure("chatbrain.service")
+    assert [name for name in forbidden if name in loaded] == []
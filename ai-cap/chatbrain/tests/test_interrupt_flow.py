@@ -7,7 +7,7 @@ sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
 os.environ.setdefault("USE_EMBEDDING", "false")
 os.environ.setdefault("USE_SQLITE_LOG", "false")
 
-from chatbrain.app import service
+from chatbrain.service import service
 
 
 def setup_module(_: object) -> None:
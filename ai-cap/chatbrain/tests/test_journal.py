@@ -0,0 +1,83 @@
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+os.environ.setdefault("USE_EMBEDDING", "false")
+os.environ.setdefault("USE_SQLITE_LOG", "false")
+
+import pytest
+
+from chatbrain.core.context import ContextManager
+from chatbrain.service import ChatBrainService
+from chatbrain.storage.journal import Journal, JournalLocked, claim
+
+
+def _service(journal_dir: Path) -> ChatBrainService:
+    svc = ChatBrainService()
+    svc.context.attach_journal(Journal(str(journal_dir), snapshot_records=0))
+    svc.load_scripts("chatbrain/examples")
+    return svc
+
+
+def test_crash_recovery_replays_flow(tmp_path: Path) -> None:
+    svc = _service(tmp_path)
+    svc.handle_message("flow", "tôi muốn kích hoạt vneid")
+    svc.handle_message("flow", "Đã xong")
+    svc.handle_message("flow", "tôi quên mật khẩu vneid")
+    svc.handle_message("flow", "Đã xong")
+    svc.handle_message("flow", "Đã xong")  # xong quy trình chen ngang -> chờ quay lại
+    svc.handle_message("xong", "tôi muốn kích hoạt vneid")
+    svc.handle_message("xong", "Huỷ")
+    before = svc.context_state("flow")
+    svc.context.journal.close()  # như tiến trình chết sau lần fsync cuối
+
+    restored = _service(tmp_path)
+    assert restored.context_state("flow") == before
+    assert restored.context_state("xong").stack == []
+    assert "Tại màn hình chính" in restored.handle_message("flow", "Quay lại").reply
+    restored.handle_message("moi", "tôi muốn kích hoạt vneid")
+    restored.context.start_sweeper()
+    restored.shutdown()  # lifespan: dừng luồng dọn phiên, ghi nốt nhật ký
+    assert restored.context.journal is None and restored.context._sweeper is None
+    recovered = _service(tmp_path)
+    assert recovered.context_state("moi").stack
+    recovered.shutdown()
+
+
+def test_snapshot_then_tail(tmp_path: Path) -> None:
+    journal = Journal(str(tmp_path), snapshot_records=0)
+    context = ContextManager(max_depth=2, ttl=0)
+    context.attach_journal(journal)
+    svc = ChatBrainService()
+    svc.context = context
+    svc.executor.context = context
+    svc.load_scripts("chatbrain/examples")
+    for idx in range(20):
+        svc.handle_message(f"s{idx}", "tôi muốn kích hoạt vneid")
+    assert journal.snapshot() is not None
+    svc.handle_message("s1", "Đã xong")
+    context.clear("s2")
+    journal.close()
+
+    segments = sorted(p.name for p in tmp_path.iterdir() if p.name != "LOCK")
+    assert segments[0].startswith("segment-") and any(name.startswith("snapshot-") for name in segments)
+    recovered = ContextManager(max_depth=2, ttl=0)
+    assert recovered.restore(Journal(str(tmp_path))) == 19
+    assert recovered.peek("s1").step_index == 1
+    assert recovered.peek("s2") is None
+
+
+def test_workers_claim_separate_directories(tmp_path: Path) -> None:
+    first = claim(str(tmp_path))
+    with pytest.raises(JournalLocked):
+        Journal(str(tmp_path))
+    second = claim(str(tmp_path))  # worker thứ hai dùng chung CHATBRAIN_JOURNAL_DIR
+    assert (first.directory, second.directory) == (tmp_path, tmp_path / "worker-1")
+    first.close()
+    # Worker khởi động lại nhận ô trống thấp nhất và khôi phục phiên của ô đó
+    restarted = claim(str(tmp_path))
+    assert restarted.directory == tmp_path
+    restarted.close()
+    second.close()
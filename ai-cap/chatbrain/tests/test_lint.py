@@ -0,0 +1,80 @@
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+os.environ.setdefault("USE_EMBEDDING", "false")
+os.environ.setdefault("USE_SQLITE_LOG", "false")
+
+import pytest
+
+from chatbrain.core import loader
+from chatbrain.core.lint import lint_path
+
+FLOWS = """
+intents:
+  - id: lam_cccd
+    domain: cu_tru
+    version: 1
+    synonyms: ["làm căn cước", "thủ tục cccd"]
+    steps:
+      - id: b1
+        say: "Chuẩn bị giấy tờ"
+        ui:
+          buttons: ["Về menu chính"]
+      - id: b2
+        say: "Nộp hồ sơ"
+        ui:
+          media:
+            - url: https://example.org/ai-cap/knowledge_base/assets/images/thieu.png
+            - url: link_se_duoc_gan_sau
+            - url: images/lon.png
+  - id: menu_phu
+    domain: cu_tru
+    version: 1
+    steps:
+      - id: b1
+        say: "Menu"
+        media:
+          - url: images/lon.png
+"""
+DUPLICATE = """
+intents:
+  - id: lam_cccd
+    domain: khac
+    version: 1
+    steps: [{id: b1, say: "x"}]
+  - id: cap_lai_cccd
+    domain: cu_tru
+    version: 1
+    synonyms: ["Làm  căn cước!"]
+    steps: [{id: b1, say: "y"}]
+"""
+
+
+def test_lint_reports_graph_synonym_and_asset_issues(tmp_path: Path) -> None:
+    scripts = tmp_path / "scripts"
+    images = tmp_path / "assets" / "images"
+    scripts.mkdir()
+    images.mkdir(parents=True)
+    (images / "lon.png").write_bytes(b"0" * 3000)
+    (scripts / "01_flows.yaml").write_text(FLOWS, encoding="utf-8")
+    (scripts / "02_dup.yaml").write_text(DUPLICATE, encoding="utf-8")
+
+    report = lint_path(str(scripts), max_image_kb=2)
+    found = {(issue.code, issue.intent, issue.step) for issue in report.issues}
+    assert ("duplicate-id", "lam_cccd", "") in found
+    assert ("unreachable-step", "lam_cccd", "b2") in found
+    assert ("missing-asset", "lam_cccd", "b2") in found
+    assert ("invalid-media-url", "lam_cccd", "b2") in found
+    assert ("oversized-image", "lam_cccd", "b2") in found
+    assert ("unknown-key", "menu_phu", "b1") in found
+    assert ("unreachable-intent", "menu_phu", "") in found
+    assert ("ambiguous-synonym", "lam_cccd", "") in found
+    assert {issue.code for issue in report.errors} == {"duplicate-id", "missing-asset", "invalid-media-url"}
+    assert report.edges["lam_cccd#b1"] == []
+    assert report.summary()["files"] == 2 and report.seconds < 1
+
+    with pytest.raises(loader.ScriptLoaderError, match="01_flows.yaml, 02_dup.yaml"):
+        loader.load_from_folder(str(scripts))
@@ -0,0 +1,52 @@
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+os.environ.setdefault("USE_EMBEDDING", "false")
+os.environ.setdefault("USE_SQLITE_LOG", "false")
+
+import pytest
+
+pytest.importorskip("sqlmodel")
+
+from chatbrain.storage.export import export_logs
+from chatbrain.storage.partitions import Maintenance, list_partitions
+from chatbrain.storage.repo import SQLiteRepo
+
+DAY = 86400
+CHOSEN = {"intent_id": "chao", "score": 0.5}
+
+
+def test_rollover_compress_and_retention(tmp_path: Path) -> None:
+    base = tmp_path / "logs" / "chatbrain_logs.db"
+    start = time.mktime((2026, 10, 5, 12, 0, 0, 0, 0, -1))
+    now = [start]
+    repo = SQLiteRepo(path=str(base), enabled=True, partition="day", clock=lambda: now[0])
+    repo.log_interaction("s", "xin chào", "chào", [], CHOSEN, 1)
+    repo.log_interaction("s", "thời tiết", "?", [], None, 1, is_fallback=True)
+    now[0] += DAY
+    repo.log_interaction("s", "xin chào", "chào", [], CHOSEN, 1)
+    assert [p.key for p in list_partitions(str(base))] == ["2026-10-05", "2026-10-06"]
+    assert repo.active_path.endswith("chatbrain_logs-2026-10-06.db")
+
+    now[0] += 10 * DAY
+    repo.log_interaction("s", "xin chào", "chào", [], CHOSEN, 1)
+    maintenance = Maintenance(str(base), retention_days=0, compress_after_days=7, interval=60)
+    maintenance.notify(Path(repo.active_path))
+    assert maintenance.run_once(now=now[0]) == {"compacted": 0, "compressed": 2, "deleted": 0}
+    assert [p.compressed for p in list_partitions(str(base))] == [True, True, False]
+    maintenance.run_once(now=now[0])  # chạy lại không cộng rollup hai lần
+
+    stats = repo.stats(days=30)
+    assert [d["messages"] for d in stats["days"]] == [2, 1, 1]
+    assert stats["top_intents"][0] == {"intent": "chao", "messages": 3, "avg_score": 0.5}
+    assert stats["missed_phrases"] == [{"phrase": "thời tiết", "count": 1}]
+    result = export_logs(str(base), str(tmp_path / "out"), fmt="csv")
+    assert result["rows"] == 4
+
+    maintenance.retention_days = 5
+    assert maintenance.run_once(now=now[0])["deleted"] == 2
+    assert [d["messages"] for d in repo.stats(days=30)["days"]] == [1]
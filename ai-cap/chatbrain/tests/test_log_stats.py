@@ -0,0 +1,158 @@
+import gzip
+import os
+import shutil
+import sqlite3
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+os.environ.setdefault("USE_EMBEDDING", "false")
+os.environ.setdefault("USE_SQLITE_LOG", "false")
+
+import pytest
+
+pytest.importorskip("sqlmodel")
+
+from chatbrain.service import ChatBrainService
+from chatbrain.storage.export import export_logs
+from chatbrain.storage.models import SCHEMA_VERSION
+from chatbrain.storage.pipeline import Sampler, Scrubber
+from chatbrain.storage.repo import SQLiteRepo
+
+
+def test_rollups_stats_and_export(tmp_path: Path) -> None:
+    db = tmp_path / "logs.db"
+    svc = ChatBrainService()
+    svc.repo = SQLiteRepo(path=str(db), enabled=True)
+    svc.load_scripts("chatbrain/examples")
+    svc.handle_message("a", "tôi muốn kích hoạt vneid")
+    svc.handle_message("a", "Đã xong")
+    svc.handle_message("b", "thời tiết  hôm nay")
+    svc.handle_message("c", "Thời tiết hôm nay")
+
+    stats = svc.stats(days=1)
+    (today,) = stats["days"]
+    assert today["messages"] == 4 and today["fallbacks"] == 2
+    assert stats["top_intents"][0]["intent"] == "cai_va_kich_hoat_vneid"
+    assert stats["missed_phrases"][0] == {"phrase": "thời tiết hôm nay", "count": 2}
+
+    result = export_logs(str(db), str(tmp_path / "out"), fmt="csv", batch_size=3, chunk_rows=3)
+    assert result["rows"] == 4 and len(result["files"]) == 2
+    with gzip.open(result["files"][0], "rt", encoding="utf-8") as handle:
+        header = handle.readline().strip().split(",")
+    assert header[:3] == ["id", "created_at", "session_id"]
+
+
+def test_migrates_v1_log_file(tmp_path: Path) -> None:
+    db = tmp_path / "old.db"
+    conn = sqlite3.connect(db)
+    conn.execute(
+        "CREATE TABLE interactionlog (id INTEGER PRIMARY KEY, session_id VARCHAR NOT NULL, user_message VARCHAR NOT NULL,"
+        " bot_reply VARCHAR NOT NULL, top_k VARCHAR NOT NULL, chosen VARCHAR, score FLOAT, stack_depth INTEGER NOT NULL)"
+    )
+    conn.execute(
+        "INSERT INTO interactionlog VALUES (1, 's', 'hi', 'chào', '[]', '{\"intent_id\": \"chao\", \"score\": 0.9}', 0.9, 1)"
+    )
+    conn.commit()
+    conn.close()
+
+    repo = SQLiteRepo(path=str(db), enabled=True)
+    repo.log_interaction("s", "xin chào", "chào", [], {"intent_id": "chao", "score": 0.8}, 1)
+    conn = sqlite3.connect(db)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+    assert conn.execute("SELECT chosen_intent, is_fallback FROM interactionlog WHERE id = 1").fetchone() == ("chao", 0)
+    indexes = {row[1] for row in conn.execute("PRAGMA index_list(interactionlog)")}
+    assert {"ix_interactionlog_session_id", "ix_interactionlog_created_at"} <= indexes
+    conn.close()
+    assert repo.stats()["days"][0]["messages"] == 1  # dòng cũ không có thời điểm, không vào rollup
+
+
+def test_scrubber_masks_vietnamese_pii() -> None:
+    scrub = Scrubber(enabled=True)
+    text = "CCCD 001099012345, sđt 0912 345 678 hoặc +84912345678, email a.b@gov.vn, CMND 123456789"
+    assert scrub(text) == "CCCD [CCCD], sđt [PHONE] hoặc [PHONE], email [EMAIL], CMND [CMND]"
+    assert scrub("thủ tục số 12 năm 2024") == "thủ tục số 12 năm 2024"
+
+
+def test_sampling_scrubbing_and_step_refs(tmp_path: Path) -> None:
+    db = tmp_path / "logs.db"
+    svc = ChatBrainService()
+    svc.repo = SQLiteRepo(path=str(db), enabled=True)
+    svc.repo.sampler = Sampler(rate=0.0, keep_below=0.5)
+    svc.load_scripts("chatbrain/examples")
+    svc.handle_message("a", "tôi muốn kích hoạt vneid")
+    svc.handle_message("b", "số của tôi là 0912345678")
+
+    assert svc.stats(days=1)["days"][0]["messages"] == 2  # rollup đếm cả lượt không được giữ
+    conn = sqlite3.connect(db)
+    rows = conn.execute("SELECT session_id, user_message, bot_reply, reply_step FROM interactionlog").fetchall()
+    conn.close()
+    assert rows == [("b", "số của tôi là [PHONE]", svc.script_pack.fallback or svc.policy.fallback_ask(), None)]
+
+    svc.repo.sampler = Sampler(rate=1.0)
+    response = svc.handle_message("a", "tôi muốn kích hoạt vneid")
+    svc.repo.flush()
+    conn = sqlite3.connect(db)
+    (row,) = conn.execute("SELECT bot_reply, reply_step FROM interactionlog WHERE session_id = 'a'").fetchall()
+    conn.close()
+    assert row == ("", response.debug["step"]) and row[1].startswith("cai_va_kich_hoat_vneid#")
+
+
+FLOW = """
+intents:
+  - id: nop_ho_so
+    domain: cu_tru
+    version: 1
+    synonyms: ["nộp hồ sơ cư trú"]
+    steps:
+      - id: mo
+        say: "Mở cổng dịch vụ công"
+        ui: {buttons: ["Đã xong", "Huỷ"]}
+      - id: hoi
+        ask: "Mã hồ sơ?"
+        slot_name: ma_ho_so
+      - id: xong
+        say: "Hoàn tất"
+"""
+
+
+def test_button_and_slot_turns_are_not_fallbacks(tmp_path: Path) -> None:
+    scripts = tmp_path / "scripts"
+    shutil.copytree(Path(__file__).resolve().parents[1] / "examples", scripts)
+    (scripts / "flow.yaml").write_text(FLOW, encoding="utf-8")
+    db = tmp_path / "logs.db"
+    svc = ChatBrainService()
+    svc.repo = SQLiteRepo(path=str(db), enabled=True)
+    svc.repo.sampler = Sampler(rate=0.0, keep_below=0.5)
+    svc.load_scripts(str(scripts))
+    svc.handle_message("a", "nộp hồ sơ cư trú")
+    assert svc.handle_message("a", "Đã xong").reply == "Mã hồ sơ?"
+    assert svc.handle_message("a", "HS-001").reply == "Hoàn tất"
+    svc.handle_message("b", "thời tiết hôm nay")
+
+    stats = svc.stats(days=1)
+    (today,) = stats["days"]
+    assert today["messages"] == 4 and today["fallbacks"] == 1
+    assert [row["intent"] for row in stats["top_intents"]] == ["nop_ho_so"]
+    assert stats["missed_phrases"] == [{"phrase": "thời tiết hôm nay", "count": 1}]
+    conn = sqlite3.connect(db)
+    rows = conn.execute("SELECT session_id, is_fallback FROM interactionlog").fetchall()
+    conn.close()
+    assert rows == [("b", 1)]  # lượt nút/slot không được giữ như fallback
+
+
+def test_shutdown_drains_log_queue(tmp_path: Path) -> None:
+    db = tmp_path / "logs.db"
+    svc = ChatBrainService()
+    svc.repo = SQLiteRepo(path=str(db), enabled=True)
+    svc.load_scripts("chatbrain/examples")
+    for n in range(50):
+        svc.handle_message(f"s{n}", "tôi muốn kích hoạt vneid")
+    writer = svc.repo._writer
+    svc.shutdown()  # không gọi flush(): shutdown phải tự ghi hết hàng đợi
+
+    conn = sqlite3.connect(db)
+    (count,) = conn.execute("SELECT SUM(messages) FROM interactionrollup").fetchone()
+    conn.close()
+    assert count == 50 and writer._thread is None
@@ -0,0 +1,43 @@
+import random
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from chatbrain.core.matcher import AhoCorasick
+
+
+def test_find_all_overlapping() -> None:
+    matcher = AhoCorasick()
+    for pattern in ("he", "she", "his", "hers"):
+        matcher.add(pattern, pattern)
+    found = [(m.start, m.end, m.value) for m in matcher.find_all("USHERS")]
+    assert found == [(1, 4, "she"), (2, 4, "he"), (2, 6, "hers")]
+
+
+def test_best_prefers_priority_then_length_then_order() -> None:
+    matcher = AhoCorasick()
+    matcher.add("đăng ký", "ngan")
+    matcher.add("Đăng ký thường trú", "dai")
+    matcher.add("thường trú", "uu_tien", priority=1)
+    matcher.add("tạm trú", "a")
+    matcher.add("tạm trú", "b")
+    assert matcher.best("tôi muốn đăng ký thường trú").value == "uu_tien"
+    assert matcher.best("đăng ký cho con").value == "ngan"
+    assert matcher.best("khai báo tạm trú").value == "a"
+    assert matcher.best("không liên quan") is None
+
+
+def test_agrees_with_substring_scan() -> None:
+    rng = random.Random(3)
+    alphabet = "abcđ "
+    patterns = list({"".join(rng.choice(alphabet) for _ in range(rng.randint(1, 5))).strip() for _ in range(300)})
+    patterns = [p for p in patterns if p]
+    matcher = AhoCorasick()
+    for idx, pattern in enumerate(patterns):
+        matcher.add(pattern, idx)
+    for _ in range(200):
+        text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 30)))
+        expected = sorted(idx for idx, p in enumerate(patterns) if p in text.strip())
+        found = sorted({m.value for m in matcher.find_all(text)})
+        assert found == expected
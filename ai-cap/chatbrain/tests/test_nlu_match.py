@@ -7,7 +7,7 @@ sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
 os.environ.setdefault("USE_EMBEDDING", "false")
 os.environ.setdefault("USE_SQLITE_LOG", "false")
 
-from chatbrain.app import service
+from chatbrain.service import service
 
 
 def setup_module(_: object) -> None:
@@ -29,3 +29,13 @@ def test_nlu_match() -> None:
         assert chosen["intent_id"] == expected
         assert chosen["score"] >= service.policy.threshold
         service.clear_context(session_id)
+
+
+def test_rank_many_matches_rank() -> None:
+    texts = ["kích hoạt vneid", "quên passcode", "lệ phí định danh tổ chức", "không liên quan", "kích hoạt vneid"]
+    batch = service.nlu.rank_many(texts, top_k=3)
+    assert batch.indices.shape == (len(texts), 3)
+    for row, text in enumerate(texts):
+        single = service.nlu.rank(text, top_k=3)
+        assert batch.top_ids(row) == [c.intent_id for c in single]
+        assert [round(float(s), 5) for s in batch.scores[row]] == [round(c.score, 5) for c in single]
@@ -0,0 +1,117 @@
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+os.environ.setdefault("USE_EMBEDDING", "false")
+os.environ.setdefault("USE_SQLITE_LOG", "false")
+
+import pytest
+
+from chatbrain.core.conditions import ConditionError, compile_condition
+from chatbrain.core.loader import ScriptLoaderError
+from chatbrain.core.registry import load_registry
+from chatbrain.service import ChatBrainService
+
+MODULE = """
+intents:
+  - id: xac_nhan_cu_tru
+    domain: cu_tru
+    version: 1
+    synonyms: ["xác nhận thông tin cư trú"]
+    steps:
+      - id: s1
+        say: "Hướng dẫn xác nhận cư trú"
+  - id: dang_ky_muc_2
+    domain: vneid
+    version: 1
+    synonyms: ["định danh điện tử"]
+    steps:
+      - id: s1
+        say: "Hướng dẫn đăng ký mức 2"
+  - id: tam_tru
+    domain: cu_tru
+    version: 1
+    synonyms: ["đăng ký tạm trú"]
+    steps:
+      - id: s1
+        say: "Hướng dẫn tạm trú"
+  - id: le_phi
+    domain: cu_tru
+    version: 1
+    synonyms: ["lệ phí bao nhiêu"]
+    steps:
+      - id: s1
+        say: "Miễn phí"
+"""
+
+REGISTRY = """
+modules:
+  - name: chinh
+    path: "scripts/main.yaml"
+  - name: hong
+    path: "scripts/khong_ton_tai.yaml"
+aliases_global:
+  - synonyms: ["Nâng cấp VNeID"]
+    target: "dang_ky_muc_2"
+  - synonyms: ["bí danh mồ côi"]
+    target: "khong_co"
+redirects:
+  - when_intent: "xac_nhan_cu_tru"
+    if: "da_co_vneid == false"
+    to: "dang_ky_muc_2"
+fallback:
+  answer: "Liên hệ Công an phường."
+"""
+
+
+def _write(tmp_path: Path, registry: str = REGISTRY) -> Path:
+    (tmp_path / "scripts").mkdir(exist_ok=True)
+    (tmp_path / "scripts" / "main.yaml").write_text(MODULE, encoding="utf-8")
+    path = tmp_path / "registry.yaml"
+    path.write_text(registry, encoding="utf-8")
+    return path
+
+
+def test_registry_compiles_into_pack(tmp_path: Path) -> None:
+    pack = load_registry(str(_write(tmp_path)))
+    assert [i.id for i in pack.intents][:2] == ["xac_nhan_cu_tru", "dang_ky_muc_2"]
+    assert pack.aliases == {"nâng cấp vneid": "dang_ky_muc_2"}
+    assert [(r.when_intent, r.condition, r.to) for r in pack.redirects] == [
+        ("xac_nhan_cu_tru", "da_co_vneid == false", "dang_ky_muc_2")
+    ]
+    assert pack.fallback == "Liên hệ Công an phường."
+
+
+def test_invalid_redirect_condition_fails_load(tmp_path: Path) -> None:
+    broken = REGISTRY.replace('"da_co_vneid == false"', '"da_co_vneid =="')
+    with pytest.raises(ScriptLoaderError):
+        load_registry(str(_write(tmp_path, broken)))
+
+
+def test_conditions_never_eval() -> None:
+    predicate = compile_condition("tuoi >= 16 and not (loai == 'tam_tru' || da_nop)")
+    assert predicate({"tuoi": "20", "loai": "thuong_tru"})
+    assert not predicate({"tuoi": "12", "loai": "thuong_tru"})
+    assert not predicate({})  # slot chưa có: so sánh luôn sai
+    with pytest.raises(ConditionError):
+        compile_condition("__import__('os')")
+
+
+def test_service_uses_aliases_redirects_and_fallback(tmp_path: Path) -> None:
+    svc = ChatBrainService()
+    svc.load_registry(str(_write(tmp_path)))
+
+    response = svc.handle_message("a", "  nâng cấp VNeID ")
+    assert response.reply == "Hướng dẫn đăng ký mức 2"
+    assert response.debug["top_k"] == []
+
+    # Chưa biết slot: không chuyển hướng
+    assert svc.handle_message("c", "xác nhận thông tin cư trú").reply == "Hướng dẫn xác nhận cư trú"
+    svc.context.peek("c").slots["da_co_vneid"] = "chưa"
+    redirected = svc.handle_message("c", "xác nhận thông tin cư trú")
+    assert redirected.reply == "Hướng dẫn đăng ký mức 2"
+    assert redirected.debug["chosen"]["intent_id"] == "dang_ky_muc_2"
+
+    assert svc.handle_message("d", "thời tiết").reply == "Liên hệ Công an phường."
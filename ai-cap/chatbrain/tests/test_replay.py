@@ -0,0 +1,40 @@
+import json
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+os.environ.setdefault("USE_EMBEDDING", "false")
+os.environ.setdefault("USE_SQLITE_LOG", "false")
+
+import pytest
+
+from chatbrain.cli import menu
+
+
+def test_replay_checks_expectations_and_writes_folded_stacks(tmp_path: Path, capsys) -> None:
+    transcript = tmp_path / "chat.jsonl"
+    turns = [
+        {"session_id": "r1", "message": "tôi muốn kích hoạt vneid", "intent": "cai_va_kich_hoat_vneid"},
+        {"session_id": "r1", "message": "Đã xong", "step": "cai_va_kich_hoat_vneid#b2_mo", "reply": "Kích hoạt"},
+        {"session_id": "r2", "message": "thời tiết hôm nay", "intent": None},
+        {"session_id": "r2", "message": "quên mật khẩu vneid", "intent": "cai_va_kich_hoat_vneid"},
+    ]
+    transcript.write_text("\n".join(json.dumps(t, ensure_ascii=False) for t in turns) + "\n", encoding="utf-8")
+    folded = tmp_path / "replay.folded"
+
+    with pytest.raises(SystemExit) as exit_info:
+        menu.main(
+            ["replay", str(transcript), "--scripts", "chatbrain/examples", "--profile", "sample",
+             "--profile-out", str(folded), "--interval", "0.1"]
+        )
+    assert exit_info.value.code == 1
+    lines = capsys.readouterr().out.strip().splitlines()
+    assert json.loads(lines[0]) == {"line": 4, "got": {"intent": "quen_mat_khau_vneid"}}
+    summary = json.loads(lines[-1])
+    assert summary["turns"] == 4 and summary["failures"] == 1 and summary["errors"] == 0
+    assert summary["profile"] == str(folded)
+    for line in folded.read_text(encoding="utf-8").splitlines():
+        stack, count = line.rsplit(" ", 1)
+        assert int(count) > 0 and "(" in stack
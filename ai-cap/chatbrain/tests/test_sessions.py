@@ -0,0 +1,49 @@
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+os.environ.setdefault("USE_EMBEDDING", "false")
+os.environ.setdefault("USE_SQLITE_LOG", "false")
+
+from chatbrain.core.context import ContextManager
+from chatbrain.core.schema import ContextFrame
+from chatbrain.service import ChatBrainService
+
+
+def _frame(intent_id: str = "a") -> ContextFrame:
+    return ContextFrame(script_file="x.yaml", intent_id=intent_id, domain="d", step_id="s1", step_index=0, version=1)
+
+
+def test_sessions_expire_and_are_bounded() -> None:
+    context = ContextManager(ttl=0.05, max_sessions=3)
+    for idx in range(5):
+        context.push(f"s{idx}", _frame())
+    assert context.stats()["sessions"] == 3
+    assert context.stats()["evicted"] == 2
+    assert context.peek("s0") is None  # bị đẩy ra theo LRU
+
+    context.set_version_prompt("s4", "a")
+    assert context.version_prompt("s4") == "a"
+    time.sleep(0.06)
+    assert context.sweep() == 3
+    context.push("s5", _frame())
+    assert context.peek("s4") is None
+    assert context.version_prompt("s4") is None
+    assert context.stats()["sessions"] == 1
+
+
+def test_one_off_senders_leave_no_state() -> None:
+    svc = ChatBrainService()
+    svc.load_scripts("chatbrain/examples")
+    for idx in range(50):
+        svc.handle_message(f"nguoi_gui_{idx}", "thời tiết hôm nay thế nào")
+        svc.context_state(f"nguoi_gui_{idx}")
+    assert svc.session_stats()["sessions"] == 0
+
+    svc.handle_message("x", "tôi muốn kích hoạt vneid")
+    assert svc.session_stats()["sessions"] == 1
+    svc.handle_message("x", "Huỷ")
+    assert svc.session_stats()["sessions"] == 0
@@ -0,0 +1,26 @@
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+os.environ.setdefault("USE_EMBEDDING", "false")
+os.environ.setdefault("USE_SQLITE_LOG", "false")
+
+from chatbrain.core import loader, shared
+from chatbrain.core.nlu import NLUIndex
+
+
+def test_shared_index_matches_built_index(tmp_path: Path) -> None:
+    built = NLUIndex(use_embedding=False)
+    built.build(loader.load_from_folder("chatbrain/examples"))
+    generation = shared.export_index(built, str(tmp_path))
+    assert shared.current_generation(str(tmp_path)) == generation
+
+    mapped = NLUIndex(use_embedding=False)
+    pack = shared.load_index(mapped, str(tmp_path))
+    assert [i.id for i in pack.intents] == [i.id for i in built.all_intents()]
+
+    for text in ["kích hoạt vneid", "quên passcode", "lệ phí định danh tổ chức", "xin chào"]:
+        expected = [(c.intent_id, round(c.score, 6)) for c in built.rank(text)]
+        assert [(c.intent_id, round(c.score, 6)) for c in mapped.rank(text)] == expected
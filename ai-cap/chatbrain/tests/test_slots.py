@@ -0,0 +1,115 @@
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+os.environ.setdefault("USE_EMBEDDING", "false")
+os.environ.setdefault("USE_SQLITE_LOG", "false")
+
+import pytest
+
+from chatbrain.core.loader import ScriptLoaderError, load_from_folder, parse_entities
+from chatbrain.core.slots import SlotExtractor
+from chatbrain.service import ChatBrainService
+
+SCRIPT = """
+entities:
+  - kenh_nop: [web, app]
+  - loai_ho_so:
+      tam_tru: ["tạm trú"]
+      thuong_tru: ["thường trú"]
+  - so_ngay: number
+  - ma_ho_so
+intents:
+  - id: nop_ho_so
+    domain: cu_tru
+    version: 1
+    synonyms: ["nộp hồ sơ cư trú trực tuyến"]
+    required_slots: [kenh_nop, loai_ho_so]
+    steps:
+      - id: hoi_kenh
+        ask: "Anh/chị nộp qua web hay app?"
+        slot_name: kenh_nop
+      - id: hoi_loai
+        ask: "Thường trú hay tạm trú?"
+        slot_name: loai_ho_so
+      - id: tam_tru
+        when: "loai_ho_so == 'tam_tru'"
+        say: "Điều kiện tạm trú"
+      - id: hoan_tat
+        say: "Nộp hồ sơ qua {kenh_nop}"
+  - id: muc_2
+    domain: vneid
+    version: 1
+    synonyms: ["đăng ký định danh mức 2"]
+    steps:
+      - id: hoi
+        ask: "Đã chụp ảnh lăn tay lần 2 chưa?"
+        slot_name: da_lan_2
+        slot_type: boolean
+      - id: da_lam
+        when: "da_lan_2 == true"
+        say: "Chờ kích hoạt"
+      - id: chua_lam
+        when: "da_lan_2 == false"
+        say: "Đến Công an phường"
+  - id: le_phi
+    domain: cu_tru
+    version: 1
+    synonyms: ["lệ phí bao nhiêu"]
+    steps:
+      - id: s1
+        say: "Miễn phí"
+"""
+
+
+def _service(tmp_path: Path) -> ChatBrainService:
+    (tmp_path / "main.yaml").write_text(SCRIPT, encoding="utf-8")
+    svc = ChatBrainService()
+    svc.load_scripts(str(tmp_path))
+    return svc
+
+
+def test_entity_declarations_and_extraction(tmp_path: Path) -> None:
+    (tmp_path / "main.yaml").write_text(SCRIPT, encoding="utf-8")
+    pack = load_from_folder(str(tmp_path))
+    assert {name: e.type for name, e in pack.entities.items()} == {
+        "kenh_nop": "list",
+        "loai_ho_so": "list",
+        "so_ngay": "number",
+        "ma_ho_so": "text",
+    }
+    extractor = SlotExtractor(pack)
+    assert extractor.extract("Nộp TAM TRU qua app được không") == {"loai_ho_so": "tam_tru", "kenh_nop": "app"}
+    assert extractor.extract("happy webinar") == {}  # phải khớp trọn từ
+    assert extractor.answer("so_ngay", None, "khoảng 45 ngày") == "45"
+    assert extractor.answer("da_lan_2", "boolean", "dạ chưa có ạ") == "false"
+    assert extractor.answer("da_lan_2", "boolean", "làm rồi") == "true"
+    assert extractor.answer("ma_ho_so", None, "Huỷ") is None
+    with pytest.raises(ScriptLoaderError):
+        parse_entities({"x": "ngay_thang"}, "test.yaml")
+
+
+def test_slot_steps_are_asked_and_skipped(tmp_path: Path) -> None:
+    svc = _service(tmp_path)
+    # Câu kích hoạt đã nêu kênh nộp: bỏ qua bước hỏi kênh
+    assert svc.handle_message("a", "nộp hồ sơ cư trú trực tuyến qua web").reply == "Thường trú hay tạm trú?"
+    reply = svc.handle_message("a", "tạm trú")
+    assert reply.reply == "Điều kiện tạm trú"
+    assert reply.debug["top_k"] == []
+    assert svc.context.peek("a").slots == {"kenh_nop": "web", "loai_ho_so": "tam_tru"}
+
+    # Thường trú: bước có ``when`` sai bị bỏ qua
+    svc.handle_message("b", "nộp hồ sơ cư trú trực tuyến")
+    svc.handle_message("b", "app")
+    assert svc.handle_message("b", "thường trú").reply == "Nộp hồ sơ qua {kenh_nop}"
+
+    assert svc.handle_message("c", "đăng ký định danh mức 2").reply == "Đã chụp ảnh lăn tay lần 2 chưa?"
+    assert svc.handle_message("c", "chưa").reply == "Đến Công an phường"
+
+
+def test_invalid_step_condition_fails_load(tmp_path: Path) -> None:
+    (tmp_path / "main.yaml").write_text(SCRIPT.replace("loai_ho_so == 'tam_tru'", "loai_ho_so =="), encoding="utf-8")
+    with pytest.raises(ScriptLoaderError):
+        load_from_folder(str(tmp_path))
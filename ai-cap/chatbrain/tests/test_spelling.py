@@ -0,0 +1,38 @@
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+os.environ.setdefault("USE_EMBEDDING", "false")
+os.environ.setdefault("USE_SQLITE_LOG", "false")
+
+from chatbrain.core import loader
+from chatbrain.core.nlu import NLUIndex
+from chatbrain.core.spelling import SpellIndex, damerau_levenshtein
+
+
+def test_spell_index_corrections() -> None:
+    spelling = SpellIndex(max_distance=2)
+    spelling.build(["kích", "hoạt", "vneid", "mật", "mất", "khẩu", "quên"], {"mật": 3, "mất": 1})
+    assert spelling.correct(["kich", "hoat", "vnied"]) == ["kích", "hoạt", "vneid"]
+    assert spelling.correct(["quen", "mk"]) == ["quên", "mật", "khẩu"]
+    assert spelling.correct(["mat"]) == ["mật"]  # dạng không dấu trùng: chọn token phổ biến hơn
+    assert spelling.correct(["xyz", "thời"]) == ["xyz", "thời"]
+    assert damerau_levenshtein("vnied", "vneid", 1) == 1
+
+
+def test_typos_reach_intent() -> None:
+    pack = loader.load_from_folder("chatbrain/examples")
+    strict = NLUIndex(use_embedding=False, spell_correction=False)
+    strict.build(pack)
+    nlu = NLUIndex(use_embedding=False, spell_correction=True)
+    nlu.build(pack)
+    # Token đã có trong vocab (kể cả không dấu) được giữ nguyên
+    assert nlu.tokenize("kich hoat vnied") == ["kich", "hoat", "vneid"]
+
+    text = "quen mk vneid"
+    assert strict.rank(text)[0].score < 0.55
+    best = nlu.rank(text)[0]
+    assert best.intent_id == "quen_mat_khau_vneid"
+    assert best.score >= 0.55
@@ -0,0 +1,108 @@
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+os.environ.setdefault("USE_EMBEDDING", "false")
+os.environ.setdefault("USE_SQLITE_LOG", "false")
+
+from chatbrain.core.buttons import BACK, INTENT, MENU, NEXT, normalize_label
+from chatbrain.service import ChatBrainService
+
+SCRIPT = """
+intents:
+  - id: menu_chinh
+    domain: system
+    version: 1
+    can_interrupt: true
+    synonyms: ["menu", "quay lại menu"]
+    steps:
+      - id: s1
+        say: "Chọn một mục"
+        ui:
+          buttons: ["📲 Cài đặt & Kích hoạt", "Nút lạ không khớp gì"]
+  - id: kich_hoat
+    domain: vneid
+    version: 1
+    synonyms: ["cài đặt kích hoạt vneid", "kích hoạt tài khoản"]
+    steps:
+      - id: b1
+        say: "B1 tải app"
+        ui:
+          buttons: ["Đã tải xong ✅", "Về menu chính"]
+      - id: b2
+        say: "B2 mở app"
+        ui:
+          buttons: ["Tiếp tục", "↩️ Quay lại"]
+      - id: b3
+        say: "B3 hoàn tất"
+  - id: quen_mat_khau
+    domain: vneid
+    version: 1
+    synonyms: ["quên mật khẩu vneid"]
+    steps:
+      - id: q1
+        say: "Đặt lại mật khẩu"
+"""
+
+
+def _service(tmp_path: Path) -> ChatBrainService:
+    (tmp_path / "pack.yaml").write_text(SCRIPT, encoding="utf-8")
+    svc = ChatBrainService()
+    svc.load_scripts(str(tmp_path))
+    return svc
+
+
+def test_normalize_label() -> None:
+    assert normalize_label("↩️ Quay lại") == "quay lại"
+    assert normalize_label("  Đã tải xong ✅ ") == "đã tải xong"
+
+
+def test_step_table_compiled_at_load(tmp_path: Path) -> None:
+    svc = _service(tmp_path)
+    table = svc.executor.buttons
+    assert table[("menu_chinh", "s1")]["cài đặt kích hoạt"].kind == INTENT
+    assert table[("menu_chinh", "s1")]["cài đặt kích hoạt"].target == "kich_hoat"
+    assert "nút lạ không khớp gì" not in table[("menu_chinh", "s1")]
+    assert table[("kich_hoat", "b1")]["đã tải xong"].kind == NEXT
+    assert table[("kich_hoat", "b1")]["về menu chính"] == (MENU, "menu_chinh")
+    assert table[("kich_hoat", "b2")]["quay lại"].kind == BACK
+
+
+def test_in_flow_buttons_skip_ranking(tmp_path: Path) -> None:
+    svc = _service(tmp_path)
+    calls = []
+    score_row = svc.nlu.score_row
+    svc.nlu.score_row = lambda *args, **kwargs: calls.append(args) or score_row(*args, **kwargs)
+
+    svc.handle_message("s", "menu")
+    assert len(calls) == 1
+    assert svc.handle_message("s", "📲 Cài đặt & Kích hoạt").reply == "B1 tải app"
+    assert svc.handle_message("s", "Đã tải xong ✅").reply == "B2 mở app"
+    assert svc.handle_message("s", "↩️ Quay lại").reply == "B1 tải app"
+    assert svc.handle_message("s", "Đã tải xong ✅").reply == "B2 mở app"
+    assert svc.handle_message("s", "Tiếp tục").reply == "B3 hoàn tất"
+    assert len(calls) == 1
+
+    # Nhãn không thuộc bước hiện tại vẫn đi qua NLU, ưu tiên domain đang chạy
+    response = svc.handle_message("s", "quên mật khẩu vneid")
+    assert response.debug["chosen"]["intent_id"] == "quen_mat_khau"
+    assert calls[-1] == ("quên mật khẩu vneid",)
+    assert all(c["domain"] == "vneid" for c in response.debug["top_k"])
+
+    # Không khớp trong domain lẫn toàn cục: vẫn chỉ chấm điểm (BM25, embedding) một lần
+    passes = []
+    bm25_matrix = svc.nlu._bm25_matrix
+    svc.nlu._bm25_matrix = lambda *args: passes.append(args) or bm25_matrix(*args)
+    svc.handle_message("s", "Tiếp tục")
+    assert svc.handle_message("s", "thời tiết hôm nay").debug.get("fallback")
+    assert len(passes) == 1
+
+
+def test_menu_button_resets_flow(tmp_path: Path) -> None:
+    svc = _service(tmp_path)
+    svc.handle_message("m", "kích hoạt tài khoản")
+    response = svc.handle_message("m", "Về menu chính")
+    assert response.reply == "Chọn một mục"
+    assert [frame.intent_id for frame in svc.context.stack("m")] == ["menu_chinh"]
@@ -0,0 +1,129 @@
+import asyncio
+import json
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+os.environ.setdefault("USE_EMBEDDING", "false")
+os.environ.setdefault("USE_SQLITE_LOG", "false")
+
+import pytest
+
+from chatbrain.service import ChatBrainService, message_events
+
+
+class GraphClient:
+    """Giả lập Send API: ghi lại message đã gửi, trả attachment_id cho ảnh gửi bằng url."""
+
+    def __init__(self, first_delay: float = 0.0) -> None:
+        self.sent = []
+        self.first_delay = first_delay
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return None
+
+    async def post(self, url, params, json=None, content=None, headers=None):
+        await asyncio.sleep(self.first_delay if not self.sent else 0)
+        body = json if json is not None else __import__("json").loads(content)
+        self.sent.append(body["message"])
+        url = body["message"].get("attachment", {}).get("payload", {}).get("url")
+        data = {"attachment_id": f"att-{url}"} if url else {}
+        return type("R", (), {"status_code": 200, "text": "", "json": lambda self: data})()
+
+
+def test_message_events_split_reply_and_media() -> None:
+    svc = ChatBrainService()
+    svc.load_scripts("chatbrain/examples")
+    response = svc.handle_message("s", "kich hoat tai khoan")
+    events = list(message_events(response))
+    assert response.ui.media
+    assert [name for name, _ in events] == ["reply"] + ["media"] * len(response.ui.media) + ["done"]
+    assert events[0][1] == {"reply": response.reply, "buttons": response.ui.buttons}
+    assert events[-1][1]["debug"] == response.debug
+
+
+def test_connector_relays_sse_in_order(monkeypatch) -> None:
+    pytest.importorskip("fastapi")
+    from chatbrain.connectors import facebook
+
+    frames = [
+        ("reply", {"reply": "Bước 1", "buttons": ["Đã xong"]}),
+        ("media", {"index": 0, "type": "image", "url": "https://x/1.png", "alt": None}),
+        ("media", {"index": 1, "type": "image", "url": "https://x/2.png", "alt": "b2"}),
+        ("done", {"debug": {}}),
+    ]
+
+    async def lines():
+        for name, data in frames:
+            for line in (f"event: {name}", f"data: {json.dumps(data)}", ""):
+                yield line
+
+    client = GraphClient(first_delay=0.01)  # lần gửi đầu chậm hơn các lần sau
+    sent = client.sent
+
+    async def relay():
+        chain = facebook._SendChain(client, "token")
+        async for event, data in facebook._parse_sse(lines()):
+            payload = facebook._event_payload("u", event, data)
+            if payload is not None:
+                chain.send(payload)
+        await chain.drain()
+
+    monkeypatch.setattr(facebook, "USE_MEDIA", True)
+    asyncio.run(relay())
+    assert sent[0]["text"] == "Bước 1" and sent[0]["quick_replies"][0]["payload"] == "Đã xong"
+    assert [m["attachment"]["payload"]["url"] for m in sent[1:]] == ["https://x/1.png", "https://x/2.png"]
+
+
+def test_connector_sends_prefetched_step_and_reuses_attachments(monkeypatch) -> None:
+    pytest.importorskip("fastapi")
+    from chatbrain.connectors import facebook
+
+    client = GraphClient()
+    monkeypatch.setattr(facebook, "_httpx", lambda: type("X", (), {"AsyncClient": lambda **kw: client}))
+    monkeypatch.setattr(facebook, "USE_MEDIA", True)
+    monkeypatch.setattr(facebook, "USE_PREFETCH", True)
+    monkeypatch.setattr(facebook, "ATTACHMENT_IDS", {})
+    monkeypatch.setattr(facebook, "PAGE_TOKENS", {"p": "token-p"})
+    monkeypatch.setattr(facebook, "_PREFETCHED", facebook.OrderedDict())
+    media = [{"type": "image", "url": "https://x/1.png"}]
+    first = {
+        "reply": "Bước 1",
+        "ui": {"buttons": ["Đã xong"], "media": media},
+        "debug": {"step": "a#1", "next": {"step": "a#2", "reply": "Bước 2", "ui": {"media": media}}},
+    }
+    asyncio.run(facebook._dispatch_response("u", first, "p"))
+    assert facebook._PREFETCHED[("p", "u")][0][0] == "a#2"
+    # Lõi trả đúng nội dung đã dựng sẵn: gửi body có attachment_id thay cho url
+    second = {"reply": "Bước 2", "ui": {"media": media}, "debug": {"step": "a#2"}}
+    asyncio.run(facebook._dispatch_response("u", second, "p"))
+    assert client.sent[2]["text"] == "Bước 2"
+    assert client.sent[3]["attachment"]["payload"] == {"attachment_id": "att-https://x/1.png"}
+    assert ("p", "u") not in facebook._PREFETCHED
+
+    # Cùng bước nhưng lời đáp đã đổi (nạp lại kịch bản, biến tenant...): lời đáp mới thắng
+    asyncio.run(facebook._dispatch_response("u", first, "p"))
+    asyncio.run(facebook._dispatch_response("u", {"reply": "khác", "debug": {"step": "a#2"}}, "p"))
+    assert client.sent[-1]["text"] == "khác"
+    assert ("p", "u") not in facebook._PREFETCHED
+
+
+def test_streaming_disables_prefetch(monkeypatch) -> None:
+    pytest.importorskip("fastapi")
+    import importlib
+
+    from chatbrain.connectors import facebook
+
+    monkeypatch.setenv("FB_STREAMING", "true")
+    monkeypatch.setenv("FB_PREFETCH", "true")
+    try:
+        assert importlib.reload(facebook).USE_PREFETCH is False
+    finally:
+        monkeypatch.delenv("FB_STREAMING")
+        monkeypatch.delenv("FB_PREFETCH")
+        importlib.reload(facebook)
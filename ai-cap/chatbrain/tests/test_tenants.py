@@ -0,0 +1,162 @@
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+os.environ.setdefault("USE_EMBEDDING", "false")
+os.environ.setdefault("USE_SQLITE_LOG", "false")
+
+import pytest
+
+from chatbrain.service import ChatBrainService, ServiceError
+
+OVERRIDE = """
+intents:
+  - id: cai_va_kich_hoat_vneid
+    domain: vneid
+    version: 3
+    synonyms: [kích hoạt vneid, cài vneid]
+    examples: [tôi muốn cài và kích hoạt vneid, hướng dẫn kích hoạt ứng dụng vneid]
+    steps:
+      - id: b1_chuan_bi
+        say: "Mời anh/chị mang CCCD tới {{address}} hoặc gọi {{phone}}."
+        ui: {buttons: ["Đã xong", "Huỷ"]}
+  - id: lich_tiep_dan
+    domain: tiep_dan
+    version: 1
+    synonyms: [lịch tiếp dân, giờ làm việc]
+    steps:
+      - id: gio
+        say: "Tiếp dân sáng thứ Hai tới thứ Sáu. Liên hệ {{phone}}."
+"""
+
+
+@pytest.fixture
+def svc(tmp_path: Path) -> ChatBrainService:
+    (tmp_path / "nghia_lo.yaml").write_text(OVERRIDE, encoding="utf-8")
+    (tmp_path / "tenants.yaml").write_text(
+        """
+tenants:
+  - id: nghia_lo
+    pages: ["111"]
+    variables: {phone: "0216 3870 123", address: "Số 1 Điện Biên"}
+    overrides: nghia_lo.yaml
+  - id: trung_tam
+    pages: ["222"]
+    fallback: "Gọi {{phone}} giúp em nhé."
+    variables: {phone: "0216 3852 000"}
+""",
+        encoding="utf-8",
+    )
+    service = ChatBrainService()
+    service.load_scripts("chatbrain/examples")
+    service.load_tenants(str(tmp_path / "tenants.yaml"))
+    return service
+
+
+def test_overlay_routing_and_shared_index(svc: ChatBrainService) -> None:
+    nghia_lo, trung_tam = svc.tenant("nghia_lo"), svc.tenant(page_id="222")
+    assert svc.tenant(page_id="999") is svc and svc.tenant() is svc
+    with pytest.raises(ServiceError):
+        svc.tenant("khong_co")
+
+    # Intent không ghi đè là chính đối tượng của pack gốc (copy-on-write)
+    base = {intent.id: intent for intent in svc.script_pack.intents}
+    shared = [intent for intent in nghia_lo.script_pack.intents if intent.id in base]
+    assert sum(intent is base[intent.id] for intent in shared) == len(base) - 1
+    assert trung_tam.nlu is svc.nlu and nghia_lo.nlu is not svc.nlu
+
+    reply = nghia_lo.handle_message("u", "tôi muốn kích hoạt vneid").reply
+    assert reply == "Mời anh/chị mang CCCD tới Số 1 Điện Biên hoặc gọi 0216 3870 123."
+    assert nghia_lo.handle_message("v", "lịch tiếp dân").reply.endswith("0216 3870 123.")
+    assert svc.handle_message("u", "tôi muốn kích hoạt vneid").reply.startswith("Anh/chị vui lòng mở")
+    assert trung_tam.handle_message("u", "thời tiết hôm nay").reply == "Gọi 0216 3852 000 giúp em nhé."
+    # Phiên tách biệt theo tenant
+    assert len(nghia_lo.context.stack("u")) == 1 and trung_tam.context.stack("u") == []
+
+
+def test_stats_and_rebuild_on_reload(svc: ChatBrainService) -> None:
+    svc.tenant("nghia_lo").handle_message("u", "lịch tiếp dân")
+    stats = svc.tenant_stats()
+    assert stats["nghia_lo"]["overridden"] == 2 and not stats["nghia_lo"]["shared_index"]
+    assert stats["trung_tam"]["shared_index"] and stats["trung_tam"]["index_bytes"] == 0
+    assert stats["nghia_lo"]["messages"] == 1 and stats["nghia_lo"]["p95_ms"] is not None
+
+    child = svc.tenant("nghia_lo")
+    svc.load_scripts("chatbrain/examples")
+    assert svc.tenant("nghia_lo") is child and svc.tenant("trung_tam").nlu is svc.nlu
+
+
+def test_overlays_compiled_once_per_snapshot(svc: ChatBrainService, monkeypatch) -> None:
+    from chatbrain.core import loader
+
+    first = svc.snapshot
+    v2 = svc.load_scripts("chatbrain/examples")["version"]
+    assert set(first.tenants) == set(svc.snapshot.tenants) == {"nghia_lo", "trung_tam"}
+
+    # Đổi qua lại phiên bản chỉ gán con trỏ: không đọc lại YAML, không dựng lại chỉ mục
+    monkeypatch.setattr(loader, "load_module", lambda *_: pytest.fail("đọc lại file ghi đè"))
+    svc.activate(first.version)
+    assert svc.tenant("nghia_lo").snapshot is first.tenants["nghia_lo"]
+    svc.activate(v2)
+    assert svc.tenant("nghia_lo").snapshot is svc.snapshot.tenants["nghia_lo"]
+    assert svc.tenant("nghia_lo").handle_message("w", "lịch tiếp dân").reply.endswith("0216 3870 123.")
+
+
+def test_tenant_errors_do_not_half_apply(svc: ChatBrainService, tmp_path: Path) -> None:
+    from chatbrain.core.loader import ScriptLoaderError
+
+    before, child = svc.snapshot, svc.tenant("nghia_lo").snapshot
+    (tmp_path / "nghia_lo.yaml").write_text("intents: [", encoding="utf-8")
+    with pytest.raises(ScriptLoaderError):
+        svc.load_scripts("chatbrain/examples")
+    # Lớp phủ hỏng được phát hiện trước khi hoán đổi: cả gốc lẫn tenant giữ bản cũ
+    assert svc.snapshot is before and svc.tenant("nghia_lo").snapshot is child
+
+
+def test_startup_is_not_ready_before_tenants_load(tmp_path: Path, monkeypatch) -> None:
+    (tmp_path / "tenants.yaml").write_text("tenants:\n  - id: a\n    pages: ['1']\n", encoding="utf-8")
+    monkeypatch.setenv("CHATBRAIN_DEFAULT_SCRIPTS", "chatbrain/examples")
+    monkeypatch.setenv("CHATBRAIN_TENANTS", str(tmp_path / "tenants.yaml"))
+    service = ChatBrainService()
+    load_tenants = service.load_tenants
+    seen = []
+
+    def spy(path):
+        seen.append(service.state)  # pack gốc đã cài nhưng trang của tenant chưa có chủ
+        return load_tenants(path)
+
+    service.load_tenants = spy
+    service.startup()
+    assert seen and seen[0] != "ready"
+    assert service.ready and service.tenant(page_id="1") is service.tenant("a")
+    service.shutdown()
+
+
+def test_bad_tenants_file_sets_error_state(tmp_path: Path, monkeypatch) -> None:
+    (tmp_path / "tenants.yaml").write_text("tenants:\n  - pages: ['1']\n", encoding="utf-8")
+    monkeypatch.setenv("CHATBRAIN_DEFAULT_SCRIPTS", "chatbrain/examples")
+    monkeypatch.setenv("CHATBRAIN_TENANTS", str(tmp_path / "tenants.yaml"))
+    service = ChatBrainService()
+    service.startup()
+    assert service.state == "error" and not service.ready
+    assert "tenants.yaml" in service.startup_error
+    service.load_scripts("chatbrain/examples")  # nạp lại kịch bản không che lỗi tenant
+    assert service.state == "error"
+    service.shutdown()
+
+
+def test_failed_script_load_is_not_ready(monkeypatch) -> None:
+    monkeypatch.setenv("CHATBRAIN_DEFAULT_SCRIPTS", "/nonexistent")
+    monkeypatch.delenv("CHATBRAIN_REGISTRY", raising=False)
+    service = ChatBrainService()
+    service.startup()
+    assert service.state == "error" and service.startup_error
+    service.shutdown()
+
+    monkeypatch.setenv("CHATBRAIN_ALLOW_EMPTY", "true")
+    service = ChatBrainService()
+    service.startup()
+    assert service.ready and service.startup_error
+    service.shutdown()
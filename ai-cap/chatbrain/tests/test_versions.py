@@ -0,0 +1,99 @@
+import os
+import shutil
+import sys
+from collections import Counter
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+os.environ.setdefault("USE_EMBEDDING", "false")
+os.environ.setdefault("USE_SQLITE_LOG", "false")
+
+import pytest
+
+from chatbrain.core.snapshots import TrafficSplit
+from chatbrain.service import ChatBrainService, ServiceError
+
+EXAMPLES = Path(__file__).resolve().parents[1] / "examples"
+
+
+@pytest.fixture
+def folders(tmp_path: Path):
+    old, new = tmp_path / "old", tmp_path / "new"
+    shutil.copytree(EXAMPLES, old)
+    shutil.copytree(EXAMPLES, new)
+    script = new / "01_vneid.yaml"
+    text = script.read_text(encoding="utf-8")
+    script.write_text(text.replace("Anh/chị vui lòng mở", "Mời anh/chị mở"), encoding="utf-8")
+    return str(old), str(new)
+
+
+def test_rollback_is_pointer_swap_and_shares_intents(folders) -> None:
+    old, new = folders
+    svc = ChatBrainService()
+    v1 = svc.load_scripts(old)["version"]
+    first = svc.snapshot
+    v2 = svc.load_scripts(new)["version"]
+    second = svc.snapshot
+
+    # Chỉ lời thoại đổi: chỉ mục dùng lại, intent không đổi là cùng đối tượng
+    assert second.reused_index and second.nlu is first.nlu
+    assert second.shared_intents == len(second.pack.intents) - 1
+    assert svc.handle_message("a", "tôi muốn kích hoạt vneid").reply.startswith("Mời anh/chị")
+
+    svc.activate(v1)
+    assert svc.snapshot is first and svc.executor.buttons is first.buttons
+    assert svc.handle_message("b", "tôi muốn kích hoạt vneid").reply.startswith("Anh/chị vui lòng")
+    assert [v["version"] for v in svc.versions()["versions"]] == [v1, v2]
+    with pytest.raises(ServiceError):
+        svc.activate("v99")
+
+
+def test_turn_reads_one_snapshot_across_a_swap(folders) -> None:
+    old, new = folders
+    script = Path(new) / "01_vneid.yaml"
+    text = script.read_text(encoding="utf-8")
+    script.write_text(text.replace("Tại màn hình chính", "Ở màn hình chính"), encoding="utf-8")
+    svc = ChatBrainService()
+    v1 = svc.load_scripts(old)["version"]
+    svc.load_scripts(new)
+    pinned = svc.snapshot
+    execute = pinned.executor.execute_intent
+
+    def rollback_midway(*args, **kwargs):
+        svc.activate(v1)  # rollback tới khi lượt đang chạy
+        return execute(*args, **kwargs)
+
+    pinned.executor.execute_intent = rollback_midway
+    response = svc.handle_message("a", "tôi muốn kích hoạt vneid", prefetch=True)
+    assert response.reply.startswith("Mời anh/chị")
+    assert response.debug["next"]["reply"].startswith("Ở màn hình chính")
+    assert pinned.usage.messages == 1 and svc.snapshot.version == v1
+
+
+def test_split_by_session_with_per_version_metrics(folders) -> None:
+    old, new = folders
+    svc = ChatBrainService()
+    v1 = svc.load_scripts(old)["version"]
+    v2 = svc.load_scripts(new, activate=False)["version"]
+    assert svc.snapshot.version == v1
+    svc.set_split({v1: 0.5, v2: 0.5})
+
+    split = TrafficSplit({v1: 0.5, v2: 0.5})
+    seen = Counter()
+    for n in range(40):
+        session = f"user-{n}"
+        reply = svc.handle_message(session, "tôi muốn kích hoạt vneid").reply
+        expected = "Mời anh/chị" if split.choose(session) == v2 else "Anh/chị vui lòng"
+        assert reply.startswith(expected)
+        seen[split.choose(session)] += 1
+        svc.handle_message(session, "thời tiết hôm nay")  # fallback
+    assert seen[v1] and seen[v2]
+
+    stats = {v["version"]: v for v in svc.versions()["versions"]}
+    assert stats[v1]["messages"] == 2 * seen[v1] and stats[v2]["messages"] == 2 * seen[v2]
+    assert stats[v2]["fallback_rate"] == 0.5 and stats[v2]["p95_ms"] is not None
+
+    svc.set_split({})
+    assert svc.handle_message("user-0", "Huỷ") is not None
+    assert svc.versions()["split"] is None